@@ -9,8 +9,16 @@ api_bp = Blueprint('api', __name__, url_prefix='/api')
 # Import blueprints to register routes
 from . import editor
 from . import database
+from . import metrics
+from . import schedules
+from . import loads
+from . import pipelines
 
 # Register blueprints
 api_bp.register_blueprint(editor.editor_bp)
 api_bp.register_blueprint(database.database_bp)
+api_bp.register_blueprint(metrics.metrics_bp)
+api_bp.register_blueprint(schedules.schedules_bp)
+api_bp.register_blueprint(loads.loads_bp)
+api_bp.register_blueprint(pipelines.pipelines_bp)
 
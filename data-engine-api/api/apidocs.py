@@ -0,0 +1,174 @@
+"""
+Swagger UI and the Swagger 2.0 spec of the API
+The spec is assembled by flasgger from the YAML docstrings of every route. Parsing them
+takes a noticeable part of a second, so the spec is built once at deploy time
+
+    python -m api.apidocs [output]
+
+and the prebuilt file is served as-is. Without a prebuilt file (and always in debug mode)
+the spec is generated on the first request for it. flasgger is never imported at startup;
+the Swagger UI page is a static shell loading flasgger's bundled assets.
+
+Configuration (environment variables):
+  APISPEC_PATH   prebuilt spec file (default: apispec.json in the data-engine-api directory)
+"""
+import importlib.util
+import json
+import os
+import threading
+from flask import Blueprint, Flask, current_app, jsonify, send_file, send_from_directory
+
+SWAGGER_CONFIG = {
+    "headers": [],
+    "specs": [
+        {
+            "endpoint": "apispec",
+            "route": "/apispec.json",
+            "rule_filter": lambda rule: True,
+            "model_filter": lambda tag: True,
+        }
+    ],
+    "static_url_path": "/flasgger_static",
+    "swagger_ui": True,
+    "specs_route": "/api-docs"
+}
+
+SWAGGER_TEMPLATE = {
+    "swagger": "2.0",
+    "info": {
+        "title": "Data Engine API",
+        "description": "API documentation for Data Engine - Directory and Project Management",
+        "version": "1.0.0",
+        "contact": {
+            "name": "API Support"
+        }
+    },
+    "basePath": "/api",
+    "schemes": ["http", "https"],
+    "tags": [
+        {
+            "name": "Editor",
+            "description": "Editor API endpoints for directory and project management"
+        }
+    ]
+}
+
+SWAGGER_UI_PAGE = """<!DOCTYPE html>
+<html lang="en">
+  <head>
+    <meta charset="UTF-8">
+    <title>{title}</title>
+    <link rel="stylesheet" type="text/css" href="{static}/swagger-ui.css">
+    <link rel="icon" type="image/png" href="{static}/favicon-32x32.png" sizes="32x32">
+  </head>
+  <body>
+    <div id="swagger-ui"></div>
+    <script src="{static}/swagger-ui-bundle.js"></script>
+    <script src="{static}/swagger-ui-standalone-preset.js"></script>
+    <script>
+      window.onload = function() {{
+        window.ui = SwaggerUIBundle({{
+          url: "{spec_url}",
+          dom_id: '#swagger-ui',
+          validatorUrl: null,
+          displayOperationId: true,
+          deepLinking: true,
+          apisSorter: "alpha",
+          presets: [SwaggerUIBundle.presets.apis, SwaggerUIStandalonePreset],
+          plugins: [SwaggerUIBundle.plugins.DownloadUrl],
+          layout: "StandaloneLayout"
+        }});
+      }};
+    </script>
+  </body>
+</html>
+"""
+
+apidocs_bp = Blueprint('apidocs', __name__)
+
+_generated_spec = None
+_generate_lock = threading.Lock()
+
+
+def apispec_path() -> str:
+    default = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'apispec.json')
+    return os.getenv('APISPEC_PATH', default)
+
+
+def generate_apispec(app: Flask) -> dict:
+    """
+    Build the spec from the route docstrings with flasgger
+    """
+    from flasgger import Swagger
+
+    # Without an app flasgger registers no views; it only needs one to read config and routes
+    swagger = Swagger(config=dict(SWAGGER_CONFIG), template=SWAGGER_TEMPLATE)
+    swagger.app = app
+    swagger.load_config(app)
+    with app.app_context():
+        spec = swagger.get_apispecs(SWAGGER_CONFIG['specs'][0]['endpoint'])
+    # Round-trip through JSON so the served and the prebuilt spec are identical
+    return json.loads(json.dumps(spec, default=str))
+
+
+def build_apispec(app: Flask, path: str) -> dict:
+    """
+    Write the spec to path (atomically) and return it
+    """
+    spec = generate_apispec(app)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(spec, f, ensure_ascii=False, sort_keys=True)
+    os.replace(tmp_path, path)
+    return spec
+
+
+def _flasgger_static_dir() -> str:
+    # find_spec locates the installed package without importing it
+    spec = importlib.util.find_spec('flasgger')
+    return os.path.join(list(spec.submodule_search_locations)[0], 'ui3', 'static')
+
+
+@apidocs_bp.route(SWAGGER_CONFIG['specs'][0]['route'])
+def apispec():
+    global _generated_spec
+    path = apispec_path()
+    if not current_app.debug and os.path.exists(path):
+        return send_file(path, mimetype='application/json', conditional=True)
+    if current_app.debug:
+        return jsonify(generate_apispec(current_app._get_current_object()))
+    with _generate_lock:
+        if _generated_spec is None:
+            _generated_spec = generate_apispec(current_app._get_current_object())
+    return jsonify(_generated_spec)
+
+
+@apidocs_bp.route(SWAGGER_CONFIG['specs_route'])
+def swagger_ui():
+    page = SWAGGER_UI_PAGE.format(
+        title=SWAGGER_TEMPLATE['info']['title'],
+        static=SWAGGER_CONFIG['static_url_path'],
+        spec_url=SWAGGER_CONFIG['specs'][0]['route'],
+    )
+    return page, 200, {'Content-Type': 'text/html; charset=utf-8'}
+
+
+@apidocs_bp.route(SWAGGER_CONFIG['static_url_path'] + '/<path:filename>')
+def swagger_static(filename):
+    return send_from_directory(_flasgger_static_dir(), filename, max_age=86400)
+
+
+def init_apidocs(app: Flask):
+    """
+    Register Swagger UI and the spec endpoint
+    """
+    app.register_blueprint(apidocs_bp)
+
+
+if __name__ == '__main__':
+    import sys
+    from main import create_app
+
+    output = sys.argv[1] if len(sys.argv) > 1 else apispec_path()
+    built = build_apispec(create_app(), output)
+    print(f'Wrote {output} ({len(built.get("paths", {}))} paths)')
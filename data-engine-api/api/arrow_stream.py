@@ -0,0 +1,262 @@
+"""
+Apache Arrow IPC stream encoding for query results
+Used by execute_sql when the client sends `Accept: application/vnd.apache.arrow.stream`.
+pyarrow is optional; without it the endpoint keeps answering with JSON.
+
+Column types are inferred from the first batch and widened (int64 -> float64 or decimal128 ->
+string) when a later batch holds values that do not fit, e.g. a SQLite NUMERIC column whose
+first rows are whole numbers. Decimals keep every digit: decimal128 when they share one scale,
+text otherwise, as in the JSON response. A stream cannot change its schema, so a widened schema starts a new stream in
+the same body: readers should read streams until the body ends (arrow JS
+RecordBatchReader.readAll, or pyarrow open_stream again on the same source).
+"""
+import datetime
+import decimal
+from .lazy_import import lazy_import
+
+# Imported on first use; None when pyarrow is not installed
+pa = lazy_import('pyarrow')
+
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# Rows per record batch
+ARROW_BATCH_ROWS = 8192
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+# Precision of decimal columns; values only decide the scale
+DECIMAL_PRECISION = 38
+# Digits of the largest int64, which a decimal column widened from int64 must still hold
+INT64_DIGITS = 19
+
+# String columns whose distinct/total ratio in the first batch is below this are dictionary-encoded
+DICTIONARY_RATIO = 0.5
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def wants_arrow(request) -> bool:
+    """
+    True when the client prefers Arrow over JSON and pyarrow is installed
+    """
+    if pa is None:
+        return False
+    accepted = request.accept_mimetypes
+    return accepted[ARROW_STREAM_MIMETYPE] > 0 and accepted[ARROW_STREAM_MIMETYPE] >= accepted['application/json']
+
+
+def _decimal_scale(values, scale=None):
+    """
+    Scale shared by the decimals among values (ints fit any scale), or None when they differ,
+    are not finite or have too many digits for decimal128
+    """
+    scales = {scale} if scale is not None else set()
+    for value in values:
+        if isinstance(value, decimal.Decimal):
+            if not value.is_finite():
+                return None
+            scales.add(max(-value.as_tuple().exponent, 0))
+    if len(scales) > 1:
+        return None
+    scale = scales.pop() if scales else 0
+    limit = 10 ** (DECIMAL_PRECISION - scale)
+    if any(abs(value) >= limit for value in values if value is not None):
+        return None
+    return scale
+
+
+def _infer_column(values):
+    """
+    Choose (arrow_type, convert) for a column from the first batch of values
+    convert maps a Python value to something pyarrow accepts for that type
+    """
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds:
+        return pa.string(), str
+    if kinds == {bool}:
+        return pa.bool_(), None
+    if kinds <= {int}:
+        if all(INT64_MIN <= value <= INT64_MAX for value in values if value is not None):
+            return pa.int64(), None
+        # Beyond int64 (e.g. MySQL BIGINT UNSIGNED): text keeps every digit
+        return pa.string(), str
+    if kinds <= {int, float}:
+        return pa.float64(), float
+    if kinds <= {int, decimal.Decimal}:
+        scale = _decimal_scale(values)
+        if scale is not None:
+            return pa.decimal128(DECIMAL_PRECISION, scale), None
+        return pa.string(), str
+    if kinds == {datetime.datetime}:
+        aware = any(value.tzinfo is not None for value in values if value is not None)
+        if aware:
+            return pa.timestamp('us', tz='UTC'), lambda value: value.astimezone(datetime.timezone.utc)
+        return pa.timestamp('us'), None
+    if kinds == {datetime.date}:
+        return pa.date32(), None
+    if kinds == {datetime.time}:
+        return pa.time64('us'), None
+    if kinds <= {bytes, bytearray, memoryview}:
+        return pa.binary(), bytes
+    if kinds == {str}:
+        non_null = [value for value in values if value is not None]
+        if len(set(non_null)) <= len(non_null) * DICTIONARY_RATIO:
+            return pa.dictionary(pa.int32(), pa.string()), None
+        return pa.string(), None
+    # Mixed or driver-specific types (UUID, JSON, intervals...) travel as text, as in the JSON response
+    return pa.string(), str
+
+
+def infer_schema(columns, sample_rows):
+    """
+    Arrow schema plus per-column value converters inferred from a sample of rows
+    """
+    fields = []
+    converters = []
+    for index, name in enumerate(columns):
+        arrow_type, convert = _infer_column([row[index] for row in sample_rows])
+        fields.append(pa.field(str(name), arrow_type))
+        converters.append(convert)
+    return pa.schema(fields), converters
+
+
+def _fits(field, convert, values) -> bool:
+    """
+    Whether a column of values can be stored as the field's type without loss
+    """
+    arrow_type = field.type
+    if pa.types.is_string(arrow_type) and convert is str:
+        return True
+    kinds = {type(value) for value in values if value is not None}
+    if not kinds:
+        return True
+    if pa.types.is_boolean(arrow_type):
+        return kinds == {bool}
+    if pa.types.is_int64(arrow_type):
+        # pyarrow truncates floats silently when building an int64 array
+        return kinds <= {int} and all(INT64_MIN <= value <= INT64_MAX for value in values if value is not None)
+    if pa.types.is_float64(arrow_type):
+        # Decimals would be rounded
+        return kinds <= {int, float}
+    if pa.types.is_decimal(arrow_type):
+        return kinds <= {int, decimal.Decimal} and _decimal_scale(values, arrow_type.scale) is not None
+    if pa.types.is_timestamp(arrow_type):
+        return kinds == {datetime.datetime}
+    if pa.types.is_date32(arrow_type):
+        return kinds == {datetime.date}
+    if pa.types.is_time64(arrow_type):
+        return kinds == {datetime.time}
+    if pa.types.is_binary(arrow_type):
+        return kinds <= {bytes, bytearray, memoryview}
+    return kinds == {str}
+
+
+def fit_schema(schema, converters, rows):
+    """
+    Schema and converters able to hold rows as well as everything before them
+    Columns whose new values do not fit are widened: int64 to float64 for floats or to
+    decimal128 for decimals of one scale, anything else to text. Returns the inputs themselves when every column fits.
+    """
+    fields = list(schema)
+    converters = list(converters)
+    widened = False
+    for index, field in enumerate(fields):
+        values = [row[index] for row in rows]
+        if _fits(field, converters[index], values):
+            continue
+        kinds = {type(value) for value in values if value is not None}
+        in_range = all(INT64_MIN <= value <= INT64_MAX for value in values if type(value) is int)
+        scale = _decimal_scale(values) if pa.types.is_int64(field.type) and kinds <= {int, decimal.Decimal} else None
+        if pa.types.is_int64(field.type) and kinds <= {int, float} and in_range:
+            fields[index], converters[index] = pa.field(field.name, pa.float64()), float
+        elif scale is not None and scale <= DECIMAL_PRECISION - INT64_DIGITS:
+            fields[index], converters[index] = pa.field(field.name, pa.decimal128(DECIMAL_PRECISION, scale)), None
+        else:
+            fields[index], converters[index] = pa.field(field.name, pa.string()), str
+        widened = True
+    if not widened:
+        return schema, converters
+    return pa.schema(fields), converters
+
+
+def table_from_batches(batches, schema):
+    """
+    One table from record batches built while the schema was widened; earlier batches are cast up
+    """
+    tables = [
+        pa.Table.from_batches([batch]) if batch.schema.equals(schema) else pa.Table.from_batches([batch]).cast(schema)
+        for batch in batches
+    ]
+    return pa.concat_tables(tables) if tables else schema.empty_table()
+
+
+def build_record_batch(schema, converters, rows):
+    arrays = []
+    for index, field in enumerate(schema):
+        convert = converters[index]
+        column = [row[index] for row in rows]
+        if convert is not None:
+            column = [None if value is None else convert(value) for value in column]
+        if pa.types.is_dictionary(field.type):
+            arrays.append(pa.array(column, type=pa.string()).dictionary_encode())
+        else:
+            arrays.append(pa.array(column, type=field.type))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class ChunkSink:
+    """
+    Minimal writable file object; the IPC writer appends to it and the generator drains it
+    after every batch, so memory stays bounded by one batch
+    """
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_arrow_stream(columns, first_rows, fetch_more):
+    """
+    Yield an Arrow IPC stream as bytes chunks, one record batch at a time
+    first_rows: rows already fetched (used to infer the schema)
+    fetch_more: callable returning the next list of rows, empty when exhausted
+    """
+    schema, converters = infer_schema(columns, first_rows)
+
+    sink = ChunkSink()
+    # Stream format allows each batch to carry its own (replacement) dictionary
+    writer = pa.ipc.new_stream(sink, schema)
+
+    yield sink.drain()
+    rows = first_rows
+    while rows:
+        widened, converters = fit_schema(schema, converters, rows)
+        if widened is not schema:
+            # End this stream and continue in a new one with the wider schema
+            schema = widened
+            writer.close()
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(build_record_batch(schema, converters, rows))
+        yield sink.drain()
+        rows = fetch_more()
+    writer.close()
+    yield sink.drain()
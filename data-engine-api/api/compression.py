@@ -0,0 +1,241 @@
+"""
+Negotiated response compression (zstd, brotli, gzip)
+Buffered responses are compressed when larger than a size threshold; streamed responses
+(Arrow result streams, large JSON query results) are compressed chunk by chunk and flushed
+after every chunk. File responses (send_file, e.g. the prebuilt apispec.json) are read into
+memory and compressed like buffered ones when they are small enough. A compressed body is a
+different representation, so a strong ETag is made weak; conditional requests still match it.
+zstd and brotli are optional dependencies; gzip is always available.
+
+Configuration (environment variables):
+  COMPRESSION_ENABLED      on/off switch (default: true)
+  COMPRESSION_MIN_SIZE     minimum body size in bytes for buffered responses (default: 1024)
+  COMPRESSION_MAX_FILE_SIZE  largest file response read into memory to compress (default: 8 MiB)
+  COMPRESSION_ALGORITHMS   server preference order (default: zstd,br,gzip)
+  COMPRESSION_LEVEL_ZSTD / COMPRESSION_LEVEL_BR / COMPRESSION_LEVEL_GZIP
+                           compression levels (defaults: 3 / 5 / 6)
+  COMPRESSION_CPU_BUDGET   share of one core compression may use on average (default: 0.5);
+                           above it new responses fall back to the fastest level
+"""
+import os
+import threading
+import time
+import zlib
+from flask import Flask, request
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+COMPRESSIBLE_MIMETYPES = (
+    'application/json',
+    'application/javascript',
+    'application/vnd.apache.arrow.stream',
+    'application/xml',
+    'image/svg+xml',
+)
+
+DEFAULT_LEVELS = {'zstd': 3, 'br': 5, 'gzip': 6}
+FASTEST_LEVELS = {'zstd': 1, 'br': 0, 'gzip': 1}
+
+
+def available_algorithms() -> list:
+    algorithms = []
+    if zstandard is not None:
+        algorithms.append('zstd')
+    if brotli is not None:
+        algorithms.append('br')
+    algorithms.append('gzip')
+    return algorithms
+
+
+class CpuBudget:
+    """
+    Exponentially decaying account of CPU seconds spent compressing
+    The spent total decays with a one-second half-life, so it approximates cores in use
+    """
+
+    HALF_LIFE = 1.0
+
+    def __init__(self, cores: float):
+        self.cores = cores
+        self.spent = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _decay(self, now):
+        self.spent *= 0.5 ** ((now - self.updated) / self.HALF_LIFE)
+        self.updated = now
+
+    def charge(self, seconds: float):
+        with self.lock:
+            self._decay(time.monotonic())
+            self.spent += seconds
+
+    def exceeded(self) -> bool:
+        with self.lock:
+            self._decay(time.monotonic())
+            # A steady load of c cores converges to c * HALF_LIFE / ln 2 decayed seconds
+            return self.spent > self.cores * self.HALF_LIFE / 0.6931
+
+
+class _Encoder:
+    """
+    Incremental encoder with a flush after every chunk so streamed data reaches the client promptly
+    """
+
+    def __init__(self, algorithm: str, level: int):
+        self.algorithm = algorithm
+        if algorithm == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        elif algorithm == 'br':
+            self._obj = brotli.Compressor(quality=level)
+        else:
+            # wbits 31 = gzip container
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.algorithm == 'zstd':
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if self.algorithm == 'br':
+            return self._obj.process(data) + self._obj.flush()
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.algorithm == 'zstd':
+            return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        if self.algorithm == 'br':
+            return self._obj.finish()
+        return self._obj.flush(zlib.Z_FINISH)
+
+
+def compress_bytes(algorithm: str, level: int, data: bytes) -> bytes:
+    if algorithm == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if algorithm == 'br':
+        return brotli.compress(data, quality=level)
+    return zlib.compress(data, level, wbits=31)
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def init_compression(app: Flask):
+    """
+    Register the compression after_request hook on the app
+    """
+    if not _env_flag('COMPRESSION_ENABLED', True):
+        return
+
+    min_size = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+    max_file_size = int(os.getenv('COMPRESSION_MAX_FILE_SIZE', str(8 * 1024 * 1024)))
+    supported = available_algorithms()
+    preference = [
+        name.strip() for name in os.getenv('COMPRESSION_ALGORITHMS', 'zstd,br,gzip').split(',')
+        if name.strip() in supported
+    ]
+    levels = {
+        name: int(os.getenv(f'COMPRESSION_LEVEL_{name.upper()}', str(DEFAULT_LEVELS[name])))
+        for name in DEFAULT_LEVELS
+    }
+    budget = CpuBudget(float(os.getenv('COMPRESSION_CPU_BUDGET', '0.5')))
+
+    def choose_algorithm():
+        accepted = request.accept_encodings
+        best = None
+        for name in preference:
+            quality = accepted[name]
+            if quality > 0 and (best is None or quality > best[1]):
+                best = (name, quality)
+        return best[0] if best else None
+
+    def stream_compressed(iterable, encoder):
+        try:
+            for chunk in iterable:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                if not chunk:
+                    continue
+                started = time.process_time()
+                data = encoder.compress(chunk)
+                budget.charge(time.process_time() - started)
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            close = getattr(iterable, 'close', None)
+            if close is not None:
+                close()
+
+    def weaken_etag(response):
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+    @app.after_request
+    def compress_response(response):
+        mimetype = response.mimetype or ''
+        compressible = mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES
+        if response.status_code == 304 and compressible and choose_algorithm() is not None:
+            # Same validator as the compressed 200 response would carry
+            weaken_etag(response)
+        if (
+            response.status_code < 200
+            or response.status_code in (204, 206, 304)
+            or request.method == 'HEAD'
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+        if not compressible:
+            return response
+        if response.direct_passthrough and not (
+            response.content_length is not None and min_size <= response.content_length <= max_file_size
+        ):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        algorithm = choose_algorithm()
+        if algorithm is None:
+            return response
+        level = FASTEST_LEVELS[algorithm] if budget.exceeded() else levels[algorithm]
+
+        if response.direct_passthrough:
+            # A file wrapper: read it so the body can be compressed as a whole
+            body = response.response
+            try:
+                data = b''.join(body)
+            finally:
+                close = getattr(body, 'close', None)
+                if close is not None:
+                    close()
+            response.direct_passthrough = False
+            response.set_data(data)
+
+        if response.is_streamed:
+            response.response = stream_compressed(response.response, _Encoder(algorithm, level))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            started = time.process_time()
+            compressed = compress_bytes(algorithm, level, data)
+            budget.charge(time.process_time() - started)
+            if len(compressed) >= len(data):
+                return response
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = algorithm
+        weaken_etag(response)
+        return response
@@ -0,0 +1,158 @@
+"""
+Five-field cron expressions (minute hour day-of-month month day-of-week)
+Fields accept `*`, numbers, ranges `a-b`, lists `a,b` and steps `*/n` or `a-b/n`; months and
+weekdays also accept English abbreviations (JAN, MON), and Sunday is 0 or 7. As in Vixie
+cron, when both day-of-month and day-of-week are restricted a day matching either runs.
+Shortcuts: @yearly, @monthly, @weekly, @daily, @hourly. Times are evaluated in the schedule's
+time zone and returned as naive UTC.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+SHORTCUTS = {
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+    '@monthly': '0 0 1 * *',
+    '@weekly': '0 0 * * 0',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+_MONTHS = {name: i + 1 for i, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])}
+_WEEKDAYS = {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])}
+
+# (name, low, high, aliases)
+_FIELDS = (
+    ('分钟', 0, 59, {}),
+    ('小时', 0, 23, {}),
+    ('日期', 1, 31, {}),
+    ('月份', 1, 12, _MONTHS),
+    ('星期', 0, 7, _WEEKDAYS),
+)
+
+# Searching further than this without a match means the expression never fires (e.g. 30 Feb)
+SEARCH_YEARS = 5
+
+
+def _parse_value(text: str, low: int, high: int, aliases: dict, name: str) -> int:
+    value = aliases.get(text.lower())
+    if value is None:
+        if not text.isdigit():
+            raise ValueError(f'cron 表达式的{name}字段无效: {text}')
+        value = int(text)
+    if not low <= value <= high:
+        raise ValueError(f'cron 表达式的{name}超出范围 {low}-{high}: {text}')
+    return value
+
+
+def _parse_field(text: str, low: int, high: int, aliases: dict, name: str) -> frozenset:
+    values = set()
+    for part in text.split(','):
+        if not part:
+            raise ValueError(f'cron 表达式的{name}字段无效: {text}')
+        base, _, step_text = part.partition('/')
+        step = 1
+        if step_text:
+            if not step_text.isdigit() or int(step_text) == 0:
+                raise ValueError(f'cron 表达式的{name}步长无效: {part}')
+            step = int(step_text)
+        if base == '*':
+            start, end = low, high
+        elif '-' in base:
+            start_text, end_text = base.split('-', 1)
+            start = _parse_value(start_text, low, high, aliases, name)
+            end = _parse_value(end_text, low, high, aliases, name)
+            if start > end:
+                raise ValueError(f'cron 表达式的{name}范围无效: {part}')
+        else:
+            start = _parse_value(base, low, high, aliases, name)
+            # `5/15` means every 15 starting at 5
+            end = high if step_text else start
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """
+    Parsed cron expression; raises ValueError for invalid expressions
+    """
+
+    def __init__(self, expression: str):
+        self.expression = (expression or '').strip()
+        fields = SHORTCUTS.get(self.expression.lower(), self.expression).split()
+        if len(fields) != 5:
+            raise ValueError('cron 表达式必须包含 5 个字段：分 时 日 月 星期')
+        parsed = [_parse_field(text, low, high, aliases, name)
+                  for text, (name, low, high, aliases) in zip(fields, _FIELDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # Sunday may be written as 7
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.day_restricted = fields[2] != '*'
+        self.weekday_restricted = fields[4] != '*'
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_match = moment.day in self.days
+        weekday_match = (moment.isoweekday() % 7) in self.weekdays
+        if self.day_restricted and self.weekday_restricted:
+            return day_match or weekday_match
+        return day_match and weekday_match
+
+    def next_local(self, after: datetime) -> Optional[datetime]:
+        """
+        First matching wall-clock time strictly after `after` (naive local time)
+        """
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * SEARCH_YEARS)
+        while moment <= limit:
+            if moment.month not in self.months:
+                year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+                continue
+            if moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+                continue
+            return moment
+        return None
+
+    def next_run(self, after: datetime, tz: str = 'UTC') -> Optional[datetime]:
+        """
+        Next run strictly after `after` (naive UTC), as naive UTC; None if it never fires
+        """
+        zone = get_zone(tz)
+        local = after.replace(tzinfo=timezone.utc).astimezone(zone).replace(tzinfo=None)
+        while True:
+            local = self.next_local(local)
+            if local is None:
+                return None
+            moment = local.replace(tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+            # Wall-clock times skipped by a DST change map back before `after`
+            if moment > after:
+                return moment
+
+    def upcoming(self, after: datetime, tz: str = 'UTC', count: int = 5) -> List[datetime]:
+        runs = []
+        while len(runs) < count:
+            after = self.next_run(after, tz)
+            if after is None:
+                break
+            runs.append(after)
+        return runs
+
+
+def get_zone(name: str) -> ZoneInfo:
+    """
+    IANA time zone; raises ValueError for unknown names
+    """
+    try:
+        return ZoneInfo(name or 'UTC')
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f'未知的时区: {name}')
@@ -1,15 +1,31 @@
 """
 Database API endpoints for managing database connections
 """
+import math
 import uuid
 import os
 import sqlite3
+from contextlib import ExitStack
 from pathlib import Path
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 from models import db
 from models.database_connection import DatabaseConnection
+from models.table_profile import TableProfile
+from models.metric import Metric, bump_library_revision
+from models.schedule import ProjectSchedule
+from models.incremental_load import IncrementalLoad
+from .arrow_stream import ARROW_STREAM_MIMETYPE, ARROW_BATCH_ROWS, iter_arrow_stream, wants_arrow
+from . import result_store
+from .result_query import ResultQueryError, apply_view
+from .federated import FederatedQueryError, FederatedTimeoutError, plan_federated_query, execute_federated_plan
+from .schema_diff import DdlWriter, default_schema, diff_catalogs, fetch_catalogs
+from .preview import DEFAULT_PREVIEW_ROWS, cache_ttl, preview_cache, preview_max_rows, preview_timeout, sample_table
+from .timeouts import is_timeout_error, parse_timeout, resolve_statement_timeout, statement_timeout
+from .profiling import is_fresh, is_in_progress, submit_profile
+from .scheduler import AdmissionRejected, acquire_all, admitted, query_scheduler, rejection_response, \
+    request_priority, request_user, scheduler_enabled
 
 database_bp = Blueprint('database', __name__, url_prefix='/database')
 
@@ -81,6 +97,226 @@ def build_connection_string(db_type: str, host: str = None, port: int = None,
         raise ValueError(f'Unsupported database type: {db_type}')
 
 
+def connection_url(connection: DatabaseConnection, database: str = None) -> str:
+    """
+    Connection string for a saved connection, optionally targeting another database
+    """
+    return build_connection_string(
+        db_type=connection.db_type,
+        host=connection.host,
+        port=connection.port,
+        database=database or connection.database,
+        username=connection.username,
+        password=connection.password,
+        connection_string=connection.connection_string
+    )
+
+
+def create_url_engine(db_type: str, conn_str: str, connect_timeout: int = 10):
+    """
+    Create an engine the same way the query endpoints do
+    """
+    return create_engine(
+        conn_str,
+        connect_args={'connect_timeout': connect_timeout} if db_type != 'sqlite' else {},
+        pool_pre_ping=True,
+        echo=False
+    )
+
+
+def create_connection_engine(connection: DatabaseConnection, database: str = None, connect_timeout: int = 10):
+    """
+    Create an engine for a saved connection; raises ValueError for invalid configuration
+    """
+    return create_url_engine(connection.db_type, connection_url(connection, database), connect_timeout)
+
+
+def is_result_set_query(sql_query: str) -> bool:
+    """
+    Whether a statement returns a result set (SELECT, SHOW, DESCRIBE, etc.)
+    """
+    sql_upper = sql_query.upper().strip()
+    return (
+        sql_upper.startswith('SELECT') or 
+        sql_upper.startswith('WITH') or
+        sql_upper.startswith('SHOW') or  # SHOW TABLES, SHOW DATABASES, etc.
+        sql_upper.startswith('DESCRIBE') or
+        sql_upper.startswith('DESC') or
+        sql_upper.startswith('EXPLAIN') or
+        sql_upper.startswith('PRAGMA')  # SQLite pragma statements
+    )
+
+
+def fetch_table_columns(conn, db_type: str, database: str, schema: str, table: str) -> list:
+    """
+    Column list of a table as returned by get_table_structure (field, type, nullable, default, comment, key, extra)
+    """
+    columns = []
+    
+    if db_type == 'mysql':
+        if database:
+            conn.execute(text(f'USE `{database}`'))
+        query = text(f"""
+            SELECT 
+                COLUMN_NAME as column_name,
+                DATA_TYPE as data_type,
+                COLUMN_TYPE as column_type,
+                IS_NULLABLE as is_nullable,
+                COLUMN_DEFAULT as column_default,
+                COLUMN_COMMENT as column_comment,
+                COLUMN_KEY as column_key,
+                EXTRA as extra
+            FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = :database
+            AND TABLE_NAME = :table
+            ORDER BY ORDINAL_POSITION
+        """)
+        result = conn.execute(query, {'database': database, 'table': table})
+        for row in result.fetchall():
+            columns.append({
+                'field': row[0],
+                'type': row[2] or row[1],  # Use COLUMN_TYPE if available, else DATA_TYPE
+                'nullable': row[3] == 'YES',
+                'default': row[4],
+                'comment': row[5] or '',
+                'key': row[6] or '',
+                'extra': row[7] or ''
+            })
+    elif db_type == 'postgresql':
+        schema_name = schema or 'public'
+        query = text("""
+            SELECT 
+                column_name,
+                data_type,
+                udt_name,
+                is_nullable,
+                column_default,
+                COALESCE(col_description(c.oid, a.attnum), '') as column_comment
+            FROM information_schema.columns c
+            LEFT JOIN pg_class cls ON cls.relname = c.table_name
+            LEFT JOIN pg_namespace nsp ON nsp.oid = cls.relnamespace AND nsp.nspname = c.table_schema
+            LEFT JOIN pg_attribute a ON a.attrelid = cls.oid AND a.attname = c.column_name
+            WHERE table_schema = :schema
+            AND table_name = :table
+            ORDER BY ordinal_position
+        """)
+        result = conn.execute(query, {'schema': schema_name, 'table': table})
+        for row in result.fetchall():
+            columns.append({
+                'field': row[0],
+                'type': row[2] or row[1],  # Use udt_name if available, else data_type
+                'nullable': row[3] == 'YES',
+                'default': row[4],
+                'comment': row[5] or '',
+                'key': '',
+                'extra': ''
+            })
+    elif db_type == 'sqlite':
+        # SQLite doesn't have a standard way to get column comments
+        result = conn.execute(text(f"PRAGMA table_info(`{table}`)"))
+        for row in result.fetchall():
+            columns.append({
+                'field': row[1],
+                'type': row[2] or '',
+                'nullable': not row[3],  # notnull is 0 for nullable
+                'default': row[4],
+                'comment': '',  # SQLite doesn't support comments
+                'key': 'PRI' if row[5] else '',
+                'extra': ''
+            })
+    else:
+        raise ValueError(f'不支持的数据库类型: {db_type}')
+    return columns
+
+
+def fetch_table_stats(conn, db_type: str, database: str, schema: str) -> dict:
+    """
+    Estimated rows and sizes (bytes) per table from catalog statistics, without counting rows
+    Returns {table: {'estimatedRows', 'dataSize', 'indexSize', 'totalSize'}}; unknown values are None
+    """
+    stats = {}
+    if db_type == 'postgresql':
+        result = conn.execute(text("""
+            SELECT c.relname, c.reltuples::bigint, pg_table_size(c.oid), pg_indexes_size(c.oid),
+                   pg_total_relation_size(c.oid)
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = :schema AND c.relkind IN ('r', 'p')
+        """), {'schema': schema or 'public'})
+        for name, rows, data_size, index_size, total_size in result.fetchall():
+            stats[name] = {
+                # reltuples is -1 (or 0) until the table has been vacuumed or analyzed
+                'estimatedRows': rows if rows is not None and rows >= 0 else None,
+                'dataSize': data_size,
+                'indexSize': index_size,
+                'totalSize': total_size,
+            }
+    elif db_type == 'mysql':
+        result = conn.execute(text("""
+            SELECT TABLE_NAME, TABLE_ROWS, DATA_LENGTH, INDEX_LENGTH
+            FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = :database AND TABLE_TYPE = 'BASE TABLE'
+        """), {'database': database})
+        for name, rows, data_size, index_size in result.fetchall():
+            stats[name] = {
+                'estimatedRows': rows,
+                'dataSize': data_size,
+                'indexSize': index_size,
+                'totalSize': (data_size or 0) + (index_size or 0) if data_size is not None else None,
+            }
+    elif db_type == 'sqlite':
+        objects = conn.execute(text(
+            "SELECT type, name, tbl_name, sql FROM sqlite_master WHERE type IN ('table', 'index')"
+        )).fetchall()
+        tables = [(name, sql) for kind, name, _, sql in objects if kind == 'table' and not name.startswith('sqlite_')]
+        owners = {name: (kind, table) for kind, name, table, _ in objects}
+        for name, _ in tables:
+            stats[name] = {'estimatedRows': None, 'dataSize': None, 'indexSize': None, 'totalSize': None}
+
+        # Page usage per b-tree; dbstat is only present when SQLite was built with it.
+        # Joining dbstat to sqlite_master rescans the virtual table, so owners are mapped here
+        try:
+            for name, size in conn.execute(text('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')).fetchall():
+                kind, table = owners.get(name, (None, None))
+                if table in stats:
+                    key = 'dataSize' if kind == 'table' else 'indexSize'
+                    stats[table][key] = (stats[table][key] or 0) + size
+            for entry in stats.values():
+                if entry['dataSize'] is not None:
+                    entry['indexSize'] = entry['indexSize'] or 0
+                    entry['totalSize'] = entry['dataSize'] + entry['indexSize']
+        except SQLAlchemyError:
+            conn.rollback()
+
+        # Row counts from ANALYZE when available, else the rowid span (an upper bound)
+        try:
+            analyzed = dict(conn.execute(text(
+                "SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl"
+            )).fetchall())
+        except SQLAlchemyError:
+            conn.rollback()
+            analyzed = {}
+        rowid_tables = []
+        for name, sql in tables:
+            if name in analyzed:
+                stats[name]['estimatedRows'] = analyzed[name]
+            elif 'WITHOUT ROWID' not in (sql or '').upper():
+                rowid_tables.append(name)
+        # Stay below SQLite's compound SELECT limit
+        for start in range(0, len(rowid_tables), 400):
+            parts = [
+                'SELECT {literal}, MAX(rowid) - MIN(rowid) + 1 FROM "{name}"'.format(
+                    literal="'" + name.replace("'", "''") + "'", name=name.replace('"', '""')
+                )
+                for name in rowid_tables[start:start + 400]
+            ]
+            for name, rows in conn.execute(text(' UNION ALL '.join(parts))).fetchall():
+                stats[name]['estimatedRows'] = rows or 0
+    else:
+        raise ValueError(f'不支持的数据库类型: {db_type}')
+    return stats
+
+
 def test_database_connection(db_type: str, host: str = None, port: int = None,
                             database: str = None, username: str = None,
                             password: str = None, connection_string: str = None) -> tuple[bool, str]:
@@ -216,6 +452,89 @@ def test_database_connection(db_type: str, host: str = None, port: int = None,
         return False, f'连接测试失败: {error_msg}'
 
 
+def stream_arrow_result(engine, sql_query: str, start_time: float, db_type: str = None, timeout: float = None):
+    """
+    Execute a result-set query and stream it as Arrow IPC record batches
+    Rows are pulled from a server-side cursor batch by batch; the connection and the
+    statement timeout stay in place until the response body has been fully sent.
+    """
+    import time
+
+    conn = engine.connect()
+    limits = ExitStack()
+    try:
+        limits.enter_context(statement_timeout(conn, db_type, timeout))
+        result = conn.execution_options(stream_results=True).execute(text(sql_query))
+        if not result.returns_rows:
+            # Misclassified DDL/DML: same response as the JSON path
+            conn.commit()
+            affected_rows = result.rowcount if hasattr(result, 'rowcount') else 0
+            execution_time = time.time() - start_time
+            limits.close()
+            conn.close()
+            engine.dispose()
+            return jsonify({
+                'success': True,
+                'columns': [],
+                'rows': [],
+                'rowCount': affected_rows,
+                'executionTime': round(execution_time, 3),
+                'message': f'执行成功，影响 {affected_rows} 行'
+            }), 200
+        columns = list(result.keys())
+        first_rows = result.fetchmany(ARROW_BATCH_ROWS)
+    except Exception:
+        limits.close()
+        conn.close()
+        engine.dispose()
+        raise
+
+    def generate():
+        try:
+            yield from iter_arrow_stream(columns, first_rows, lambda: result.fetchmany(ARROW_BATCH_ROWS))
+        finally:
+            result.close()
+            limits.close()
+            conn.close()
+            engine.dispose()
+
+    response = Response(generate(), mimetype=ARROW_STREAM_MIMETYPE)
+    # Time until the first batch was ready; the total is only known once the stream ends
+    response.headers['X-Execution-Time'] = f'{time.time() - start_time:.3f}'
+    return response
+
+
+JSON_STREAM_MIN_ROWS = 2048
+JSON_STREAM_CHUNK_ROWS = 2048
+
+
+def json_rows_response(response_data: dict):
+    """
+    JSON response for a query result
+    Large row sets are encoded in chunks of rows as a streamed body, so the encoded JSON is
+    never held whole in memory and response compression works chunk by chunk as well.
+    """
+    rows = response_data['rows']
+    if len(rows) < JSON_STREAM_MIN_ROWS:
+        return jsonify(response_data)
+
+    dumps = current_app.json.dumps
+    head = {key: value for key, value in response_data.items() if key != 'rows'}
+
+    def generate():
+        # Same document as jsonify, with "rows" moved to the end
+        yield dumps(head)[:-1] + ', "rows": ['
+        for start in range(0, len(rows), JSON_STREAM_CHUNK_ROWS):
+            chunk = dumps(rows[start:start + JSON_STREAM_CHUNK_ROWS])[1:-1]
+            yield chunk if start == 0 else ', ' + chunk
+        yield ']}'
+
+    response = Response(generate(), mimetype=current_app.json.mimetype)
+    # The rows are already in memory; the body does not need the connection slot
+    response.holds_connection = False
+    return response
+
+
 @database_bp.route('/connections', methods=['GET'])
 def get_connections():
     """
@@ -338,6 +657,10 @@ def create_connection():
               type: string
               description: Connection description
               example: "生产环境MySQL数据库"
+            statementTimeout:
+              type: integer
+              description: Statement timeout in seconds for SQL executed on this connection (default STATEMENT_TIMEOUT)
+              example: 120
     responses:
       201:
         description: Database connection created successfully
@@ -388,6 +711,11 @@ def create_connection():
         if not name or not db_type:
             return jsonify({'error': '连接名称和数据库类型不能为空'}), 400
         
+        try:
+            statement_timeout_seconds = parse_timeout(data.get('statementTimeout'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Create new database connection
         connection_id = f"db_{uuid.uuid4()}"
         new_connection = DatabaseConnection(
@@ -400,7 +728,8 @@ def create_connection():
             username=data.get('username'),
             password=data.get('password'),  # TODO: 加密存储密码
             connection_string=data.get('connectionString'),
-            description=data.get('description')
+            description=data.get('description'),
+            statement_timeout=int(math.ceil(statement_timeout_seconds)) if statement_timeout_seconds else None
         )
         
         db.session.add(new_connection)
@@ -456,6 +785,9 @@ def update_connection(connection_id):
               type: string
             description:
               type: string
+            statementTimeout:
+              type: integer
+              description: Statement timeout in seconds; null restores the default
     responses:
       200:
         description: Connection updated successfully
@@ -502,6 +834,12 @@ def update_connection(connection_id):
             connection.connection_string = data.get('connectionString')
         if 'description' in data:
             connection.description = data.get('description')
+        if 'statementTimeout' in data:
+            try:
+                seconds = parse_timeout(data.get('statementTimeout'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            connection.statement_timeout = int(math.ceil(seconds)) if seconds else None
         
         db.session.commit()
         
@@ -554,6 +892,14 @@ def delete_connection(connection_id):
         if not connection:
             return jsonify({'error': '数据库连接不存在'}), 404
         
+        TableProfile.query.filter_by(connection_id=connection_id).delete(synchronize_session=False)
+        if Metric.query.filter_by(connection_id=connection_id).update({'connection_id': None}, synchronize_session=False):
+            bump_library_revision()
+        ProjectSchedule.query.filter_by(connection_id=connection_id).update(
+            {'connection_id': None, 'enabled': False, 'next_run_at': None}, synchronize_session=False
+        )
+        for column in ('source_connection_id', 'target_connection_id'):
+            IncrementalLoad.query.filter_by(**{column: connection_id}).update({column: None}, synchronize_session=False)
         db.session.delete(connection)
         db.session.commit()
         
@@ -684,6 +1030,7 @@ def test_connection():
 
 
 @database_bp.route('/connections/<connection_id>/execute', methods=['POST'])
+@admitted('interactive')
 def execute_sql(connection_id):
     """
     Execute SQL query on a database connection
@@ -691,11 +1038,16 @@ def execute_sql(connection_id):
     tags:
       - Database
     summary: Execute SQL query
-    description: Executes a SQL query on the specified database connection
+    description: |
+      Executes a SQL query on the specified database connection.
+      Send `Accept: application/vnd.apache.arrow.stream` to receive result sets as a streamed
+      Apache Arrow IPC stream (typed columns, repeated strings dictionary-encoded) instead of JSON.
+      Requires pyarrow on the server; otherwise JSON is returned.
     consumes:
       - application/json
     produces:
       - application/json
+      - application/vnd.apache.arrow.stream
     parameters:
       - in: path
         name: connection_id
@@ -715,6 +1067,16 @@ def execute_sql(connection_id):
               type: string
               description: SQL query to execute
               example: "SELECT * FROM users LIMIT 10"
+            pageSize:
+              type: integer
+              description: Return only the first pageSize rows; the full result is kept under resultId for paging
+            timeout:
+              type: number
+              description: Statement timeout in seconds for this request (overrides the connection setting)
+            priority:
+              type: string
+              enum: [interactive, batch]
+              description: Scheduling class; exports and other heavy jobs should use batch
     responses:
       200:
         description: Query executed successfully
@@ -737,6 +1099,9 @@ def execute_sql(connection_id):
               type: number
             message:
               type: string
+            resultId:
+              type: string
+              description: Present when the result was spilled to the shared result store; fetch more rows from /results/{resultId}
       400:
         description: Bad request
         schema:
@@ -751,6 +1116,24 @@ def execute_sql(connection_id):
           properties:
             error:
               type: string
+      504:
+        description: The statement exceeded its timeout and was cancelled (errorType is "timeout")
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+            errorType:
+              type: string
+            timeout:
+              type: number
+      429:
+        description: Query queue for the connection is full or the wait for a slot timed out (see Retry-After)
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
       500:
         description: Server error
         schema:
@@ -761,6 +1144,7 @@ def execute_sql(connection_id):
     """
     import time
     
+    timeout = None
     try:
         data = request.get_json()
         
@@ -771,10 +1155,25 @@ def execute_sql(connection_id):
         if not sql_query:
             return jsonify({'error': 'SQL 查询不能为空'}), 400
         
+        page_size = data.get('pageSize')
+        if page_size is not None:
+            try:
+                page_size = int(page_size)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'pageSize 必须是正整数'}), 400
+            if page_size <= 0:
+                return jsonify({'error': 'pageSize 必须是正整数'}), 400
+        
+        try:
+            requested_timeout = parse_timeout(data.get('timeout'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Get database connection
         connection = DatabaseConnection.query.get(connection_id)
         if not connection:
             return jsonify({'error': '数据库连接不存在'}), 404
+        timeout = resolve_statement_timeout(connection.statement_timeout, requested_timeout)
         
         # Build connection string with proper error handling
         try:
@@ -817,44 +1216,73 @@ def execute_sql(connection_id):
         
         start_time = time.time()
         
+        # Determine if query returns a result set
+        returns_result_set = is_result_set_query(sql_query)
+        
+        # Columnar transport when the client asks for Arrow
+        if returns_result_set and wants_arrow(request):
+            return stream_arrow_result(engine, sql_query, start_time, connection.db_type, timeout)
+        
         # Execute query
-        with engine.connect() as conn:
-            # Determine if query returns a result set
-            sql_upper = sql_query.upper().strip()
-            # Queries that return result sets
-            returns_result_set = (
-                sql_upper.startswith('SELECT') or 
-                sql_upper.startswith('WITH') or
-                sql_upper.startswith('SHOW') or  # SHOW TABLES, SHOW DATABASES, etc.
-                sql_upper.startswith('DESCRIBE') or
-                sql_upper.startswith('DESC') or
-                sql_upper.startswith('EXPLAIN') or
-                sql_upper.startswith('PRAGMA')  # SQLite pragma statements
-            )
-            
-            if returns_result_set:
-                # For queries that return result sets (SELECT, SHOW, DESCRIBE, etc.)
-                result = conn.execute(text(sql_query))
-                
-                # Try to fetch results
-                try:
-                    rows = result.fetchall()
-                    # Get column names from result
-                    if hasattr(result, 'keys'):
-                        columns = list(result.keys())
-                    elif hasattr(result, 'columns'):
-                        columns = [col.name for col in result.columns]
-                    else:
-                        # Fallback: try to get columns from first row
-                        columns = []
-                        if rows:
-                            if hasattr(rows[0], '_fields'):
-                                columns = list(rows[0]._fields)
-                            elif hasattr(rows[0], '_asdict'):
-                                columns = list(rows[0]._asdict().keys())
-                            elif isinstance(rows[0], (list, tuple)):
-                                # For tuple/list rows, use generic column names
-                                columns = [f'column_{i+1}' for i in range(len(rows[0]))]
+        try:
+            with engine.connect() as conn, statement_timeout(conn, connection.db_type, timeout):
+                if returns_result_set:
+                    # For queries that return result sets (SELECT, SHOW, DESCRIBE, etc.)
+                    result = conn.execute(text(sql_query))
+                    
+                    # Try to fetch results
+                    try:
+                        rows = result.fetchall()
+                        # Get column names from result
+                        if hasattr(result, 'keys'):
+                            columns = list(result.keys())
+                        elif hasattr(result, 'columns'):
+                            columns = [col.name for col in result.columns]
+                        else:
+                            # Fallback: try to get columns from first row
+                            columns = []
+                            if rows:
+                                if hasattr(rows[0], '_fields'):
+                                    columns = list(rows[0]._fields)
+                                elif hasattr(rows[0], '_asdict'):
+                                    columns = list(rows[0]._asdict().keys())
+                                elif isinstance(rows[0], (list, tuple)):
+                                    # For tuple/list rows, use generic column names
+                                    columns = [f'column_{i+1}' for i in range(len(rows[0]))]
+                    except Exception as fetch_error:
+                        if is_timeout_error(fetch_error):
+                            raise
+                        # If fetch fails, it might be a DDL/DML statement that was misclassified
+                        # Try to commit and return rowcount
+                        conn.commit()
+                        execution_time = time.time() - start_time
+                        affected_rows = result.rowcount if hasattr(result, 'rowcount') else 0
+                        
+                        return jsonify({
+                            'success': True,
+                            'columns': [],
+                            'rows': [],
+                            'rowCount': affected_rows,
+                            'executionTime': round(execution_time, 3),
+                            'message': f'执行成功，影响 {affected_rows} 行'
+                        }), 200
+
+                    # Spill large results so any worker can serve further pages without re-running the query
+                    result_id = None
+                    if result_store.store_enabled() and rows and (
+                        len(rows) >= result_store.spill_min_rows()
+                        or (page_size is not None and len(rows) > page_size)
+                    ):
+                        try:
+                            result_id = result_store.spill_rows(
+                                columns, rows, {'connectionId': connection_id, 'sql': sql_query}
+                            )
+                        except Exception:
+                            # The query itself succeeded: serve the rows inline, without a resultId
+                            current_app.logger.exception('Failed to spill a result of connection %s', connection_id)
+                    total_rows = len(rows)
+                    if page_size is not None and result_id is not None:
+                        rows = rows[:page_size]
                     
                     # Convert rows to list of lists
                     rows_data = []
@@ -894,18 +1322,22 @@ def execute_sql(connection_id):
                     
                     execution_time = time.time() - start_time
                     
-                    return jsonify({
+                    response_data = {
                         'success': True,
                         'columns': columns,
                         'rows': rows_data,
-                        'rowCount': len(rows_data),
+                        'rowCount': total_rows,
                         'executionTime': round(execution_time, 3),
-                        'message': f'查询成功，返回 {len(rows_data)} 行'
-                    }), 200
-                except Exception as fetch_error:
-                    # If fetch fails, it might be a DDL/DML statement that was misclassified
-                    # Try to commit and return rowcount
+                        'message': f'查询成功，返回 {total_rows} 行'
+                    }
+                    if result_id is not None:
+                        response_data['resultId'] = result_id
+                    return json_rows_response(response_data), 200
+                else:
+                    # For non-SELECT queries (INSERT, UPDATE, DELETE, CREATE, ALTER, etc.)
+                    result = conn.execute(text(sql_query))
                     conn.commit()
+                    
                     execution_time = time.time() - start_time
                     affected_rows = result.rowcount if hasattr(result, 'rowcount') else 0
                     
@@ -917,24 +1349,20 @@ def execute_sql(connection_id):
                         'executionTime': round(execution_time, 3),
                         'message': f'执行成功，影响 {affected_rows} 行'
                     }), 200
-            else:
-                # For non-SELECT queries (INSERT, UPDATE, DELETE, CREATE, ALTER, etc.)
-                result = conn.execute(text(sql_query))
-                conn.commit()
-                
-                execution_time = time.time() - start_time
-                affected_rows = result.rowcount if hasattr(result, 'rowcount') else 0
-                
-                return jsonify({
-                    'success': True,
-                    'columns': [],
-                    'rows': [],
-                    'rowCount': affected_rows,
-                    'executionTime': round(execution_time, 3),
-                    'message': f'执行成功，影响 {affected_rows} 行'
-                }), 200
+        finally:
+            # Per-request engine: close its pooled connection right away
+            engine.dispose()
         
     except SQLAlchemyError as e:
+        if timeout and is_timeout_error(e):
+            message = f'查询超时：执行超过 {timeout:g} 秒，已取消'
+            return jsonify({
+                'success': False,
+                'errorType': 'timeout',
+                'timeout': timeout,
+                'error': message,
+                'message': message
+            }), 504
         error_msg = str(e)
         return jsonify({
             'success': False,
@@ -950,7 +1378,171 @@ def execute_sql(connection_id):
         }), 200
 
 
+@database_bp.route('/federated/execute', methods=['POST'])
+def execute_federated_sql():
+    """
+    Execute a federated query across saved connections
+    ---
+    tags:
+      - Database
+    summary: Execute federated SQL query
+    description: |
+      Joins tables from several saved connections in one query. Reference tables as
+      `<connection_name>.<schema>.<table>` (or `<connection_name>.<table>`).
+      Each table is fetched from its connection in parallel with the referenced columns and
+      single-table WHERE conditions pushed down, then the query runs locally in SQLite's dialect.
+      Unqualified column names in multi-table queries disable projection pushdown.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - sql
+          properties:
+            sql:
+              type: string
+              example: "SELECT o.id, c.name FROM shop.public.orders o JOIN crm.customers c ON c.id = o.customer_id WHERE o.total > 100"
+            pageSize:
+              type: integer
+              description: Return only the first pageSize rows; the full result is kept under resultId for paging
+    responses:
+      200:
+        description: Query executed (check success)
+        schema:
+          type: object
+          properties:
+            success:
+              type: boolean
+            columns:
+              type: array
+              items:
+                type: string
+            rows:
+              type: array
+              items:
+                type: array
+            rowCount:
+              type: integer
+            executionTime:
+              type: number
+            resultId:
+              type: string
+            sources:
+              type: array
+              description: Per-source query sent, rows fetched and connect/fetch/load timings in seconds
+              items:
+                type: object
+            loadTime:
+              type: number
+            localTime:
+              type: number
+      400:
+        description: Invalid request or query cannot be planned
+    """
+    import time
+
+    data = request.get_json(silent=True) or {}
+    sql_query = (data.get('sql') or '').strip()
+    if not sql_query:
+        return jsonify({'error': 'SQL 查询不能为空'}), 400
+    page_size = data.get('pageSize')
+    if page_size is not None:
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'pageSize 必须是正整数'}), 400
+        if page_size <= 0:
+            return jsonify({'error': 'pageSize 必须是正整数'}), 400
+
+    connections = {}
+    for connection in DatabaseConnection.query.all():
+        key = connection.name.strip().lower()
+        # Duplicate names are only an error when the query uses them
+        connections[key] = None if key in connections else connection
+    try:
+        plan = plan_federated_query(sql_query, connections)
+    except FederatedQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Admission as for single-connection queries, with a slot on every participating connection
+    tickets = []
+    if scheduler_enabled():
+        try:
+            tickets = acquire_all([source.connection.id for source in plan.sources], request_user(),
+                                  request_priority('interactive'))
+        except AdmissionRejected as e:
+            return rejection_response(e)
+
+    start_time = time.time()
+    try:
+        columns, rows, sources, load_time, local_time = execute_federated_plan(plan)
+    except FederatedTimeoutError as e:
+        message = f'查询超时：{str(e)}'
+        return jsonify({
+            'success': False,
+            'errorType': 'timeout',
+            'timeout': e.timeout,
+            'error': message,
+            'message': message,
+            'sources': [source.describe() for source in plan.sources],
+            'localSql': plan.local_sql
+        }), 504
+    except (FederatedQueryError, sqlite3.Error, SQLAlchemyError, ValueError) as e:
+        return jsonify({
+            'success': False,
+            'error': f'联邦查询失败: {str(e)}',
+            'message': f'联邦查询失败: {str(e)}',
+            'sources': [source.describe() for source in plan.sources],
+            'localSql': plan.local_sql
+        }), 200
+    finally:
+        for ticket in tickets:
+            ticket.release()
+
+    result_id = None
+    if result_store.store_enabled() and rows and (
+        len(rows) >= result_store.spill_min_rows()
+        or (page_size is not None and len(rows) > page_size)
+    ):
+        try:
+            result_id = result_store.spill_rows(columns, rows, {'federated': True, 'sql': sql_query})
+        except Exception:
+            current_app.logger.exception('Failed to spill a federated result')
+    total_rows = len(rows)
+    if page_size is not None and result_id is not None:
+        rows = rows[:page_size]
+
+    response_data = {
+        'success': True,
+        'columns': columns,
+        'rows': [
+            [value if value is None or isinstance(value, (int, float, str)) else str(value) for value in row]
+            for row in rows
+        ],
+        'rowCount': total_rows,
+        'executionTime': round(time.time() - start_time, 3),
+        'message': f'查询成功，返回 {total_rows} 行',
+        'sources': sources,
+        'loadTime': round(load_time, 3),
+        'localTime': round(local_time, 3),
+        'localSql': plan.local_sql
+    }
+    if result_id is not None:
+        response_data['resultId'] = result_id
+    response = json_rows_response(response_data)
+    if tickets:
+        response.headers['X-Queue-Wait'] = f'{max(ticket.wait_time for ticket in tickets):.3f}'
+    return response, 200
+
+
 @database_bp.route('/connections/<connection_id>/databases', methods=['GET'])
+@admitted('metadata')
 def get_databases(connection_id):
     """
     Get list of databases for a connection
@@ -1003,9 +1595,11 @@ def get_databases(connection_id):
 
 
 @database_bp.route('/connections/<connection_id>/tables', methods=['GET'])
+@admitted('metadata')
 def get_tables(connection_id):
     """
     Get list of tables for a database
+    With stats=true, estimated rows and data/index sizes from catalog statistics are included
     """
     try:
         connection = DatabaseConnection.query.get(connection_id)
@@ -1070,13 +1664,18 @@ def get_tables(connection_id):
             else:
                 return jsonify({'error': f'不支持的数据库类型: {connection.db_type}'}), 400
             
-            return jsonify({'tables': tables}), 200
+            response_data = {'tables': tables}
+            if request.args.get('stats', '').lower() in ('1', 'true', 'yes'):
+                stats = fetch_table_stats(conn, connection.db_type, database or connection.database, schema)
+                response_data['stats'] = {name: stats[name] for name in tables if name in stats}
+            return jsonify(response_data), 200
         
     except Exception as e:
         return jsonify({'error': f'获取表列表失败: {str(e)}'}), 500
 
 
 @database_bp.route('/connections/<connection_id>/table-structure', methods=['GET'])
+@admitted('metadata')
 def get_table_structure(connection_id):
     """
     Get table structure (columns, types, comments)
@@ -1117,81 +1716,10 @@ def get_table_structure(connection_id):
             return jsonify({'error': f'无法创建数据库引擎: {str(e)}'}), 500
         
         with engine.connect() as conn:
-            columns = []
-            
-            if connection.db_type == 'mysql':
-                if database:
-                    conn.execute(text(f'USE `{database}`'))
-                query = text(f"""
-                    SELECT 
-                        COLUMN_NAME as column_name,
-                        DATA_TYPE as data_type,
-                        COLUMN_TYPE as column_type,
-                        IS_NULLABLE as is_nullable,
-                        COLUMN_DEFAULT as column_default,
-                        COLUMN_COMMENT as column_comment,
-                        COLUMN_KEY as column_key,
-                        EXTRA as extra
-                    FROM INFORMATION_SCHEMA.COLUMNS
-                    WHERE TABLE_SCHEMA = :database
-                    AND TABLE_NAME = :table
-                    ORDER BY ORDINAL_POSITION
-                """)
-                result = conn.execute(query, {'database': database or connection.database, 'table': table})
-                for row in result.fetchall():
-                    columns.append({
-                        'field': row[0],
-                        'type': row[2] or row[1],  # Use COLUMN_TYPE if available, else DATA_TYPE
-                        'nullable': row[3] == 'YES',
-                        'default': row[4],
-                        'comment': row[5] or '',
-                        'key': row[6] or '',
-                        'extra': row[7] or ''
-                    })
-            elif connection.db_type == 'postgresql':
-                schema_name = schema or 'public'
-                query = text("""
-                    SELECT 
-                        column_name,
-                        data_type,
-                        udt_name,
-                        is_nullable,
-                        column_default,
-                        COALESCE(col_description(c.oid, a.attnum), '') as column_comment
-                    FROM information_schema.columns c
-                    LEFT JOIN pg_class cls ON cls.relname = c.table_name
-                    LEFT JOIN pg_namespace nsp ON nsp.oid = cls.relnamespace AND nsp.nspname = c.table_schema
-                    LEFT JOIN pg_attribute a ON a.attrelid = cls.oid AND a.attname = c.column_name
-                    WHERE table_schema = :schema
-                    AND table_name = :table
-                    ORDER BY ordinal_position
-                """)
-                result = conn.execute(query, {'schema': schema_name, 'table': table})
-                for row in result.fetchall():
-                    columns.append({
-                        'field': row[0],
-                        'type': row[2] or row[1],  # Use udt_name if available, else data_type
-                        'nullable': row[3] == 'YES',
-                        'default': row[4],
-                        'comment': row[5] or '',
-                        'key': '',
-                        'extra': ''
-                    })
-            elif connection.db_type == 'sqlite':
-                # SQLite doesn't have a standard way to get column comments
-                result = conn.execute(text(f"PRAGMA table_info(`{table}`)"))
-                for row in result.fetchall():
-                    columns.append({
-                        'field': row[1],
-                        'type': row[2] or '',
-                        'nullable': not row[3],  # notnull is 0 for nullable
-                        'default': row[4],
-                        'comment': '',  # SQLite doesn't support comments
-                        'key': 'PRI' if row[5] else '',
-                        'extra': ''
-                    })
-            else:
-                return jsonify({'error': f'不支持的数据库类型: {connection.db_type}'}), 400
+            try:
+                columns = fetch_table_columns(conn, connection.db_type, database or connection.database, schema, table)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
             return jsonify({
                 'database': database or connection.database,
@@ -1203,3 +1731,655 @@ def get_table_structure(connection_id):
     except Exception as e:
         return jsonify({'error': f'获取表结构失败: {str(e)}'}), 500
 
+
+
+@database_bp.route('/connections/<connection_id>/table-preview', methods=['GET'])
+@admitted('metadata')
+def get_table_preview(connection_id):
+    """
+    Preview rows of a table using native sampling
+    ---
+    tags:
+      - Database
+    summary: Table preview
+    description: |
+      Returns up to `limit` rows using the cheapest sampling path of the dialect
+      (PostgreSQL TABLESAMPLE SYSTEM, MySQL primary-key range probes, SQLite rowid range probes,
+      plain LIMIT for small tables), under a hard statement timeout. Previews are cached per
+      table; pass refresh=true to bypass the cache.
+    parameters:
+      - in: path
+        name: connection_id
+        type: string
+        required: true
+      - in: query
+        name: table
+        type: string
+        required: true
+      - in: query
+        name: database
+        type: string
+      - in: query
+        name: schema
+        type: string
+      - in: query
+        name: limit
+        type: integer
+        default: 100
+      - in: query
+        name: refresh
+        type: boolean
+    responses:
+      200:
+        description: columns, rows, rowCount, method, executionTime, sampledAt, cached
+      400:
+        description: Invalid parameters
+      404:
+        description: Connection not found
+      504:
+        description: Preview exceeded the statement timeout
+    """
+    try:
+        connection = DatabaseConnection.query.get(connection_id)
+        if not connection:
+            return jsonify({'error': '数据库连接不存在'}), 404
+
+        database = request.args.get('database', connection.database)
+        schema = request.args.get('schema', None)
+        table = request.args.get('table')
+        if not table:
+            return jsonify({'error': '表名不能为空'}), 400
+        try:
+            limit = int(request.args.get('limit', DEFAULT_PREVIEW_ROWS))
+        except ValueError:
+            return jsonify({'error': 'limit 必须是正整数'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'limit 必须是正整数'}), 400
+        limit = min(limit, preview_max_rows())
+
+        # updated_at in the key drops cached previews when the connection is edited
+        cache_key = (connection.id, str(connection.updated_at), database, schema, table, limit)
+        if request.args.get('refresh', '').lower() not in ('1', 'true', 'yes'):
+            cached = preview_cache.get(cache_key, cache_ttl())
+            if cached is not None:
+                return jsonify(dict(cached, cached=True)), 200
+
+        try:
+            engine = create_connection_engine(connection, database)
+        except Exception as e:
+            return jsonify({'error': f'连接字符串构建失败: {str(e)}'}), 400
+
+        try:
+            preview = sample_table(engine, connection.db_type, database, schema, table, limit)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except SQLAlchemyError as e:
+            if is_timeout_error(e):
+                return jsonify({'error': f'预览超时（{preview_timeout():g} 秒）'}), 504
+            raise
+        finally:
+            engine.dispose()
+
+        preview.update({'database': database, 'schema': schema, 'table': table})
+        preview_cache.put(cache_key, preview)
+        return jsonify(dict(preview, cached=False)), 200
+
+    except Exception as e:
+        return jsonify({'error': f'获取表预览失败: {str(e)}'}), 500
+
+
+def _profile_target(connection, args):
+    database = args.get('database') or connection.database or ''
+    schema = args.get('schema') or ''
+    return database, schema, args.get('table')
+
+
+def _find_profile(connection_id, database, schema, table):
+    return TableProfile.query.filter_by(
+        connection_id=connection_id, database_name=database, schema_name=schema, table_name=table
+    ).first()
+
+
+@database_bp.route('/connections/<connection_id>/profile', methods=['POST'])
+def request_table_profile(connection_id):
+    """
+    Start (or reuse) a column profile of a table
+    ---
+    tags:
+      - Database
+    summary: Profile table columns
+    description: |
+      Computes null rate, distinct count, min/max, top values and a histogram for every column
+      in the background with one aggregate query plus one distribution query over a sample.
+      A fresh completed profile (younger than PROFILE_MAX_AGE) is returned directly unless
+      refresh is true; otherwise 202 is returned and the profile can be polled with GET.
+    parameters:
+      - in: path
+        name: connection_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - table
+          properties:
+            table:
+              type: string
+            database:
+              type: string
+            schema:
+              type: string
+            refresh:
+              type: boolean
+    responses:
+      200:
+        description: Fresh cached profile
+      202:
+        description: Profile queued or already running
+      400:
+        description: Invalid request
+      404:
+        description: Connection not found
+    """
+    try:
+        connection = DatabaseConnection.query.get(connection_id)
+        if not connection:
+            return jsonify({'error': '数据库连接不存在'}), 404
+        data = request.get_json(silent=True) or {}
+        database, schema, table = _profile_target(connection, data)
+        if not table:
+            return jsonify({'error': '表名不能为空'}), 400
+
+        profile = _find_profile(connection_id, database, schema, table)
+        if profile is not None and not data.get('refresh'):
+            if is_fresh(profile):
+                return jsonify(dict(profile.to_dict(), fresh=True)), 200
+        if profile is not None and is_in_progress(profile):
+            return jsonify(dict(profile.to_dict(), fresh=False)), 202
+
+        if profile is None:
+            profile = TableProfile(
+                id=f'prof_{uuid.uuid4()}',
+                connection_id=connection_id,
+                database_name=database,
+                schema_name=schema,
+                table_name=table
+            )
+            db.session.add(profile)
+        else:
+            # Keep the previous statistics visible until the new run completes
+            profile.status = 'pending'
+            profile.error = None
+            profile.started_at = None
+        db.session.commit()
+
+        submit_profile(current_app._get_current_object(), profile.id)
+        return jsonify(dict(profile.to_dict(), fresh=False)), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建统计任务失败: {str(e)}'}), 500
+
+
+@database_bp.route('/connections/<connection_id>/profile', methods=['GET'])
+def get_table_profile(connection_id):
+    """
+    Get the stored column profile of a table
+    ---
+    tags:
+      - Database
+    summary: Get table profile
+    parameters:
+      - in: path
+        name: connection_id
+        type: string
+        required: true
+      - in: query
+        name: table
+        type: string
+        required: true
+      - in: query
+        name: database
+        type: string
+      - in: query
+        name: schema
+        type: string
+    responses:
+      200:
+        description: Profile with status, columns, completedAt and fresh flag
+      404:
+        description: Connection or profile not found
+    """
+    connection = DatabaseConnection.query.get(connection_id)
+    if not connection:
+        return jsonify({'error': '数据库连接不存在'}), 404
+    database, schema, table = _profile_target(connection, request.args)
+    if not table:
+        return jsonify({'error': '表名不能为空'}), 400
+    profile = _find_profile(connection_id, database, schema, table)
+    if profile is None:
+        return jsonify({'error': '该表尚未统计'}), 404
+    return jsonify(dict(profile.to_dict(), fresh=is_fresh(profile))), 200
+
+
+@database_bp.route('/schema-diff', methods=['POST'])
+def diff_schemas():
+    """
+    Compare the schemas of two connections or databases
+    ---
+    tags:
+      - Database
+    summary: Schema diff
+    description: |
+      Reads both catalogs concurrently (one bulk catalog query per side) and compares tables,
+      columns (type, nullability, default, identity), primary keys, indexes and foreign keys.
+      Changes describe how to turn the target into the source; with generateDdl the matching
+      DDL for the target's dialect is returned as well. Indexes and foreign keys are matched
+      by definition, so equivalent objects with different names are not reported.
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - source
+            - target
+          properties:
+            source:
+              type: object
+              properties:
+                connectionId:
+                  type: string
+                database:
+                  type: string
+                schema:
+                  type: string
+            target:
+              type: object
+              description: Same shape as source
+            tables:
+              type: array
+              items:
+                type: string
+              description: Only compare these tables
+            generateDdl:
+              type: boolean
+    responses:
+      200:
+        description: Changeset (summary, added, removed, changed) plus per-side fetch timings
+      400:
+        description: Invalid request
+      404:
+        description: Connection not found
+      500:
+        description: Catalog query failed
+    """
+    import time
+
+    data = request.get_json(silent=True) or {}
+    sides = []
+    for key in ('source', 'target'):
+        side = data.get(key) or {}
+        connection = DatabaseConnection.query.get(side.get('connectionId') or '')
+        if not connection:
+            return jsonify({'error': f'{key} 数据库连接不存在'}), 404
+        database = side.get('database') or connection.database
+        schema = side.get('schema') or default_schema(connection.db_type, database)
+        if not schema:
+            return jsonify({'error': f'{key} 需要指定 database 或 schema'}), 400
+        try:
+            conn_str = connection_url(connection, database)
+        except ValueError as e:
+            return jsonify({'error': f'连接字符串构建失败: {str(e)}'}), 400
+        sides.append((connection, database, schema, conn_str))
+
+    tables = data.get('tables')
+    if tables is not None and not isinstance(tables, list):
+        return jsonify({'error': 'tables 必须是数组'}), 400
+
+    # Catalog queries run on both connections at once: a metadata slot on each
+    tickets = []
+    if scheduler_enabled():
+        try:
+            tickets = acquire_all([connection.id for connection, _, _, _ in sides], request_user(),
+                                  request_priority('metadata'))
+        except AdmissionRejected as e:
+            return rejection_response(e)
+
+    start_time = time.time()
+    try:
+        catalogs = fetch_catalogs([
+            (connection.db_type, conn_str, schema) for connection, _, schema, conn_str in sides
+        ])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'读取数据库目录失败: {str(e)}'}), 500
+    finally:
+        for ticket in tickets:
+            ticket.release()
+
+    changes = diff_catalogs(catalogs[0]['tables'], catalogs[1]['tables'], tables)
+    response_data = {}
+    for key, (connection, database, schema, _), catalog in zip(('source', 'target'), sides, catalogs):
+        response_data[key] = {
+            'connectionId': connection.id,
+            'connection': connection.name,
+            'dbType': connection.db_type,
+            'database': database,
+            'schema': schema,
+            'tableCount': len(catalog['tables']),
+            'fetchTime': catalog['fetchTime'],
+        }
+    response_data.update(changes)
+    if data.get('generateDdl'):
+        target_connection, _, target_schema, _ = sides[1]
+        response_data['ddl'] = DdlWriter(target_connection.db_type, target_schema).changeset(changes)
+    response_data['executionTime'] = round(time.time() - start_time, 3)
+    response = jsonify(response_data)
+    if tickets:
+        response.headers['X-Queue-Wait'] = f'{max(ticket.wait_time for ticket in tickets):.3f}'
+    return response, 200
+
+
+@database_bp.route('/results/<result_id>', methods=['GET'])
+def get_result_slice(result_id):
+    """
+    Get a slice of a spilled query result
+    ---
+    tags:
+      - Database
+    summary: Read rows from a stored result
+    description: |
+      Serves rows of a result previously returned by execute_sql with a resultId, from any worker,
+      without re-running the query. Send `Accept: application/vnd.apache.arrow.stream` for Arrow output.
+    parameters:
+      - in: path
+        name: result_id
+        type: string
+        required: true
+      - in: query
+        name: offset
+        type: integer
+        default: 0
+      - in: query
+        name: limit
+        type: integer
+        default: 100
+    responses:
+      200:
+        description: Rows of the result
+        schema:
+          type: object
+          properties:
+            resultId:
+              type: string
+            columns:
+              type: array
+              items:
+                type: string
+            rows:
+              type: array
+              items:
+                type: array
+            rowCount:
+              type: integer
+              description: Total rows in the stored result
+            offset:
+              type: integer
+            limit:
+              type: integer
+      404:
+        description: Result not found or expired
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      501:
+        description: Result store not available (pyarrow not installed)
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    if not result_store.store_enabled():
+        return jsonify({'error': '结果缓存不可用：未安装 pyarrow'}), 501
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = max(request.args.get('limit', 100, type=int), 0)
+        try:
+            table = result_store.open_result(result_id)
+        except KeyError:
+            return jsonify({'error': '查询结果不存在或已过期'}), 404
+        
+        page = table.slice(offset, limit)
+        if wants_arrow(request):
+            response = Response(result_store.iter_table_stream(page), mimetype=ARROW_STREAM_MIMETYPE)
+            response.headers['X-Row-Count'] = str(table.num_rows)
+            return response
+        
+        return jsonify({
+            'resultId': result_id,
+            'columns': table.column_names,
+            'rows': result_store.table_to_rows(page),
+            'rowCount': table.num_rows,
+            'offset': offset,
+            'limit': limit
+        }), 200
+    except Exception as e:
+        return jsonify({'error': f'读取查询结果失败: {str(e)}'}), 500
+
+
+@database_bp.route('/results/<result_id>/query', methods=['POST'])
+def query_result(result_id):
+    """
+    Sort, filter, search and aggregate a stored query result
+    ---
+    tags:
+      - Database
+    summary: Query a stored result
+    description: |
+      Runs grid interactions (sort, filter, search, group by) against a result previously returned
+      with a resultId, using vectorized in-process compute instead of re-querying the source database.
+      Steps run in the order filters, search, groupBy/aggregates, sort, then offset/limit.
+    consumes:
+      - application/json
+    parameters:
+      - in: path
+        name: result_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            filters:
+              type: array
+              items:
+                type: object
+                properties:
+                  column:
+                    type: string
+                  op:
+                    type: string
+                    enum: [eq, ne, gt, gte, lt, lte, in, notIn, contains, startsWith, endsWith, isNull, notNull]
+                  value: {}
+                  ignoreCase:
+                    type: boolean
+            search:
+              type: string
+              description: Case-insensitive text matched against every column
+            groupBy:
+              type: array
+              items:
+                type: string
+            aggregates:
+              type: array
+              items:
+                type: object
+                properties:
+                  column:
+                    type: string
+                  func:
+                    type: string
+                    enum: [count, count_distinct, sum, mean, min, max]
+                  as:
+                    type: string
+            sort:
+              type: array
+              items:
+                type: object
+                properties:
+                  column:
+                    type: string
+                  direction:
+                    type: string
+                    enum: [asc, desc]
+            offset:
+              type: integer
+              default: 0
+            limit:
+              type: integer
+              default: 100
+            save:
+              type: boolean
+              description: Store the derived result and return its resultId
+    responses:
+      200:
+        description: Derived rows
+        schema:
+          type: object
+          properties:
+            columns:
+              type: array
+              items:
+                type: string
+            rows:
+              type: array
+              items:
+                type: array
+            rowCount:
+              type: integer
+            offset:
+              type: integer
+            limit:
+              type: integer
+            executionTime:
+              type: number
+            resultId:
+              type: string
+      400:
+        description: Invalid view specification
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      404:
+        description: Result not found or expired
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      501:
+        description: Result store not available (pyarrow not installed)
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    import time
+    
+    if not result_store.store_enabled():
+        return jsonify({'error': '结果缓存不可用：未安装 pyarrow'}), 501
+    try:
+        data = request.get_json(silent=True) or {}
+        offset = max(int(data.get('offset', 0)), 0)
+        limit = max(int(data.get('limit', 100)), 0)
+        try:
+            table = result_store.open_result(result_id)
+        except KeyError:
+            return jsonify({'error': '查询结果不存在或已过期'}), 404
+        
+        start_time = time.time()
+        try:
+            view = apply_view(table, data)
+        except ResultQueryError as e:
+            return jsonify({'error': str(e)}), 400
+        page = view.slice(offset, limit)
+        execution_time = time.time() - start_time
+        
+        response_data = {
+            'columns': view.column_names,
+            'rows': result_store.table_to_rows(page),
+            'rowCount': view.num_rows,
+            'offset': offset,
+            'limit': limit,
+            'executionTime': round(execution_time, 3)
+        }
+        if data.get('save'):
+            response_data['resultId'] = result_store.spill_table(view, {'sourceResultId': result_id})
+        return jsonify(response_data), 200
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'参数错误: {str(e)}'}), 400
+    except Exception as e:
+        return jsonify({'error': f'查询结果处理失败: {str(e)}'}), 500
+
+
+@database_bp.route('/results/<result_id>', methods=['DELETE'])
+def delete_result(result_id):
+    """
+    Discard a spilled query result
+    """
+    if not result_store.store_enabled():
+        return jsonify({'error': '结果缓存不可用：未安装 pyarrow'}), 501
+    try:
+        if not result_store.delete_result(result_id):
+            return jsonify({'error': '查询结果不存在或已过期'}), 404
+        return jsonify({'message': '查询结果已删除'}), 200
+    except KeyError:
+        return jsonify({'error': '查询结果不存在或已过期'}), 404
+    except Exception as e:
+        return jsonify({'error': f'删除查询结果失败: {str(e)}'}), 500
+
+
+@database_bp.route('/scheduler', methods=['GET'])
+def get_scheduler_stats():
+    """
+    Query admission control status
+    ---
+    tags:
+      - Database
+    summary: Query scheduler status
+    description: |
+      Concurrency limits, running and queued queries per connection and priority class
+      (interactive, metadata, batch), and the average wait before admission per class.
+    responses:
+      200:
+        description: Scheduler status
+        schema:
+          type: object
+          properties:
+            limits:
+              type: object
+            connections:
+              type: object
+            averageWait:
+              type: object
+            queueLength:
+              type: integer
+            rejected:
+              type: integer
+    """
+    return jsonify(query_scheduler.stats()), 200
@@ -1,14 +1,34 @@
 """
 Editor API endpoints for directory and project management
 """
+import difflib
 import uuid
+from datetime import datetime
 from flask import Blueprint, request, jsonify
+from sqlalchemy import insert, update, delete, select, func
 from models import db
 from models.directory import Directory
 from models.project import Project
+from models.search_index import search_projects
+from models.project_revision import list_revisions, purge_project_revisions, record_revision, revision_content
+from models.schedule import purge_project_schedules
+from models.incremental_load import purge_project_loads
+from models.pipeline import purge_project_dependencies
+from .text_patch import apply_text_patches
+from models.sql_usage import (
+    ProjectSqlIndex, ProjectTableUsage, index_projects, purge_project_sql_index, backfill_sql_index
+)
 
 editor_bp = Blueprint('editor', __name__, url_prefix='/editor')
 
+# 单次批量操作允许的最大条目数
+MAX_BATCH_OPERATIONS = 5000
+
+# 搜索分页大小上限
+MAX_SEARCH_PAGE_SIZE = 100
+
+SQL_VERSION_CONFLICT = 'SQL 内容已被其他保存修改，请重新加载后再保存'
+
 
 def build_file_tree(directories, projects):
     """
@@ -597,6 +617,9 @@ def update_project_details(project_id):
             sql:
               type: string
               description: SQL content
+            sqlVersion:
+              type: integer
+              description: Version the SQL was edited from; the save fails with 409 if it is no longer current
     responses:
       200:
         description: Project details updated successfully
@@ -616,6 +639,15 @@ def update_project_details(project_id):
           properties:
             error:
               type: string
+      409:
+        description: SQL version conflict
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+            currentVersion:
+              type: integer
       500:
         description: Server error
         schema:
@@ -638,8 +670,15 @@ def update_project_details(project_id):
             project.requirement_description = data.get('requirementDescription')
         if 'requester' in data:
             project.requester = data.get('requester')
-        if 'sql' in data:
-            project.sql_content = data.get('sql')
+        # Unchanged SQL keeps its version and records no revision
+        if 'sql' in data and (data.get('sql') or '') != (project.sql_content or ''):
+            base_version = data.get('sqlVersion')
+            if base_version is not None and not is_version(base_version):
+                return jsonify({'error': 'sqlVersion 必须是整数'}), 400
+            previous = (project.sql_version, project.sql_content)
+            if save_project_sql(project.id, data.get('sql'), base_version, previous) is None:
+                db.session.rollback()
+                return jsonify({'error': SQL_VERSION_CONFLICT, 'currentVersion': current_sql_version(project_id)}), 409
         
         db.session.commit()
         
@@ -649,6 +688,366 @@ def update_project_details(project_id):
         return jsonify({'error': str(e)}), 500
 
 
+@editor_bp.route('/projects/<project_id>/sql', methods=['PATCH'])
+def patch_project_sql(project_id):
+    """
+    Apply incremental edits to the project SQL
+    ---
+    tags:
+      - Editor
+    summary: Patch project SQL
+    description: |
+      Applies range patches to the SQL content at version baseVersion and returns the new
+      version, so autosave only sends the edited ranges. Offsets are UTF-16 code units
+      (JavaScript string indices); patches refer to the base text and must be sorted and
+      non-overlapping. When the stored version differs from baseVersion nothing is written
+      and 409 is returned with the current version.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+        description: Project ID
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - baseVersion
+          properties:
+            baseVersion:
+              type: integer
+              description: sqlVersion the patches were computed against
+            patches:
+              type: array
+              items:
+                type: object
+                properties:
+                  start:
+                    type: integer
+                    description: Start offset in the base text
+                  end:
+                    type: integer
+                    description: End offset (exclusive) in the base text, defaults to start
+                  text:
+                    type: string
+                    description: Replacement text
+              example: [{"start": 7, "end": 8, "text": "id, name"}]
+            requirementDescription:
+              type: string
+              description: New requirement description (only when changed)
+            requester:
+              type: string
+              description: New requester (only when changed)
+    responses:
+      200:
+        description: Patches applied
+        schema:
+          type: object
+          properties:
+            id:
+              type: string
+            sqlVersion:
+              type: integer
+      400:
+        description: Invalid baseVersion or patches
+      404:
+        description: Project not found
+      409:
+        description: Version conflict
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+            currentVersion:
+              type: integer
+    """
+    try:
+        data = request.get_json() or {}
+        base_version = data.get('baseVersion')
+        if not is_version(base_version):
+            return jsonify({'error': 'baseVersion 必须是整数'}), 400
+        
+        stored = db.session.execute(
+            select(Project.sql_content, Project.sql_version).where(Project.id == project_id)
+        ).first()
+        if stored is None:
+            return jsonify({'error': '项目不存在'}), 404
+        if stored.sql_version != base_version:
+            return jsonify({'error': SQL_VERSION_CONFLICT, 'currentVersion': stored.sql_version}), 409
+        
+        try:
+            sql_content = apply_text_patches(stored.sql_content or '', data.get('patches') or [])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        values = {}
+        if 'requirementDescription' in data:
+            values['requirement_description'] = data.get('requirementDescription')
+        if 'requester' in data:
+            values['requester'] = data.get('requester')
+        if sql_content == (stored.sql_content or '') and not values:
+            return jsonify({'id': project_id, 'sqlVersion': base_version}), 200
+        
+        version = save_project_sql(
+            project_id, sql_content, base_version, (stored.sql_version, stored.sql_content), **values
+        )
+        if version is None:
+            db.session.rollback()
+            return jsonify({'error': SQL_VERSION_CONFLICT, 'currentVersion': current_sql_version(project_id)}), 409
+        db.session.commit()
+        
+        return jsonify({'id': project_id, 'sqlVersion': version}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/projects/<project_id>/revisions', methods=['GET'])
+def get_project_revisions(project_id):
+    """
+    List saved revisions of the project SQL
+    ---
+    tags:
+      - Editor
+    summary: List SQL revisions
+    description: Revisions of the project SQL, newest first. Each save creates one revision numbered by the resulting sqlVersion.
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+        description: Project ID
+      - in: query
+        name: page
+        type: integer
+        default: 1
+      - in: query
+        name: pageSize
+        type: integer
+        default: 20
+        description: Page size (max 100)
+    responses:
+      200:
+        description: Revisions
+        schema:
+          type: object
+          properties:
+            revisions:
+              type: array
+              items:
+                type: object
+                properties:
+                  version:
+                    type: integer
+                  kind:
+                    type: string
+                    enum: [snapshot, delta]
+                  length:
+                    type: integer
+                    description: Length of the SQL in characters
+                  hash:
+                    type: string
+                  storedSize:
+                    type: integer
+                    description: Compressed bytes stored for this revision
+                  createdAt:
+                    type: string
+                    format: date-time
+            total:
+              type: integer
+            page:
+              type: integer
+            pageSize:
+              type: integer
+      404:
+        description: Project not found
+    """
+    try:
+        if current_sql_version(project_id) is None:
+            return jsonify({'error': '项目不存在'}), 404
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('pageSize', 20, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+        total, revisions = list_revisions(project_id, offset=(page - 1) * page_size, limit=page_size)
+        return jsonify({
+            'revisions': [revision.to_dict() for revision in revisions],
+            'total': total,
+            'page': page,
+            'pageSize': page_size
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/projects/<project_id>/revisions/<int:version>', methods=['GET'])
+def get_project_revision(project_id, version):
+    """
+    Get the SQL of one revision
+    ---
+    tags:
+      - Editor
+    summary: Get SQL revision
+    description: Rebuilds the SQL saved as the given version from the nearest snapshot and the deltas after it.
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+      - in: path
+        name: version
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Revision content
+        schema:
+          type: object
+          properties:
+            version:
+              type: integer
+            sql:
+              type: string
+      404:
+        description: Revision not found
+    """
+    try:
+        sql_content = revision_content(project_id, version)
+        if sql_content is None:
+            return jsonify({'error': '版本不存在'}), 404
+        return jsonify({'version': version, 'sql': sql_content}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/projects/<project_id>/revisions/diff', methods=['GET'])
+def diff_project_revisions(project_id):
+    """
+    Diff two revisions of the project SQL
+    ---
+    tags:
+      - Editor
+    summary: Diff SQL revisions
+    description: Unified line diff from one revision to another (default to the latest).
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+      - in: query
+        name: from
+        type: integer
+        required: true
+        description: Older version
+      - in: query
+        name: to
+        type: integer
+        description: Newer version (default current sqlVersion)
+      - in: query
+        name: context
+        type: integer
+        default: 3
+        description: Unchanged lines shown around each change
+    responses:
+      200:
+        description: Diff
+        schema:
+          type: object
+          properties:
+            from:
+              type: integer
+            to:
+              type: integer
+            diff:
+              type: string
+            added:
+              type: integer
+            removed:
+              type: integer
+      400:
+        description: Missing from
+      404:
+        description: Revision not found
+    """
+    try:
+        from_version = request.args.get('from', type=int)
+        if from_version is None:
+            return jsonify({'error': 'from 必须是整数'}), 400
+        to_version = request.args.get('to', type=int)
+        if to_version is None:
+            to_version = current_sql_version(project_id)
+        context = min(max(request.args.get('context', 3, type=int), 0), 100)
+        
+        old = revision_content(project_id, from_version) if to_version is not None else None
+        new = revision_content(project_id, to_version) if old is not None else None
+        if new is None:
+            return jsonify({'error': '版本不存在'}), 404
+        
+        lines = list(difflib.unified_diff(
+            old.splitlines(keepends=True), new.splitlines(keepends=True),
+            fromfile=f'v{from_version}', tofile=f'v{to_version}', n=context
+        ))
+        added = sum(1 for line in lines if line.startswith('+') and not line.startswith('+++'))
+        removed = sum(1 for line in lines if line.startswith('-') and not line.startswith('---'))
+        diff = ''.join(line if line.endswith('\n') else line + '\n\\ No newline at end of file\n' for line in lines)
+        return jsonify({
+            'from': from_version,
+            'to': to_version,
+            'diff': diff,
+            'added': added,
+            'removed': removed
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def is_version(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def current_sql_version(project_id):
+    return db.session.execute(select(Project.sql_version).where(Project.id == project_id)).scalar()
+
+
+def save_project_sql(project_id, sql_content, base_version=None, previous=None, **values):
+    """
+    Store new SQL content (and other project columns) and bump sql_version in one UPDATE
+    With base_version the row is only written if its version still matches, so concurrent
+    saves cannot overwrite each other; returns the new version, or None on a conflict.
+    previous is the (version, content) being replaced, the base of the new revision's delta
+    """
+    statement = update(Project).where(Project.id == project_id)
+    if base_version is not None:
+        statement = statement.where(Project.sql_version == base_version)
+    result = db.session.execute(
+        statement.values(
+            sql_content=sql_content,
+            sql_version=Project.sql_version + 1,
+            updated_at=datetime.utcnow(),
+            **values
+        ),
+        execution_options={'synchronize_session': False}
+    )
+    if not result.rowcount:
+        return None
+    # 同步更新SQL指纹和表使用索引
+    index_projects([(project_id, sql_content)])
+    version = base_version + 1 if base_version is not None else current_sql_version(project_id)
+    record_revision(project_id, version, sql_content, previous)
+    return version
+
+
 @editor_bp.route('/projects/<project_id>/move', methods=['PUT', 'PATCH'])
 def move_project(project_id):
     """
@@ -730,3 +1129,1100 @@ def move_project(project_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+
+
+def subtree_cte(root_ids):
+    """
+    Recursive CTE yielding the IDs of the given directories and all their descendants
+    The CTE is nested inside the enclosing subquery so DML statements still start with DELETE/UPDATE
+    """
+    tree = (
+        select(Directory.id)
+        .where(Directory.id.in_(root_ids))
+        .cte('subtree', recursive=True, nesting=True)
+    )
+    # UNION (not UNION ALL) so a corrupted parent chain cannot recurse forever
+    return tree.union(
+        select(Directory.id).where(Directory.parent_id == tree.c.id)
+    )
+
+
+def is_descendant_or_self(directory_id, candidate_id):
+    """
+    Check whether candidate_id is directory_id or lies inside its subtree
+    Walks up the ancestor chain of the candidate, which is short compared to the subtree
+    """
+    ancestors = (
+        select(Directory.id, Directory.parent_id)
+        .where(Directory.id == candidate_id)
+        .cte('ancestors', recursive=True)
+    )
+    ancestors = ancestors.union(
+        select(Directory.id, Directory.parent_id).where(Directory.id == ancestors.c.parent_id)
+    )
+    found = db.session.execute(
+        select(ancestors.c.id).where(ancestors.c.id == directory_id).limit(1)
+    ).first()
+    return found is not None
+
+
+def delete_subtrees(root_ids):
+    """
+    Delete directories with all nested directories and projects using set-based SQL
+    Returns (deleted_directories, deleted_projects)
+    """
+    tree = subtree_cte(root_ids)
+    purge_project_sql_index(
+        select(Project.id).where(Project.directory_id.in_(select(tree.c.id)))
+    )
+    tree = subtree_cte(root_ids)
+    purge_project_revisions(
+        select(Project.id).where(Project.directory_id.in_(select(tree.c.id)))
+    )
+    tree = subtree_cte(root_ids)
+    purge_project_schedules(
+        select(Project.id).where(Project.directory_id.in_(select(tree.c.id)))
+    )
+    tree = subtree_cte(root_ids)
+    purge_project_loads(
+        select(Project.id).where(Project.directory_id.in_(select(tree.c.id)))
+    )
+    tree = subtree_cte(root_ids)
+    purge_project_dependencies(
+        select(Project.id).where(Project.directory_id.in_(select(tree.c.id)))
+    )
+    tree = subtree_cte(root_ids)
+    project_result = db.session.execute(
+        delete(Project).where(Project.directory_id.in_(select(tree.c.id))),
+        execution_options={'synchronize_session': False}
+    )
+    tree = subtree_cte(root_ids)
+    directory_result = db.session.execute(
+        delete(Directory).where(Directory.id.in_(select(tree.c.id))),
+        execution_options={'synchronize_session': False}
+    )
+    return directory_result.rowcount, project_result.rowcount
+
+
+def bulk_update_rows(model, updates):
+    """
+    Apply per-row updates keyed by primary key using executemany
+    Rows are grouped by the set of columns they change so each group is one statement
+    """
+    groups = {}
+    for row in updates.values():
+        groups.setdefault(frozenset(row.keys()), []).append(row)
+    for rows in groups.values():
+        db.session.execute(update(model), rows)
+
+
+@editor_bp.route('/batch', methods=['POST'])
+def batch_operations():
+    """
+    Apply a batch of directory and project operations
+    ---
+    tags:
+      - Editor
+    summary: Batch create, move, rename and delete
+    description: |
+      Applies an ordered list of operations in a single transaction.
+      All referenced directories and projects are validated with one IN query each,
+      and the changes are written with bulk insert/update/delete statements.
+      A createDirectory operation may carry a tempId which later operations can use as parentId/targetParentId.
+      Invalid operations are reported per item; with atomic=true any invalid operation aborts the whole batch.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        description: Operations to apply
+        required: true
+        schema:
+          type: object
+          required:
+            - operations
+          properties:
+            atomic:
+              type: boolean
+              description: Reject the whole batch if any operation is invalid
+              default: false
+            operations:
+              type: array
+              items:
+                type: object
+                required:
+                  - op
+                properties:
+                  op:
+                    type: string
+                    enum: [createDirectory, createProject, move, rename, delete]
+                  type:
+                    type: string
+                    enum: [directory, file]
+                    description: Item type for move/rename/delete
+                  id:
+                    type: string
+                    description: Item ID for move/rename/delete
+                  tempId:
+                    type: string
+                    description: Client-side reference for a created directory
+                  name:
+                    type: string
+                    description: Name for create/rename
+                  parentId:
+                    type: string
+                    nullable: true
+                    description: Parent directory ID for create
+                  targetParentId:
+                    type: string
+                    nullable: true
+                    description: Target directory ID for move (null for root)
+                  creator:
+                    type: string
+                    description: Creator for createProject
+    responses:
+      200:
+        description: Batch processed, see per-item results
+        schema:
+          type: object
+          properties:
+            results:
+              type: array
+              items:
+                type: object
+                properties:
+                  index:
+                    type: integer
+                  op:
+                    type: string
+                  success:
+                    type: boolean
+                  id:
+                    type: string
+                  error:
+                    type: string
+            succeeded:
+              type: integer
+            failed:
+              type: integer
+      400:
+        description: Bad request - empty or oversized batch, or atomic batch with invalid operations
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+            results:
+              type: array
+              items:
+                type: object
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        data = request.get_json() or {}
+        operations = data.get('operations')
+        atomic = bool(data.get('atomic', False))
+
+        if not isinstance(operations, list) or not operations:
+            return jsonify({'error': '操作列表不能为空'}), 400
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return jsonify({'error': f'单次最多支持 {MAX_BATCH_OPERATIONS} 个操作'}), 400
+
+        # Collect every referenced ID up front so each table is validated with a single IN query
+        temp_ids = set()
+        directory_ids = set()
+        project_ids = set()
+        needs_tree = False
+        for op in operations:
+            if not isinstance(op, dict):
+                continue
+            if op.get('op') == 'createDirectory' and op.get('tempId'):
+                temp_ids.add(op['tempId'])
+        for op in operations:
+            if not isinstance(op, dict):
+                continue
+            for key in ('parentId', 'targetParentId'):
+                value = op.get(key)
+                if value and value not in temp_ids:
+                    directory_ids.add(value)
+            if op.get('op') in ('move', 'rename', 'delete') and op.get('id'):
+                if op.get('type') == 'directory':
+                    directory_ids.add(op['id'])
+                    if op.get('op') in ('move', 'delete'):
+                        needs_tree = True
+                else:
+                    project_ids.add(op['id'])
+
+        # Directory moves and deletes need the whole (id, parent_id) map for cycle checks and subtrees
+        if needs_tree:
+            parent_map = dict(db.session.query(Directory.id, Directory.parent_id).all())
+        elif directory_ids:
+            parent_map = dict(
+                db.session.query(Directory.id, Directory.parent_id)
+                .filter(Directory.id.in_(directory_ids))
+                .all()
+            )
+        else:
+            parent_map = {}
+
+        project_parent = {}
+        if project_ids:
+            project_parent = dict(
+                db.session.query(Project.id, Project.directory_id)
+                .filter(Project.id.in_(project_ids))
+                .all()
+            )
+
+        children = {}
+        if needs_tree:
+            for dir_id, parent_id in parent_map.items():
+                children.setdefault(parent_id, set()).add(dir_id)
+
+        temp_map = {}
+        deleted_directories = set()
+        deleted_projects = set()
+        new_directories = []
+        new_projects = []
+        directory_updates = {}
+        project_updates = {}
+        results = []
+        now = datetime.utcnow()
+
+        def resolve_parent(parent_id):
+            if not parent_id:
+                return None
+            return temp_map.get(parent_id, parent_id)
+
+        def directory_exists(dir_id):
+            return dir_id in parent_map and dir_id not in deleted_directories
+
+        def project_exists(project_id):
+            return (
+                project_id in project_parent
+                and project_id not in deleted_projects
+                and project_parent[project_id] not in deleted_directories
+            )
+
+        for index, op in enumerate(operations):
+            if not isinstance(op, dict):
+                results.append({'index': index, 'success': False, 'error': '操作格式无效'})
+                continue
+
+            op_name = op.get('op')
+            result = {'index': index, 'op': op_name, 'success': False}
+            results.append(result)
+
+            if op_name in ('createDirectory', 'createProject'):
+                name = (op.get('name') or '').strip()
+                if not name:
+                    result['error'] = '目录名称不能为空' if op_name == 'createDirectory' else '项目名称不能为空'
+                    continue
+                parent_id = resolve_parent(op.get('parentId'))
+                if parent_id and not directory_exists(parent_id):
+                    result['error'] = '父目录不存在'
+                    continue
+
+                if op_name == 'createDirectory':
+                    item_id = f"dir_{uuid.uuid4()}"
+                    new_directories.append({
+                        'id': item_id,
+                        'name': name,
+                        'parent_id': parent_id,
+                        'created_at': now,
+                        'updated_at': now,
+                    })
+                    parent_map[item_id] = parent_id
+                    if needs_tree:
+                        children.setdefault(parent_id, set()).add(item_id)
+                    if op.get('tempId'):
+                        temp_map[op['tempId']] = item_id
+                else:
+                    item_id = f"file_{uuid.uuid4()}"
+                    new_projects.append({
+                        'id': item_id,
+                        'name': name,
+                        'directory_id': parent_id,
+                        'requirement_name': name,  # 需求名称默认为项目名称
+                        'creator': op.get('creator', '当前用户'),
+                        'created_at': now,
+                        'updated_at': now,
+                    })
+                    project_parent[item_id] = parent_id
+
+                result['success'] = True
+                result['id'] = item_id
+                continue
+
+            if op_name not in ('move', 'rename', 'delete'):
+                result['error'] = f'不支持的操作: {op_name}'
+                continue
+
+            item_id = op.get('id')
+            is_directory = op.get('type') == 'directory'
+            result['id'] = item_id
+            if is_directory and not directory_exists(item_id):
+                result['error'] = '目录不存在'
+                continue
+            if not is_directory and not project_exists(item_id):
+                result['error'] = '项目不存在'
+                continue
+
+            if op_name == 'rename':
+                name = (op.get('name') or '').strip()
+                if not name:
+                    result['error'] = '名称不能为空'
+                    continue
+                if is_directory:
+                    directory_updates.setdefault(item_id, {'id': item_id}).update(
+                        {'name': name, 'updated_at': now}
+                    )
+                else:
+                    # 同时更新需求名称
+                    project_updates.setdefault(item_id, {'id': item_id}).update(
+                        {'name': name, 'requirement_name': name, 'updated_at': now}
+                    )
+
+            elif op_name == 'move':
+                target_parent_id = resolve_parent(op.get('targetParentId'))
+                if target_parent_id and not directory_exists(target_parent_id):
+                    result['error'] = '目标目录不存在'
+                    continue
+                if is_directory:
+                    # Walk up from the target; reaching the moved directory means a cycle
+                    ancestor = target_parent_id
+                    while ancestor is not None and ancestor != item_id:
+                        ancestor = parent_map.get(ancestor)
+                    if ancestor == item_id:
+                        result['error'] = '不能将目录移动到其自身或子目录中'
+                        continue
+                    children.get(parent_map.get(item_id), set()).discard(item_id)
+                    children.setdefault(target_parent_id, set()).add(item_id)
+                    parent_map[item_id] = target_parent_id
+                    directory_updates.setdefault(item_id, {'id': item_id}).update(
+                        {'parent_id': target_parent_id, 'updated_at': now}
+                    )
+                else:
+                    project_parent[item_id] = target_parent_id
+                    project_updates.setdefault(item_id, {'id': item_id}).update(
+                        {'directory_id': target_parent_id, 'updated_at': now}
+                    )
+
+            else:
+                if is_directory:
+                    stack = [item_id]
+                    while stack:
+                        current = stack.pop()
+                        if current in deleted_directories:
+                            continue
+                        deleted_directories.add(current)
+                        stack.extend(children.get(current, ()))
+                else:
+                    deleted_projects.add(item_id)
+
+            result['success'] = True
+
+        failed = sum(1 for result in results if not result['success'])
+        if atomic and failed:
+            return jsonify({'error': '批量操作校验失败', 'results': results}), 400
+
+        # Apply everything in one transaction: inserts, then updates, then deletes
+        if new_directories:
+            db.session.execute(insert(Directory), new_directories)
+        if new_projects:
+            db.session.execute(insert(Project), new_projects)
+        if directory_updates:
+            bulk_update_rows(Directory, directory_updates)
+        if project_updates:
+            bulk_update_rows(Project, project_updates)
+        if deleted_directories:
+            purge_project_sql_index(
+                select(Project.id).where(Project.directory_id.in_(deleted_directories))
+            )
+            purge_project_revisions(
+                select(Project.id).where(Project.directory_id.in_(deleted_directories))
+            )
+            purge_project_schedules(
+                select(Project.id).where(Project.directory_id.in_(deleted_directories))
+            )
+            purge_project_loads(
+                select(Project.id).where(Project.directory_id.in_(deleted_directories))
+            )
+            purge_project_dependencies(
+                select(Project.id).where(Project.directory_id.in_(deleted_directories))
+            )
+            db.session.execute(
+                delete(Project).where(Project.directory_id.in_(deleted_directories)),
+                execution_options={'synchronize_session': False}
+            )
+        if deleted_projects:
+            purge_project_sql_index(deleted_projects)
+            purge_project_revisions(deleted_projects)
+            purge_project_schedules(deleted_projects)
+            purge_project_loads(deleted_projects)
+            purge_project_dependencies(deleted_projects)
+            db.session.execute(
+                delete(Project).where(Project.id.in_(deleted_projects)),
+                execution_options={'synchronize_session': False}
+            )
+        if deleted_directories:
+            db.session.execute(
+                delete(Directory).where(Directory.id.in_(deleted_directories)),
+                execution_options={'synchronize_session': False}
+            )
+        db.session.commit()
+
+        return jsonify({
+            'results': results,
+            'succeeded': len(results) - failed,
+            'failed': failed
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/directories/<directory_id>/move', methods=['PUT', 'PATCH'])
+def move_directory(directory_id):
+    """
+    Move directory (with its whole subtree) to a different parent
+    ---
+    tags:
+      - Editor
+    summary: Move directory to different parent
+    description: Moves a directory and everything below it. Moving a directory into itself or one of its descendants is rejected.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: directory_id
+        type: string
+        required: true
+        description: Directory ID
+      - in: body
+        name: body
+        description: Target directory information
+        required: false
+        schema:
+          type: object
+          properties:
+            targetParentId:
+              type: string
+              description: Target parent directory ID (null for root)
+              nullable: true
+    responses:
+      200:
+        description: Directory moved successfully
+        schema:
+          type: object
+          properties:
+            id:
+              type: string
+            name:
+              type: string
+            parentId:
+              type: string
+              nullable: true
+      400:
+        description: Target is the directory itself or one of its descendants
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+              example: "不能将目录移动到其自身或子目录中"
+      404:
+        description: Directory or target directory not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        data = request.get_json() or {}
+        target_parent_id = data.get('targetParentId')
+
+        directory = Directory.query.get(directory_id)
+        if not directory:
+            return jsonify({'error': '目录不存在'}), 404
+
+        if target_parent_id:
+            target_parent = Directory.query.get(target_parent_id)
+            if not target_parent:
+                return jsonify({'error': '目标目录不存在'}), 404
+            if is_descendant_or_self(directory_id, target_parent_id):
+                return jsonify({'error': '不能将目录移动到其自身或子目录中'}), 400
+
+        # The subtree hangs off parent_id, so re-pointing the root moves everything below it
+        directory.parent_id = target_parent_id
+        db.session.commit()
+
+        return jsonify(directory.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/directories/<directory_id>', methods=['DELETE'])
+def delete_directory(directory_id):
+    """
+    Delete directory recursively
+    ---
+    tags:
+      - Editor
+    summary: Delete directory recursively
+    description: Deletes a directory together with all nested directories and projects in a single transaction, without loading the subtree into memory
+    parameters:
+      - in: path
+        name: directory_id
+        type: string
+        required: true
+        description: Directory ID
+    responses:
+      200:
+        description: Directory deleted successfully
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+            deletedDirectories:
+              type: integer
+            deletedProjects:
+              type: integer
+      404:
+        description: Directory not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        exists = db.session.execute(
+            select(Directory.id).where(Directory.id == directory_id)
+        ).first()
+        if not exists:
+            return jsonify({'error': '目录不存在'}), 404
+
+        deleted_directories, deleted_projects = delete_subtrees([directory_id])
+        db.session.commit()
+
+        return jsonify({
+            'message': '目录已删除',
+            'deletedDirectories': deleted_directories,
+            'deletedProjects': deleted_projects
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/projects/<project_id>', methods=['DELETE'])
+def delete_project(project_id):
+    """
+    Delete project
+    ---
+    tags:
+      - Editor
+    summary: Delete project
+    description: Deletes a single project
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+        description: Project ID
+    responses:
+      200:
+        description: Project deleted successfully
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+      404:
+        description: Project not found
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        purge_project_sql_index([project_id])
+        purge_project_revisions([project_id])
+        purge_project_schedules([project_id])
+        purge_project_loads([project_id])
+        purge_project_dependencies([project_id])
+        result = db.session.execute(
+            delete(Project).where(Project.id == project_id),
+            execution_options={'synchronize_session': False}
+        )
+        if not result.rowcount:
+            db.session.rollback()
+            return jsonify({'error': '项目不存在'}), 404
+
+        db.session.commit()
+
+        return jsonify({'message': '项目已删除'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/search', methods=['GET'])
+def search():
+    """
+    Full-text search over projects
+    ---
+    tags:
+      - Editor
+    summary: Search projects
+    description: |
+      Ranked full-text search over project name, requirement name, requirement description, requester and SQL content.
+      Backed by SQLite FTS5, a PostgreSQL GIN index, or an in-process inverted index, all maintained incrementally.
+    parameters:
+      - in: query
+        name: q
+        type: string
+        required: true
+        description: Search terms (all terms must match)
+      - in: query
+        name: page
+        type: integer
+        default: 1
+      - in: query
+        name: pageSize
+        type: integer
+        default: 20
+    responses:
+      200:
+        description: Search results
+        schema:
+          type: object
+          properties:
+            items:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: string
+                  name:
+                    type: string
+                  parentId:
+                    type: string
+                    nullable: true
+                  requirementName:
+                    type: string
+                  requester:
+                    type: string
+                    nullable: true
+                  creator:
+                    type: string
+                    nullable: true
+                  updatedAt:
+                    type: string
+                    format: date-time
+                  score:
+                    type: number
+                  snippet:
+                    type: string
+                    nullable: true
+                    description: Matching excerpt with hits wrapped in <mark>
+            total:
+              type: integer
+            page:
+              type: integer
+            pageSize:
+              type: integer
+      400:
+        description: Bad request - query is required
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': '搜索关键词不能为空'}), 400
+
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('pageSize', 20, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+
+        total, hits = search_projects(query, offset=(page - 1) * page_size, limit=page_size)
+
+        # Load only the listing columns; sql_content stays in the database
+        rows = {}
+        if hits:
+            rows = {
+                row.id: row
+                for row in db.session.query(
+                    Project.id, Project.name, Project.directory_id, Project.requirement_name,
+                    Project.requester, Project.creator, Project.updated_at
+                ).filter(Project.id.in_([project_id for project_id, _, _ in hits]))
+            }
+
+        items = []
+        for project_id, score, snippet in hits:
+            row = rows.get(project_id)
+            if row is None:
+                continue
+            items.append({
+                'id': row.id,
+                'name': row.name,
+                'parentId': row.directory_id,
+                'requirementName': row.requirement_name,
+                'requester': row.requester,
+                'creator': row.creator,
+                'updatedAt': row.updated_at.isoformat() if row.updated_at else None,
+                'score': round(score, 4),
+                'snippet': snippet,
+            })
+
+        return jsonify({
+            'items': items,
+            'total': total,
+            'page': page,
+            'pageSize': page_size
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/table-usage', methods=['GET'])
+def get_table_usage():
+    """
+    Find projects whose saved SQL references a table
+    ---
+    tags:
+      - Editor
+    summary: Projects using a table
+    description: |
+      Reverse lookup on the SQL usage index. A table name containing a dot (schema.table) matches exactly;
+      a bare name matches that table in any schema.
+    parameters:
+      - in: query
+        name: table
+        type: string
+        required: true
+        description: Table name, optionally schema-qualified
+      - in: query
+        name: column
+        type: string
+        required: false
+        description: Only projects referencing this column
+      - in: query
+        name: access
+        type: string
+        enum: [read, write]
+        required: false
+        description: Only projects reading or writing the table
+    responses:
+      200:
+        description: Matching projects
+        schema:
+          type: object
+          properties:
+            table:
+              type: string
+            projects:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: string
+                  name:
+                    type: string
+                  parentId:
+                    type: string
+                    nullable: true
+                  tables:
+                    type: array
+                    items:
+                      type: string
+                  access:
+                    type: array
+                    items:
+                      type: string
+                  columns:
+                    type: array
+                    items:
+                      type: string
+      400:
+        description: Bad request - table is required
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        table = request.args.get('table', '').strip().lower()
+        if not table:
+            return jsonify({'error': '表名不能为空'}), 400
+        column = request.args.get('column', '').strip().lower()
+        access = request.args.get('access', '').strip().lower()
+
+        query = db.session.query(
+            ProjectTableUsage.project_id, ProjectTableUsage.table_name,
+            ProjectTableUsage.column_name, ProjectTableUsage.access,
+            Project.name, Project.directory_id
+        ).join(Project, Project.id == ProjectTableUsage.project_id)
+        if '.' in table:
+            query = query.filter(ProjectTableUsage.table_name == table)
+        else:
+            query = query.filter(ProjectTableUsage.object_name == table)
+        if column:
+            query = query.filter(ProjectTableUsage.column_name == column)
+        if access in ('read', 'write'):
+            query = query.filter(ProjectTableUsage.access == access)
+
+        projects = {}
+        for row in query.all():
+            item = projects.setdefault(row.project_id, {
+                'id': row.project_id,
+                'name': row.name,
+                'parentId': row.directory_id,
+                'tables': set(),
+                'access': set(),
+                'columns': set(),
+            })
+            item['tables'].add(row.table_name)
+            item['access'].add(row.access)
+            if row.column_name:
+                item['columns'].add(row.column_name)
+
+        result = []
+        for item in sorted(projects.values(), key=lambda item: item['name']):
+            item['tables'] = sorted(item['tables'])
+            item['access'] = sorted(item['access'])
+            item['columns'] = sorted(item['columns'])
+            result.append(item)
+
+        return jsonify({'table': table, 'projects': result}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/duplicate-queries', methods=['GET'])
+def get_duplicate_queries():
+    """
+    Find groups of projects with the same normalized SQL
+    ---
+    tags:
+      - Editor
+    summary: Duplicated queries
+    description: Groups projects by SQL fingerprint (literals, formatting and case ignored), largest groups first
+    parameters:
+      - in: query
+        name: minCount
+        type: integer
+        default: 2
+        description: Minimum group size
+      - in: query
+        name: page
+        type: integer
+        default: 1
+      - in: query
+        name: pageSize
+        type: integer
+        default: 20
+    responses:
+      200:
+        description: Duplicate groups
+        schema:
+          type: object
+          properties:
+            groups:
+              type: array
+              items:
+                type: object
+                properties:
+                  fingerprint:
+                    type: string
+                  count:
+                    type: integer
+                  projects:
+                    type: array
+                    items:
+                      type: object
+                      properties:
+                        id:
+                          type: string
+                        name:
+                          type: string
+                        parentId:
+                          type: string
+                          nullable: true
+            total:
+              type: integer
+            page:
+              type: integer
+            pageSize:
+              type: integer
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        min_count = max(request.args.get('minCount', 2, type=int), 2)
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('pageSize', 20, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+
+        groups_query = (
+            db.session.query(ProjectSqlIndex.fingerprint, func.count().label('count'))
+            .join(Project, Project.id == ProjectSqlIndex.project_id)
+            .filter(ProjectSqlIndex.fingerprint.isnot(None))
+            .group_by(ProjectSqlIndex.fingerprint)
+            .having(func.count() >= min_count)
+        )
+        total = groups_query.count()
+        groups = (
+            groups_query
+            .order_by(func.count().desc(), ProjectSqlIndex.fingerprint)
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+
+        members = {}
+        if groups:
+            for row in (
+                db.session.query(ProjectSqlIndex.fingerprint, Project.id, Project.name, Project.directory_id)
+                .join(Project, Project.id == ProjectSqlIndex.project_id)
+                .filter(ProjectSqlIndex.fingerprint.in_([group.fingerprint for group in groups]))
+                .order_by(Project.name)
+            ):
+                members.setdefault(row.fingerprint, []).append({
+                    'id': row.id,
+                    'name': row.name,
+                    'parentId': row.directory_id,
+                })
+
+        return jsonify({
+            'groups': [
+                {
+                    'fingerprint': group.fingerprint,
+                    'count': group.count,
+                    'projects': members.get(group.fingerprint, [])
+                }
+                for group in groups
+            ],
+            'total': total,
+            'page': page,
+            'pageSize': page_size
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@editor_bp.route('/sql-index/backfill', methods=['POST'])
+def run_sql_index_backfill():
+    """
+    Index one batch of existing projects into the SQL usage index
+    ---
+    tags:
+      - Editor
+    summary: Backfill SQL usage index
+    description: |
+      Processes one keyset-ordered batch and returns the cursor to continue from.
+      Call repeatedly until nextCursor is null; projects whose SQL is unchanged are skipped.
+      The same job is available from the command line as `python -m models.backfill_sql_index`.
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: false
+        schema:
+          type: object
+          properties:
+            after:
+              type: string
+              nullable: true
+              description: Cursor returned by the previous call
+            batchSize:
+              type: integer
+              default: 500
+    responses:
+      200:
+        description: Batch processed
+        schema:
+          type: object
+          properties:
+            processed:
+              type: integer
+            indexed:
+              type: integer
+            nextCursor:
+              type: string
+              nullable: true
+      500:
+        description: Server error
+        schema:
+          type: object
+          properties:
+            error:
+              type: string
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        batch_size = min(max(int(data.get('batchSize', 500)), 1), MAX_BATCH_OPERATIONS)
+        return jsonify(backfill_sql_index(after=data.get('after'), batch_size=batch_size)), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
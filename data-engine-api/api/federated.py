@@ -0,0 +1,577 @@
+"""
+Federated queries across saved connections
+Tables are written as <connection_name>.<schema>.<table> (or <connection_name>.<table>).
+Every referenced table is fetched from its own connection in parallel, with the needed columns
+and single-table WHERE conditions pushed down, and loaded into a scratch SQLite database; the
+query then runs there with the references rewritten to the loaded tables. The scratch database
+is a temp file with a bounded page cache, so joins over inputs larger than memory spill to disk
+(SQLite builds transient indexes on the join keys instead of nested-loop scanning).
+
+The query itself runs in SQLite's dialect. Pushed-down conditions are kept in the local query
+as well, so pushdown only ever shrinks what is transferred, never the result.
+
+Configuration (environment variables):
+  FEDERATED_MAX_PARALLEL     sources fetched concurrently (default: 4)
+  FEDERATED_MAX_SOURCE_ROWS  rows one source may return before the query is aborted (default: 5000000)
+  FEDERATED_SPILL_DIR        directory for scratch databases (default: system temp dir)
+  FEDERATED_CACHE_MB         in-memory page cache of the scratch database (default: 256)
+"""
+import datetime
+import decimal
+import os
+import queue
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from models.sql_parser import KEYWORDS, tokenize_sql_spans
+from .timeouts import is_timeout_error, resolve_statement_timeout, statement_timeout
+
+
+FETCH_BATCH_ROWS = 5000
+
+# Clause keywords that end a FROM list or a WHERE clause at the same nesting level
+_CLAUSE_END = frozenset(['where', 'group', 'order', 'having', 'limit', 'offset', 'window', 'union',
+                         'intersect', 'except', 'fetch', 'on', 'using', 'select', 'returning'])
+_WHERE_END = frozenset(['group', 'order', 'having', 'limit', 'offset', 'window', 'union',
+                        'intersect', 'except', 'fetch'])
+# Tokens a condition may consist of to be pushed down to a source
+_PUSHDOWN_KEYWORDS = frozenset(['and', 'or', 'not', 'in', 'between', 'is', 'null', 'true', 'false'])
+_PUSHDOWN_OPERATORS = frozenset(['=', '<>', '!=', '<', '>', '<=', '>=', '(', ')', ',', '-'])
+_ISO_DATE_RE = re.compile(r"^'\d{4}-\d{2}-\d{2}([ T][\d:.]+)?'$")
+
+
+class FederatedQueryError(ValueError):
+    """
+    The query cannot be planned (no federated tables, unknown or ambiguous connection, etc.)
+    """
+
+
+class FederatedTimeoutError(FederatedQueryError):
+    """
+    A source query or the local query ran longer than its statement timeout
+    """
+
+    def __init__(self, message: str, timeout: float):
+        super().__init__(message)
+        self.timeout = timeout
+
+
+def _identifier(token) -> str:
+    kind, value = token
+    if kind == 'qident':
+        return value[1:-1].replace('""', '"').replace('``', '`').lower()
+    return value.lower()
+
+
+def _is_name(token) -> bool:
+    return token[0] == 'qident' or (token[0] == 'word' and token[1].lower() not in KEYWORDS)
+
+
+def _quote_local(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+class SourceTable:
+    """
+    One remote table of a federated query and what has to be fetched from it
+    """
+
+    def __init__(self, connection, object_parts, local_name):
+        self.connection = connection
+        self.object_sql = '.'.join(object_parts)  # schema.table as written in the query
+        self.local_name = local_name
+        self.references = 0
+        self.pushdown_allowed = True
+        self.all_columns = False
+        self.columns = {}  # lower-case name -> name as written
+        self.filters = []
+
+    def build_query(self) -> str:
+        if self.all_columns:
+            projection = '*'
+        elif self.columns:
+            projection = ', '.join(self.columns.values())
+        else:
+            # Only the row count matters, e.g. SELECT count(*)
+            projection = '1 AS __row'
+        sql = f'SELECT {projection} FROM {self.object_sql}'
+        if self.filters:
+            sql += ' WHERE ' + ' AND '.join(f'({condition})' for condition in self.filters)
+        return sql
+
+    def describe(self) -> dict:
+        return {
+            'connectionId': self.connection.id,
+            'connection': self.connection.name,
+            'table': self.object_sql,
+            'localTable': self.local_name,
+            'query': self.build_query(),
+        }
+
+
+class FederatedPlan:
+    def __init__(self, sources, local_sql):
+        self.sources = sources
+        self.local_sql = local_sql
+
+
+def _find_table_references(tokens, connections):
+    """
+    Yield (start, name_end, end, parts, alias, depth, nullable, disables_pushdown) for every
+    table reference whose first name part is a saved connection
+    """
+    depth = 0
+    in_from = {0: False}
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        word = value.lower() if kind == 'word' else None
+        if value == '(' and kind == 'op':
+            depth += 1
+            in_from[depth] = False
+            i += 1
+            continue
+        if value == ')' and kind == 'op':
+            in_from.pop(depth, None)
+            depth = max(depth - 1, 0)
+            i += 1
+            continue
+        if word in ('from', 'join'):
+            in_from[depth] = True
+        elif word in _CLAUSE_END:
+            in_from[depth] = False
+
+        previous = tokens[i - 1] if i > 0 else None
+        is_trigger = previous is not None and (
+            previous[1].lower() in ('from', 'join') or (previous == ('op', ',') and in_from.get(depth))
+        )
+        if not (is_trigger and _is_name(tokens[i]) and _identifier(tokens[i]) in connections):
+            i += 1
+            continue
+
+        parts = [tokens[i]]
+        j = i + 1
+        while j + 1 < len(tokens) and tokens[j] == ('op', '.') and tokens[j + 1][0] in ('word', 'qident'):
+            parts.append(tokens[j + 1])
+            j += 2
+        if len(parts) < 2 or (j < len(tokens) and tokens[j] == ('op', '(')):
+            i += 1
+            continue
+        name_end = j
+
+        alias = None
+        if j < len(tokens) and tokens[j][1].lower() == 'as':
+            j += 1
+        if j < len(tokens) and _is_name(tokens[j]):
+            alias = tokens[j]
+            j += 1
+
+        # Outer joins: conditions on the nullable side must not be pushed down
+        nullable = False
+        disables_pushdown = False
+        if previous[1].lower() == 'join':
+            k = i - 2
+            while k >= 0 and tokens[k][1].lower() in ('outer', 'natural'):
+                k -= 1
+            join_type = tokens[k][1].lower() if k >= 0 else ''
+            nullable = join_type == 'left'
+            disables_pushdown = join_type in ('right', 'full')
+
+        yield i, name_end, j, parts, alias, depth, nullable, disables_pushdown
+        i = j
+
+
+def _where_conditions(tokens):
+    """
+    Top-level WHERE conjuncts as token lists; empty when the statement is a compound query
+    """
+    depth = 0
+    start = end = None
+    for i, (kind, value) in enumerate(tokens):
+        if kind == 'op' and value == '(':
+            depth += 1
+        elif kind == 'op' and value == ')':
+            depth -= 1
+        elif depth == 0 and kind == 'word':
+            word = value.lower()
+            if word in ('union', 'intersect', 'except'):
+                return []
+            if word == 'where' and start is None:
+                start = i + 1
+            elif word in _WHERE_END and start is not None and end is None:
+                end = i
+    if start is None:
+        return []
+
+    conditions = []
+    current = []
+    depth = 0
+    pending_between = False
+    for kind, value in tokens[start:end]:
+        word = value.lower() if kind == 'word' else None
+        if kind == 'op' and value == '(':
+            depth += 1
+        elif kind == 'op' and value == ')':
+            depth -= 1
+        if depth == 0 and word == 'between':
+            pending_between = True
+        elif depth == 0 and word == 'and':
+            if pending_between:
+                pending_between = False
+            else:
+                conditions.append(current)
+                current = []
+                continue
+        current.append((kind, value))
+    if current:
+        conditions.append(current)
+    return conditions
+
+
+def _pushdown_condition(condition, aliases, single_source=None):
+    """
+    Return (source, rewritten_sql) when the condition only compares columns of one source
+    with plain literals, else None; unqualified columns belong to single_source if given
+    """
+    source = None
+    parts = []
+    has_text = False
+    ordering = False
+    i = 0
+    while i < len(condition):
+        kind, value = condition[i]
+        if _is_name(condition[i]):
+            if i + 2 < len(condition) and condition[i + 1] == ('op', '.') and _is_name(condition[i + 2]):
+                owner, column, step = aliases.get(_identifier(condition[i])), condition[i + 2][1], 3
+            elif i + 1 < len(condition) and condition[i + 1] in (('op', '.'), ('op', '(')):
+                return None
+            else:
+                owner, column, step = single_source, value, 1
+            if owner is None or (source is not None and owner is not source):
+                return None
+            source = owner
+            parts.append(column)
+            i += step
+            continue
+        if kind == 'string':
+            # Plain quoted literals only, without dialect-specific escapes
+            if not value.startswith("'") or '\\' in value:
+                return None
+            has_text = True
+            if _ISO_DATE_RE.match(value):
+                has_text = 'date'
+        elif kind == 'number':
+            pass
+        elif kind == 'word':
+            if value.lower() not in _PUSHDOWN_KEYWORDS:
+                return None
+            if value.lower() in ('not', 'between'):
+                ordering = True
+        elif kind == 'op':
+            if value not in _PUSHDOWN_OPERATORS:
+                return None
+            if value not in ('=', '(', ')', ',', '-'):
+                ordering = True
+        else:
+            return None
+        parts.append(value)
+        i += 1
+
+    if source is None or not source.pushdown_allowed:
+        return None
+    # Text ordering and negation depend on collations, which differ between databases;
+    # only ISO dates compare the same everywhere
+    if has_text is True and ordering:
+        return None
+    return source, ' '.join(parts)
+
+
+def plan_federated_query(sql: str, connections: dict) -> FederatedPlan:
+    """
+    Plan a federated query
+    connections: lower-case connection name -> DatabaseConnection (None marks ambiguous names)
+    """
+    spans = tokenize_sql_spans(sql)
+    while spans and spans[-1][:2] == ('op', ';'):
+        spans.pop()
+    if any(span[:2] == ('op', ';') for span in spans):
+        raise FederatedQueryError('联邦查询只支持单条 SELECT 语句')
+    tokens = [(kind, value) for kind, value, _, _ in spans]
+    if not tokens or tokens[0][1].lower() not in ('select', 'with'):
+        raise FederatedQueryError('联邦查询只支持 SELECT 语句')
+
+    sources = {}
+    aliases = {}
+    replacements = []
+    pushdown = True
+    for start, name_end, end, parts, alias, depth, nullable, disables_pushdown in \
+            _find_table_references(tokens, connections):
+        connection_name = _identifier(parts[0])
+        connection = connections[connection_name]
+        if connection is None:
+            raise FederatedQueryError(f'连接名称不唯一: {parts[0][1]}')
+        object_parts = [value for _, value in parts[1:]]
+        key = (connection.id, tuple(_identifier(part) for part in parts[1:]))
+        source = sources.get(key)
+        if source is None:
+            source = SourceTable(connection, object_parts, f'src_{len(sources) + 1}')
+            sources[key] = source
+        source.references += 1
+        if nullable or depth > 0:
+            source.pushdown_allowed = False
+        if disables_pushdown:
+            pushdown = False
+
+        alias_token = alias if alias is not None else parts[-1]
+        alias_name = _identifier(alias_token)
+        if aliases.get(alias_name, source) is not source:
+            raise FederatedQueryError(f'表别名重复: {alias_token[1]}')
+        aliases[alias_name] = source
+        local_alias = alias_token[1] if alias_token[0] == 'qident' else _quote_local(alias_token[1])
+        replacements.append((start, end, f'{source.local_name} AS {local_alias}'))
+
+    if not sources:
+        raise FederatedQueryError('未找到联邦表引用，请使用 <连接名>.<schema>.<表名> 引用表')
+
+    # Projection pushdown from qualified column references
+    consumed = set()
+    for start, end, _ in replacements:
+        consumed.update(range(start, end))
+    bare_columns = False
+    select_aliases = {
+        _identifier(tokens[i + 1]) for i, token in enumerate(tokens[:-1])
+        if token[1].lower() == 'as' and _is_name(tokens[i + 1])
+    }
+    for i, token in enumerate(tokens):
+        if i in consumed:
+            continue
+        previous = tokens[i - 1] if i > 0 else None
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        if token == ('op', '*'):
+            if previous is not None and (previous[1].lower() in ('select', 'distinct', 'all') or previous == ('op', ',')):
+                for source in sources.values():
+                    source.all_columns = True
+            continue
+        if not _is_name(token) or previous == ('op', '.') or following == ('op', '('):
+            continue
+        if following == ('op', '.') and i + 2 < len(tokens):
+            source = aliases.get(_identifier(token))
+            target = tokens[i + 2]
+            if source is None:
+                continue
+            if target == ('op', '*'):
+                source.all_columns = True
+            elif _is_name(target):
+                source.columns.setdefault(_identifier(target), target[1])
+            continue
+        name = _identifier(token)
+        if name in aliases or name in select_aliases:
+            continue
+        if previous is not None and (previous[1].lower() == 'as' or previous == ('op', '::')):
+            continue
+        if previous is not None and (previous[0] in ('string', 'number') or previous == ('op', ')')
+                                     or _is_name(previous)):
+            continue  # implicit alias such as count(*) cnt
+        bare_columns = True
+    if bare_columns:
+        # Unqualified columns cannot be attributed to a source; fetch everything
+        for source in sources.values():
+            source.all_columns = True
+
+    # Filter pushdown: single-source conjuncts of the top-level WHERE clause
+    plan_sources = list(sources.values())
+    if pushdown:
+        for source in plan_sources:
+            if source.references > 1:
+                source.pushdown_allowed = False
+        single_source = plan_sources[0] if len(plan_sources) == 1 else None
+        for condition in _where_conditions(tokens):
+            pushed = _pushdown_condition(condition, aliases, single_source)
+            if pushed is not None:
+                source, condition_sql = pushed
+                source.filters.append(condition_sql)
+
+    # Splice the replacements into the original text so formatting and column labels survive
+    parts = []
+    position = spans[0][2]
+    for start, end, replacement in replacements:
+        parts.append(sql[position:spans[start][2]])
+        parts.append(replacement)
+        position = spans[end - 1][3]
+    parts.append(sql[position:spans[-1][3]])
+    return FederatedPlan(plan_sources, ''.join(parts))
+
+
+# Values sqlite3 binds as they are
+_NATIVE_TYPES = frozenset([type(None), int, float, str, bytes, bool])
+
+
+def _local_value(value):
+    if value is None or isinstance(value, (int, float, str, bytes)):
+        return int(value) if isinstance(value, bool) else value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    return str(value)
+
+
+def _put(out, item, cancelled):
+    # Bounded queue: wait for the loader, but give up once the query was cancelled
+    while not cancelled.is_set():
+        try:
+            out.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch_source(source, db_type, conn_str, timeout, out, cancelled, max_rows):
+    from .database import create_url_engine
+
+    started = time.perf_counter()
+    engine = None
+    try:
+        engine = create_url_engine(db_type, conn_str)
+        with engine.connect() as conn, statement_timeout(conn, db_type, timeout):
+            connected = time.perf_counter()
+            result = conn.execution_options(stream_results=True).execute(text(source.build_query()))
+            if not _put(out, ('columns', source, list(result.keys())), cancelled):
+                return
+            fetched = 0
+            while not cancelled.is_set():
+                batch = result.fetchmany(FETCH_BATCH_ROWS)
+                if not batch:
+                    break
+                fetched += len(batch)
+                if fetched > max_rows:
+                    raise FederatedQueryError(f'返回行数超过上限 {max_rows}')
+                if not _put(out, ('rows', source, batch), cancelled):
+                    return
+            result.close()
+        _put(out, ('done', source, {
+            'rowCount': fetched,
+            'connectTime': round(connected - started, 3),
+            'fetchTime': round(time.perf_counter() - connected, 3),
+        }), cancelled)
+    except Exception as e:
+        _put(out, ('error', source, e), cancelled)
+    finally:
+        if engine is not None:
+            engine.dispose()
+
+
+def _open_scratch_database():
+    directory = os.getenv('FEDERATED_SPILL_DIR') or None
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='federated-', suffix='.db', dir=directory)
+    os.close(fd)
+    local = sqlite3.connect(path)
+    # Throwaway database: no journal or fsync; pages beyond the cache go to the file
+    local.execute('PRAGMA journal_mode=OFF')
+    local.execute('PRAGMA synchronous=OFF')
+    local.execute('PRAGMA temp_store=FILE')
+    local.execute(f'PRAGMA cache_size=-{int(os.getenv("FEDERATED_CACHE_MB", "256")) * 1024}')
+    return local, path
+
+
+def execute_federated_plan(plan: FederatedPlan):
+    """
+    Fetch all sources in parallel, load them into the scratch database and run the local query
+    Returns (columns, rows, source_stats, load_time, local_time); raises on any source error
+    """
+    from .database import connection_url
+
+    max_parallel = max(int(os.getenv('FEDERATED_MAX_PARALLEL', '4')), 1)
+    max_rows = int(os.getenv('FEDERATED_MAX_SOURCE_ROWS', '5000000'))
+    # Build connection strings and timeouts up front so worker threads never touch ORM objects
+    targets = [
+        (source, source.connection.db_type, connection_url(source.connection),
+         resolve_statement_timeout(source.connection.statement_timeout))
+        for source in plan.sources
+    ]
+    timeouts = {id(source): timeout for source, _, _, timeout in targets}
+
+    local, path = _open_scratch_database()
+    out = queue.Queue(maxsize=max_parallel * 4)
+    cancelled = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=min(max_parallel, len(targets)), thread_name_prefix='federated')
+    stats = {id(source): dict(source.describe(), loadTime=0.0) for source in plan.sources}
+    load_started = time.perf_counter()
+    try:
+        for source, db_type, conn_str, timeout in targets:
+            executor.submit(_fetch_source, source, db_type, conn_str, timeout, out, cancelled, max_rows)
+
+        inserts = {}
+        pending = len(targets)
+        while pending:
+            kind, source, payload = out.get()
+            entry = stats[id(source)]
+            if kind == 'error':
+                name = f'{source.connection.name}.{source.object_sql}'
+                if is_timeout_error(payload) and timeouts[id(source)]:
+                    raise FederatedTimeoutError(f'{name}: 查询超过 {timeouts[id(source)]:g} 秒，已取消',
+                                                timeouts[id(source)])
+                raise FederatedQueryError(f'{name}: {payload}')
+            if kind == 'done':
+                entry.update(payload)
+                pending -= 1
+                continue
+            started = time.perf_counter()
+            if kind == 'columns':
+                column_list = ', '.join(_quote_local(name) for name in payload)
+                local.execute(f'CREATE TABLE {source.local_name} ({column_list})')
+                placeholders = ', '.join('?' for _ in payload)
+                inserts[id(source)] = f'INSERT INTO {source.local_name} VALUES ({placeholders})'
+            else:
+                if {type(value) for row in payload for value in row} <= _NATIVE_TYPES:
+                    local.executemany(inserts[id(source)], payload)
+                else:
+                    local.executemany(
+                        inserts[id(source)],
+                        [tuple(_local_value(value) for value in row) for row in payload]
+                    )
+            entry['loadTime'] += time.perf_counter() - started
+        local.commit()
+        load_time = time.perf_counter() - load_started
+
+        started = time.perf_counter()
+        # Same bound as a query on a single connection: interrupt the local query at its deadline
+        timeout = resolve_statement_timeout()
+        if timeout:
+            deadline = time.monotonic() + timeout
+            local.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+        try:
+            cursor = local.execute(plan.local_sql)
+            columns = [description[0] for description in cursor.description or []]
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            if timeout and is_timeout_error(e):
+                raise FederatedTimeoutError(f'本地查询超过 {timeout:g} 秒，已取消', timeout)
+            raise
+        local_time = time.perf_counter() - started
+    finally:
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+        local.close()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    source_stats = []
+    for source in plan.sources:
+        entry = stats[id(source)]
+        entry['loadTime'] = round(entry['loadTime'], 3)
+        source_stats.append(entry)
+    return columns, rows, source_stats, load_time, local_time
@@ -0,0 +1,316 @@
+"""
+Watermark-based incremental loads of project SQL into target tables
+A load runs the project's SELECT on the source connection for the rows at or after the stored
+high-water mark. The SQL either uses :watermark itself, e.g.
+
+    SELECT id, name, updated_at FROM users WHERE :watermark IS NULL OR updated_at >= :watermark
+
+(it is NULL on the first load), or it is wrapped as
+
+    SELECT * FROM (<project SQL>) load_source WHERE <watermark column> >= :watermark
+
+Rows are streamed from a server-side cursor in batches and upserted into the target table
+with the dialect's upsert (INSERT ... ON CONFLICT DO UPDATE on PostgreSQL and SQLite,
+INSERT ... ON DUPLICATE KEY UPDATE on MySQL) as one executemany per batch. All batches are
+written in one target transaction; only after it commits is the new high-water mark (the
+largest watermark value read) stored, together with the load's status, in one metadata
+transaction. Rows equal to the old mark are read again, and since writes are upserts,
+repeating a load after a failure between the two commits writes the same rows again
+instead of duplicating them. Deleted source rows are not propagated.
+
+Configuration (environment variables):
+  LOAD_WORKERS   background load threads per process (default: 2)
+"""
+import contextlib
+import decimal
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from sqlalchemy import Column, MetaData, Table, text, update
+from models import db, DatabaseConnection, Project
+from models.incremental_load import IncrementalLoad, definition_hash, encode_watermark
+from .preview import quote_table
+from .scheduler import acquire_all, scheduler_enabled
+from .timeouts import is_timeout_error, resolve_statement_timeout, statement_timeout
+
+# Loads queue under this user as background work (no per-user limit, no wait deadline)
+SCHEDULER_USER = 'incremental-load'
+# A pending or running load older than this is treated as abandoned
+ABANDONED_LOAD_SECONDS = 6 * 3600
+# Dialects that can write on the connection a server-side cursor is reading from; loads
+# within one such connection use a single connection (and transaction) for both
+SHARED_CONNECTION_DIALECTS = ('sqlite', 'postgresql')
+
+_WATERMARK_PARAMETER = re.compile(r'(?<![:\w]):watermark\b')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(int(os.getenv('LOAD_WORKERS', '2')), 1), thread_name_prefix='load'
+            )
+        return _executor
+
+
+def uses_watermark(sql: str) -> bool:
+    return bool(_WATERMARK_PARAMETER.search(sql or ''))
+
+
+def load_query(sql: str, db_type: str, watermark_column: str, incremental: bool) -> str:
+    sql = sql.strip().rstrip(';').strip()
+    if uses_watermark(sql) or not incremental:
+        return sql
+    column = quote_table(db_type, watermark_column)
+    return f'SELECT * FROM ({sql}) load_source WHERE {column} >= :watermark'
+
+
+def watermark_parameter(db_type: str, watermark):
+    """
+    Bound value of :watermark; SQLite compares times as text
+    """
+    if db_type == 'sqlite':
+        if isinstance(watermark, datetime):
+            return watermark.isoformat(sep=' ')
+        if isinstance(watermark, date):
+            return watermark.isoformat()
+        if isinstance(watermark, decimal.Decimal):
+            return float(watermark)
+    return watermark
+
+
+def _bind_value(value, db_type: str):
+    """
+    Source value as the target driver accepts it
+    """
+    if db_type != 'postgresql' and isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False, default=str)
+    if db_type == 'sqlite':
+        if isinstance(value, decimal.Decimal):
+            # Text keeps the exact value; NUMERIC columns convert it on insert
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat(sep=' ')
+        if isinstance(value, date):
+            return value.isoformat()
+    return value
+
+
+def _later(current, value):
+    """
+    The larger of two watermark values; a value of another type (after the source column
+    changed type) replaces the current one
+    """
+    if value is None:
+        return current
+    if current is None or type(current) is not type(value):
+        return value
+    return value if value > current else current
+
+
+def upsert_statement(db_type: str, table: Table, keys: list):
+    """
+    INSERT that updates the non-key columns of rows whose key already exists
+    """
+    updates = [column.name for column in table.columns if column.name not in keys]
+    if db_type in ('postgresql', 'sqlite'):
+        if db_type == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        statement = insert(table)
+        if not updates:
+            return statement.on_conflict_do_nothing(index_elements=keys)
+        return statement.on_conflict_do_update(
+            index_elements=keys, set_={name: statement.excluded[name] for name in updates}
+        )
+    if db_type == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        # Assigning a key to itself keeps key-only rows a no-op instead of an error
+        names = updates or keys[:1]
+        return statement.on_duplicate_key_update({name: statement.inserted[name] for name in names})
+    raise ValueError(f'不支持的数据库类型: {db_type}')
+
+
+def resolve_columns(result_columns: list, target_columns: list, keys: list, watermark_column: str) -> dict:
+    """
+    Map result columns to target column names (case-insensitively); raises ValueError when
+    the result cannot be written to the target
+    """
+    lowered = [column.lower() for column in result_columns]
+    duplicates = sorted({column for column in lowered if lowered.count(column) > 1})
+    if duplicates:
+        raise ValueError(f'项目 SQL 的结果列名重复: {", ".join(duplicates)}')
+    if watermark_column.lower() not in lowered:
+        raise ValueError(f'项目 SQL 的结果中没有水位列 {watermark_column}')
+    missing_keys = [key for key in keys if key.lower() not in lowered]
+    if missing_keys:
+        raise ValueError(f'项目 SQL 的结果中没有唯一键列: {", ".join(missing_keys)}')
+
+    targets = {column.lower(): column for column in target_columns}
+    missing = [column for column in result_columns if column.lower() not in targets]
+    if missing:
+        raise ValueError(f'目标表中没有这些列: {", ".join(missing)}')
+    return {column: targets[column.lower()] for column in result_columns}
+
+
+def execute_load(load: IncrementalLoad, sql: str, source: DatabaseConnection, target: DatabaseConnection,
+                 watermark=None) -> dict:
+    """
+    Upsert the project's rows at or after watermark (all rows when None) into the target table
+    Returns {rowsRead, rowsWritten, watermark}, watermark being the largest value read (or
+    the given one when no newer row was read). The target transaction is committed on return.
+    """
+    from .database import create_connection_engine, fetch_table_columns
+
+    keys = load.keys
+    batch_size = max(load.batch_size or 1, 1)
+    query = load_query(sql, source.db_type, load.watermark_column, watermark is not None)
+    parameter = watermark_parameter(source.db_type, watermark)
+    timeout = resolve_statement_timeout(source.statement_timeout, batch=True)
+    same_connection = source.id == target.id
+    shared = same_connection and source.db_type in SHARED_CONNECTION_DIALECTS
+
+    source_engine = create_connection_engine(source)
+    target_engine = source_engine if same_connection else create_connection_engine(target)
+    try:
+        with contextlib.ExitStack() as stack:
+            source_conn = stack.enter_context(source_engine.connect())
+            target_conn = source_conn if shared else stack.enter_context(target_engine.connect())
+            stack.enter_context(statement_timeout(source_conn, source.db_type, timeout))
+
+            result = source_conn.execution_options(stream_results=True).execute(text(query), {'watermark': parameter})
+            if not result.returns_rows:
+                raise ValueError('项目 SQL 必须是返回结果集的查询')
+            result_columns = list(result.keys())
+            # On MySQL the schema of a table is its database
+            database = (load.target_schema or target.database) if target.db_type == 'mysql' else target.database
+            target_columns = fetch_table_columns(target_conn, target.db_type, database, load.target_schema,
+                                                 load.target_table)
+            if not target_columns:
+                raise ValueError(f'目标表不存在: {load.target_table}')
+            names = resolve_columns(result_columns, [column['field'] for column in target_columns],
+                                    keys, load.watermark_column)
+
+            lowered = [column.lower() for column in result_columns]
+            key_indexes = [index for index, column in enumerate(lowered) if column in {key.lower() for key in keys}]
+            watermark_index = lowered.index(load.watermark_column.lower())
+            target_names = [names[column] for column in result_columns]
+            table = Table(load.target_table, MetaData(), *[Column(name) for name in target_names],
+                          schema=load.target_schema or None)
+            statement = upsert_statement(target.db_type, table, [target_names[index] for index in key_indexes])
+
+            rows_read = rows_written = 0
+            high = None
+            for rows in result.partitions(batch_size):
+                rows_read += len(rows)
+                # One row per key and batch: PostgreSQL rejects a multi-row upsert touching a row twice
+                batch = {}
+                for row in rows:
+                    high = _later(high, row[watermark_index])
+                    batch[tuple(row[index] for index in key_indexes)] = {
+                        name: _bind_value(value, target.db_type) for name, value in zip(target_names, row)
+                    }
+                target_conn.execute(statement, list(batch.values()))
+                rows_written += len(batch)
+            result.close()
+            target_conn.commit()
+    finally:
+        source_engine.dispose()
+        if target_engine is not source_engine:
+            target_engine.dispose()
+    return {'rowsRead': rows_read, 'rowsWritten': rows_written, 'watermark': _later(watermark, high)}
+
+
+def is_in_progress(load: IncrementalLoad) -> bool:
+    """
+    Pending or running and not abandoned (e.g. by a restarted worker process)
+    """
+    if load.status not in ('pending', 'running'):
+        return False
+    since = load.started_at or load.updated_at
+    return (datetime.utcnow() - since).total_seconds() <= ABANDONED_LOAD_SECONDS
+
+
+def submit_load(app, project_id: str, full: bool = False):
+    """
+    Run a project's load in the background; progress is visible through the load's status
+    """
+    _get_executor().submit(_run_in_app, app, project_id, full)
+
+
+def _run_in_app(app, project_id: str, full: bool):
+    with app.app_context():
+        run_load(project_id, full)
+
+
+def run_load(project_id: str, full: bool = False) -> IncrementalLoad:
+    """
+    Claim a pending load and run it; returns the load's final state (None if it was deleted
+    or another worker claimed it). Needs an application context.
+    """
+    claimed = db.session.execute(
+        update(IncrementalLoad)
+        .where(IncrementalLoad.project_id == project_id, IncrementalLoad.status == 'pending')
+        .values(status='running', started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return None
+    load = IncrementalLoad.query.get(project_id)
+    if load is None:
+        return None
+
+    tickets = []
+    started = time.perf_counter()
+    try:
+        project = Project.query.get(project_id)
+        if project is None or not (project.sql_content or '').strip():
+            raise ValueError('项目没有 SQL')
+        source = DatabaseConnection.query.get(load.source_connection_id) if load.source_connection_id else None
+        target = DatabaseConnection.query.get(load.target_connection_id) if load.target_connection_id else None
+        if source is None or target is None:
+            raise ValueError('源或目标数据库连接不存在')
+        fingerprint = definition_hash(load)
+        # A watermark of another definition says nothing about this one
+        watermark = None if full or load.definition_hash != fingerprint else load.get_watermark()
+        if scheduler_enabled():
+            # One slot on each connection, as one background request
+            tickets = acquire_all([source.id, target.id], SCHEDULER_USER, 'batch', background=True)
+
+        outcome = execute_load(load, project.sql_content, source, target, watermark)
+
+        db.session.refresh(load)
+        if definition_hash(load) != fingerprint:
+            raise ValueError('加载期间源、目标或水位列已修改，水位未更新，请重新加载')
+        load.watermark, load.watermark_type = encode_watermark(outcome['watermark'])
+        load.definition_hash = fingerprint
+        load.rows_read = outcome['rowsRead']
+        load.rows_written = outcome['rowsWritten']
+        load.duration = time.perf_counter() - started
+        load.status = 'completed'
+        load.error = None
+        load.completed_at = datetime.utcnow()
+    except Exception as e:
+        db.session.rollback()
+        load = IncrementalLoad.query.get(project_id)
+        if load is None:
+            return None
+        load.status = 'failed'
+        load.error = '加载超时' if is_timeout_error(e) else str(e)
+        load.rows_read = load.rows_written = None
+        load.duration = time.perf_counter() - started
+    finally:
+        for ticket in tickets:
+            ticket.release()
+    db.session.commit()
+    return load
@@ -0,0 +1,31 @@
+"""
+Deferred imports for heavy optional dependencies
+lazy_import returns a stand-in module that performs the real import on first attribute
+access, so `pa is None` style availability checks stay cheap and startup does not pay for
+libraries (pyarrow, ...) that a worker may never use.
+"""
+import importlib
+import importlib.util
+import types
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module proxy that imports the named module on first attribute access
+    """
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        # Later lookups hit the copied namespace directly
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str):
+    """
+    Return a lazily imported module, or None when its package is not installed
+    """
+    # Only the top-level package is located; finding a submodule would import its parent
+    if importlib.util.find_spec(name.partition('.')[0]) is None:
+        return None
+    return LazyModule(name)
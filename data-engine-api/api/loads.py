@@ -0,0 +1,298 @@
+"""
+Incremental load API endpoints: load definitions of projects and load runs
+Loads execute in the background (see api/incremental_load.py).
+"""
+import json
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import delete
+from models import db, DatabaseConnection, Project
+from models.incremental_load import DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE, IncrementalLoad
+from .incremental_load import is_in_progress, submit_load
+
+loads_bp = Blueprint('loads', __name__, url_prefix='/loads')
+
+
+def _read_name(data, key, required):
+    value = data.get(key)
+    if value is None or value == '':
+        if required:
+            raise ValueError(f'{key} 不能为空')
+        return None
+    if not isinstance(value, str) or not value.strip() or len(value) > 255:
+        raise ValueError(f'{key} 必须是不超过 255 个字符的名称')
+    return value.strip()
+
+
+def read_load_fields(data, partial):
+    """
+    Validated column values from a load request body; raises ValueError
+    """
+    values = {}
+    for key, column in (('sourceConnectionId', 'source_connection_id'), ('targetConnectionId', 'target_connection_id')):
+        if key in data or not partial:
+            if not data.get(key) or not DatabaseConnection.query.get(data[key]):
+                raise ValueError('数据库连接不存在')
+            values[column] = data[key]
+    if 'targetTable' in data or not partial:
+        values['target_table'] = _read_name(data, 'targetTable', required=True)
+    if 'targetSchema' in data:
+        values['target_schema'] = _read_name(data, 'targetSchema', required=False)
+    if 'keyColumns' in data or not partial:
+        keys = data.get('keyColumns')
+        if not isinstance(keys, list) or not keys:
+            raise ValueError('keyColumns 必须是非空的列名数组')
+        keys = [_read_name({'keyColumns': key}, 'keyColumns', required=True) for key in keys]
+        if len({key.lower() for key in keys}) != len(keys):
+            raise ValueError('keyColumns 中有重复的列')
+        values['key_columns'] = keys
+    if 'watermarkColumn' in data or not partial:
+        values['watermark_column'] = _read_name(data, 'watermarkColumn', required=True)
+    if 'batchSize' in data:
+        size = data['batchSize']
+        if isinstance(size, bool) or not isinstance(size, int) or not 1 <= size <= MAX_BATCH_SIZE:
+            raise ValueError(f'batchSize 必须是 1 到 {MAX_BATCH_SIZE} 之间的整数')
+        values['batch_size'] = size
+    return values
+
+
+@loads_bp.route('', methods=['GET'])
+def list_loads():
+    """
+    List incremental load definitions
+    ---
+    tags:
+      - Loads
+    summary: List loads
+    produces:
+      - application/json
+    responses:
+      200:
+        description: Load definitions with the state of their latest run
+        schema:
+          type: object
+          properties:
+            loads:
+              type: array
+              items:
+                type: object
+    """
+    try:
+        loads = IncrementalLoad.query.order_by(IncrementalLoad.created_at).all()
+        return jsonify({'loads': [load.to_dict() for load in loads]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@loads_bp.route('/<project_id>', methods=['GET'])
+def get_load(project_id):
+    """
+    Get the load definition of a project
+    ---
+    tags:
+      - Loads
+    summary: Get load
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Load definition, stored watermark and the state of the latest run
+      404:
+        description: The project has no load
+    """
+    load = IncrementalLoad.query.get(project_id)
+    if not load:
+        return jsonify({'error': '该项目没有增量加载配置'}), 404
+    return jsonify(load.to_dict()), 200
+
+
+@loads_bp.route('/<project_id>', methods=['PUT', 'PATCH'])
+def save_load(project_id):
+    """
+    Create or update the load definition of a project
+    ---
+    tags:
+      - Loads
+    summary: Save load
+    description: |
+      PUT creates or replaces the definition and needs all required fields; PATCH updates the
+      fields present in the body of an existing one. The project's SQL is run on the source
+      connection and its rows are upserted into targetTable on the target connection, keyed
+      by keyColumns (the target needs a primary key or unique index on them). Changing the
+      source, target or watermark column discards the stored watermark.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - sourceConnectionId
+            - targetConnectionId
+            - targetTable
+            - keyColumns
+            - watermarkColumn
+          properties:
+            sourceConnectionId:
+              type: string
+            targetConnectionId:
+              type: string
+            targetSchema:
+              type: string
+            targetTable:
+              type: string
+            keyColumns:
+              type: array
+              items:
+                type: string
+            watermarkColumn:
+              type: string
+              example: updated_at
+            batchSize:
+              type: integer
+              default: 1000
+    responses:
+      200:
+        description: Load updated
+      201:
+        description: Load created
+      400:
+        description: Invalid load definition
+      404:
+        description: Project or load not found
+    """
+    try:
+        data = request.get_json() or {}
+        if not Project.query.get(project_id):
+            return jsonify({'error': '项目不存在'}), 404
+        load = IncrementalLoad.query.get(project_id)
+        partial = request.method == 'PATCH'
+        if partial and not load:
+            return jsonify({'error': '该项目没有增量加载配置'}), 404
+        try:
+            values = read_load_fields(data, partial)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if load is None:
+            load = IncrementalLoad(project_id=project_id, **values)
+            db.session.add(load)
+            db.session.commit()
+            return jsonify(load.to_dict()), 201
+
+        if not partial:
+            values.setdefault('target_schema', None)
+            values.setdefault('batch_size', DEFAULT_BATCH_SIZE)
+        if 'key_columns' in values:
+            values['key_columns'] = json.dumps(values['key_columns'])
+        for key, value in values.items():
+            setattr(load, key, value)
+        db.session.commit()
+        return jsonify(load.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@loads_bp.route('/<project_id>', methods=['DELETE'])
+def delete_load(project_id):
+    """
+    Delete the load definition of a project
+    ---
+    tags:
+      - Loads
+    summary: Delete load
+    description: The target table and the rows already loaded are left untouched.
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Load deleted
+      404:
+        description: The project has no load
+    """
+    try:
+        result = db.session.execute(
+            delete(IncrementalLoad).where(IncrementalLoad.project_id == project_id),
+            execution_options={'synchronize_session': False}
+        )
+        if not result.rowcount:
+            db.session.rollback()
+            return jsonify({'error': '该项目没有增量加载配置'}), 404
+        db.session.commit()
+        return jsonify({'message': '增量加载配置已删除'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@loads_bp.route('/<project_id>/run', methods=['POST'])
+def run_load(project_id):
+    """
+    Load new and changed rows into the target table
+    ---
+    tags:
+      - Loads
+    summary: Run load
+    description: |
+      Runs the project's SQL in the background for the rows at or after the stored watermark
+      and upserts them into the target table; the new watermark is stored after the target
+      transaction commits. With full, all rows are loaded. Returns 202; poll
+      GET /loads/{project_id} for the state.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            full:
+              type: boolean
+              default: false
+    responses:
+      202:
+        description: Load queued or already running
+      404:
+        description: The project has no load
+    """
+    try:
+        load = IncrementalLoad.query.get(project_id)
+        if not load:
+            return jsonify({'error': '该项目没有增量加载配置'}), 404
+        data = request.get_json(silent=True) or {}
+        if is_in_progress(load):
+            return jsonify(load.to_dict()), 202
+        load.status = 'pending'
+        load.error = None
+        load.started_at = None
+        db.session.commit()
+
+        submit_load(current_app._get_current_object(), project_id, full=bool(data.get('full')))
+        return jsonify(load.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建加载任务失败: {str(e)}'}), 500
@@ -0,0 +1,225 @@
+"""
+Incremental materialization of metric values
+A metric's definition SQL returns one row per time partition: the watermark column (the
+partition's time) and the value (a column named `value`, or the only other column). A
+refresh runs it against the metric's connection restricted to partitions at or after the
+stored high-water mark:
+
+    SELECT * FROM (<definition>) metric_source WHERE <watermark column> >= :watermark
+
+The newest stored partition is recomputed because it may have been incomplete; older ones
+are never read again. Definitions may also use :watermark themselves to filter the source
+tables before aggregating (it is NULL on the first refresh). Values are written to
+metric_values in the metadata database and served from there, so reading a metric never
+touches the source warehouse. Refreshes run in the background through the batch class of
+the query scheduler and under the connection's statement timeout.
+
+Configuration (environment variables):
+  METRIC_REFRESH_WORKERS   background refresh threads per process (default: 2)
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from sqlalchemy import delete, insert, text
+from models import db, DatabaseConnection, Metric, MetricMaterialization, MetricValue
+from models.metric_value import definition_hash, truncate_period
+from .preview import quote_table
+from .scheduler import query_scheduler, scheduler_enabled
+from .timeouts import is_timeout_error, resolve_statement_timeout, statement_timeout
+
+# Refreshes queue under this user as background work (no per-user limit, no wait deadline)
+SCHEDULER_USER = 'metric-refresh'
+# A pending or running refresh older than this is treated as abandoned
+ABANDONED_REFRESH_SECONDS = 3600
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(int(os.getenv('METRIC_REFRESH_WORKERS', '2')), 1), thread_name_prefix='metric'
+            )
+        return _executor
+
+
+def _as_period(value, grain: str) -> datetime:
+    if isinstance(value, datetime):
+        parsed = value.replace(tzinfo=None)
+    elif isinstance(value, date):
+        parsed = datetime(value.year, value.month, value.day)
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00')).replace(tzinfo=None)
+        except ValueError:
+            raise ValueError(f'水位列的值不是时间: {value}')
+    else:
+        raise ValueError(f'水位列的值不是时间: {value!r}')
+    return truncate_period(parsed, grain)
+
+
+def _as_value(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'指标值不是数字: {value!r}')
+
+
+def watermark_parameter(db_type: str, watermark, grain: str):
+    """
+    Bound value of :watermark; SQLite stores times as text, so it gets the text form
+    dates and timestamps are written in
+    """
+    if watermark is None:
+        return None
+    if grain == 'hour':
+        return watermark.isoformat(sep=' ') if db_type == 'sqlite' else watermark
+    day = watermark.date()
+    return day.isoformat() if db_type == 'sqlite' else day
+
+
+def refresh_query(metric: Metric, db_type: str, incremental: bool) -> str:
+    sql = metric.definition_sql.strip().rstrip(';').strip()
+    if not incremental:
+        return f'SELECT * FROM ({sql}) metric_source'
+    column = quote_table(db_type, metric.watermark_column)
+    return f'SELECT * FROM ({sql}) metric_source WHERE {column} >= :watermark'
+
+
+def compute_partitions(conn, db_type: str, metric: Metric, watermark=None, timeout: float = 0) -> dict:
+    """
+    Run the definition for partitions at or after watermark; returns {period: value}
+    Raises ValueError when the result does not have one row per partition
+    """
+    query = refresh_query(metric, db_type, watermark is not None)
+    parameter = watermark_parameter(db_type, watermark, metric.time_grain)
+    with statement_timeout(conn, db_type, timeout):
+        result = conn.execute(text(query), {'watermark': parameter})
+        columns = list(result.keys())
+        lowered = [column.lower() for column in columns]
+        if metric.watermark_column.lower() not in lowered:
+            raise ValueError(f'定义 SQL 的结果中没有水位列 {metric.watermark_column}')
+        period_index = lowered.index(metric.watermark_column.lower())
+        others = [i for i in range(len(columns)) if i != period_index]
+        if 'value' in lowered and lowered.index('value') != period_index:
+            value_index = lowered.index('value')
+        elif len(others) == 1:
+            value_index = others[0]
+        else:
+            raise ValueError('定义 SQL 必须返回水位列和一个名为 value 的指标值列')
+
+        values = {}
+        for row in result:
+            if row[period_index] is None:
+                continue
+            period = _as_period(row[period_index], metric.time_grain)
+            if period in values:
+                raise ValueError(f'定义 SQL 在同一时间分区（{period.isoformat()}）返回了多行，请按 '
+                                 f'{metric.time_grain} 粒度分组')
+            values[period] = _as_value(row[value_index])
+    if watermark is not None:
+        values = {period: value for period, value in values.items() if period >= watermark}
+    return values
+
+
+def store_partitions(metric_id: str, values: dict, since=None):
+    """
+    Replace stored partitions at or after since (all of them when None) with values
+    Runs in the caller's transaction.
+    """
+    condition = MetricValue.metric_id == metric_id
+    if since is not None:
+        condition = condition & (MetricValue.period >= since)
+    db.session.execute(delete(MetricValue).where(condition), execution_options={'synchronize_session': False})
+    if values:
+        now = datetime.utcnow()
+        db.session.execute(insert(MetricValue), [
+            {'metric_id': metric_id, 'period': period, 'value': value, 'computed_at': now}
+            for period, value in values.items()
+        ])
+
+
+def is_in_progress(state: MetricMaterialization) -> bool:
+    """
+    Pending or running and not abandoned (e.g. by a restarted worker process)
+    """
+    if state.status not in ('pending', 'running'):
+        return False
+    since = state.started_at or state.created_at
+    return (datetime.utcnow() - since).total_seconds() <= ABANDONED_REFRESH_SECONDS
+
+
+def submit_refresh(app, metric_id: str, full: bool = False):
+    """
+    Refresh a metric in the background; progress is visible through its materialization state
+    """
+    _get_executor().submit(_run_refresh, app, metric_id, full)
+
+
+def _run_refresh(app, metric_id: str, full: bool):
+    from .database import create_connection_engine
+
+    with app.app_context():
+        metric = Metric.query.get(metric_id)
+        state = MetricMaterialization.query.get(metric_id)
+        if metric is None or state is None:
+            return
+        state.status = 'running'
+        state.started_at = datetime.utcnow()
+        db.session.commit()
+
+        ticket = None
+        try:
+            if not metric.is_materializable():
+                raise ValueError('指标缺少定义 SQL、数据库连接、时间粒度或水位列')
+            connection = DatabaseConnection.query.get(metric.connection_id)
+            if connection is None:
+                raise ValueError('数据库连接不存在')
+            fingerprint = definition_hash(metric)
+            # Stored values of another definition cannot be extended
+            watermark = None if full or state.definition_hash != fingerprint else state.watermark
+            timeout = resolve_statement_timeout(connection.statement_timeout, batch=True)
+            if scheduler_enabled():
+                ticket = query_scheduler.acquire(connection.id, SCHEDULER_USER, 'batch', background=True)
+
+            started = time.perf_counter()
+            engine = create_connection_engine(connection)
+            try:
+                with engine.connect() as conn:
+                    values = compute_partitions(conn, connection.db_type, metric, watermark, timeout)
+            finally:
+                engine.dispose()
+
+            db.session.refresh(metric)
+            if definition_hash(metric) != fingerprint:
+                raise ValueError('刷新期间指标定义已修改，请重新刷新')
+            store_partitions(metric_id, values, watermark)
+            state.definition_hash = fingerprint
+            if values:
+                state.watermark = max(values) if watermark is None else max(max(values), watermark)
+            elif watermark is None:
+                state.watermark = None
+            state.partitions = len(values)
+            state.status = 'completed'
+            state.error = None
+            state.completed_at = datetime.utcnow()
+            app.logger.info('Materialized %d partition(s) of metric %s in %.2fs',
+                            len(values), metric_id, time.perf_counter() - started)
+        except Exception as e:
+            db.session.rollback()
+            state = MetricMaterialization.query.get(metric_id)
+            if state is None:
+                return
+            state.status = 'failed'
+            state.error = '刷新超时' if is_timeout_error(e) else str(e)
+        finally:
+            if ticket is not None:
+                ticket.release()
+        db.session.commit()
@@ -0,0 +1,824 @@
+"""
+Metrics library API endpoints: categories, metric definitions, search and bulk import
+Reads carry a weak ETag derived from the library version, so unchanged data is answered
+with 304 without loading any rows. Materialized metric values are refreshed in the
+background (see api/materialization.py) and served from the metadata database.
+"""
+import uuid
+from datetime import datetime
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import delete, func, select, update
+from models import db, DatabaseConnection, MetricMaterialization, MetricValue
+from models.metric import (
+    METRIC_STATUSES, TIME_GRAINS, Metric, MetricCategory, bump_library_revision, import_library, library_version,
+    metric_search_filter, parse_timestamp
+)
+from models.metric_value import definition_hash, purge_metric_values
+from .materialization import is_in_progress, submit_refresh
+
+metrics_bp = Blueprint('metrics', __name__, url_prefix='/metrics')
+
+# 指标列表分页大小上限
+MAX_METRICS_PAGE_SIZE = 200
+# 单次返回的物化指标值上限
+MAX_METRIC_VALUES = 10000
+
+
+def cached_library_response(build):
+    """
+    Answer If-None-Match with 304 while the library is unchanged, otherwise build() the body
+    """
+    etag = library_version()
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag, weak=True)
+    # Let browsers keep the body but revalidate on every use
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+def touch_category(category_id):
+    db.session.execute(
+        update(MetricCategory).where(MetricCategory.id == category_id).values(updated_at=datetime.utcnow()),
+        execution_options={'synchronize_session': False}
+    )
+    bump_library_revision()
+
+
+@metrics_bp.route('/library', methods=['GET'])
+def get_metrics_library():
+    """
+    Get all metric categories with their metrics
+    ---
+    tags:
+      - Metrics
+    summary: Get metrics library
+    description: All categories with their metrics in one response (two queries). Supports If-None-Match.
+    produces:
+      - application/json
+    responses:
+      200:
+        description: Metrics library
+        headers:
+          ETag:
+            type: string
+            description: Weak ETag of the library version
+        schema:
+          type: object
+          properties:
+            categories:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: string
+                  name:
+                    type: string
+                  createdAt:
+                    type: string
+                    format: date-time
+                  updatedAt:
+                    type: string
+                    format: date-time
+                  metrics:
+                    type: array
+                    items:
+                      type: object
+      304:
+        description: Library unchanged since the ETag in If-None-Match
+    """
+    try:
+        def build():
+            metrics_by_category = {}
+            for metric in Metric.query.order_by(Metric.created_at, Metric.id).all():
+                metrics_by_category.setdefault(metric.category_id, []).append(metric.to_dict())
+            categories = MetricCategory.query.order_by(MetricCategory.created_at, MetricCategory.id).all()
+            return {
+                'categories': [
+                    category.to_dict(metrics_by_category.get(category.id, [])) for category in categories
+                ]
+            }
+        return cached_library_response(build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('', methods=['GET'])
+def list_metrics():
+    """
+    Search and page through metrics
+    ---
+    tags:
+      - Metrics
+    summary: List metrics
+    description: Paginated metrics, optionally filtered by category and status and searched by name/description (substring, all terms must match). Supports If-None-Match.
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: q
+        type: string
+        description: Search terms
+      - in: query
+        name: categoryId
+        type: string
+      - in: query
+        name: status
+        type: string
+        enum: [active, draft]
+      - in: query
+        name: page
+        type: integer
+        default: 1
+      - in: query
+        name: pageSize
+        type: integer
+        default: 50
+        description: Page size (max 200)
+    responses:
+      200:
+        description: Metrics page
+        schema:
+          type: object
+          properties:
+            metrics:
+              type: array
+              items:
+                type: object
+            total:
+              type: integer
+            page:
+              type: integer
+            pageSize:
+              type: integer
+      304:
+        description: Library unchanged since the ETag in If-None-Match
+    """
+    try:
+        query = (request.args.get('q') or '').strip()
+        category_id = request.args.get('categoryId')
+        status = request.args.get('status')
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('pageSize', 50, type=int), 1), MAX_METRICS_PAGE_SIZE)
+
+        def build():
+            filters = []
+            if query:
+                filters.append(metric_search_filter(query))
+            if category_id:
+                filters.append(Metric.category_id == category_id)
+            if status:
+                filters.append(Metric.status == status)
+            total = db.session.execute(
+                select(func.count()).select_from(Metric).where(*filters)
+            ).scalar()
+            metrics = (
+                Metric.query.filter(*filters)
+                .order_by(Metric.updated_at.desc(), Metric.id)
+                .offset((page - 1) * page_size)
+                .limit(page_size)
+                .all()
+            )
+            return {
+                'metrics': [metric.to_dict() for metric in metrics],
+                'total': total,
+                'page': page,
+                'pageSize': page_size
+            }
+        return cached_library_response(build)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/categories', methods=['POST'])
+def create_metric_category():
+    """
+    Create a metric category
+    ---
+    tags:
+      - Metrics
+    summary: Create metric category
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - name
+          properties:
+            name:
+              type: string
+              example: "用户指标"
+    responses:
+      201:
+        description: Category created
+      400:
+        description: Name is required
+    """
+    try:
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': '目录名称不能为空'}), 400
+
+        category = MetricCategory(id=f'cat_{uuid.uuid4().hex}', name=name)
+        db.session.add(category)
+        bump_library_revision()
+        db.session.commit()
+        return jsonify(category.to_dict([])), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/categories/<category_id>', methods=['PUT', 'PATCH'])
+def update_metric_category(category_id):
+    """
+    Rename a metric category
+    ---
+    tags:
+      - Metrics
+    summary: Update metric category
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: category_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - name
+          properties:
+            name:
+              type: string
+    responses:
+      200:
+        description: Category updated
+      400:
+        description: Name is required
+      404:
+        description: Category not found
+    """
+    try:
+        data = request.get_json() or {}
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'error': '目录名称不能为空'}), 400
+
+        category = MetricCategory.query.get(category_id)
+        if not category:
+            return jsonify({'error': '指标目录不存在'}), 404
+        category.name = name
+        bump_library_revision()
+        db.session.commit()
+        return jsonify(category.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/categories/<category_id>', methods=['DELETE'])
+def delete_metric_category(category_id):
+    """
+    Delete a metric category with all its metrics
+    ---
+    tags:
+      - Metrics
+    summary: Delete metric category
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: category_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Category deleted
+        schema:
+          type: object
+          properties:
+            message:
+              type: string
+            deletedMetrics:
+              type: integer
+      404:
+        description: Category not found
+    """
+    try:
+        purge_metric_values(select(Metric.id).where(Metric.category_id == category_id))
+        metric_result = db.session.execute(
+            delete(Metric).where(Metric.category_id == category_id),
+            execution_options={'synchronize_session': False}
+        )
+        category_result = db.session.execute(
+            delete(MetricCategory).where(MetricCategory.id == category_id),
+            execution_options={'synchronize_session': False}
+        )
+        if not category_result.rowcount:
+            db.session.rollback()
+            return jsonify({'error': '指标目录不存在'}), 404
+        bump_library_revision()
+        db.session.commit()
+        return jsonify({'message': '指标目录已删除', 'deletedMetrics': metric_result.rowcount}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+def read_metric_fields(data, partial):
+    """
+    Validated column values from a metric request body; raises ValueError
+    """
+    values = {}
+    if 'name' in data or not partial:
+        name = (data.get('name') or '').strip()
+        if not name:
+            raise ValueError('指标名称不能为空')
+        values['name'] = name
+    if 'description' in data:
+        values['description'] = data.get('description')
+    if 'definitionSql' in data:
+        values['definition_sql'] = data.get('definitionSql')
+    if 'status' in data:
+        if data.get('status') not in METRIC_STATUSES:
+            raise ValueError('指标状态必须是 active 或 draft')
+        values['status'] = data['status']
+    if 'categoryId' in data or not partial:
+        category_id = data.get('categoryId')
+        if not category_id or not MetricCategory.query.get(category_id):
+            raise ValueError('指标目录不存在')
+        values['category_id'] = category_id
+    if 'connectionId' in data:
+        connection_id = data.get('connectionId') or None
+        if connection_id and not DatabaseConnection.query.get(connection_id):
+            raise ValueError('数据库连接不存在')
+        values['connection_id'] = connection_id
+    if 'timeGrain' in data:
+        time_grain = data.get('timeGrain') or None
+        if time_grain is not None and time_grain not in TIME_GRAINS:
+            raise ValueError(f'时间粒度必须是 {" / ".join(TIME_GRAINS)} 之一')
+        values['time_grain'] = time_grain
+    if 'watermarkColumn' in data:
+        values['watermark_column'] = (data.get('watermarkColumn') or '').strip() or None
+    return values
+
+
+@metrics_bp.route('', methods=['POST'])
+def create_metric():
+    """
+    Create a metric
+    ---
+    tags:
+      - Metrics
+    summary: Create metric
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - categoryId
+            - name
+          properties:
+            categoryId:
+              type: string
+            name:
+              type: string
+              example: "日活跃用户数"
+            description:
+              type: string
+            definitionSql:
+              type: string
+            connectionId:
+              type: string
+              description: Connection the definition SQL runs on
+            timeGrain:
+              type: string
+              enum: [hour, day, week, month, quarter, year]
+            watermarkColumn:
+              type: string
+              description: Time column of the definition's result
+            status:
+              type: string
+              enum: [active, draft]
+              default: draft
+    responses:
+      201:
+        description: Metric created
+      400:
+        description: Invalid metric
+    """
+    try:
+        data = request.get_json() or {}
+        try:
+            values = read_metric_fields(data, partial=False)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        metric = Metric(id=f'metric_{uuid.uuid4().hex}', **values)
+        db.session.add(metric)
+        touch_category(metric.category_id)
+        db.session.commit()
+        return jsonify(metric.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/<metric_id>', methods=['GET'])
+def get_metric(metric_id):
+    """
+    Get a metric
+    ---
+    tags:
+      - Metrics
+    summary: Get metric
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: metric_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Metric
+      404:
+        description: Metric not found
+    """
+    metric = Metric.query.get(metric_id)
+    if not metric:
+        return jsonify({'error': '指标不存在'}), 404
+    return jsonify(metric.to_dict()), 200
+
+
+@metrics_bp.route('/<metric_id>', methods=['PUT', 'PATCH'])
+def update_metric(metric_id):
+    """
+    Update a metric
+    ---
+    tags:
+      - Metrics
+    summary: Update metric
+    description: Updates the fields present in the body; categoryId moves the metric to another category.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: metric_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            categoryId:
+              type: string
+            name:
+              type: string
+            description:
+              type: string
+            definitionSql:
+              type: string
+            connectionId:
+              type: string
+              description: Connection the definition SQL runs on
+            timeGrain:
+              type: string
+              enum: [hour, day, week, month, quarter, year]
+            watermarkColumn:
+              type: string
+              description: Time column of the definition's result
+            status:
+              type: string
+              enum: [active, draft]
+    responses:
+      200:
+        description: Metric updated
+      400:
+        description: Invalid metric
+      404:
+        description: Metric not found
+    """
+    try:
+        data = request.get_json() or {}
+        metric = Metric.query.get(metric_id)
+        if not metric:
+            return jsonify({'error': '指标不存在'}), 404
+        try:
+            values = read_metric_fields(data, partial=True)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        previous_category = metric.category_id
+        previous_definition = definition_hash(metric)
+        for key, value in values.items():
+            setattr(metric, key, value)
+        if definition_hash(metric) != previous_definition:
+            # Values of the old definition must not be mixed with new ones
+            purge_metric_values([metric.id])
+        touch_category(metric.category_id)
+        if previous_category != metric.category_id:
+            touch_category(previous_category)
+        db.session.commit()
+        return jsonify(metric.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/<metric_id>', methods=['DELETE'])
+def delete_metric(metric_id):
+    """
+    Delete a metric
+    ---
+    tags:
+      - Metrics
+    summary: Delete metric
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: metric_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Metric deleted
+      404:
+        description: Metric not found
+    """
+    try:
+        category_id = db.session.execute(select(Metric.category_id).where(Metric.id == metric_id)).scalar()
+        if category_id is None:
+            return jsonify({'error': '指标不存在'}), 404
+        purge_metric_values([metric_id])
+        db.session.execute(
+            delete(Metric).where(Metric.id == metric_id),
+            execution_options={'synchronize_session': False}
+        )
+        touch_category(category_id)
+        db.session.commit()
+        return jsonify({'message': '指标已删除'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/import', methods=['POST'])
+def import_metrics():
+    """
+    Bulk import categories and metrics
+    ---
+    tags:
+      - Metrics
+    summary: Import metrics library
+    description: |
+      Imports data in the format of the web client's data/metrics.json. Rows are matched by
+      id: new ones are inserted and existing ones updated, in one transaction with batched
+      statements. With replace, categories and metrics not in the payload are deleted.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - categories
+          properties:
+            replace:
+              type: boolean
+              default: false
+            categories:
+              type: array
+              items:
+                type: object
+                properties:
+                  id:
+                    type: string
+                  name:
+                    type: string
+                  metrics:
+                    type: array
+                    items:
+                      type: object
+    responses:
+      200:
+        description: Import summary
+        schema:
+          type: object
+          properties:
+            categories:
+              type: object
+              properties:
+                created:
+                  type: integer
+                updated:
+                  type: integer
+                deleted:
+                  type: integer
+            metrics:
+              type: object
+      400:
+        description: Invalid import data
+    """
+    try:
+        data = request.get_json() or {}
+        try:
+            summary = import_library(data, replace=bool(data.get('replace')))
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        db.session.commit()
+        return jsonify(summary), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@metrics_bp.route('/<metric_id>/refresh', methods=['POST'])
+def refresh_metric(metric_id):
+    """
+    Materialize new time partitions of a metric
+    ---
+    tags:
+      - Metrics
+    summary: Refresh metric values
+    description: |
+      Runs the metric's definition SQL on its connection in the background for the partitions
+      at or after the stored high-water mark (the newest stored partition is recomputed) and
+      stores the values. With full, all partitions are recomputed. Returns 202; poll
+      GET /metrics/{metric_id}/values for the state.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: metric_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        schema:
+          type: object
+          properties:
+            full:
+              type: boolean
+              default: false
+    responses:
+      202:
+        description: Refresh queued or already running
+      400:
+        description: Metric is not configured for materialization
+      404:
+        description: Metric not found
+    """
+    try:
+        metric = Metric.query.get(metric_id)
+        if not metric:
+            return jsonify({'error': '指标不存在'}), 404
+        if not metric.is_materializable():
+            return jsonify({'error': '指标缺少定义 SQL、数据库连接、时间粒度或水位列'}), 400
+        data = request.get_json(silent=True) or {}
+
+        state = MetricMaterialization.query.get(metric_id)
+        if state is not None and is_in_progress(state):
+            return jsonify(state.to_dict()), 202
+        if state is None:
+            state = MetricMaterialization(metric_id)
+            db.session.add(state)
+        else:
+            # Keep the stored values visible until the refresh completes
+            state.status = 'pending'
+            state.error = None
+            state.started_at = None
+        db.session.commit()
+
+        submit_refresh(current_app._get_current_object(), metric_id, full=bool(data.get('full')))
+        return jsonify(state.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建刷新任务失败: {str(e)}'}), 500
+
+
+@metrics_bp.route('/<metric_id>/values', methods=['GET'])
+def get_metric_values(metric_id):
+    """
+    Get materialized values of a metric
+    ---
+    tags:
+      - Metrics
+    summary: Get metric values
+    description: Stored partitions in time order, read from the metadata database only (the source is never queried).
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: metric_id
+        type: string
+        required: true
+      - in: query
+        name: from
+        type: string
+        format: date-time
+        description: First partition (inclusive)
+      - in: query
+        name: to
+        type: string
+        format: date-time
+        description: Last partition (inclusive)
+      - in: query
+        name: limit
+        type: integer
+        description: Newest partitions to return (max 10000)
+    responses:
+      200:
+        description: Metric values with the refresh state
+        schema:
+          type: object
+          properties:
+            metricId:
+              type: string
+            timeGrain:
+              type: string
+            values:
+              type: array
+              items:
+                type: object
+                properties:
+                  period:
+                    type: string
+                    format: date-time
+                  value:
+                    type: number
+            materialization:
+              type: object
+            stale:
+              type: boolean
+              description: Values were computed from a different definition
+      400:
+        description: Invalid range
+      404:
+        description: Metric not found
+    """
+    metric = Metric.query.get(metric_id)
+    if not metric:
+        return jsonify({'error': '指标不存在'}), 404
+    bounds = {}
+    for name in ('from', 'to'):
+        if request.args.get(name):
+            bounds[name] = parse_timestamp(request.args[name])
+            if bounds[name] is None:
+                return jsonify({'error': f'{name} 必须是 ISO 8601 时间'}), 400
+    filters = [MetricValue.metric_id == metric_id]
+    if 'from' in bounds:
+        filters.append(MetricValue.period >= bounds['from'])
+    if 'to' in bounds:
+        filters.append(MetricValue.period <= bounds['to'])
+    limit = min(max(request.args.get('limit', MAX_METRIC_VALUES, type=int), 1), MAX_METRIC_VALUES)
+
+    # Newest partitions first so limit keeps the latest ones, then back to time order
+    values = (
+        MetricValue.query.filter(*filters)
+        .order_by(MetricValue.period.desc())
+        .limit(limit)
+        .all()
+    )
+    state = MetricMaterialization.query.get(metric_id)
+    return jsonify({
+        'metricId': metric_id,
+        'timeGrain': metric.time_grain,
+        'values': [value.to_dict() for value in reversed(values)],
+        'materialization': state.to_dict() if state else None,
+        'stale': bool(state and state.definition_hash and state.definition_hash != definition_hash(metric)),
+    }), 200
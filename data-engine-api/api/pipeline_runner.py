@@ -0,0 +1,603 @@
+"""
+Parallel execution of the project DAG of a directory
+The projects of a directory and its subdirectories are the nodes. A project runs after the
+projects it is declared to depend on (project_dependencies) and, unless inference is turned
+off, after the projects writing a table it reads, according to the SQL usage index (and the
+target tables of incremental loads). Projects with an incremental load run the load; the
+others run their SQL, statement by statement in one transaction, on the run's connection.
+
+A coordinator thread per run keeps the ready nodes (all upstream nodes finished) and hands
+them to a worker pool shared by all runs, at most max_workers of the run at a time and at
+most connection_limit per connection. Among the ready nodes, the one with the longest
+estimated chain of work below it (from the durations of earlier runs) starts first, so the
+wall time tends to the longest chain rather than the sum of all projects. A failed node
+blocks its descendants; independent branches continue.
+
+Before running, a node computes its input fingerprint from its SQL, its connection (or load
+definition), the fingerprints of its upstream nodes and a version of every table it reads
+that no project of the run writes: on PostgreSQL the table's insert/update/delete counters
+and file node (pg_stat_user_tables, updated by the statistics system within about a second
+of a commit), on MySQL its UPDATE_TIME. Tables without a version (SQLite, views, MySQL after
+a restart) make the fingerprint unknown, and the node and everything below it run. A node
+whose fingerprint equals that of its last outcome, which succeeded or was skipped, is skipped.
+
+Configuration (environment variables):
+  PIPELINE_WORKERS            node threads per process, shared by all runs (default: 4)
+  PIPELINE_CONNECTION_LIMIT   default concurrent nodes per connection in a run (default: 2)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import NamedTuple, Optional
+from sqlalchemy import and_, func, insert, select, text, update
+from models import db, DatabaseConnection, IncrementalLoad, Project, ProjectTableUsage
+from models.incremental_load import definition_hash as load_definition_hash
+from models.pipeline import PipelineNode, PipelineRun, ProjectDependency
+from models.sql_parser import tokenize_sql_spans
+from models.sql_usage import content_hash, index_projects
+from .editor import subtree_cte
+from .incremental_load import is_in_progress as load_in_progress, run_load
+from .scheduler import query_scheduler, scheduler_enabled
+from .timeouts import is_timeout_error, resolve_statement_timeout, statement_timeout
+
+# Nodes queue under this user as background work (no per-user limit, no wait deadline)
+SCHEDULER_USER = 'pipeline'
+# A pending or running run older than this belongs to a process that died
+ABANDONED_RUN_SECONDS = 12 * 3600
+# Concurrent runs per process; further runs wait for a coordinator
+MAX_ACTIVE_RUNS = 4
+# Duration assumed for projects that never ran, when ordering ready nodes
+DEFAULT_ESTIMATE = 1.0
+
+_node_executor = None
+_coordinator_executor = None
+_executor_lock = threading.Lock()
+
+
+def pipeline_workers() -> int:
+    return max(int(os.getenv('PIPELINE_WORKERS', '4')), 1)
+
+
+def default_connection_limit() -> int:
+    return max(int(os.getenv('PIPELINE_CONNECTION_LIMIT', '2')), 1)
+
+
+def _get_executors():
+    global _node_executor, _coordinator_executor
+    with _executor_lock:
+        if _node_executor is None:
+            _node_executor = ThreadPoolExecutor(max_workers=pipeline_workers(), thread_name_prefix='pipeline-node')
+            _coordinator_executor = ThreadPoolExecutor(max_workers=MAX_ACTIVE_RUNS, thread_name_prefix='pipeline')
+        return _node_executor, _coordinator_executor
+
+
+def split_script(sql: str) -> list:
+    """
+    Statements of a script as source text, split at semicolons outside strings and comments
+    """
+    statements = []
+    start = end = None
+    for kind, value, token_start, token_end in tokenize_sql_spans(sql):
+        if (kind, value) == ('op', ';'):
+            if start is not None:
+                statements.append(sql[start:end])
+            start = None
+            continue
+        if start is None:
+            start = token_start
+        end = token_end
+    if start is not None:
+        statements.append(sql[start:end])
+    return statements
+
+
+def _object_name(table: str) -> str:
+    return table.rsplit('.', 1)[-1]
+
+
+def _same_table(a: str, b: str) -> bool:
+    # An unqualified name may refer to a table of any schema on the search path
+    return a == b or (('.' not in a or '.' not in b) and _object_name(a) == _object_name(b))
+
+
+class PipelineGraph:
+    """
+    Projects of a directory subtree with their dependencies
+    """
+
+    def __init__(self, projects: list, loads: dict):
+        self.projects = {project.id: project for project in projects}
+        self.loads = loads  # project id -> IncrementalLoad
+        self.upstream = {project.id: set() for project in projects}
+        self.downstream = {project.id: set() for project in projects}
+        self.explicit = set()  # (upstream, downstream) declared edges
+        self.tables = defaultdict(set)  # (upstream, downstream) -> tables written by one and read by the other
+        self.external = {project.id: set() for project in projects}  # tables read that no project here writes
+
+    def add_edge(self, upstream: str, downstream: str):
+        self.upstream[downstream].add(upstream)
+        self.downstream[upstream].add(downstream)
+
+    def mode(self, project_id: str) -> str:
+        return 'load' if project_id in self.loads else 'sql'
+
+    def order(self) -> list:
+        """
+        Topological order (ties by project name); raises ValueError naming a cycle
+        """
+        remaining = {project_id: len(upstream) for project_id, upstream in self.upstream.items()}
+        ready = sorted((self.projects[project_id].name, project_id)
+                       for project_id, count in remaining.items() if count == 0)
+        order = []
+        while ready:
+            _, project_id = ready.pop(0)
+            order.append(project_id)
+            for child in self.downstream[project_id]:
+                remaining[child] -= 1
+                if remaining[child] == 0:
+                    ready.append((self.projects[child].name, child))
+            ready.sort()
+        if len(order) < len(self.projects):
+            cycle = self._find_cycle({project_id for project_id, count in remaining.items() if count > 0})
+            raise ValueError('存在循环依赖: ' + ' -> '.join(self.projects[project_id].name for project_id in cycle))
+        return order
+
+    def _find_cycle(self, candidates: set) -> list:
+        # Every node left by Kahn's algorithm has an upstream node that is also left
+        path = [min(candidates)]
+        seen = {path[0]: 0}
+        while True:
+            node = min(self.upstream[path[-1]] & candidates)
+            if node in seen:
+                cycle = path[seen[node]:] + [node]
+                return list(reversed(cycle))
+            seen[node] = len(path)
+            path.append(node)
+
+    def edges(self) -> list:
+        pairs = self.explicit | set(self.tables)
+        return [
+            {'from': upstream, 'to': downstream, 'explicit': (upstream, downstream) in self.explicit,
+             'tables': sorted(self.tables.get((upstream, downstream), ()))}
+            for upstream, downstream in sorted(pairs)
+        ]
+
+
+def build_graph(directory_id: str, infer: bool = True) -> PipelineGraph:
+    """
+    DAG of the projects under a directory
+    Brings the SQL usage index of these projects up to date in the caller's transaction.
+    """
+    tree = subtree_cte([directory_id])
+    projects = Project.query.filter(Project.directory_id.in_(select(tree.c.id))).order_by(Project.name).all()
+    ids = [project.id for project in projects]
+    loads = {load.project_id: load for load in IncrementalLoad.query.filter(IncrementalLoad.project_id.in_(ids)).all()} \
+        if ids else {}
+    graph = PipelineGraph(projects, loads)
+    if not ids:
+        return graph
+
+    for upstream, downstream in db.session.execute(
+        select(ProjectDependency.depends_on_id, ProjectDependency.project_id)
+        .where(ProjectDependency.project_id.in_(ids), ProjectDependency.depends_on_id.in_(ids))
+    ).all():
+        graph.add_edge(upstream, downstream)
+        graph.explicit.add((upstream, downstream))
+
+    index_projects([(project.id, project.sql_content) for project in projects])
+    reads = defaultdict(set)
+    writes = defaultdict(set)
+    for project_id, table_name, access in db.session.execute(
+        select(ProjectTableUsage.project_id, ProjectTableUsage.table_name, ProjectTableUsage.access)
+        .where(ProjectTableUsage.project_id.in_(ids), ProjectTableUsage.column_name.is_(None))
+    ).all():
+        (writes if access == 'write' else reads)[project_id].add(table_name)
+    for project_id, load in loads.items():
+        target = f'{load.target_schema}.{load.target_table}' if load.target_schema else load.target_table
+        writes[project_id].add(target.lower())
+
+    writers = defaultdict(list)  # object name -> [(table, project id)]
+    for project_id, tables in writes.items():
+        for table in tables:
+            writers[_object_name(table)].append((table, project_id))
+    for project_id in ids:
+        # A project reading a table it writes itself (INSERT ... SELECT FROM t) depends on nothing for it
+        own = writes[project_id]
+        for table in reads[project_id]:
+            if any(_same_table(table, written) for written in own):
+                continue
+            producers = [writer for written, writer in writers.get(_object_name(table), ())
+                         if writer != project_id and _same_table(table, written)]
+            if not producers:
+                graph.external[project_id].add(table)
+            elif infer:
+                for producer in producers:
+                    graph.add_edge(producer, project_id)
+                    graph.tables[(producer, project_id)].add(table)
+            else:
+                # Without inference the order is not guaranteed, so the table is an outside input
+                graph.external[project_id].add(table)
+    return graph
+
+
+def critical_path(order: list, upstream: dict, durations: dict) -> tuple:
+    """
+    Longest chain of dependent nodes by total duration; returns (project ids, seconds)
+    """
+    finish = {}
+    previous = {}
+    for project_id in order:
+        before = max(upstream[project_id], key=lambda node: finish[node], default=None)
+        finish[project_id] = durations.get(project_id, 0.0) + (finish[before] if before else 0.0)
+        previous[project_id] = before
+    if not finish:
+        return [], 0.0
+    node = max(order, key=lambda project_id: finish[project_id])
+    total = finish[node]
+    path = []
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    return list(reversed(path)), total
+
+
+def remaining_work(order: list, downstream: dict, durations: dict) -> dict:
+    """
+    Per node, the estimated duration of the longest chain starting at it
+    """
+    levels = {}
+    for project_id in reversed(order):
+        below = max((levels[child] for child in downstream[project_id]), default=0.0)
+        levels[project_id] = durations.get(project_id, DEFAULT_ESTIMATE) + below
+    return levels
+
+
+def latest_nodes(project_ids: list, statuses: tuple) -> dict:
+    """
+    Most recent finished node of each project with one of the statuses: {project id: PipelineNode}
+    """
+    if not project_ids:
+        return {}
+    latest = (
+        select(PipelineNode.project_id, func.max(PipelineNode.finished_at).label('finished_at'))
+        .where(PipelineNode.project_id.in_(project_ids), PipelineNode.status.in_(statuses))
+        .group_by(PipelineNode.project_id)
+        .subquery()
+    )
+    nodes = PipelineNode.query.join(latest, and_(
+        PipelineNode.project_id == latest.c.project_id, PipelineNode.finished_at == latest.c.finished_at
+    )).all()
+    return {node.project_id: node for node in nodes}
+
+
+def estimated_durations(project_ids: list) -> dict:
+    return {project_id: node.duration or 0.0
+            for project_id, node in latest_nodes(project_ids, ('succeeded',)).items()}
+
+
+def table_versions(conn, db_type: str, tables) -> dict:
+    """
+    A value per table that changes whenever its rows change, or None when there is none
+    """
+    versions = {table: None for table in tables}
+    if db_type == 'postgresql':
+        for table in tables:
+            row = conn.execute(text(
+                'SELECT n_tup_ins, n_tup_upd, n_tup_del, pg_relation_filenode(relid) '
+                'FROM pg_stat_user_tables WHERE relid = to_regclass(:name)'
+            ), {'name': table}).first()
+            if row is not None:
+                versions[table] = ':'.join(str(value) for value in row)
+    elif db_type == 'mysql':
+        try:
+            # MySQL 8 caches table statistics for a day by default
+            conn.execute(text('SET SESSION information_schema_stats_expiry = 0'))
+        except Exception:
+            pass
+        for table in tables:
+            schema, _, name = table.rpartition('.')
+            row = conn.execute(text(
+                'SELECT UPDATE_TIME, CREATE_TIME FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = COALESCE(:schema, DATABASE()) AND TABLE_NAME = :name'
+            ), {'schema': schema or None, 'name': name}).first()
+            if row is not None and row[0] is not None:
+                versions[table] = f'{row[0].isoformat()}:{row[1].isoformat() if row[1] else ""}'
+    return versions
+
+
+def input_fingerprint(source_key: str, sql: str, upstream: dict, versions: dict) -> Optional[str]:
+    """
+    Hash of everything a node's output depends on; None when a table version is unknown
+    """
+    if any(version is None for version in versions.values()):
+        return None
+    raw = json.dumps([source_key, content_hash(sql), sorted(upstream.items()), sorted(versions.items())])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def execute_script(connection: DatabaseConnection, sql: str) -> int:
+    """
+    Run the statements of a script in one transaction; returns the rows affected
+    """
+    from .database import create_connection_engine
+
+    timeout = resolve_statement_timeout(connection.statement_timeout, batch=True)
+    engine = create_connection_engine(connection)
+    affected = 0
+    try:
+        with engine.connect() as conn, statement_timeout(conn, connection.db_type, timeout):
+            for statement in split_script(sql):
+                result = conn.execute(text(statement))
+                if not result.returns_rows and result.rowcount > 0:
+                    affected += result.rowcount
+                result.close()
+            conn.commit()
+    finally:
+        engine.dispose()
+    return affected
+
+
+def _run_load_node(project_id: str) -> int:
+    load = IncrementalLoad.query.get(project_id)
+    if load is None:
+        raise ValueError('增量加载配置已删除')
+    if load_in_progress(load):
+        raise ValueError('该项目的增量加载正在执行')
+    load.status = 'pending'
+    load.error = None
+    load.started_at = None
+    db.session.commit()
+    load = run_load(project_id)
+    if load is None:
+        raise ValueError('该项目的增量加载正在执行')
+    if load.status == 'failed':
+        raise ValueError(load.error)
+    return load.rows_written or 0
+
+
+class NodeTask(NamedTuple):
+    run_id: str
+    project_id: str
+    mode: str
+    connection_id: Optional[str]  # SQL nodes: the run's connection; loads: the source connection
+    source_key: str
+    external_tables: frozenset
+    upstream: dict  # upstream project id -> fingerprint
+    previous: Optional[tuple]  # (status, fingerprint) of the project's last outcome
+    force: bool
+
+
+def _execute_node(app, task: NodeTask) -> dict:
+    with app.app_context():
+        started = time.perf_counter()
+        outcome = {'status': 'failed', 'fingerprint': None, 'rowCount': None, 'error': None}
+        ticket = None
+        try:
+            db.session.execute(
+                update(PipelineNode)
+                .where(PipelineNode.run_id == task.run_id, PipelineNode.project_id == task.project_id)
+                .values(status='running', started_at=datetime.utcnow())
+            )
+            db.session.commit()
+            project = Project.query.get(task.project_id)
+            if project is None:
+                raise ValueError('项目已删除')
+            sql = project.sql_content or ''
+            connection = DatabaseConnection.query.get(task.connection_id) if task.connection_id else None
+
+            versions = {table: None for table in task.external_tables}
+            if task.external_tables and connection is not None and connection.db_type in ('postgresql', 'mysql'):
+                from .database import create_connection_engine
+                engine = create_connection_engine(connection)
+                try:
+                    with engine.connect() as conn:
+                        versions = table_versions(conn, connection.db_type, sorted(task.external_tables))
+                finally:
+                    engine.dispose()
+            fingerprint = input_fingerprint(task.source_key, sql, task.upstream, versions)
+            # An unknown input makes this node, and through it everything below, run every time
+            outcome['fingerprint'] = fingerprint or f'run:{task.run_id}'
+
+            if not task.force and fingerprint is not None and task.previous == ('succeeded', fingerprint):
+                outcome['status'] = 'skipped'
+            elif task.mode == 'load':
+                outcome['rowCount'] = _run_load_node(task.project_id)
+                outcome['status'] = 'succeeded'
+            elif not split_script(sql):
+                outcome['rowCount'] = 0
+                outcome['status'] = 'succeeded'
+            else:
+                if connection is None:
+                    raise ValueError('未指定数据库连接')
+                if scheduler_enabled():
+                    ticket = query_scheduler.acquire(connection.id, SCHEDULER_USER, 'batch', background=True)
+                outcome['rowCount'] = execute_script(connection, sql)
+                outcome['status'] = 'succeeded'
+        except Exception as e:
+            db.session.rollback()
+            outcome['status'] = 'failed'
+            outcome['error'] = '执行超时' if is_timeout_error(e) else str(e)
+        finally:
+            if ticket is not None:
+                ticket.release()
+        outcome['duration'] = 0.0 if outcome['status'] == 'skipped' else time.perf_counter() - started
+        db.session.execute(
+            update(PipelineNode)
+            .where(PipelineNode.run_id == task.run_id, PipelineNode.project_id == task.project_id)
+            .values(status=outcome['status'], fingerprint=outcome['fingerprint'], row_count=outcome['rowCount'],
+                    duration=outcome['duration'], error=outcome['error'], finished_at=datetime.utcnow())
+        )
+        db.session.commit()
+        return outcome
+
+
+def is_in_progress(run: PipelineRun) -> bool:
+    """
+    Pending or running and not abandoned (e.g. by a restarted worker process)
+    """
+    if run.status not in ('pending', 'running'):
+        return False
+    since = run.started_at or run.created_at
+    return (datetime.utcnow() - since).total_seconds() <= ABANDONED_RUN_SECONDS
+
+
+def submit_pipeline(app, run_id: str):
+    """
+    Run a pipeline in the background; progress is visible through its run and node rows
+    """
+    _, coordinators = _get_executors()
+    coordinators.submit(_coordinate_in_app, app, run_id)
+
+
+def _coordinate_in_app(app, run_id: str):
+    with app.app_context():
+        try:
+            coordinate(app, run_id)
+        except Exception as e:
+            db.session.rollback()
+            run = PipelineRun.query.get(run_id)
+            if run is not None:
+                run.status = 'failed'
+                run.error = str(e)
+                run.finished_at = datetime.utcnow()
+                db.session.commit()
+            app.logger.exception('Pipeline run %s failed', run_id)
+
+
+def coordinate(app, run_id: str):
+    """
+    Execute a pending run to completion; needs an application context
+    """
+    claimed = db.session.execute(
+        update(PipelineRun)
+        .where(PipelineRun.id == run_id, PipelineRun.status == 'pending')
+        .values(status='running', started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return
+    run = PipelineRun.query.get(run_id)
+    started = time.perf_counter()
+
+    graph = build_graph(run.directory_id, run.infer)
+    order = graph.order()
+    db.session.commit()
+    if order:
+        db.session.execute(insert(PipelineNode), [{
+            'run_id': run_id,
+            'project_id': project_id,
+            'project_name': graph.projects[project_id].name,
+            'mode': graph.mode(project_id),
+            'depends_on_json': json.dumps(sorted(graph.upstream[project_id])),
+            'status': 'pending',
+        } for project_id in order])
+    run.node_count = len(order)
+    db.session.commit()
+
+    previous = {project_id: (node.status, node.fingerprint)
+                for project_id, node in latest_nodes(order, ('succeeded', 'skipped', 'failed')).items()}
+    # A skipped node stands for the outcome it was skipped in favour of
+    previous = {project_id: ('succeeded' if status == 'skipped' else status, fingerprint)
+                for project_id, (status, fingerprint) in previous.items()}
+    priority = remaining_work(order, graph.downstream, estimated_durations(order))
+
+    def connections_of(project_id):
+        load = graph.loads.get(project_id)
+        if load is None:
+            return {run.connection_id}
+        return {load.source_connection_id, load.target_connection_id}
+
+    def task_for(project_id):
+        load = graph.loads.get(project_id)
+        if load is None:
+            connection_id = run.connection_id
+            source_key = f'sql:{run.connection_id}'
+        else:
+            connection_id = load.source_connection_id
+            source_key = f'load:{load_definition_hash(load)}:{load.key_columns}'
+        return NodeTask(run_id, project_id, graph.mode(project_id), connection_id, source_key,
+                        frozenset(graph.external[project_id]),
+                        {upstream: fingerprints[upstream] for upstream in graph.upstream[project_id]},
+                        previous.get(project_id), run.force)
+
+    nodes, _ = _get_executors()
+    worker_limit = min(run.max_workers, pipeline_workers())
+    waiting = {project_id: set(graph.upstream[project_id]) for project_id in order}
+    ready = [project_id for project_id in order if not waiting[project_id]]
+    in_flight = {}
+    busy = Counter()
+    fingerprints = {}
+    durations = {}
+    statuses = {}
+
+    while ready or in_flight:
+        ready.sort(key=lambda project_id: (-priority[project_id], graph.projects[project_id].name))
+        for project_id in list(ready):
+            if len(in_flight) >= worker_limit:
+                break
+            connections = connections_of(project_id)
+            if any(busy[connection_id] >= run.connection_limit for connection_id in connections):
+                continue
+            ready.remove(project_id)
+            busy.update(connections)
+            in_flight[nodes.submit(_execute_node, app, task_for(project_id))] = project_id
+
+        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+        for future in done:
+            project_id = in_flight.pop(future)
+            busy.subtract(connections_of(project_id))
+            outcome = future.result()
+            statuses[project_id] = outcome['status']
+            fingerprints[project_id] = outcome['fingerprint']
+            durations[project_id] = outcome['duration']
+            if outcome['status'] == 'failed':
+                blocked = _descendants(graph, project_id) - statuses.keys()
+                for node in blocked:
+                    statuses[node] = 'blocked'
+                    waiting.pop(node, None)
+                if blocked:
+                    db.session.execute(
+                        update(PipelineNode)
+                        .where(PipelineNode.run_id == run_id, PipelineNode.project_id.in_(blocked))
+                        .values(status='blocked', error='上游项目执行失败')
+                    )
+                    db.session.commit()
+                continue
+            for child in graph.downstream[project_id]:
+                if child in waiting:
+                    waiting[child].discard(project_id)
+                    if not waiting[child]:
+                        ready.append(child)
+
+    counts = Counter(statuses.values())
+    path, path_duration = critical_path(order, graph.upstream, durations)
+    run = PipelineRun.query.get(run_id)
+    run.succeeded = counts['succeeded']
+    run.failed = counts['failed']
+    run.skipped = counts['skipped']
+    run.blocked = counts['blocked']
+    run.critical_path_json = json.dumps(path)
+    run.critical_path_duration = path_duration
+    run.total_duration = sum(durations.values())
+    run.wall_time = time.perf_counter() - started
+    run.status = 'failed' if counts['failed'] else 'succeeded'
+    run.finished_at = datetime.utcnow()
+    db.session.commit()
+    app.logger.info('Pipeline run %s: %d node(s) in %.2fs, critical path %.2fs, total work %.2fs',
+                    run_id, len(order), run.wall_time, path_duration, run.total_duration)
+
+
+def _descendants(graph: PipelineGraph, project_id: str) -> set:
+    found = set()
+    stack = [project_id]
+    while stack:
+        for child in graph.downstream[stack.pop()]:
+            if child not in found:
+                found.add(child)
+                stack.append(child)
+    return found
@@ -0,0 +1,455 @@
+"""
+Pipeline API endpoints: project dependencies, the project DAG of a directory and its runs
+Runs execute in the background (see api/pipeline_runner.py).
+"""
+import uuid
+from flask import Blueprint, current_app, request, jsonify
+from sqlalchemy import delete, func, insert, select
+from models import db, DatabaseConnection, Directory, Project
+from models.pipeline import RUN_STATUSES, PipelineNode, PipelineRun, ProjectDependency
+from .pipeline_runner import (
+    build_graph, critical_path, default_connection_limit, estimated_durations, is_in_progress, pipeline_workers,
+    submit_pipeline
+)
+
+pipelines_bp = Blueprint('pipelines', __name__, url_prefix='/pipelines')
+
+# 运行记录分页大小上限
+MAX_RUNS_PAGE_SIZE = 200
+
+
+def _read_flag(value, default: bool) -> bool:
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).lower() not in ('false', '0', 'no')
+
+
+def _read_limit(data, key, default, maximum):
+    value = data.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= maximum:
+        raise ValueError(f'{key} 必须是 1 到 {maximum} 之间的整数')
+    return value
+
+
+def _reaches(start_ids, target_id) -> bool:
+    """
+    Whether target_id is reachable from start_ids along declared dependencies
+    """
+    seen = set()
+    frontier = set(start_ids)
+    while frontier:
+        if target_id in frontier:
+            return True
+        seen |= frontier
+        frontier = set(db.session.execute(
+            select(ProjectDependency.depends_on_id).where(ProjectDependency.project_id.in_(frontier))
+        ).scalars()) - seen
+    return False
+
+
+@pipelines_bp.route('/dependencies/<project_id>', methods=['GET'])
+def get_dependencies(project_id):
+    """
+    Projects a project is declared to depend on
+    ---
+    tags:
+      - Pipelines
+    summary: Get project dependencies
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Declared upstream projects and the projects declared to depend on this one
+        schema:
+          type: object
+          properties:
+            projectId:
+              type: string
+            dependsOn:
+              type: array
+              items:
+                type: string
+            dependents:
+              type: array
+              items:
+                type: string
+      404:
+        description: Project not found
+    """
+    if not Project.query.get(project_id):
+        return jsonify({'error': '项目不存在'}), 404
+    depends_on = db.session.execute(
+        select(ProjectDependency.depends_on_id)
+        .where(ProjectDependency.project_id == project_id)
+        .order_by(ProjectDependency.depends_on_id)
+    ).scalars().all()
+    dependents = db.session.execute(
+        select(ProjectDependency.project_id)
+        .where(ProjectDependency.depends_on_id == project_id)
+        .order_by(ProjectDependency.project_id)
+    ).scalars().all()
+    return jsonify({'projectId': project_id, 'dependsOn': depends_on, 'dependents': dependents}), 200
+
+
+@pipelines_bp.route('/dependencies/<project_id>', methods=['PUT'])
+def set_dependencies(project_id):
+    """
+    Replace the projects a project is declared to depend on
+    ---
+    tags:
+      - Pipelines
+    summary: Set project dependencies
+    description: |
+      Declared dependencies come on top of the ones inferred from the tables the projects
+      read and write; use them for dependencies the SQL does not show (e.g. through views,
+      procedures or another connection). Dependencies on projects outside the directory of
+      a run are ignored by that run.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: project_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - dependsOn
+          properties:
+            dependsOn:
+              type: array
+              items:
+                type: string
+    responses:
+      200:
+        description: Dependencies saved
+      400:
+        description: Unknown project, self-dependency or cycle
+      404:
+        description: Project not found
+    """
+    try:
+        if not Project.query.get(project_id):
+            return jsonify({'error': '项目不存在'}), 404
+        depends_on = (request.get_json() or {}).get('dependsOn')
+        if not isinstance(depends_on, list) or not all(isinstance(item, str) for item in depends_on):
+            return jsonify({'error': 'dependsOn 必须是项目 ID 数组'}), 400
+        depends_on = sorted(set(depends_on))
+        if project_id in depends_on:
+            return jsonify({'error': '项目不能依赖自身'}), 400
+        found = set(db.session.execute(select(Project.id).where(Project.id.in_(depends_on))).scalars()) \
+            if depends_on else set()
+        missing = [item for item in depends_on if item not in found]
+        if missing:
+            return jsonify({'error': f'项目不存在: {", ".join(missing)}'}), 400
+
+        db.session.execute(
+            delete(ProjectDependency).where(ProjectDependency.project_id == project_id),
+            execution_options={'synchronize_session': False}
+        )
+        if depends_on and _reaches(depends_on, project_id):
+            db.session.rollback()
+            return jsonify({'error': '依赖会形成循环'}), 400
+        if depends_on:
+            db.session.execute(insert(ProjectDependency), [
+                {'project_id': project_id, 'depends_on_id': item} for item in depends_on
+            ])
+        db.session.commit()
+        return jsonify({'projectId': project_id, 'dependsOn': depends_on}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@pipelines_bp.route('/graph', methods=['GET'])
+def get_graph():
+    """
+    Project DAG of a directory
+    ---
+    tags:
+      - Pipelines
+    summary: Get pipeline graph
+    description: |
+      The projects of the directory and its subdirectories with their declared and inferred
+      dependencies, the order they can run in (levels of projects that can run in parallel)
+      and the critical path estimated from the durations of earlier runs.
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: directoryId
+        type: string
+        required: true
+      - in: query
+        name: infer
+        type: boolean
+        default: true
+        description: Infer dependencies from the tables the projects write and read
+    responses:
+      200:
+        description: Nodes, edges, levels and estimated critical path
+      400:
+        description: The dependencies form a cycle
+      404:
+        description: Directory not found
+    """
+    try:
+        directory_id = request.args.get('directoryId')
+        if not directory_id or not Directory.query.get(directory_id):
+            return jsonify({'error': '目录不存在'}), 404
+        graph = build_graph(directory_id, _read_flag(request.args.get('infer'), True))
+        db.session.commit()
+        try:
+            order = graph.order()
+        except ValueError as e:
+            return jsonify({'error': str(e), 'edges': graph.edges()}), 400
+
+        levels = {}
+        for project_id in order:
+            levels[project_id] = max((levels[upstream] + 1 for upstream in graph.upstream[project_id]), default=0)
+        estimates = estimated_durations(order)
+        path, path_duration = critical_path(order, graph.upstream, estimates)
+        return jsonify({
+            'directoryId': directory_id,
+            'nodes': [{
+                'projectId': project_id,
+                'projectName': graph.projects[project_id].name,
+                'mode': graph.mode(project_id),
+                'dependsOn': sorted(graph.upstream[project_id]),
+                'level': levels[project_id],
+                'externalTables': sorted(graph.external[project_id]),
+                'estimatedDuration': estimates.get(project_id),
+            } for project_id in order],
+            'edges': graph.edges(),
+            'levels': max(levels.values(), default=-1) + 1,
+            'criticalPath': path,
+            'criticalPathDuration': path_duration,
+            'totalDuration': sum(estimates.values()),
+        }), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@pipelines_bp.route('/runs', methods=['POST'])
+def create_run():
+    """
+    Run the project DAG of a directory
+    ---
+    tags:
+      - Pipelines
+    summary: Start pipeline run
+    description: |
+      Runs the projects of the directory and its subdirectories in the background, each after
+      the projects it depends on and independent ones in parallel. Projects with an incremental
+      load run the load; the others run their SQL on connectionId. Projects whose inputs did not
+      change since their last successful run are skipped unless force is set. Returns 202; poll
+      GET /pipelines/runs/{run_id} for the state.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - directoryId
+          properties:
+            directoryId:
+              type: string
+            connectionId:
+              type: string
+              description: Connection for the projects without an incremental load
+            maxWorkers:
+              type: integer
+              description: Projects running at the same time (at most PIPELINE_WORKERS)
+            connectionLimit:
+              type: integer
+              description: Projects running at the same time on one connection
+            force:
+              type: boolean
+              default: false
+            infer:
+              type: boolean
+              default: true
+    responses:
+      202:
+        description: Run queued
+      400:
+        description: Invalid request or the dependencies form a cycle
+      404:
+        description: Directory or connection not found
+      409:
+        description: The directory already has a run in progress
+    """
+    try:
+        data = request.get_json() or {}
+        directory_id = data.get('directoryId')
+        if not directory_id or not Directory.query.get(directory_id):
+            return jsonify({'error': '目录不存在'}), 404
+        connection_id = data.get('connectionId')
+        if connection_id and not DatabaseConnection.query.get(connection_id):
+            return jsonify({'error': '数据库连接不存在'}), 404
+        workers = pipeline_workers()
+        try:
+            max_workers = _read_limit(data, 'maxWorkers', workers, workers)
+            connection_limit = _read_limit(data, 'connectionLimit', default_connection_limit(), workers)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        infer = _read_flag(data.get('infer'), True)
+
+        graph = build_graph(directory_id, infer)
+        db.session.commit()
+        try:
+            graph.order()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not connection_id and any(graph.mode(project_id) == 'sql' for project_id in graph.projects):
+            return jsonify({'error': '目录中有未配置增量加载的项目，需要指定 connectionId'}), 400
+
+        active = PipelineRun.query.filter(
+            PipelineRun.directory_id == directory_id, PipelineRun.status.in_(('pending', 'running'))
+        ).all()
+        running = [run for run in active if is_in_progress(run)]
+        if running:
+            return jsonify({'error': '该目录已有运行中的流水线', 'runningRunId': running[0].id}), 409
+
+        run = PipelineRun(
+            id=str(uuid.uuid4()),
+            directory_id=directory_id,
+            connection_id=connection_id,
+            max_workers=max_workers,
+            connection_limit=connection_limit,
+            infer=infer,
+            force=_read_flag(data.get('force'), False),
+        )
+        db.session.add(run)
+        db.session.commit()
+
+        submit_pipeline(current_app._get_current_object(), run.id)
+        return jsonify(run.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'创建流水线运行失败: {str(e)}'}), 500
+
+
+@pipelines_bp.route('/runs', methods=['GET'])
+def list_runs():
+    """
+    Pipeline run history
+    ---
+    tags:
+      - Pipelines
+    summary: List pipeline runs
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: directoryId
+        type: string
+      - in: query
+        name: status
+        type: string
+        enum: [pending, running, succeeded, failed]
+      - in: query
+        name: page
+        type: integer
+        default: 1
+      - in: query
+        name: pageSize
+        type: integer
+        default: 20
+        description: Page size (max 200)
+    responses:
+      200:
+        description: Runs, newest first
+        schema:
+          type: object
+          properties:
+            runs:
+              type: array
+              items:
+                type: object
+            total:
+              type: integer
+            page:
+              type: integer
+            pageSize:
+              type: integer
+    """
+    try:
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('pageSize', 20, type=int), 1), MAX_RUNS_PAGE_SIZE)
+        filters = []
+        directory_id = request.args.get('directoryId')
+        if directory_id:
+            filters.append(PipelineRun.directory_id == directory_id)
+        status = request.args.get('status')
+        if status:
+            if status not in RUN_STATUSES:
+                return jsonify({'error': f'运行状态无效: {status}'}), 400
+            filters.append(PipelineRun.status == status)
+
+        total = db.session.execute(select(func.count()).select_from(PipelineRun).where(*filters)).scalar()
+        runs = (
+            PipelineRun.query.filter(*filters)
+            .order_by(PipelineRun.created_at.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+        return jsonify({
+            'runs': [run.to_dict() for run in runs],
+            'total': total,
+            'page': page,
+            'pageSize': page_size
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@pipelines_bp.route('/runs/<run_id>', methods=['GET'])
+def get_run(run_id):
+    """
+    Get a pipeline run with its nodes
+    ---
+    tags:
+      - Pipelines
+    summary: Get pipeline run
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: run_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Run with one node per project, in start order
+      404:
+        description: Run not found
+    """
+    run = PipelineRun.query.get(run_id)
+    if not run:
+        return jsonify({'error': '运行记录不存在'}), 404
+    nodes = (
+        PipelineNode.query.filter(PipelineNode.run_id == run_id)
+        .order_by(PipelineNode.started_at.is_(None), PipelineNode.started_at, PipelineNode.project_name)
+        .all()
+    )
+    return jsonify({**run.to_dict(), 'nodes': [node.to_dict() for node in nodes]}), 200
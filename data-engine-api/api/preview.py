@@ -0,0 +1,198 @@
+"""
+Cheap table previews using each dialect's native sampling
+PostgreSQL reads a few random blocks with TABLESAMPLE SYSTEM, MySQL probes random ranges of
+an integer primary key and SQLite random rowid ranges, so preview cost does not grow with
+table size. Small tables (or tables without a usable key) fall back to a plain LIMIT.
+Every preview runs under a hard statement timeout and is cached per table for a short time.
+
+Configuration (environment variables):
+  PREVIEW_TIMEOUT     statement timeout in seconds (default: 5)
+  PREVIEW_CACHE_TTL   seconds a preview is served from cache (default: 300)
+  PREVIEW_MAX_ROWS    upper bound for the requested row count (default: 1000)
+"""
+import math
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from .timeouts import statement_timeout
+
+
+DEFAULT_PREVIEW_ROWS = 100
+PREVIEW_CACHE_SIZE = 256
+# Range probes per preview for key-based sampling
+PREVIEW_PROBES = 10
+# Tables with fewer estimated rows than this multiple of the requested rows are read with LIMIT
+SAMPLE_MIN_FACTOR = 20
+
+_INTEGER_TYPES = frozenset(['tinyint', 'smallint', 'mediumint', 'int', 'integer', 'bigint'])
+
+
+def preview_timeout() -> float:
+    return float(os.getenv('PREVIEW_TIMEOUT', '5'))
+
+
+def preview_max_rows() -> int:
+    return int(os.getenv('PREVIEW_MAX_ROWS', '1000'))
+
+
+class PreviewCache:
+    """
+    Small thread-safe LRU of recent previews with a TTL
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, ttl: float):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
+preview_cache = PreviewCache(PREVIEW_CACHE_SIZE)
+
+
+def cache_ttl() -> float:
+    return float(os.getenv('PREVIEW_CACHE_TTL', '300'))
+
+
+def quote_table(db_type: str, table: str, schema: str = None) -> str:
+    if db_type == 'mysql':
+        quote = lambda name: '`' + name.replace('`', '``') + '`'
+    else:
+        quote = lambda name: '"' + name.replace('"', '""') + '"'
+    return f'{quote(schema)}.{quote(table)}' if schema else quote(table)
+
+
+def range_probe_query(table_sql: str, key_sql: str, low: int, high: int, limit: int,
+                      select: str = '*', probes: int = PREVIEW_PROBES) -> tuple:
+    """
+    UNION ALL of short index range scans starting at random key values; returns (sql, params)
+    """
+    probes = min(probes, limit)
+    per_probe = math.ceil(limit / probes)
+    # One random start per equal-width stratum spreads probes over the key range without overlap
+    stride = (high - low + 1) / probes
+    starts = [int(low + stride * index + random.random() * max(stride - per_probe, 0)) for index in range(probes)]
+    parts = [
+        f'SELECT * FROM (SELECT {select} FROM {table_sql} WHERE {key_sql} >= :start_{index} '
+        f'ORDER BY {key_sql} LIMIT {per_probe}) AS probe_{index}'
+        for index in range(probes)
+    ]
+    return ' UNION ALL '.join(parts), {f'start_{index}': start for index, start in enumerate(starts)}
+
+
+def _dedupe(rows, key_index: int, limit: int) -> list:
+    seen = set()
+    unique = []
+    for row in rows:
+        key = row[key_index]
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(row)
+    return unique[:limit]
+
+
+def _sample_postgresql(conn, table_sql: str, limit: int):
+    estimate = conn.execute(
+        text('SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)'), {'name': table_sql}
+    ).scalar()
+    if estimate is None:
+        raise ValueError('表不存在')
+    if estimate >= limit * SAMPLE_MIN_FACTOR:
+        # Aim for about three times the requested rows to absorb block-level variance
+        percent = min(100.0, max(limit * 3 * 100.0 / estimate, 0.0001))
+        result = conn.execute(text(f'SELECT * FROM {table_sql} TABLESAMPLE SYSTEM ({percent:.6f}) LIMIT {limit}'))
+        rows = result.fetchall()
+        if len(rows) >= limit:
+            return list(result.keys()), rows, 'tablesample'
+    result = conn.execute(text(f'SELECT * FROM {table_sql} LIMIT {limit}'))
+    return list(result.keys()), result.fetchall(), 'limit'
+
+
+def _sample_mysql(conn, database: str, table: str, table_sql: str, limit: int):
+    key_columns = conn.execute(text("""
+        SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_SCHEMA = :database AND TABLE_NAME = :table AND COLUMN_KEY = 'PRI'
+        ORDER BY ORDINAL_POSITION
+    """), {'database': database, 'table': table}).fetchall()
+    if len(key_columns) == 1 and key_columns[0][1].lower() in _INTEGER_TYPES:
+        key = key_columns[0][0]
+        key_sql = '`' + key.replace('`', '``') + '`'
+        # MIN/MAX of the primary key are read from the ends of the index
+        low, high = conn.execute(text(f'SELECT MIN({key_sql}), MAX({key_sql}) FROM {table_sql}')).fetchone()
+        if low is not None and high - low + 1 >= limit * SAMPLE_MIN_FACTOR:
+            query, params = range_probe_query(table_sql, key_sql, int(low), int(high), limit)
+            result = conn.execute(text(query), params)
+            columns = list(result.keys())
+            rows = _dedupe(result.fetchall(), columns.index(key), limit)
+            if len(rows) >= limit:
+                return columns, rows, 'pk-range'
+    result = conn.execute(text(f'SELECT * FROM {table_sql} LIMIT {limit}'))
+    return list(result.keys()), result.fetchall(), 'limit'
+
+
+def _sample_sqlite(conn, table_sql: str, limit: int):
+    try:
+        low, high = conn.execute(text(f'SELECT MIN(rowid), MAX(rowid) FROM {table_sql}')).fetchone()
+    except Exception:
+        low = high = None  # WITHOUT ROWID table
+    if low is not None and high - low + 1 >= limit * SAMPLE_MIN_FACTOR:
+        query, params = range_probe_query(
+            table_sql, 'rowid', int(low), int(high), limit, select='rowid AS __preview_rowid, *'
+        )
+        result = conn.execute(text(query), params)
+        rows = _dedupe(result.fetchall(), 0, limit)
+        if len(rows) >= limit:
+            return list(result.keys())[1:], [tuple(row)[1:] for row in rows], 'rowid-range'
+    result = conn.execute(text(f'SELECT * FROM {table_sql} LIMIT {limit}'))
+    return list(result.keys()), result.fetchall(), 'limit'
+
+
+def sample_table(engine, db_type: str, database: str, schema: str, table: str, limit: int) -> dict:
+    """
+    Read up to limit rows of a table with the cheapest sampling path for the dialect
+    """
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        with statement_timeout(conn, db_type, preview_timeout()):
+            if db_type == 'postgresql':
+                columns, rows, method = _sample_postgresql(conn, quote_table(db_type, table, schema or 'public'), limit)
+            elif db_type == 'mysql':
+                columns, rows, method = _sample_mysql(conn, database, table, quote_table(db_type, table, database), limit)
+            elif db_type == 'sqlite':
+                columns, rows, method = _sample_sqlite(conn, quote_table(db_type, table), limit)
+            else:
+                raise ValueError(f'不支持的数据库类型: {db_type}')
+        conn.rollback()
+
+    return {
+        'columns': columns,
+        'rows': [
+            [value if value is None or isinstance(value, (int, float, str, bool)) else str(value) for value in row]
+            for row in rows
+        ],
+        'rowCount': len(rows),
+        'method': method,
+        'executionTime': round(time.perf_counter() - started, 3),
+        'sampledAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
@@ -0,0 +1,370 @@
+"""
+Column profiling with cached statistics
+A profile is computed in the background with two statements over the same sample of the table:
+one combined aggregate query for row/null/distinct counts and min/max of every column, then
+one UNION ALL query for top values and numeric histograms (bucket bounds come from the first).
+Large tables are sampled (TABLESAMPLE SYSTEM ... REPEATABLE on PostgreSQL, primary key /
+rowid range probes on MySQL and SQLite); on PostgreSQL distinct counts of sampled tables come
+from the planner's pg_stats estimates. Results are stored in table_profiles with the time
+they were computed.
+
+Configuration (environment variables):
+  PROFILE_SAMPLE_ROWS   rows examined per table; larger tables are sampled (default: 100000)
+  PROFILE_TIMEOUT       statement timeout per profiling query in seconds (default: 120)
+  PROFILE_MAX_AGE       seconds a completed profile counts as fresh (default: 86400)
+  PROFILE_WORKERS       background profiling threads per process (default: 2)
+"""
+import decimal
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import text
+from models import db, DatabaseConnection, TableProfile
+from .preview import range_probe_query, quote_table
+from .scheduler import query_scheduler, scheduler_enabled
+from .timeouts import statement_timeout, is_timeout_error
+
+
+# Profiles queue under this user as background work (no per-user limit, no wait deadline)
+SCHEDULER_USER = 'profile'
+
+TOP_VALUES = 5
+HISTOGRAM_BUCKETS = 10
+SAMPLE_PROBES = 50
+
+_NUMERIC_RE = re.compile(r'^(tiny|small|medium|big)?int|^integer|^int[248]?$|^serial|^bigserial|^decimal|^numeric'
+                         r'|^real|^double|^float|^number')
+_TEMPORAL_RE = re.compile(r'^(date|time|timestamp|datetime|year|timestamptz|timetz)\b')
+_TEXT_RE = re.compile(r'char|text|^string|^clob|^enum|^set\(')
+_BOOLEAN_RE = re.compile(r'^bool')
+
+
+def sample_rows() -> int:
+    return int(os.getenv('PROFILE_SAMPLE_ROWS', '100000'))
+
+
+def profile_timeout() -> float:
+    return float(os.getenv('PROFILE_TIMEOUT', '120'))
+
+
+def profile_max_age() -> float:
+    return float(os.getenv('PROFILE_MAX_AGE', '86400'))
+
+
+def column_kind(db_type: str, type_name: str) -> str:
+    """
+    numeric / temporal / boolean / text / other; decides which aggregates apply
+    """
+    name = (type_name or '').strip().lower()
+    if name.startswith('tinyint(1)') and db_type == 'mysql':
+        return 'boolean'
+    if _BOOLEAN_RE.search(name):
+        return 'boolean'
+    if _NUMERIC_RE.search(name):
+        return 'numeric'
+    if _TEMPORAL_RE.search(name):
+        return 'temporal'
+    if _TEXT_RE.search(name):
+        return 'text'
+    return 'other'
+
+
+class ProfileDialect:
+    def __init__(self, db_type: str):
+        self.db_type = db_type
+
+    def quote(self, name: str) -> str:
+        if self.db_type == 'mysql':
+            return '`' + name.replace('`', '``') + '`'
+        return '"' + name.replace('"', '""') + '"'
+
+    def as_text(self, expression: str) -> str:
+        return f'CAST({expression} AS {"CHAR" if self.db_type == "mysql" else "TEXT"})'
+
+    def bucket(self, expression: str, low: float, width: float) -> str:
+        if self.db_type == 'sqlite':
+            # FLOOR is only available in SQLite builds with math functions; values are >= low
+            return f'CAST(({expression} - {low!r}) / {width!r} AS INTEGER)'
+        return f'FLOOR(({expression} - {low!r}) / {width!r})'
+
+    def orderable(self, kind: str) -> bool:
+        # SQLite orders any value; elsewhere MIN/MAX need a type with an ordering
+        return self.db_type == 'sqlite' or kind in ('numeric', 'temporal', 'text')
+
+
+def _sample_source(conn, db_type: str, database: str, schema: str, table: str, limit: int):
+    """
+    Returns (sample_sql, params, estimated_rows, sampled); sample_sql is a SELECT yielding the rows to profile
+    """
+    if db_type == 'postgresql':
+        table_sql = quote_table(db_type, table, schema or 'public')
+        estimate = conn.execute(
+            text('SELECT reltuples FROM pg_class WHERE oid = to_regclass(:name)'), {'name': table_sql}
+        ).scalar()
+        if estimate is None:
+            raise ValueError('表不存在')
+        estimate = int(max(estimate, 0))
+        if estimate > limit * 1.5:
+            percent = min(100.0, limit * 100.0 / estimate)
+            # REPEATABLE keeps both profiling queries on the same blocks
+            seed = random.randint(1, 2 ** 31 - 1)
+            return (f'SELECT * FROM {table_sql} TABLESAMPLE SYSTEM ({percent:.6f}) REPEATABLE ({seed})',
+                    {}, estimate, True)
+        return f'SELECT * FROM {table_sql}', {}, estimate, False
+
+    if db_type == 'mysql':
+        table_sql = quote_table(db_type, table, database)
+        estimate = conn.execute(text("""
+            SELECT TABLE_ROWS FROM INFORMATION_SCHEMA.TABLES WHERE TABLE_SCHEMA = :database AND TABLE_NAME = :table
+        """), {'database': database, 'table': table}).scalar()
+        if estimate is None:
+            raise ValueError('表不存在')
+        estimate = int(estimate)
+        if estimate <= limit * 1.5:
+            return f'SELECT * FROM {table_sql}', {}, estimate, False
+        key_columns = conn.execute(text("""
+            SELECT COLUMN_NAME, DATA_TYPE FROM INFORMATION_SCHEMA.COLUMNS
+            WHERE TABLE_SCHEMA = :database AND TABLE_NAME = :table AND COLUMN_KEY = 'PRI'
+        """), {'database': database, 'table': table}).fetchall()
+        if len(key_columns) == 1 and column_kind(db_type, key_columns[0][1]) == 'numeric':
+            key_sql = ProfileDialect(db_type).quote(key_columns[0][0])
+            low, high = conn.execute(text(f'SELECT MIN({key_sql}), MAX({key_sql}) FROM {table_sql}')).fetchone()
+            if low is not None:
+                query, params = range_probe_query(table_sql, key_sql, int(low), int(high), limit, probes=SAMPLE_PROBES)
+                return query, params, estimate, True
+        return f'SELECT * FROM {table_sql} LIMIT {limit}', {}, estimate, True
+
+    if db_type == 'sqlite':
+        table_sql = quote_table(db_type, table)
+        try:
+            low, high = conn.execute(text(f'SELECT MIN(rowid), MAX(rowid) FROM {table_sql}')).fetchone()
+        except Exception as e:
+            if 'no such table' in str(e):
+                raise ValueError('表不存在')
+            low = high = None  # WITHOUT ROWID table
+        estimate = int(high - low + 1) if low is not None else None
+        if estimate is not None and estimate > limit * 1.5:
+            query, params = range_probe_query(table_sql, 'rowid', int(low), int(high), limit, probes=SAMPLE_PROBES)
+            return query, params, estimate, True
+        return f'SELECT * FROM {table_sql}', {}, estimate, False
+
+    raise ValueError(f'不支持的数据库类型: {db_type}')
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (int, float, str, bool)):
+        return value
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return str(value)
+
+
+def profile_table(engine, db_type: str, database: str, schema: str, table: str) -> dict:
+    """
+    Compute column statistics for a table; returns rowCount, estimatedRows, sampled and columns
+    """
+    from .database import fetch_table_columns
+
+    dialect = ProfileDialect(db_type)
+    with engine.connect() as conn:
+        structure = fetch_table_columns(conn, db_type, database, schema, table)
+        if not structure:
+            raise ValueError('表不存在或没有列')
+        columns = [
+            {'name': column['field'], 'type': column['type'], 'kind': column_kind(db_type, column['type'])}
+            for column in structure
+        ]
+
+        with statement_timeout(conn, db_type, profile_timeout()):
+            sample_sql, params, estimated_rows, sampled = _sample_source(
+                conn, db_type, database, schema, table, sample_rows()
+            )
+
+            # Pass 1: one aggregate query for every column
+            aggregates = ['COUNT(*)']
+            for column in columns:
+                name = dialect.quote(column['name'])
+                distinct = name if column['kind'] != 'other' or db_type == 'sqlite' else dialect.as_text(name)
+                aggregates.append(f'COUNT({name})')
+                aggregates.append(f'COUNT(DISTINCT {distinct})')
+                if dialect.orderable(column['kind']):
+                    aggregates.extend([f'MIN({name})', f'MAX({name})'])
+            stats = conn.execute(
+                text(f'WITH sample AS ({sample_sql}) SELECT {", ".join(aggregates)} FROM sample'), params
+            ).fetchone()
+
+            row_count = stats[0]
+            position = 1
+            for column in columns:
+                non_null = stats[position]
+                column['nullCount'] = row_count - non_null
+                column['nullRate'] = round((row_count - non_null) / row_count, 6) if row_count else None
+                column['distinctCount'] = stats[position + 1]
+                column['distinctSource'] = 'sample' if sampled else 'exact'
+                position += 2
+                if dialect.orderable(column['kind']):
+                    column['min'] = _json_value(stats[position])
+                    column['max'] = _json_value(stats[position + 1])
+                    position += 2
+                else:
+                    column['min'] = column['max'] = None
+
+            # Pass 2: top values and histograms in one UNION ALL over the same sample
+            branches = []
+            for index, column in enumerate(columns):
+                name = dialect.quote(column['name'])
+                value = dialect.as_text(name)
+                branches.append(
+                    f'SELECT * FROM (SELECT {index} AS col, \'top\' AS kind, {value} AS value, COUNT(*) AS freq '
+                    f'FROM sample WHERE {name} IS NOT NULL GROUP BY {value} '
+                    f'ORDER BY freq DESC LIMIT {TOP_VALUES}) AS top_{index}'
+                )
+                low, high = column['min'], column['max']
+                if column['kind'] == 'numeric' and isinstance(low, (int, float)) and isinstance(high, (int, float)) \
+                        and high > low:
+                    width = (float(high) - float(low)) / HISTOGRAM_BUCKETS
+                    column['histogramBounds'] = (float(low), width)
+                    bucket = dialect.as_text(dialect.bucket(name, float(low), width))
+                    branches.append(
+                        f'SELECT * FROM (SELECT {index} AS col, \'bucket\' AS kind, {bucket} AS value, COUNT(*) AS freq '
+                        f'FROM sample WHERE {name} IS NOT NULL GROUP BY {bucket}) AS histogram_{index}'
+                    )
+            distributions = conn.execute(
+                text(f'WITH sample AS ({sample_sql}) ' + ' UNION ALL '.join(branches)), params
+            ).fetchall()
+
+            # Planner statistics give whole-table distinct estimates on PostgreSQL
+            planner_distinct = {}
+            if db_type == 'postgresql' and sampled:
+                planner_distinct = dict(conn.execute(text("""
+                    SELECT attname, n_distinct FROM pg_stats WHERE schemaname = :schema AND tablename = :table
+                """), {'schema': schema or 'public', 'table': table}).fetchall())
+        conn.rollback()
+
+    for column in columns:
+        column['topValues'] = []
+        column['histogram'] = []
+    for index, kind, value, frequency in distributions:
+        column = columns[int(index)]
+        if kind == 'top':
+            column['topValues'].append({'value': value, 'count': frequency})
+        else:
+            bucket = min(int(float(value)), HISTOGRAM_BUCKETS - 1)
+            column['histogram'].append({'bucket': bucket, 'count': frequency})
+
+    for column in columns:
+        column['topValues'].sort(key=lambda item: -item['count'])
+        bounds = column.pop('histogramBounds', None)
+        if bounds:
+            low, width = bounds
+            counts = [0] * HISTOGRAM_BUCKETS
+            for item in column['histogram']:
+                counts[item['bucket']] += item['count']
+            column['histogram'] = [
+                {'from': low + width * bucket, 'to': low + width * (bucket + 1), 'count': count}
+                for bucket, count in enumerate(counts)
+            ]
+        estimate = planner_distinct.get(column['name'])
+        if estimate is not None and estimated_rows:
+            # Negative n_distinct is a fraction of the row count
+            column['distinctCount'] = int(estimate if estimate > 0 else -estimate * estimated_rows)
+            column['distinctSource'] = 'pg_stats'
+
+    return {
+        'rowCount': row_count,
+        'estimatedRows': estimated_rows,
+        'sampled': sampled,
+        'columns': columns,
+    }
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(int(os.getenv('PROFILE_WORKERS', '2')), 1), thread_name_prefix='profile'
+            )
+        return _executor
+
+
+def is_fresh(profile: TableProfile) -> bool:
+    return (
+        profile.status == 'completed'
+        and profile.completed_at is not None
+        and (datetime.utcnow() - profile.completed_at).total_seconds() <= profile_max_age()
+    )
+
+
+def is_in_progress(profile: TableProfile) -> bool:
+    """
+    Pending or running and not abandoned (e.g. by a restarted worker process)
+    """
+    if profile.status not in ('pending', 'running'):
+        return False
+    since = profile.started_at or profile.created_at
+    return (datetime.utcnow() - since).total_seconds() <= profile_timeout() * 2 + 60
+
+
+def submit_profile(app, profile_id: str):
+    """
+    Compute a profile in the background; progress is visible through its status
+    """
+    _get_executor().submit(_run_profile, app, profile_id)
+
+
+def _run_profile(app, profile_id: str):
+    from .database import create_connection_engine
+
+    with app.app_context():
+        profile = TableProfile.query.get(profile_id)
+        if profile is None:
+            return
+        connection = DatabaseConnection.query.get(profile.connection_id)
+        profile.status = 'running'
+        profile.started_at = datetime.utcnow()
+        db.session.commit()
+
+        ticket = None
+        try:
+            if connection is None:
+                raise ValueError('数据库连接不存在')
+            if scheduler_enabled():
+                ticket = query_scheduler.acquire(connection.id, SCHEDULER_USER, 'batch', background=True)
+            engine = create_connection_engine(connection, profile.database_name or None)
+            try:
+                started = time.perf_counter()
+                result = profile_table(
+                    engine, connection.db_type, profile.database_name or connection.database,
+                    profile.schema_name or None, profile.table_name
+                )
+            finally:
+                engine.dispose()
+            profile.columns_json = json.dumps(result['columns'], ensure_ascii=False)
+            profile.row_count = result['rowCount']
+            profile.estimated_rows = result['estimatedRows']
+            profile.sampled = result['sampled']
+            profile.status = 'completed'
+            profile.error = None
+            profile.completed_at = datetime.utcnow()
+            app.logger.info('Profiled %s in %.2fs', profile.table_name, time.perf_counter() - started)
+        except Exception as e:
+            db.session.rollback()
+            profile = TableProfile.query.get(profile_id)
+            if profile is None:
+                return
+            profile.status = 'failed'
+            profile.error = f'统计超时（{profile_timeout():g} 秒）' if is_timeout_error(e) else str(e)
+        finally:
+            if ticket is not None:
+                ticket.release()
+        db.session.commit()
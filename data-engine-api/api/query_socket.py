@@ -0,0 +1,256 @@
+"""
+Query execution over Socket.IO
+Clients connect to the /query namespace and emit `execute`; the server streams the result
+as it is read from a server-side cursor:
+
+  queued     {queryId, connectionId, priority, queued}            accepted, waiting for a slot
+  started    {queryId, queueWait}                                  admitted by the scheduler
+  row-batch  {queryId, batch, rows[, columns]}                     columns only on batch 0
+  progress   {queryId, rowsFetched, bytes, elapsed}
+  finished   {queryId, rowCount, columns, executionTime, firstBatchTime, queueWait, truncated}
+  error      {queryId, error, errorType}                           errorType: invalid, rejected,
+                                                                   timeout, cancelled, failed
+
+The first batch is small so the editor can render it long before the query finishes.
+`cancel` {queryId} stops a running query (SQLite and PostgreSQL statements are interrupted
+in the database, other dialects between batches); disconnecting cancels all of the client's
+queries. Queries go through the same admission control and statement timeouts as the
+HTTP execute endpoint.
+
+Configuration (environment variables):
+  QUERY_SOCKET_FIRST_BATCH_ROWS   rows in the first batch (default: 100)
+  QUERY_SOCKET_BATCH_ROWS         rows in every later batch (default: 2000)
+  QUERY_SOCKET_MAX_ROWS           rows streamed before the result is truncated (default: 1000000)
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from flask import Flask, request
+from flask_socketio import Namespace, SocketIO, emit
+from sqlalchemy import text
+from models.database_connection import DatabaseConnection
+from .database import connection_url, create_url_engine
+from .scheduler import AdmissionRejected, query_scheduler, request_user, scheduler_enabled
+from .timeouts import is_timeout_error, parse_timeout, resolve_statement_timeout, statement_timeout
+
+NAMESPACE = '/query'
+
+socketio = SocketIO()
+
+_running = {}
+_running_lock = threading.Lock()
+
+
+class QueryCancelled(Exception):
+    pass
+
+
+class RunningQuery:
+    """
+    Cancellation handle of a query streamed to one client
+    """
+
+    def __init__(self, sid: str, query_id: str):
+        self.sid = sid
+        self.query_id = query_id
+        self.cancelled = threading.Event()
+        self.driver_connection = None
+        self.db_type = None
+
+    def attach(self, driver_connection, db_type: str):
+        self.driver_connection = driver_connection
+        self.db_type = db_type
+        if self.cancelled.is_set():
+            self._interrupt()
+
+    def cancel(self):
+        self.cancelled.set()
+        self._interrupt()
+
+    def _interrupt(self):
+        raw = self.driver_connection
+        if raw is None:
+            return
+        try:
+            if self.db_type == 'sqlite':
+                raw.interrupt()
+            elif self.db_type == 'postgresql':
+                raw.cancel()
+        except Exception:
+            pass
+
+
+def _batch_setting(name: str, default: int) -> int:
+    return max(1, int(os.getenv(name, str(default))))
+
+
+def _json_value(value):
+    return value if value is None or isinstance(value, (int, float, str, bool)) else str(value)
+
+
+def _send(event: str, payload: dict, sid: str):
+    socketio.emit(event, payload, to=sid, namespace=NAMESPACE)
+
+
+def _run_query(running: RunningQuery, connection_id: str, db_type: str, conn_str: str, sql_query: str,
+               timeout: float, user: str, priority: str):
+    query_id, sid = running.query_id, running.sid
+    ticket = None
+    queue_wait = 0.0
+    try:
+        if scheduler_enabled():
+            try:
+                ticket = query_scheduler.acquire(connection_id, user, priority, cancelled=running.cancelled)
+            except AdmissionRejected as e:
+                _send('error', {'queryId': query_id, 'error': str(e), 'errorType': 'rejected',
+                                'retryAfter': e.retry_after}, sid)
+                return
+            queue_wait = ticket.wait_time
+        if running.cancelled.is_set():
+            raise QueryCancelled()
+        _send('started', {'queryId': query_id, 'queueWait': round(queue_wait, 3)}, sid)
+
+        start_time = time.perf_counter()
+        first_batch_time = None
+        row_count = 0
+        sent_bytes = 0
+        truncated = False
+        columns = []
+        max_rows = _batch_setting('QUERY_SOCKET_MAX_ROWS', 1000000)
+        batch_size = _batch_setting('QUERY_SOCKET_FIRST_BATCH_ROWS', 100)
+        engine = create_url_engine(db_type, conn_str)
+        try:
+            with engine.connect() as conn, statement_timeout(conn, db_type, timeout):
+                running.attach(conn.connection.driver_connection, db_type)
+                result = conn.execution_options(stream_results=True).execute(text(sql_query))
+                if not result.returns_rows:
+                    conn.commit()
+                    row_count = max(result.rowcount, 0)
+                else:
+                    columns = list(result.keys())
+                    batch = 0
+                    while True:
+                        if running.cancelled.is_set():
+                            raise QueryCancelled()
+                        rows = result.fetchmany(min(batch_size, max_rows - row_count))
+                        if not rows:
+                            break
+                        payload = {
+                            'queryId': query_id,
+                            'batch': batch,
+                            'rows': [[_json_value(value) for value in row] for row in rows],
+                        }
+                        if batch == 0:
+                            payload['columns'] = columns
+                            first_batch_time = time.perf_counter() - start_time
+                        sent_bytes += len(json.dumps(payload['rows'], ensure_ascii=False).encode('utf-8'))
+                        row_count += len(rows)
+                        _send('row-batch', payload, sid)
+                        _send('progress', {
+                            'queryId': query_id,
+                            'rowsFetched': row_count,
+                            'bytes': sent_bytes,
+                            'elapsed': round(time.perf_counter() - start_time, 3),
+                        }, sid)
+                        batch += 1
+                        batch_size = _batch_setting('QUERY_SOCKET_BATCH_ROWS', 2000)
+                        if row_count >= max_rows:
+                            truncated = result.fetchone() is not None
+                            break
+                    result.close()
+        finally:
+            engine.dispose()
+
+        _send('finished', {
+            'queryId': query_id,
+            'rowCount': row_count,
+            'columns': columns,
+            'bytes': sent_bytes,
+            'executionTime': round(time.perf_counter() - start_time, 3),
+            'firstBatchTime': round(first_batch_time, 3) if first_batch_time is not None else None,
+            'queueWait': round(queue_wait, 3),
+            'truncated': truncated,
+        }, sid)
+    except Exception as e:
+        if running.cancelled.is_set():
+            _send('error', {'queryId': query_id, 'error': '查询已取消', 'errorType': 'cancelled'}, sid)
+        elif timeout and is_timeout_error(e):
+            _send('error', {'queryId': query_id, 'error': f'查询超时：执行超过 {timeout:g} 秒，已取消',
+                            'errorType': 'timeout', 'timeout': timeout}, sid)
+        else:
+            _send('error', {'queryId': query_id, 'error': f'SQL 执行失败: {str(e)}', 'errorType': 'failed'}, sid)
+    finally:
+        if ticket is not None:
+            ticket.release()
+        with _running_lock:
+            _running.pop((sid, query_id), None)
+
+
+class QueryNamespace(Namespace):
+    """
+    Socket.IO namespace for streamed query execution
+    """
+
+    def on_execute(self, data):
+        data = data if isinstance(data, dict) else {}
+        query_id = str(data.get('queryId') or uuid.uuid4())
+
+        def reject(message):
+            emit('error', {'queryId': query_id, 'error': message, 'errorType': 'invalid'})
+            return {'queryId': query_id, 'accepted': False}
+
+        sql_query = (data.get('sql') or '').strip()
+        if not sql_query:
+            return reject('SQL 查询不能为空')
+        connection = DatabaseConnection.query.get(data.get('connectionId') or '')
+        if not connection:
+            return reject('数据库连接不存在')
+        try:
+            timeout = resolve_statement_timeout(connection.statement_timeout, parse_timeout(data.get('timeout')))
+            conn_str = connection_url(connection)
+        except ValueError as e:
+            return reject(str(e))
+        key = (request.sid, query_id)
+        with _running_lock:
+            if key in _running:
+                return reject('queryId 已在执行中')
+            running = _running[key] = RunningQuery(request.sid, query_id)
+
+        priority = 'batch' if data.get('priority') == 'batch' else 'interactive'
+        queued = query_scheduler.stats()['connections'].get(connection.id, {}).get('queued', {})
+        emit('queued', {
+            'queryId': query_id,
+            'connectionId': connection.id,
+            'priority': priority,
+            'queued': queued.get(priority, 0),
+        })
+        socketio.start_background_task(
+            _run_query, running, connection.id, connection.db_type, conn_str, sql_query,
+            timeout, request_user(), priority
+        )
+        return {'queryId': query_id, 'accepted': True}
+
+    def on_cancel(self, data):
+        query_id = str((data or {}).get('queryId') or '')
+        with _running_lock:
+            running = _running.get((request.sid, query_id))
+        if running is None:
+            return {'queryId': query_id, 'cancelled': False}
+        running.cancel()
+        return {'queryId': query_id, 'cancelled': True}
+
+    def on_disconnect(self, reason=None):
+        with _running_lock:
+            queries = [running for (sid, _), running in _running.items() if sid == request.sid]
+        for running in queries:
+            running.cancel()
+
+
+def init_query_socket(app: Flask):
+    """
+    Attach Socket.IO to the app and register the /query namespace
+    """
+    socketio.init_app(app, cors_allowed_origins='*')
+    socketio.on_namespace(QueryNamespace(NAMESPACE))
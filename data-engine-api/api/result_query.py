@@ -0,0 +1,190 @@
+"""
+Sort, filter, search and group-by over results held in the result store
+Runs vectorized with pyarrow.compute on the memory-mapped table, so grid interactions
+never go back to the source database.
+"""
+from .arrow_stream import pa
+from .lazy_import import lazy_import
+
+pc = lazy_import('pyarrow.compute')
+
+
+FILTER_OPERATORS = (
+    'eq', 'ne', 'gt', 'gte', 'lt', 'lte', 'in', 'notIn',
+    'contains', 'startsWith', 'endsWith', 'isNull', 'notNull',
+)
+AGGREGATE_FUNCTIONS = ('count', 'count_distinct', 'sum', 'mean', 'min', 'max')
+
+
+class ResultQueryError(ValueError):
+    """
+    Invalid view specification (unknown column, operator, etc.)
+    """
+
+
+def _column(table, name):
+    if name not in table.column_names:
+        raise ResultQueryError(f'列不存在: {name}')
+    column = table.column(name)
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    return column
+
+
+def _is_numeric(arrow_type) -> bool:
+    return pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type)
+
+
+def _literal(value, column_type):
+    """
+    Arrow scalar for a filter value; numeric text compared with a numeric column is read as a number
+    """
+    if isinstance(value, str) and _is_numeric(column_type):
+        for parse in (int, float):
+            try:
+                value = parse(value)
+                break
+            except ValueError:
+                continue
+    try:
+        return pa.scalar(value)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        raise ResultQueryError(f'无法识别的值 {value!r}')
+
+
+def _promote(column, values):
+    """
+    Cast a column and its filter values to a common type; returns (column, scalars)
+    Numbers compare as numbers, as float64 when either side is fractional; other values are
+    cast to the column's type. Raises ResultQueryError when there is no common type.
+    """
+    scalars = [_literal(value, column.type) for value in values]
+    value_types = {scalar.type for scalar in scalars if scalar.is_valid}
+    if _is_numeric(column.type) and all(_is_numeric(value_type) for value_type in value_types) \
+            and value_types - {column.type}:
+        fractional = any(not pa.types.is_integer(arrow_type) for arrow_type in value_types | {column.type})
+        target = pa.float64() if fractional else pa.int64()
+    else:
+        target = column.type
+    try:
+        if column.type != target:
+            column = column.cast(target)
+        return column, [scalar.cast(target) if scalar.is_valid else pa.scalar(None, type=target)
+                        for scalar in scalars]
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        shown = values[0] if len(values) == 1 else values
+        raise ResultQueryError(f'无法将值 {shown!r} 与 {column.type} 类型的列比较')
+
+
+def _filter_mask(table, spec):
+    name = spec.get('column')
+    op = spec.get('op', 'eq')
+    value = spec.get('value')
+    if op not in FILTER_OPERATORS:
+        raise ResultQueryError(f'不支持的过滤操作: {op}')
+    column = _column(table, name)
+
+    if op == 'isNull':
+        return pc.is_null(column)
+    if op == 'notNull':
+        return pc.is_valid(column)
+    if op in ('contains', 'startsWith', 'endsWith'):
+        text_column = column if pa.types.is_string(column.type) else column.cast(pa.string())
+        function = {'contains': pc.match_substring, 'startsWith': pc.starts_with,
+                    'endsWith': pc.ends_with}[op]
+        return function(text_column, str(value), ignore_case=bool(spec.get('ignoreCase', True)))
+    if op in ('in', 'notIn'):
+        if not isinstance(value, list):
+            raise ResultQueryError(f'{op} 操作需要数组值')
+        column, scalars = _promote(column, value)
+        values = pa.array([scalar.as_py() for scalar in scalars], type=column.type)
+        mask = pc.is_in(column, value_set=values)
+        return pc.invert(mask) if op == 'notIn' else mask
+
+    compare = {'eq': pc.equal, 'ne': pc.not_equal, 'gt': pc.greater, 'gte': pc.greater_equal,
+               'lt': pc.less, 'lte': pc.less_equal}[op]
+    column, (scalar,) = _promote(column, [value])
+    return compare(column, scalar)
+
+
+def _search_mask(table, text):
+    mask = None
+    for name in table.column_names:
+        column = _column(table, name)
+        if not pa.types.is_string(column.type):
+            try:
+                column = column.cast(pa.string())
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                continue
+        hits = pc.match_substring(column, text, ignore_case=True)
+        mask = hits if mask is None else pc.or_kleene(mask, hits)
+    return mask
+
+
+def apply_view(table, spec: dict):
+    """
+    Apply filters, free-text search, grouping/aggregation and sorting, in that order
+    spec keys (all optional):
+      filters:    [{column, op, value, ignoreCase}]  combined with AND
+      search:     text matched case-insensitively against every column
+      groupBy:    [column, ...]
+      aggregates: [{column, func, as}]  func in AGGREGATE_FUNCTIONS; count without column counts rows
+      sort:       [{column, direction: asc|desc}]
+    """
+    for condition in spec.get('filters') or []:
+        mask = _filter_mask(table, condition)
+        table = table.filter(pc.fill_null(mask, False))
+
+    search = (spec.get('search') or '').strip()
+    if search and table.num_columns:
+        mask = _search_mask(table, search)
+        if mask is not None:
+            table = table.filter(pc.fill_null(mask, False))
+
+    group_by = spec.get('groupBy') or []
+    aggregates = spec.get('aggregates') or []
+    if group_by or aggregates:
+        for name in group_by:
+            _column(table, name)
+        decoded = {name: _column(table, name) for name in table.column_names}
+        table = pa.table(decoded)
+
+        aggregations = []
+        output_names = []
+        for aggregate in aggregates:
+            func = aggregate.get('func', 'count')
+            if func not in AGGREGATE_FUNCTIONS:
+                raise ResultQueryError(f'不支持的聚合函数: {func}')
+            name = aggregate.get('column')
+            if name is None:
+                if func != 'count':
+                    raise ResultQueryError(f'{func} 需要指定列')
+                aggregations.append(([], 'count_all'))
+                output_names.append(aggregate.get('as') or 'count')
+                continue
+            _column(table, name)
+            aggregations.append((name, func))
+            output_names.append(aggregate.get('as') or f'{name}_{func}')
+
+        grouped = table.group_by(group_by).aggregate(aggregations)
+        # Column order of the grouped table varies between pyarrow versions; select by generated name
+        aggregate_columns = [
+            'count_all' if column == [] else f'{column}_{func}' for column, func in aggregations
+        ]
+        table = pa.table(
+            [grouped.column(name) for name in group_by] + [grouped.column(name) for name in aggregate_columns],
+            names=list(group_by) + output_names
+        )
+
+    sort = spec.get('sort') or []
+    if sort:
+        keys = []
+        for item in sort:
+            name = item.get('column')
+            _column(table, name)
+            direction = 'descending' if str(item.get('direction', 'asc')).lower() == 'desc' else 'ascending'
+            keys.append((name, direction))
+        decoded = {name: _column(table, name) for name in table.column_names}
+        table = pa.table(decoded).sort_by(keys)
+
+    return table
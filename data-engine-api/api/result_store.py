@@ -0,0 +1,187 @@
+"""
+Spill store for large query results shared across worker processes
+Results are written once as Arrow IPC files under a result id; any worker can then
+memory-map the file and serve slices zero-copy. Old results expire after a TTL and the
+store evicts least recently read files when it grows past its size limit.
+Requires pyarrow (optional dependency); without it results are simply not spilled.
+
+Configuration (environment variables):
+  RESULT_STORE_DIR        directory for spilled results (default: <tmp>/data-engine-results)
+  RESULT_STORE_MAX_BYTES  total size limit in bytes (default: 2 GiB)
+  RESULT_STORE_TTL        seconds a result is kept after its last read (default: 3600)
+  RESULT_SPILL_MIN_ROWS   results with at least this many rows are spilled (default: 1000)
+"""
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from .arrow_stream import pa, ARROW_BATCH_ROWS, infer_schema, build_record_batch, ChunkSink
+
+
+RESULT_FILE_SUFFIX = '.arrow'
+_RESULT_ID_RE = re.compile(r'^res_[0-9a-f]{32}$')
+
+# Minimum seconds between cleanup passes in one process
+CLEANUP_INTERVAL = 60
+
+
+def store_enabled() -> bool:
+    return pa is not None
+
+
+def store_dir() -> str:
+    path = os.getenv('RESULT_STORE_DIR') or os.path.join(tempfile.gettempdir(), 'data-engine-results')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spill_min_rows() -> int:
+    return int(os.getenv('RESULT_SPILL_MIN_ROWS', '1000'))
+
+
+def _result_path(result_id: str) -> str:
+    if not _RESULT_ID_RE.match(result_id or ''):
+        raise KeyError(result_id)
+    return os.path.join(store_dir(), result_id + RESULT_FILE_SUFFIX)
+
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def cleanup(force: bool = False):
+    """
+    Remove expired results, then evict least recently read files until under the size limit
+    Safe to run concurrently from several processes; files already removed are ignored
+    """
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if not force and now - _last_cleanup < CLEANUP_INTERVAL:
+            return
+        _last_cleanup = now
+
+    ttl = int(os.getenv('RESULT_STORE_TTL', '3600'))
+    max_bytes = int(os.getenv('RESULT_STORE_MAX_BYTES', str(2 * 1024 ** 3)))
+    directory = store_dir()
+
+    entries = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(RESULT_FILE_SUFFIX):
+            # Leftover temp file from an interrupted spill
+            if entry.name.endswith('.tmp') and now - entry.stat().st_mtime > ttl:
+                _remove(entry.path)
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if now - stat.st_mtime > ttl:
+            _remove(entry.path)
+        else:
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        _remove(path)
+        total -= size
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def spill_rows(columns, rows, metadata: dict = None) -> str:
+    """
+    Write rows to a new result file and return its result id
+    The file is written under a temporary name and renamed, so readers never see partial files
+    """
+    # All rows are at hand: infer the types over all of them, not just the first batch
+    # Decimals stay exact (decimal128 or text), so later pages read back as the inline first page
+    schema, converters = infer_schema(columns, rows)
+    batches = [
+        build_record_batch(schema, converters, rows[start:start + ARROW_BATCH_ROWS])
+        for start in range(0, len(rows), ARROW_BATCH_ROWS)
+    ]
+    return spill_table(pa.Table.from_batches(batches, schema=schema), metadata)
+
+
+def spill_table(table, metadata: dict = None) -> str:
+    """
+    Write an Arrow table to a new result file and return its result id
+    """
+    result_id = f'res_{uuid.uuid4().hex}'
+    path = _result_path(result_id)
+    if metadata:
+        table = table.replace_schema_metadata({str(key): str(value) for key, value in metadata.items()})
+    # The IPC file format needs one dictionary per column for the whole file
+    table = table.unify_dictionaries()
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=ARROW_BATCH_ROWS)
+    os.replace(tmp_path, path)
+
+    cleanup()
+    return result_id
+
+
+def open_result(result_id: str):
+    """
+    Memory-map a spilled result as an Arrow table (no copy); raises KeyError if unknown or expired
+    """
+    path = _result_path(result_id)
+    try:
+        source = pa.memory_map(path, 'r')
+    except FileNotFoundError:
+        raise KeyError(result_id)
+    # Reading counts as use for LRU eviction and TTL
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return pa.ipc.open_file(source).read_all()
+
+
+def delete_result(result_id: str) -> bool:
+    path = _result_path(result_id)
+    if not os.path.exists(path):
+        return False
+    _remove(path)
+    return True
+
+
+def table_to_rows(table) -> list:
+    """
+    Convert an Arrow table to JSON-ready row lists, matching execute_sql's value conversion
+    """
+    columns = [column.to_pylist() for column in table.columns]
+    rows = []
+    for values in zip(*columns):
+        rows.append([
+            value if value is None or isinstance(value, (int, float, str, bool)) else str(value)
+            for value in values
+        ])
+    return rows
+
+
+def iter_table_stream(table):
+    """
+    Yield an Arrow table as IPC stream chunks
+    """
+    sink = ChunkSink()
+    writer = pa.ipc.new_stream(sink, table.schema)
+    yield sink.drain()
+    for batch in table.to_batches(max_chunksize=ARROW_BATCH_ROWS):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
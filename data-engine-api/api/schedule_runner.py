@@ -0,0 +1,436 @@
+"""
+Background execution of project schedules
+A poller thread in every API process looks for due schedules and due runs in the database:
+
+  1. A due schedule gets a queued run and its next fire time, in one conditional UPDATE that
+     also takes the schedule's run slot (running_run_id), so a run is created once even with
+     several processes polling, and never while the previous run of the schedule is active
+     (that fire is recorded as skipped). Fires missed while no process was polling are
+     coalesced into one: with misfire policy run_once it runs late, with skip it is recorded
+     as skipped when it is more than misfire_grace seconds late.
+  2. Queued runs and runs whose retry is due are claimed, again with a conditional UPDATE,
+     up to the free slots of this process's bounded worker pool; the rest stay queued in the
+     table for any process with free workers.
+
+Runs execute the project's SQL through the batch class of the query scheduler and under the
+connection's statement timeout. A failed run is retried after retry_delay seconds, doubling
+per attempt, up to max_retries times. Results are kept as zstd-compressed Arrow IPC files
+(columnar, one file per run) so the latest result can be viewed without running the query;
+without pyarrow only row counts are recorded.
+
+Configuration (environment variables):
+  SCHEDULE_RUNNER_ENABLED    poll and execute schedules in this process (default: true)
+  SCHEDULE_WORKERS           concurrent runs per process (default: 2)
+  SCHEDULE_POLL_INTERVAL     seconds between polls (default: 15)
+  SCHEDULE_MAX_ROWS          rows kept in a result snapshot (default: 1000000)
+  SCHEDULE_MAX_RETRY_DELAY   upper bound of the retry backoff in seconds (default: 3600)
+  SCHEDULE_SNAPSHOT_DIR      directory of result snapshots (default: snapshots)
+  SCHEDULE_SNAPSHOT_KEEP     snapshots kept per schedule (default: 10)
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import select, text, update
+from models import db, DatabaseConnection, Project
+from models.schedule import ProjectSchedule, ScheduleRun
+from .arrow_stream import pa, ARROW_BATCH_ROWS, build_record_batch, fit_schema, infer_schema, table_from_batches
+from .cron import CronExpression
+from .scheduler import query_scheduler, scheduler_enabled
+from .timeouts import is_timeout_error, resolve_statement_timeout, statement_timeout
+
+logger = logging.getLogger(__name__)
+
+# Runs queue under this user as background work (no per-user limit, no wait deadline)
+SCHEDULER_USER = 'schedule-runner'
+# A run still marked running after this long belongs to a process that died
+ABANDONED_RUN_SECONDS = 6 * 3600
+# Due schedules handled per poll
+POLL_BATCH = 100
+# Seconds between sweeps for snapshot files of deleted runs
+ORPHAN_SWEEP_INTERVAL = 3600
+SNAPSHOT_SUFFIX = '.arrow'
+
+
+def runner_enabled() -> bool:
+    return os.getenv('SCHEDULE_RUNNER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+def snapshot_dir() -> str:
+    path = os.getenv('SCHEDULE_SNAPSHOT_DIR') or 'snapshots'
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def snapshot_path(run_id: str) -> str:
+    return os.path.join(snapshot_dir(), f'{run_id}{SNAPSHOT_SUFFIX}')
+
+
+def snapshot_enabled() -> bool:
+    return pa is not None
+
+
+def open_snapshot(run_id: str):
+    """
+    Read the result snapshot of a run as an Arrow table; raises KeyError if there is none
+    """
+    try:
+        source = pa.memory_map(snapshot_path(run_id), 'r')
+    except FileNotFoundError:
+        raise KeyError(run_id)
+    return pa.ipc.open_file(source).read_all()
+
+
+def remove_snapshot(run_id: str):
+    try:
+        os.remove(snapshot_path(run_id))
+    except FileNotFoundError:
+        pass
+
+
+def _write_snapshot(run_id: str, schema, batches) -> int:
+    table = table_from_batches(batches, schema).unify_dictionaries()
+    options = pa.ipc.IpcWriteOptions(compression='zstd' if pa.Codec.is_available('zstd') else None)
+    path = snapshot_path(run_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=ARROW_BATCH_ROWS)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def retry_delay(schedule: ProjectSchedule, attempt: int) -> float:
+    """
+    Seconds before retrying after the given failed attempt (1-based), doubling each time
+    """
+    delay = max(schedule.retry_delay, 0) * 2 ** max(attempt - 1, 0)
+    return min(delay, float(os.getenv('SCHEDULE_MAX_RETRY_DELAY', '3600')))
+
+
+def first_run_at(cron: str, tz: str, after: datetime = None) -> datetime:
+    return CronExpression(cron).next_run(after or datetime.utcnow(), tz)
+
+
+def execute_project_sql(connection: DatabaseConnection, sql_query: str, run_id: str) -> dict:
+    """
+    Run SQL on a connection; result rows are kept as a snapshot file
+    Returns {rowCount, columns, truncated, snapshotSize}
+    """
+    from .database import create_connection_engine
+
+    max_rows = max(int(os.getenv('SCHEDULE_MAX_ROWS', '1000000')), 1)
+    timeout = resolve_statement_timeout(connection.statement_timeout, batch=True)
+    engine = create_connection_engine(connection)
+    try:
+        with engine.connect() as conn, statement_timeout(conn, connection.db_type, timeout):
+            result = conn.execution_options(stream_results=True).execute(text(sql_query))
+            if not result.returns_rows:
+                conn.commit()
+                return {'rowCount': max(result.rowcount, 0), 'columns': None, 'truncated': False,
+                        'snapshotSize': None}
+            columns = list(result.keys())
+            row_count = 0
+            truncated = False
+            schema = converters = None
+            batches = []
+            while row_count < max_rows:
+                rows = result.fetchmany(min(ARROW_BATCH_ROWS, max_rows - row_count))
+                if not rows:
+                    break
+                row_count += len(rows)
+                if snapshot_enabled():
+                    if schema is None:
+                        schema, converters = infer_schema(columns, rows)
+                    else:
+                        # Earlier batches are cast to the widened schema when the snapshot is written
+                        schema, converters = fit_schema(schema, converters, rows)
+                    batches.append(build_record_batch(schema, converters, rows))
+            else:
+                truncated = result.fetchone() is not None
+            result.close()
+    finally:
+        engine.dispose()
+
+    snapshot_size = None
+    if snapshot_enabled():
+        if schema is None:
+            schema, converters = infer_schema(columns, [])
+        snapshot_size = _write_snapshot(run_id, schema, batches)
+    return {'rowCount': row_count, 'columns': columns, 'truncated': truncated, 'snapshotSize': snapshot_size}
+
+
+def _prune_snapshots(schedule_id: str):
+    keep = max(int(os.getenv('SCHEDULE_SNAPSHOT_KEEP', '10')), 1)
+    old_runs = db.session.execute(
+        select(ScheduleRun.id)
+        .where(ScheduleRun.schedule_id == schedule_id, ScheduleRun.snapshot_size.is_not(None))
+        .order_by(ScheduleRun.finished_at.desc())
+        .offset(keep)
+    ).scalars().all()
+    if not old_runs:
+        return
+    db.session.execute(
+        update(ScheduleRun).where(ScheduleRun.id.in_(old_runs)).values(snapshot_size=None),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    for run_id in old_runs:
+        remove_snapshot(run_id)
+
+
+def _release_schedule(schedule_id: str, run_id: str, status: str):
+    db.session.execute(
+        update(ProjectSchedule)
+        .where(ProjectSchedule.id == schedule_id, ProjectSchedule.running_run_id == run_id)
+        .values(running_run_id=None, last_status=status),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def run_schedule(run_id: str):
+    """
+    Execute one claimed run (status running) and record the outcome; needs an app context
+    """
+    run = ScheduleRun.query.get(run_id)
+    if run is None:
+        return
+    schedule = ProjectSchedule.query.get(run.schedule_id)
+    project = Project.query.get(run.project_id)
+    connection = DatabaseConnection.query.get(schedule.connection_id) if schedule and schedule.connection_id else None
+    started = time.perf_counter()
+    ticket = None
+    retryable = True
+    try:
+        if schedule is None or project is None:
+            retryable = False
+            raise ValueError('计划或项目不存在')
+        if connection is None:
+            retryable = False
+            raise ValueError('数据库连接不存在')
+        sql_query = (project.sql_content or '').strip()
+        if not sql_query:
+            retryable = False
+            raise ValueError('项目 SQL 为空')
+        run.sql_version = project.sql_version
+        db.session.commit()
+
+        if scheduler_enabled():
+            ticket = query_scheduler.acquire(connection.id, SCHEDULER_USER, 'batch', background=True)
+        outcome = execute_project_sql(connection, sql_query, run.id)
+
+        run.status = 'succeeded'
+        run.error = None
+        run.row_count = outcome['rowCount']
+        run.truncated = outcome['truncated']
+        run.columns_json = json.dumps(outcome['columns'], ensure_ascii=False) if outcome['columns'] is not None else None
+        run.snapshot_size = outcome['snapshotSize']
+        run.duration = time.perf_counter() - started
+        run.finished_at = datetime.utcnow()
+        _release_schedule(run.schedule_id, run.id, 'succeeded')
+        db.session.commit()
+        logger.info('Schedule run %s finished: %d row(s) in %.2fs', run.id, run.row_count, run.duration)
+        _prune_snapshots(run.schedule_id)
+    except Exception as e:
+        db.session.rollback()
+        run = ScheduleRun.query.get(run_id)
+        if run is None:
+            return
+        run.error = f'执行超时（{resolve_statement_timeout(connection.statement_timeout, batch=True):g} 秒）' \
+            if connection is not None and is_timeout_error(e) else str(e)
+        run.duration = time.perf_counter() - started
+        if retryable and schedule is not None and run.attempt <= schedule.max_retries:
+            run.status = 'retrying'
+            run.next_attempt_at = datetime.utcnow() + timedelta(seconds=retry_delay(schedule, run.attempt))
+        else:
+            run.status = 'failed'
+            run.finished_at = datetime.utcnow()
+            _release_schedule(run.schedule_id, run.id, 'failed')
+        db.session.commit()
+        logger.warning('Schedule run %s attempt %d failed: %s', run.id, run.attempt, run.error)
+    finally:
+        if ticket is not None:
+            ticket.release()
+
+
+class ScheduleRunner:
+    """
+    Poller thread plus a bounded worker pool executing schedule runs of one process
+    """
+
+    def __init__(self, app: Flask, workers: int, interval: float):
+        self.app = app
+        self.workers = workers
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='schedule')
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.last_sweep = 0.0
+        self.thread = threading.Thread(target=self._loop, name='schedule-poller', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def wake(self):
+        """
+        Poll now instead of at the next interval (e.g. after a manual trigger)
+        """
+        self.wakeup.set()
+
+    def _loop(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.poll()
+            except Exception:
+                logger.exception('Schedule poll failed')
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    def poll(self, now: datetime = None):
+        now = now or datetime.utcnow()
+        self._recover_abandoned(now)
+        self._fire_due_schedules(now)
+        self._claim_due_runs(now)
+        if time.monotonic() - self.last_sweep > ORPHAN_SWEEP_INTERVAL:
+            self.last_sweep = time.monotonic()
+            self._sweep_orphans()
+
+    def _recover_abandoned(self, now: datetime):
+        cutoff = now - timedelta(seconds=ABANDONED_RUN_SECONDS)
+        abandoned = ScheduleRun.query.filter(ScheduleRun.status == 'running', ScheduleRun.started_at < cutoff).all()
+        for run in abandoned:
+            run.status = 'failed'
+            run.error = '执行进程已退出'
+            run.finished_at = now
+            _release_schedule(run.schedule_id, run.id, 'failed')
+        if abandoned:
+            db.session.commit()
+
+    def _fire_due_schedules(self, now: datetime):
+        schedules = (
+            ProjectSchedule.query
+            .filter(ProjectSchedule.enabled.is_(True), ProjectSchedule.next_run_at <= now)
+            .order_by(ProjectSchedule.next_run_at)
+            .limit(POLL_BATCH)
+            .all()
+        )
+        for schedule in schedules:
+            fire_time = schedule.next_run_at
+            try:
+                # Later missed fires are coalesced into this one
+                next_run_at = first_run_at(schedule.cron, schedule.timezone, max(now, fire_time))
+            except ValueError as e:
+                logger.warning('Disabling schedule %s: %s', schedule.id, e)
+                next_run_at = None
+            late = (now - fire_time).total_seconds()
+            claim = (
+                update(ProjectSchedule)
+                .where(ProjectSchedule.id == schedule.id, ProjectSchedule.next_run_at == fire_time)
+                .values(next_run_at=next_run_at)
+            )
+            run = ScheduleRun(id=str(uuid.uuid4()), schedule_id=schedule.id, project_id=schedule.project_id,
+                              scheduled_for=fire_time)
+            if schedule.running_run_id is not None:
+                run.status = 'skipped'
+                run.error = '上一次运行尚未结束'
+            elif late > schedule.misfire_grace and schedule.misfire_policy == 'skip':
+                run.status = 'skipped'
+                run.error = f'错过执行时间 {int(late)} 秒'
+            else:
+                run.next_attempt_at = now
+                claim = claim.where(ProjectSchedule.running_run_id.is_(None)).values(
+                    running_run_id=run.id, last_run_at=now
+                )
+            if run.status == 'skipped':
+                run.finished_at = now
+            if db.session.execute(claim, execution_options={'synchronize_session': False}).rowcount:
+                db.session.add(run)
+            db.session.commit()
+
+    def _claim_due_runs(self, now: datetime):
+        with self.lock:
+            free = self.workers - self.in_flight
+        if free <= 0:
+            return
+        candidates = db.session.execute(
+            select(ScheduleRun.id)
+            .where(ScheduleRun.status.in_(('queued', 'retrying')), ScheduleRun.next_attempt_at <= now)
+            .order_by(ScheduleRun.next_attempt_at)
+            .limit(free)
+        ).scalars().all()
+        for run_id in candidates:
+            claimed = db.session.execute(
+                update(ScheduleRun)
+                .where(ScheduleRun.id == run_id, ScheduleRun.status.in_(('queued', 'retrying')),
+                       ScheduleRun.next_attempt_at <= now)
+                .values(status='running', attempt=ScheduleRun.attempt + 1, next_attempt_at=None, started_at=now),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            db.session.commit()
+            if claimed:
+                with self.lock:
+                    self.in_flight += 1
+                self.executor.submit(self._execute, run_id)
+
+    def _execute(self, run_id: str):
+        try:
+            with self.app.app_context():
+                run_schedule(run_id)
+        except Exception:
+            logger.exception('Schedule run %s crashed', run_id)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+            # A worker is free: pick up queued runs without waiting for the next interval
+            self.wake()
+
+    def _sweep_orphans(self):
+        directory = snapshot_dir()
+        cutoff = time.time() - 600
+        names = [name for name in os.listdir(directory) if name.endswith(SNAPSHOT_SUFFIX)]
+        if not names:
+            return
+        run_ids = [name[:-len(SNAPSHOT_SUFFIX)] for name in names]
+        known = set()
+        for start in range(0, len(run_ids), 500):
+            known.update(db.session.execute(
+                select(ScheduleRun.id).where(ScheduleRun.id.in_(run_ids[start:start + 500]),
+                                             ScheduleRun.snapshot_size.is_not(None))
+            ).scalars())
+        for run_id in run_ids:
+            path = snapshot_path(run_id)
+            try:
+                if run_id not in known and os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+schedule_runner = None
+
+
+def init_schedule_runner(app: Flask):
+    """
+    Start the schedule poller and worker pool for this process
+    """
+    global schedule_runner
+    if not runner_enabled() or schedule_runner is not None:
+        return
+    schedule_runner = ScheduleRunner(
+        app,
+        workers=max(int(os.getenv('SCHEDULE_WORKERS', '2')), 1),
+        interval=max(float(os.getenv('SCHEDULE_POLL_INTERVAL', '15')), 1.0),
+    )
+    schedule_runner.start()
+
+
+def wake_runner():
+    if schedule_runner is not None:
+        schedule_runner.wake()
@@ -0,0 +1,341 @@
+"""
+Admission control for queries against saved connections
+Every query takes a slot before it runs. Slots are limited per connection and per user;
+requests beyond the limits wait in bounded queues, one per connection and priority class,
+and are granted in class order (interactive, metadata, batch) and FIFO within a class.
+Batch work may never take the slots reserved for interactive queries, so small queries
+keep low latency while exports and other heavy jobs queue behind each other. Metadata
+requests (catalog browsing, previews) do not count towards the per-user limit. A full queue,
+or a wait longer than SCHEDULER_MAX_WAIT, is answered with 429. Background jobs (scheduled
+runs, incremental loads, pipelines, metric refreshes) are bounded by their own worker pools:
+they do not count towards the per-user limit and wait for a slot without a deadline.
+
+Configuration (environment variables):
+  SCHEDULER_ENABLED              admission control on/off (default: true)
+  SCHEDULER_CONNECTION_LIMIT     concurrent queries per connection (default: 4)
+  SCHEDULER_USER_LIMIT           concurrent queries per user (default: 2)
+  SCHEDULER_INTERACTIVE_RESERVE  connection slots batch work may not use (default: 1)
+  SCHEDULER_QUEUE_SIZE           waiting requests per connection and class (default: 32)
+  SCHEDULER_MAX_WAIT             seconds a request may wait for a slot (default: 30)
+  SCHEDULER_USER_HEADER          request header identifying the user (default: X-User)
+"""
+import functools
+import itertools
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from flask import jsonify, make_response, request
+
+PRIORITIES = ('interactive', 'metadata', 'batch')
+# Weight of the newest sample in the per-class average wait
+WAIT_EWMA_ALPHA = 0.2
+# Seconds between checks of a cancellable waiter's cancel flag
+CANCEL_POLL_INTERVAL = 0.1
+
+
+def scheduler_enabled() -> bool:
+    return os.getenv('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a request cannot be admitted (queue full or waited too long)
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionCancelled(Exception):
+    """
+    Raised when a waiting request is cancelled before it was granted a slot
+    """
+
+
+class _Waiter:
+    __slots__ = ('seq', 'connection_id', 'user', 'priority', 'counts_user', 'enqueued_at', 'granted')
+
+    def __init__(self, seq, connection_id, user, priority, counts_user=True):
+        self.seq = seq
+        self.connection_id = connection_id
+        self.user = user
+        self.priority = priority
+        # Metadata requests, and the extra connections of one multi-connection request, are free for the user
+        self.counts_user = counts_user and priority != 'metadata'
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+
+
+class Ticket:
+    """
+    An admitted request; release() frees its slot (idempotent)
+    """
+
+    def __init__(self, scheduler, waiter, wait_time: float):
+        self.scheduler = scheduler
+        self.waiter = waiter
+        self.wait_time = wait_time
+        self.released = False
+
+    def release(self):
+        with self.scheduler.condition:
+            if self.released:
+                return
+            self.released = True
+            self.scheduler._release(self.waiter)
+
+
+class QueryScheduler:
+    """
+    Per-connection / per-user slot accounting with priority queues
+    """
+
+    def __init__(self, connection_limit: int, user_limit: int, interactive_reserve: int,
+                 queue_size: int, max_wait: float):
+        self.connection_limit = connection_limit
+        self.user_limit = user_limit
+        self.interactive_reserve = interactive_reserve
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.sequence = itertools.count()
+        self.running = defaultdict(int)          # connection_id -> running queries
+        self.running_users = defaultdict(int)    # user -> running queries
+        self.running_batch = defaultdict(int)    # connection_id -> running batch queries
+        self.queues = defaultdict(deque)         # (connection_id, priority) -> waiters
+        self.average_wait = {priority: 0.0 for priority in PRIORITIES}
+        self.counters = defaultdict(int)
+
+    def _batch_limit(self) -> int:
+        return max(1, self.connection_limit - self.interactive_reserve)
+
+    def _can_run(self, waiter) -> bool:
+        if self.running.get(waiter.connection_id, 0) >= self.connection_limit:
+            return False
+        if waiter.counts_user and self.running_users.get(waiter.user, 0) >= self.user_limit:
+            return False
+        if waiter.priority == 'batch' and self.running_batch.get(waiter.connection_id, 0) >= self._batch_limit():
+            return False
+        return True
+
+    def _grant(self, waiter):
+        waiter.granted = True
+        self.running[waiter.connection_id] += 1
+        if waiter.counts_user:
+            self.running_users[waiter.user] += 1
+        if waiter.priority == 'batch':
+            self.running_batch[waiter.connection_id] += 1
+
+    def _dispatch(self, connection_id):
+        # Higher classes first; a waiter whose user is at its limit does not block the others
+        granted = False
+        for priority in PRIORITIES:
+            queue = self.queues.get((connection_id, priority))
+            if not queue:
+                continue
+            for waiter in list(queue):
+                if self._can_run(waiter):
+                    queue.remove(waiter)
+                    self._grant(waiter)
+                    granted = True
+            if not queue:
+                del self.queues[(connection_id, priority)]
+        if granted:
+            self.condition.notify_all()
+
+    def _withdraw(self, waiter):
+        queue = self.queues.get((waiter.connection_id, waiter.priority))
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self.queues[(waiter.connection_id, waiter.priority)]
+
+    def acquire(self, connection_id: str, user: str, priority: str, counts_user: bool = True,
+                background: bool = False, cancelled: threading.Event = None) -> Ticket:
+        """
+        Wait for a slot; raises AdmissionRejected when the queue is full or the wait times out
+        counts_user=False leaves the per-user limit alone (further connections of one request);
+        background=True also waits without the SCHEDULER_MAX_WAIT deadline. Setting the
+        cancelled event while waiting leaves the queue and raises AdmissionCancelled.
+        """
+        if priority not in PRIORITIES:
+            priority = 'interactive'
+        with self.condition:
+            waiter = _Waiter(next(self.sequence), connection_id, user, priority, counts_user and not background)
+            queue = self.queues[(connection_id, priority)]
+            if len(queue) >= self.queue_size:
+                self.counters['rejected'] += 1
+                raise AdmissionRejected('查询队列已满，请稍后重试', retry_after=max(1, int(self.average_wait[priority]) + 1))
+            queue.append(waiter)
+            self._dispatch(connection_id)
+            deadline = None if background else waiter.enqueued_at + self.max_wait
+            while not waiter.granted:
+                if cancelled is not None and cancelled.is_set():
+                    self._withdraw(waiter)
+                    self.counters['cancelled'] += 1
+                    raise AdmissionCancelled('查询已取消')
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._withdraw(waiter)
+                    self.counters['timedOut'] += 1
+                    raise AdmissionRejected('排队等待超时，请稍后重试', retry_after=max(1, int(self.max_wait / 2)))
+                if cancelled is not None:
+                    # Setting the event does not notify the condition
+                    remaining = CANCEL_POLL_INTERVAL if remaining is None else min(remaining, CANCEL_POLL_INTERVAL)
+                self.condition.wait(remaining)
+            wait_time = time.monotonic() - waiter.enqueued_at
+            self.average_wait[priority] += WAIT_EWMA_ALPHA * (wait_time - self.average_wait[priority])
+            self.counters['admitted'] += 1
+            if wait_time > 0.001:
+                self.counters['queued'] += 1
+        return Ticket(self, waiter, wait_time)
+
+    def _release(self, waiter):
+        with self.condition:
+            self.running[waiter.connection_id] -= 1
+            if not self.running[waiter.connection_id]:
+                del self.running[waiter.connection_id]
+            if waiter.counts_user:
+                self.running_users[waiter.user] -= 1
+                if not self.running_users[waiter.user]:
+                    del self.running_users[waiter.user]
+            if waiter.priority == 'batch':
+                self.running_batch[waiter.connection_id] -= 1
+                if not self.running_batch[waiter.connection_id]:
+                    del self.running_batch[waiter.connection_id]
+            # The user may also have waiters on other connections
+            for connection_id in {key[0] for key in self.queues}:
+                self._dispatch(connection_id)
+
+    def stats(self) -> dict:
+        """
+        Running and queued requests per connection, average and oldest wait per class
+        """
+        now = time.monotonic()
+        with self.condition:
+            connections = {}
+            for connection_id in set(self.running) | {key[0] for key in self.queues}:
+                queued = {priority: len(self.queues.get((connection_id, priority), ())) for priority in PRIORITIES}
+                oldest = [
+                    now - queue[0].enqueued_at
+                    for (queue_connection, _), queue in self.queues.items()
+                    if queue_connection == connection_id and queue
+                ]
+                connections[connection_id] = {
+                    'running': self.running.get(connection_id, 0),
+                    'runningBatch': self.running_batch.get(connection_id, 0),
+                    'queued': queued,
+                    'oldestWait': round(max(oldest), 3) if oldest else 0.0,
+                }
+            return {
+                'limits': {
+                    'connection': self.connection_limit,
+                    'user': self.user_limit,
+                    'batch': self._batch_limit(),
+                    'queueSize': self.queue_size,
+                    'maxWait': self.max_wait,
+                },
+                'connections': connections,
+                'averageWait': {priority: round(value, 3) for priority, value in self.average_wait.items()},
+                'queueLength': sum(len(queue) for queue in self.queues.values()),
+                'admitted': self.counters['admitted'],
+                'queuedBeforeAdmission': self.counters['queued'],
+                'rejected': self.counters['rejected'],
+                'timedOut': self.counters['timedOut'],
+                'cancelled': self.counters['cancelled'],
+            }
+
+
+query_scheduler = QueryScheduler(
+    connection_limit=int(os.getenv('SCHEDULER_CONNECTION_LIMIT', '4')),
+    user_limit=int(os.getenv('SCHEDULER_USER_LIMIT', '2')),
+    interactive_reserve=int(os.getenv('SCHEDULER_INTERACTIVE_RESERVE', '1')),
+    queue_size=int(os.getenv('SCHEDULER_QUEUE_SIZE', '32')),
+    max_wait=float(os.getenv('SCHEDULER_MAX_WAIT', '30')),
+)
+
+
+def request_user() -> str:
+    return request.headers.get(os.getenv('SCHEDULER_USER_HEADER', 'X-User')) or request.remote_addr or 'anonymous'
+
+
+def request_priority(default: str) -> str:
+    """
+    Priority requested by the client (`priority` in the JSON body or query string)
+    Clients may only lower a request to batch, not raise it
+    """
+    data = request.get_json(silent=True) if request.is_json else None
+    requested = (data or {}).get('priority') if isinstance(data, dict) else None
+    requested = requested or request.args.get('priority')
+    return 'batch' if requested == 'batch' else default
+
+
+def acquire_all(connection_ids, user: str, priority: str, background: bool = False) -> list:
+    """
+    One ticket per connection, acquired in a fixed order so two requests over the same
+    connections never hold one slot each while waiting for the other; all or nothing
+    The request counts once towards the user's limit.
+    """
+    tickets = []
+    try:
+        for connection_id in sorted(set(connection_ids)):
+            tickets.append(query_scheduler.acquire(connection_id, user, priority, counts_user=not tickets,
+                                                   background=background))
+    except BaseException:
+        for ticket in tickets:
+            ticket.release()
+        raise
+    return tickets
+
+
+def _release_when_done(body, ticket: Ticket):
+    # Covers servers that exhaust the body without closing the response
+    try:
+        yield from body
+    finally:
+        ticket.release()
+
+
+def rejection_response(error: AdmissionRejected):
+    """
+    429 answer for a request that was not admitted
+    """
+    response = jsonify({'success': False, 'error': str(error), 'message': str(error)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+
+def admitted(priority: str):
+    """
+    Route decorator: run the view only after the connection_id route argument grants a slot
+    Streamed responses keep their slot until the body has been sent, unless they mark
+    themselves with holds_connection = False
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not scheduler_enabled():
+                return view(*args, **kwargs)
+            try:
+                ticket = query_scheduler.acquire(kwargs.get('connection_id'), request_user(), request_priority(priority))
+            except AdmissionRejected as e:
+                return rejection_response(e)
+            try:
+                response = view(*args, **kwargs)
+            except BaseException:
+                ticket.release()
+                raise
+            # Normalize (body, status) tuples so the slot can be tied to the response lifetime
+            response = make_response(response)
+            response.headers['X-Queue-Wait'] = f'{ticket.wait_time:.3f}'
+            if response.is_streamed and getattr(response, 'holds_connection', True):
+                response.response = _release_when_done(response.response, ticket)
+                response.call_on_close(ticket.release)
+            else:
+                ticket.release()
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,607 @@
+"""
+Project schedule API endpoints: cron schedules, run history and result snapshots
+Execution happens in the background runner (see api/schedule_runner.py).
+"""
+import uuid
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify
+from sqlalchemy import delete, func, select, update
+from models import db, DatabaseConnection, Project
+from models.schedule import MISFIRE_POLICIES, RUN_STATUSES, ProjectSchedule, ScheduleRun
+from .arrow_stream import ARROW_STREAM_MIMETYPE, wants_arrow
+from .cron import CronExpression, get_zone
+from . import result_store
+from .schedule_runner import first_run_at, open_snapshot, remove_snapshot, snapshot_enabled, wake_runner
+
+schedules_bp = Blueprint('schedules', __name__, url_prefix='/schedules')
+
+# 运行记录分页大小上限
+MAX_RUNS_PAGE_SIZE = 200
+
+
+def _read_int(data, key, minimum):
+    value = data.get(key)
+    if isinstance(value, bool) or not isinstance(value, int) or value < minimum:
+        raise ValueError(f'{key} 必须是不小于 {minimum} 的整数')
+    return value
+
+
+def read_schedule_fields(data, partial):
+    """
+    Validated column values from a schedule request body; raises ValueError
+    """
+    values = {}
+    if 'projectId' in data or not partial:
+        if not data.get('projectId') or not Project.query.get(data['projectId']):
+            raise ValueError('项目不存在')
+        values['project_id'] = data['projectId']
+    if 'connectionId' in data or not partial:
+        if not data.get('connectionId') or not DatabaseConnection.query.get(data['connectionId']):
+            raise ValueError('数据库连接不存在')
+        values['connection_id'] = data['connectionId']
+    if 'cron' in data or not partial:
+        values['cron'] = CronExpression(data.get('cron') or '').expression
+    if 'timezone' in data:
+        get_zone(data.get('timezone'))
+        values['timezone'] = data['timezone']
+    if 'enabled' in data:
+        values['enabled'] = bool(data['enabled'])
+    if 'maxRetries' in data:
+        values['max_retries'] = _read_int(data, 'maxRetries', 0)
+    if 'retryDelay' in data:
+        values['retry_delay'] = _read_int(data, 'retryDelay', 0)
+    if 'misfirePolicy' in data:
+        if data['misfirePolicy'] not in MISFIRE_POLICIES:
+            raise ValueError('misfirePolicy 必须是 run_once 或 skip')
+        values['misfire_policy'] = data['misfirePolicy']
+    if 'misfireGrace' in data:
+        values['misfire_grace'] = _read_int(data, 'misfireGrace', 0)
+    return values
+
+
+def schedule_next_run(schedule: ProjectSchedule):
+    return first_run_at(schedule.cron, schedule.timezone) if schedule.enabled else None
+
+
+def delete_schedule_runs(schedule_ids):
+    """
+    Delete the runs of schedules with their snapshot files
+    """
+    run_ids = db.session.execute(
+        select(ScheduleRun.id).where(ScheduleRun.schedule_id.in_(schedule_ids), ScheduleRun.snapshot_size.is_not(None))
+    ).scalars().all()
+    db.session.execute(
+        delete(ScheduleRun).where(ScheduleRun.schedule_id.in_(schedule_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    return run_ids
+
+
+@schedules_bp.route('', methods=['GET'])
+def list_schedules():
+    """
+    List project schedules
+    ---
+    tags:
+      - Schedules
+    summary: List schedules
+    produces:
+      - application/json
+    parameters:
+      - in: query
+        name: projectId
+        type: string
+        description: Only schedules of this project
+    responses:
+      200:
+        description: Schedules ordered by next run
+        schema:
+          type: object
+          properties:
+            schedules:
+              type: array
+              items:
+                type: object
+    """
+    try:
+        query = ProjectSchedule.query
+        if request.args.get('projectId'):
+            query = query.filter(ProjectSchedule.project_id == request.args['projectId'])
+        schedules = query.order_by(ProjectSchedule.next_run_at.is_(None), ProjectSchedule.next_run_at,
+                                   ProjectSchedule.created_at).all()
+        return jsonify({'schedules': [schedule.to_dict() for schedule in schedules]}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@schedules_bp.route('', methods=['POST'])
+def create_schedule():
+    """
+    Schedule a project
+    ---
+    tags:
+      - Schedules
+    summary: Create schedule
+    description: |
+      Runs the project's SQL on the connection at the times of a five-field cron expression
+      (minute hour day-of-month month day-of-week, or @daily / @hourly / ...) in the given
+      time zone. Failed runs are retried after retryDelay seconds, doubling per attempt.
+      A fire missed by more than misfireGrace seconds runs once late (run_once) or is
+      skipped (skip); a fire while the previous run is still active is skipped.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          required:
+            - projectId
+            - connectionId
+            - cron
+          properties:
+            projectId:
+              type: string
+            connectionId:
+              type: string
+            cron:
+              type: string
+              example: "0 9 * * 1-5"
+            timezone:
+              type: string
+              default: UTC
+              example: Asia/Shanghai
+            enabled:
+              type: boolean
+              default: true
+            maxRetries:
+              type: integer
+              default: 2
+            retryDelay:
+              type: integer
+              default: 60
+            misfirePolicy:
+              type: string
+              enum: [run_once, skip]
+              default: run_once
+            misfireGrace:
+              type: integer
+              default: 3600
+    responses:
+      201:
+        description: Schedule created, with nextRunAt
+      400:
+        description: Invalid schedule
+    """
+    try:
+        data = request.get_json() or {}
+        try:
+            values = read_schedule_fields(data, partial=False)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        schedule = ProjectSchedule(id=str(uuid.uuid4()), **values)
+        schedule.next_run_at = schedule_next_run(schedule)
+        if schedule.enabled and schedule.next_run_at is None:
+            return jsonify({'error': 'cron 表达式在未来 5 年内不会触发'}), 400
+        db.session.add(schedule)
+        db.session.commit()
+        return jsonify(schedule.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@schedules_bp.route('/<schedule_id>', methods=['GET'])
+def get_schedule(schedule_id):
+    """
+    Get a schedule
+    ---
+    tags:
+      - Schedules
+    summary: Get schedule
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: schedule_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Schedule
+      404:
+        description: Schedule not found
+    """
+    schedule = ProjectSchedule.query.get(schedule_id)
+    if not schedule:
+        return jsonify({'error': '计划不存在'}), 404
+    return jsonify(schedule.to_dict()), 200
+
+
+@schedules_bp.route('/<schedule_id>', methods=['PUT', 'PATCH'])
+def update_schedule(schedule_id):
+    """
+    Update a schedule
+    ---
+    tags:
+      - Schedules
+    summary: Update schedule
+    description: Updates the fields present in the body; changing cron, timezone or enabled recomputes nextRunAt.
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: schedule_id
+        type: string
+        required: true
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            connectionId:
+              type: string
+            cron:
+              type: string
+            timezone:
+              type: string
+            enabled:
+              type: boolean
+            maxRetries:
+              type: integer
+            retryDelay:
+              type: integer
+            misfirePolicy:
+              type: string
+              enum: [run_once, skip]
+            misfireGrace:
+              type: integer
+    responses:
+      200:
+        description: Schedule updated
+      400:
+        description: Invalid schedule
+      404:
+        description: Schedule not found
+    """
+    try:
+        data = request.get_json() or {}
+        schedule = ProjectSchedule.query.get(schedule_id)
+        if not schedule:
+            return jsonify({'error': '计划不存在'}), 404
+        data.pop('projectId', None)
+        try:
+            values = read_schedule_fields(data, partial=True)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        for key, value in values.items():
+            setattr(schedule, key, value)
+        if {'cron', 'timezone', 'enabled'} & values.keys():
+            schedule.next_run_at = schedule_next_run(schedule)
+        db.session.commit()
+        return jsonify(schedule.to_dict()), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@schedules_bp.route('/<schedule_id>', methods=['DELETE'])
+def delete_schedule(schedule_id):
+    """
+    Delete a schedule with its run history and snapshots
+    ---
+    tags:
+      - Schedules
+    summary: Delete schedule
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: schedule_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Schedule deleted
+      404:
+        description: Schedule not found
+    """
+    try:
+        snapshot_runs = delete_schedule_runs([schedule_id])
+        result = db.session.execute(
+            delete(ProjectSchedule).where(ProjectSchedule.id == schedule_id),
+            execution_options={'synchronize_session': False}
+        )
+        if not result.rowcount:
+            db.session.rollback()
+            return jsonify({'error': '计划不存在'}), 404
+        db.session.commit()
+        for run_id in snapshot_runs:
+            remove_snapshot(run_id)
+        return jsonify({'message': '计划已删除'}), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@schedules_bp.route('/<schedule_id>/run', methods=['POST'])
+def trigger_schedule(schedule_id):
+    """
+    Run a schedule now
+    ---
+    tags:
+      - Schedules
+    summary: Trigger schedule
+    description: Queues a run immediately (also for disabled schedules). Refused while a run of the schedule is active.
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: schedule_id
+        type: string
+        required: true
+    responses:
+      202:
+        description: Run queued
+      404:
+        description: Schedule not found
+      409:
+        description: A run of the schedule is already active
+    """
+    try:
+        schedule = ProjectSchedule.query.get(schedule_id)
+        if not schedule:
+            return jsonify({'error': '计划不存在'}), 404
+        now = datetime.utcnow()
+        run = ScheduleRun(id=str(uuid.uuid4()), schedule_id=schedule.id, project_id=schedule.project_id,
+                          scheduled_for=now, trigger='manual')
+        run.next_attempt_at = now
+        claimed = db.session.execute(
+            update(ProjectSchedule)
+            .where(ProjectSchedule.id == schedule_id, ProjectSchedule.running_run_id.is_(None))
+            .values(running_run_id=run.id, last_run_at=now),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not claimed:
+            db.session.rollback()
+            return jsonify({'error': '该计划已有运行中的任务', 'runningRunId': schedule.running_run_id}), 409
+        db.session.add(run)
+        db.session.commit()
+        wake_runner()
+        return jsonify(run.to_dict()), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@schedules_bp.route('/<schedule_id>/runs', methods=['GET'])
+def list_schedule_runs(schedule_id):
+    """
+    Run history of a schedule
+    ---
+    tags:
+      - Schedules
+    summary: List schedule runs
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: schedule_id
+        type: string
+        required: true
+      - in: query
+        name: status
+        type: string
+        enum: [queued, running, retrying, succeeded, failed, skipped]
+      - in: query
+        name: page
+        type: integer
+        default: 1
+      - in: query
+        name: pageSize
+        type: integer
+        default: 20
+        description: Page size (max 200)
+    responses:
+      200:
+        description: Runs, newest first
+        schema:
+          type: object
+          properties:
+            runs:
+              type: array
+              items:
+                type: object
+            total:
+              type: integer
+            page:
+              type: integer
+            pageSize:
+              type: integer
+      404:
+        description: Schedule not found
+    """
+    try:
+        if not ProjectSchedule.query.get(schedule_id):
+            return jsonify({'error': '计划不存在'}), 404
+        page = max(request.args.get('page', 1, type=int), 1)
+        page_size = min(max(request.args.get('pageSize', 20, type=int), 1), MAX_RUNS_PAGE_SIZE)
+        filters = [ScheduleRun.schedule_id == schedule_id]
+        status = request.args.get('status')
+        if status:
+            if status not in RUN_STATUSES:
+                return jsonify({'error': f'运行状态无效: {status}'}), 400
+            filters.append(ScheduleRun.status == status)
+
+        total = db.session.execute(select(func.count()).select_from(ScheduleRun).where(*filters)).scalar()
+        runs = (
+            ScheduleRun.query.filter(*filters)
+            .order_by(ScheduleRun.created_at.desc())
+            .offset((page - 1) * page_size)
+            .limit(page_size)
+            .all()
+        )
+        return jsonify({
+            'runs': [run.to_dict() for run in runs],
+            'total': total,
+            'page': page,
+            'pageSize': page_size
+        }), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@schedules_bp.route('/runs/<run_id>', methods=['GET'])
+def get_schedule_run(run_id):
+    """
+    Get a schedule run
+    ---
+    tags:
+      - Schedules
+    summary: Get schedule run
+    produces:
+      - application/json
+    parameters:
+      - in: path
+        name: run_id
+        type: string
+        required: true
+    responses:
+      200:
+        description: Run
+      404:
+        description: Run not found
+    """
+    run = ScheduleRun.query.get(run_id)
+    if not run:
+        return jsonify({'error': '运行记录不存在'}), 404
+    return jsonify(run.to_dict()), 200
+
+
+def snapshot_response(run: ScheduleRun):
+    if not snapshot_enabled():
+        return jsonify({'error': '结果快照不可用：未安装 pyarrow'}), 501
+    if run.snapshot_size is None:
+        return jsonify({'error': '该运行没有结果快照'}), 404
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = max(request.args.get('limit', 100, type=int), 0)
+    try:
+        table = open_snapshot(run.id)
+    except KeyError:
+        return jsonify({'error': '结果快照不存在'}), 404
+
+    page = table.slice(offset, limit)
+    if wants_arrow(request):
+        response = Response(result_store.iter_table_stream(page), mimetype=ARROW_STREAM_MIMETYPE)
+        response.headers['X-Row-Count'] = str(table.num_rows)
+        return response
+    return jsonify({
+        'runId': run.id,
+        'finishedAt': run.finished_at.isoformat() if run.finished_at else None,
+        'columns': table.column_names,
+        'rows': result_store.table_to_rows(page),
+        'rowCount': table.num_rows,
+        'truncated': run.truncated,
+        'offset': offset,
+        'limit': limit
+    }), 200
+
+
+@schedules_bp.route('/runs/<run_id>/result', methods=['GET'])
+def get_run_result(run_id):
+    """
+    Read the result snapshot of a run
+    ---
+    tags:
+      - Schedules
+    summary: Get run result
+    description: Rows [offset, offset + limit) of the stored result. Clients accepting application/vnd.apache.arrow.stream get an Arrow IPC stream.
+    produces:
+      - application/json
+      - application/vnd.apache.arrow.stream
+    parameters:
+      - in: path
+        name: run_id
+        type: string
+        required: true
+      - in: query
+        name: offset
+        type: integer
+        default: 0
+      - in: query
+        name: limit
+        type: integer
+        default: 100
+    responses:
+      200:
+        description: Result rows with columns and total rowCount
+      404:
+        description: Run or snapshot not found
+      501:
+        description: Snapshots not available (pyarrow not installed)
+    """
+    try:
+        run = ScheduleRun.query.get(run_id)
+        if not run:
+            return jsonify({'error': '运行记录不存在'}), 404
+        return snapshot_response(run)
+    except Exception as e:
+        return jsonify({'error': f'读取结果快照失败: {str(e)}'}), 500
+
+
+@schedules_bp.route('/<schedule_id>/result', methods=['GET'])
+def get_latest_result(schedule_id):
+    """
+    Read the latest result snapshot of a schedule
+    ---
+    tags:
+      - Schedules
+    summary: Get latest schedule result
+    description: Same as /schedules/runs/{run_id}/result for the newest successful run with a snapshot.
+    produces:
+      - application/json
+      - application/vnd.apache.arrow.stream
+    parameters:
+      - in: path
+        name: schedule_id
+        type: string
+        required: true
+      - in: query
+        name: offset
+        type: integer
+        default: 0
+      - in: query
+        name: limit
+        type: integer
+        default: 100
+    responses:
+      200:
+        description: Result rows with columns and total rowCount
+      404:
+        description: Schedule or snapshot not found
+      501:
+        description: Snapshots not available (pyarrow not installed)
+    """
+    try:
+        if not ProjectSchedule.query.get(schedule_id):
+            return jsonify({'error': '计划不存在'}), 404
+        run = (
+            ScheduleRun.query
+            .filter(ScheduleRun.schedule_id == schedule_id, ScheduleRun.status == 'succeeded',
+                    ScheduleRun.snapshot_size.is_not(None))
+            .order_by(ScheduleRun.finished_at.desc())
+            .first()
+        )
+        if run is None:
+            return jsonify({'error': '该计划还没有结果快照'}), 404
+        return snapshot_response(run)
+    except Exception as e:
+        return jsonify({'error': f'读取结果快照失败: {str(e)}'}), 500
@@ -0,0 +1,476 @@
+"""
+Schema diff between two connections/databases
+Each side's catalog (columns, primary keys, indexes, foreign keys) is read with a single bulk
+query, both sides concurrently, and compared in memory. Changes describe what has to happen
+to the target to match the source; DDL for the target's dialect can be generated from them.
+
+Every catalog query returns rows of
+  (kind, table_name, name, position, info, detail, extra, role, flag)
+  column:       info=type, detail=default, extra=identity/auto_increment, role=pk ordinal (SQLite), flag=nullable
+  index:        info=method, detail=key column or expression, extra=partial predicate, role='primary', flag=unique
+  foreign_key:  info=referenced table, detail=column, extra=referenced column, role='ON UPDATE|ON DELETE'
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+
+
+_POSTGRESQL_CATALOG = """
+    SELECT 'column' AS kind, cls.relname::text AS table_name, a.attname::text AS name, a.attnum::int AS position,
+           format_type(a.atttypid, a.atttypmod) AS info, pg_get_expr(d.adbin, d.adrelid) AS detail,
+           CASE a.attidentity WHEN 'a' THEN 'GENERATED ALWAYS AS IDENTITY'
+                              WHEN 'd' THEN 'GENERATED BY DEFAULT AS IDENTITY' END AS extra,
+           NULL::text AS role, NOT a.attnotnull AS flag
+    FROM pg_attribute a
+    JOIN pg_class cls ON cls.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = cls.relnamespace
+    LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+    WHERE n.nspname = :schema AND cls.relkind IN ('r', 'p') AND a.attnum > 0 AND NOT a.attisdropped
+    UNION ALL
+    SELECT 'index', cls.relname::text, ic.relname::text, k.ord::int,
+           am.amname::text, pg_get_indexdef(i.indexrelid, k.ord::int, true), pg_get_expr(i.indpred, i.indrelid),
+           CASE WHEN i.indisprimary THEN 'primary' END, i.indisunique
+    FROM pg_index i
+    JOIN pg_class cls ON cls.oid = i.indrelid
+    JOIN pg_namespace n ON n.oid = cls.relnamespace
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_am am ON am.oid = ic.relam
+    CROSS JOIN LATERAL generate_series(1, i.indnkeyatts) AS k(ord)
+    WHERE n.nspname = :schema AND cls.relkind IN ('r', 'p')
+    UNION ALL
+    SELECT 'foreign_key', cls.relname::text, con.conname::text, k.ord::int,
+           ref.relname::text, a.attname::text, ra.attname::text,
+           (CASE con.confupdtype WHEN 'c' THEN 'CASCADE' WHEN 'n' THEN 'SET NULL' WHEN 'd' THEN 'SET DEFAULT'
+                                 WHEN 'r' THEN 'RESTRICT' ELSE 'NO ACTION' END) || '|' ||
+           (CASE con.confdeltype WHEN 'c' THEN 'CASCADE' WHEN 'n' THEN 'SET NULL' WHEN 'd' THEN 'SET DEFAULT'
+                                 WHEN 'r' THEN 'RESTRICT' ELSE 'NO ACTION' END),
+           NULL
+    FROM pg_constraint con
+    JOIN pg_class cls ON cls.oid = con.conrelid
+    JOIN pg_namespace n ON n.oid = cls.relnamespace
+    JOIN pg_class ref ON ref.oid = con.confrelid
+    CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, refattnum, ord)
+    JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+    JOIN pg_attribute ra ON ra.attrelid = con.confrelid AND ra.attnum = k.refattnum
+    WHERE con.contype = 'f' AND n.nspname = :schema
+"""
+
+_MYSQL_CATALOG = """
+    SELECT 'column' AS kind, c.TABLE_NAME AS table_name, c.COLUMN_NAME AS name, c.ORDINAL_POSITION AS position,
+           c.COLUMN_TYPE AS info, c.COLUMN_DEFAULT AS detail, NULLIF(c.EXTRA, '') AS extra,
+           NULL AS role, c.IS_NULLABLE = 'YES' AS flag
+    FROM INFORMATION_SCHEMA.COLUMNS c
+    JOIN INFORMATION_SCHEMA.TABLES t
+      ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME AND t.TABLE_TYPE = 'BASE TABLE'
+    WHERE c.TABLE_SCHEMA = :schema
+    UNION ALL
+    SELECT 'index', s.TABLE_NAME, s.INDEX_NAME, s.SEQ_IN_INDEX,
+           s.INDEX_TYPE, CONCAT(s.COLUMN_NAME, IF(s.SUB_PART IS NULL, '', CONCAT('(', s.SUB_PART, ')'))), NULL,
+           IF(s.INDEX_NAME = 'PRIMARY', 'primary', NULL), s.NON_UNIQUE = 0
+    FROM INFORMATION_SCHEMA.STATISTICS s
+    WHERE s.TABLE_SCHEMA = :schema
+    UNION ALL
+    SELECT 'foreign_key', k.TABLE_NAME, k.CONSTRAINT_NAME, k.ORDINAL_POSITION,
+           k.REFERENCED_TABLE_NAME, k.COLUMN_NAME, k.REFERENCED_COLUMN_NAME,
+           CONCAT(r.UPDATE_RULE, '|', r.DELETE_RULE), NULL
+    FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE k
+    JOIN INFORMATION_SCHEMA.REFERENTIAL_CONSTRAINTS r
+      ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+         AND r.TABLE_NAME = k.TABLE_NAME
+    WHERE k.TABLE_SCHEMA = :schema AND k.REFERENCED_TABLE_NAME IS NOT NULL
+"""
+
+# Table-valued pragma functions keep SQLite to one statement as well
+_SQLITE_CATALOG = """
+    SELECT 'column' AS kind, m.name AS table_name, p.name AS name, p.cid + 1 AS position,
+           p.type AS info, p.dflt_value AS detail, NULL AS extra, NULLIF(p.pk, 0) AS role, p."notnull" = 0 AS flag
+    FROM sqlite_master m JOIN pragma_table_info(m.name) p
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+    UNION ALL
+    SELECT 'index', m.name, il.name, ii.seqno + 1,
+           NULL, COALESCE(ii.name, '<expression>'), CASE WHEN il.partial THEN 'partial' END,
+           CASE WHEN il.origin = 'pk' THEN 'primary' END, il."unique"
+    FROM sqlite_master m JOIN pragma_index_list(m.name) il JOIN pragma_index_info(il.name) ii
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+    UNION ALL
+    SELECT 'foreign_key', m.name, 'fk_' || m.name || '_' || fk.id, fk.seq + 1,
+           fk."table", fk."from", fk."to", fk.on_update || '|' || fk.on_delete, NULL
+    FROM sqlite_master m JOIN pragma_foreign_key_list(m.name) fk
+    WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+"""
+
+CATALOG_QUERIES = {
+    'postgresql': _POSTGRESQL_CATALOG,
+    'mysql': _MYSQL_CATALOG,
+    'sqlite': _SQLITE_CATALOG,
+}
+
+
+def default_schema(db_type: str, database: str = None):
+    if db_type == 'postgresql':
+        return 'public'
+    if db_type == 'mysql':
+        return database
+    return 'main'
+
+
+def build_catalog(rows) -> dict:
+    """
+    Fold catalog rows into {table: {'columns', 'primaryKey', 'indexes', 'foreignKeys'}}
+    """
+    tables = {}
+    index_keys = {}
+    foreign_keys = {}
+    for kind, table_name, name, position, info, detail, extra, role, flag in rows:
+        table = tables.setdefault(table_name, {'columns': {}, 'primaryKey': [], 'indexes': {}, 'foreignKeys': {}})
+        position = int(position or 0)
+        if kind == 'column':
+            table['columns'][name] = {
+                'position': position,
+                'type': info or '',
+                'nullable': bool(flag),
+                'default': None if detail is None else str(detail),
+                'extra': extra or '',
+                'pk': int(role) if role else 0,
+            }
+        elif kind == 'index':
+            entry = index_keys.setdefault((table_name, name), {
+                'method': (info or '').lower(),
+                'unique': bool(flag),
+                'primary': role == 'primary',
+                'where': extra,
+                'keys': [],
+            })
+            entry['keys'].append((position, detail))
+        elif kind == 'foreign_key':
+            entry = foreign_keys.setdefault((table_name, name), {
+                'references': info,
+                'rules': (role or '').upper(),
+                'keys': [],
+            })
+            entry['keys'].append((position, detail, extra))
+
+    for (table_name, name), entry in index_keys.items():
+        columns = [key for _, key in sorted(entry.pop('keys'))]
+        if entry['primary']:
+            tables[table_name]['primaryKey'] = columns
+            tables[table_name]['primaryKeyName'] = name
+            continue
+        entry['columns'] = columns
+        tables[table_name]['indexes'][name] = entry
+    for (table_name, name), entry in foreign_keys.items():
+        keys = sorted(entry.pop('keys'), key=lambda key: key[0])
+        entry['columns'] = [column for _, column, _ in keys]
+        entry['referencedColumns'] = [column for _, _, column in keys]
+        tables[table_name]['foreignKeys'][name] = entry
+    for table in tables.values():
+        # SQLite reports the primary key per column (rowid tables have no pk index)
+        if not table['primaryKey']:
+            pk_columns = sorted((column['pk'], name) for name, column in table['columns'].items() if column['pk'])
+            table['primaryKey'] = [name for _, name in pk_columns]
+        for column in table['columns'].values():
+            del column['pk']
+    return tables
+
+
+def fetch_catalog(db_type: str, conn_str: str, schema: str) -> dict:
+    """
+    Read a whole schema's catalog with one query; returns {'tables', 'fetchTime'}
+    """
+    from .database import create_url_engine
+
+    query = CATALOG_QUERIES.get(db_type)
+    if query is None:
+        raise ValueError(f'不支持的数据库类型: {db_type}')
+    started = time.perf_counter()
+    engine = create_url_engine(db_type, conn_str)
+    try:
+        with engine.connect() as conn:
+            rows = conn.execute(text(query), {'schema': schema}).fetchall()
+    finally:
+        engine.dispose()
+    return {'tables': build_catalog(rows), 'fetchTime': round(time.perf_counter() - started, 3)}
+
+
+def fetch_catalogs(sides) -> list:
+    """
+    Fetch several catalogs concurrently; sides is a list of (db_type, conn_str, schema)
+    """
+    with ThreadPoolExecutor(max_workers=max(len(sides), 1), thread_name_prefix='schema-diff') as executor:
+        futures = [executor.submit(fetch_catalog, *side) for side in sides]
+        return [future.result() for future in futures]
+
+
+def _normalize_type(value: str) -> str:
+    return re.sub(r'\s+', ' ', (value or '').strip().lower())
+
+
+def _index_signature(index: dict):
+    return (index['unique'], tuple(index['columns']), index['method'], index['where'] or '')
+
+
+def _foreign_key_signature(foreign_key: dict):
+    return (tuple(foreign_key['columns']), foreign_key['references'],
+            tuple(foreign_key['referencedColumns']), foreign_key['rules'])
+
+
+def _diff_keyed(source: dict, target: dict, signature):
+    """
+    Match indexes/foreign keys by definition rather than name, so differently named
+    but equivalent objects are not reported
+    """
+    target_by_signature = {signature(value): name for name, value in target.items()}
+    source_by_signature = {signature(value): name for name, value in source.items()}
+    added = [dict(source[name], name=name) for key, name in source_by_signature.items()
+             if key not in target_by_signature]
+    removed = [dict(target[name], name=name) for key, name in target_by_signature.items()
+               if key not in source_by_signature]
+    return added, removed
+
+
+def _diff_table(name: str, source: dict, target: dict):
+    change = {'table': name}
+
+    added_columns = [dict(source['columns'][column], name=column)
+                     for column in source['columns'] if column not in target['columns']]
+    removed_columns = [dict(target['columns'][column], name=column)
+                       for column in target['columns'] if column not in source['columns']]
+    changed_columns = []
+    for column, definition in source['columns'].items():
+        current = target['columns'].get(column)
+        if current is None:
+            continue
+        differences = {}
+        if _normalize_type(definition['type']) != _normalize_type(current['type']):
+            differences['type'] = {'from': current['type'], 'to': definition['type']}
+        if definition['nullable'] != current['nullable']:
+            differences['nullable'] = {'from': current['nullable'], 'to': definition['nullable']}
+        if definition['default'] != current['default']:
+            differences['default'] = {'from': current['default'], 'to': definition['default']}
+        if definition['extra'] != current['extra']:
+            differences['extra'] = {'from': current['extra'], 'to': definition['extra']}
+        if differences:
+            changed_columns.append({'name': column, 'definition': definition, 'changes': differences})
+    if added_columns or removed_columns or changed_columns:
+        change['columns'] = {'added': added_columns, 'removed': removed_columns, 'changed': changed_columns}
+
+    if source['primaryKey'] != target['primaryKey']:
+        change['primaryKey'] = {
+            'from': target['primaryKey'], 'to': source['primaryKey'],
+            'name': target.get('primaryKeyName'),
+        }
+
+    added, removed = _diff_keyed(source['indexes'], target['indexes'], _index_signature)
+    if added or removed:
+        change['indexes'] = {'added': added, 'removed': removed}
+    added, removed = _diff_keyed(source['foreignKeys'], target['foreignKeys'], _foreign_key_signature)
+    if added or removed:
+        change['foreignKeys'] = {'added': added, 'removed': removed}
+
+    return change if len(change) > 1 else None
+
+
+def diff_catalogs(source: dict, target: dict, tables=None) -> dict:
+    """
+    Structured changeset turning the target schema into the source schema
+    tables: optional list of table names to restrict the comparison to
+    """
+    names = set(source) | set(target)
+    if tables:
+        names &= set(tables)
+
+    added = sorted(name for name in names if name in source and name not in target)
+    removed = sorted(name for name in names if name in target and name not in source)
+    changed = []
+    for name in sorted(names):
+        if name in source and name in target:
+            change = _diff_table(name, source[name], target[name])
+            if change:
+                changed.append(change)
+
+    return {
+        'summary': {
+            'tablesCompared': len(names),
+            'tablesAdded': len(added),
+            'tablesRemoved': len(removed),
+            'tablesChanged': len(changed),
+        },
+        'added': [dict(source[name], table=name) for name in added],
+        'removed': removed,
+        'changed': changed,
+    }
+
+
+class DdlWriter:
+    """
+    Generates DDL in the target's dialect; column types are used verbatim from the source
+    """
+
+    def __init__(self, db_type: str, schema: str = None):
+        self.db_type = db_type
+        self.schema = schema if db_type == 'postgresql' else None
+
+    def quote(self, name: str) -> str:
+        if self.db_type == 'mysql':
+            return '`' + name.replace('`', '``') + '`'
+        return '"' + name.replace('"', '""') + '"'
+
+    def table(self, name: str) -> str:
+        if self.schema:
+            return f'{self.quote(self.schema)}.{self.quote(name)}'
+        return self.quote(name)
+
+    def key_list(self, columns) -> str:
+        parts = []
+        for column in columns:
+            prefix = re.match(r'^(.*)\((\d+)\)$', column or '') if self.db_type == 'mysql' else None
+            if prefix:
+                parts.append(f'{self.quote(prefix.group(1))}({prefix.group(2)})')
+            elif column and re.match(r'^[\w$]+$', column):
+                parts.append(self.quote(column))
+            else:
+                parts.append(column or '')  # expression key
+        return ', '.join(parts)
+
+    def default_sql(self, column: dict):
+        default = column['default']
+        if default is None:
+            return None
+        if self.db_type != 'mysql':
+            return default
+        # MySQL reports literal defaults unquoted
+        if 'DEFAULT_GENERATED' in column['extra'].upper() or re.match(r'^-?\d+(\.\d+)?$', default) \
+                or default.upper().startswith(('CURRENT_TIMESTAMP', 'NULL')):
+            return default
+        return "'" + default.replace("'", "''") + "'"
+
+    def column_sql(self, name: str, column: dict) -> str:
+        sql = f'{self.quote(name)} {column["type"]}'
+        extra = ' '.join(word for word in column['extra'].split() if word.upper() != 'DEFAULT_GENERATED')
+        if extra and self.db_type == 'postgresql':
+            sql += f' {extra}'
+        if not column['nullable']:
+            sql += ' NOT NULL'
+        default = self.default_sql(column)
+        if default is not None:
+            sql += f' DEFAULT {default}'
+        if extra and self.db_type == 'mysql':
+            sql += f' {extra}'
+        return sql
+
+    def create_index(self, table: str, index: dict) -> str:
+        unique = 'UNIQUE ' if index['unique'] else ''
+        using = f' USING {index["method"]}' if self.db_type == 'postgresql' and index['method'] else ''
+        sql = f'CREATE {unique}INDEX {self.quote(index["name"])} ON {self.table(table)}{using} ({self.key_list(index["columns"])})'
+        if index['where'] and self.db_type == 'postgresql':
+            sql += f' WHERE {index["where"]}'
+        return sql + ';'
+
+    def drop_index(self, table: str, index: dict) -> str:
+        if self.db_type == 'mysql':
+            return f'DROP INDEX {self.quote(index["name"])} ON {self.table(table)};'
+        name = f'{self.quote(self.schema)}.{self.quote(index["name"])}' if self.schema else self.quote(index['name'])
+        return f'DROP INDEX {name};'
+
+    def foreign_key_clause(self, foreign_key: dict) -> str:
+        on_update, _, on_delete = foreign_key['rules'].partition('|')
+        sql = (f'FOREIGN KEY ({self.key_list(foreign_key["columns"])}) '
+               f'REFERENCES {self.table(foreign_key["references"])} ({self.key_list(foreign_key["referencedColumns"])})')
+        if on_delete and on_delete != 'NO ACTION':
+            sql += f' ON DELETE {on_delete}'
+        if on_update and on_update != 'NO ACTION':
+            sql += f' ON UPDATE {on_update}'
+        return sql
+
+    def create_table(self, name: str, table: dict) -> list:
+        lines = [self.column_sql(column, definition) for column, definition in
+                 sorted(table['columns'].items(), key=lambda item: item[1]['position'])]
+        if table['primaryKey']:
+            lines.append(f'PRIMARY KEY ({self.key_list(table["primaryKey"])})')
+        if self.db_type == 'sqlite':
+            # SQLite cannot add foreign keys later
+            lines.extend(self.foreign_key_clause(foreign_key) for foreign_key in table['foreignKeys'].values())
+        body = ',\n  '.join(lines)
+        statements = [f'CREATE TABLE {self.table(name)} (\n  {body}\n);']
+        statements.extend(self.create_index(name, dict(index, name=index_name))
+                          for index_name, index in table['indexes'].items())
+        if self.db_type != 'sqlite':
+            statements.extend(
+                f'ALTER TABLE {self.table(name)} ADD CONSTRAINT {self.quote(fk_name)} {self.foreign_key_clause(foreign_key)};'
+                for fk_name, foreign_key in table['foreignKeys'].items()
+            )
+        return statements
+
+    def alter_column(self, table: str, column: dict) -> list:
+        name = column['name']
+        definition = column['definition']
+        changes = column['changes']
+        prefix = f'ALTER TABLE {self.table(table)}'
+        if self.db_type == 'mysql':
+            return [f'{prefix} MODIFY COLUMN {self.column_sql(name, definition)};']
+        if self.db_type == 'sqlite':
+            return [f'-- SQLite cannot alter column {self.quote(name)} of {self.table(table)}; rebuild the table']
+        statements = []
+        if 'type' in changes:
+            statements.append(f'{prefix} ALTER COLUMN {self.quote(name)} TYPE {definition["type"]};')
+        if 'nullable' in changes:
+            action = 'DROP NOT NULL' if definition['nullable'] else 'SET NOT NULL'
+            statements.append(f'{prefix} ALTER COLUMN {self.quote(name)} {action};')
+        if 'default' in changes:
+            if definition['default'] is None:
+                statements.append(f'{prefix} ALTER COLUMN {self.quote(name)} DROP DEFAULT;')
+            else:
+                statements.append(f'{prefix} ALTER COLUMN {self.quote(name)} SET DEFAULT {definition["default"]};')
+        if 'extra' in changes:
+            statements.append(f'-- {self.quote(name)}: identity changed from '
+                              f'"{changes["extra"]["from"]}" to "{changes["extra"]["to"]}"')
+        return statements
+
+    def changeset(self, changes: dict) -> list:
+        statements = []
+        for table in changes['added']:
+            statements.extend(self.create_table(table['table'], table))
+        for change in changes['changed']:
+            name = change['table']
+            prefix = f'ALTER TABLE {self.table(name)}'
+            foreign_keys = change.get('foreignKeys', {})
+            indexes = change.get('indexes', {})
+            columns = change.get('columns', {})
+            # Drop dependent objects first, create them last
+            for foreign_key in foreign_keys.get('removed', []):
+                if self.db_type == 'mysql':
+                    statements.append(f'{prefix} DROP FOREIGN KEY {self.quote(foreign_key["name"])};')
+                elif self.db_type == 'postgresql':
+                    statements.append(f'{prefix} DROP CONSTRAINT {self.quote(foreign_key["name"])};')
+                else:
+                    statements.append(f'-- SQLite cannot drop foreign keys of {self.table(name)}; rebuild the table')
+            statements.extend(self.drop_index(name, index) for index in indexes.get('removed', []))
+            for column in columns.get('added', []):
+                statements.append(f'{prefix} ADD COLUMN {self.column_sql(column["name"], column)};')
+            for column in columns.get('changed', []):
+                statements.extend(self.alter_column(name, column))
+            if 'primaryKey' in change:
+                primary_key = change['primaryKey']
+                if self.db_type == 'sqlite':
+                    statements.append(f'-- SQLite cannot change the primary key of {self.table(name)}; rebuild the table')
+                else:
+                    if primary_key['from']:
+                        if self.db_type == 'mysql':
+                            statements.append(f'{prefix} DROP PRIMARY KEY;')
+                        else:
+                            statements.append(f'{prefix} DROP CONSTRAINT {self.quote(primary_key["name"])};')
+                    if primary_key['to']:
+                        statements.append(f'{prefix} ADD PRIMARY KEY ({self.key_list(primary_key["to"])});')
+            for column in columns.get('removed', []):
+                statements.append(f'{prefix} DROP COLUMN {self.quote(column["name"])};')
+            statements.extend(self.create_index(name, index) for index in indexes.get('added', []))
+            for foreign_key in foreign_keys.get('added', []):
+                if self.db_type == 'sqlite':
+                    statements.append(f'-- SQLite cannot add foreign keys to {self.table(name)}; rebuild the table')
+                else:
+                    statements.append(f'{prefix} ADD CONSTRAINT {self.quote(foreign_key["name"])} '
+                                      f'{self.foreign_key_clause(foreign_key)};')
+        for name in changes['removed']:
+            statements.append(f'DROP TABLE {self.table(name)};')
+        return statements
@@ -0,0 +1,46 @@
+"""
+Range patches against a known text version
+A patch replaces the range [start, end) of the base text with `text`. Offsets are UTF-16
+code units, the native string indices of the editor (JavaScript), so clients can compute
+them without re-encoding; characters outside the BMP count as two units. Patches in one
+request refer to the same base text and must be sorted and non-overlapping.
+"""
+from typing import List
+
+
+def _offset(patch: dict, key: str, default=None) -> int:
+    value = patch.get(key, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'补丁的 {key} 必须是整数')
+    return value
+
+
+def apply_text_patches(base: str, patches: List[dict]) -> str:
+    """
+    Apply range patches to base and return the new text
+    Raises ValueError for malformed, unsorted, overlapping or out-of-range patches
+    """
+    if not isinstance(patches, list):
+        raise ValueError('patches 必须是数组')
+    try:
+        units = base.encode('utf-16-le')
+        length = len(units) // 2
+        parts = []
+        position = 0
+        for patch in patches:
+            if not isinstance(patch, dict):
+                raise ValueError('补丁格式无效')
+            start = _offset(patch, 'start')
+            end = _offset(patch, 'end', start)
+            replacement = patch.get('text') or ''
+            if not isinstance(replacement, str):
+                raise ValueError('补丁的 text 必须是字符串')
+            if not position <= start <= end <= length:
+                raise ValueError('补丁范围无效：超出内容长度、未排序或相互重叠')
+            parts.append(units[position * 2:start * 2])
+            parts.append(replacement.encode('utf-16-le'))
+            position = end
+        parts.append(units[position * 2:])
+        return b''.join(parts).decode('utf-16-le')
+    except UnicodeError:
+        raise ValueError('补丁位置落在代理对（surrogate pair）中间')
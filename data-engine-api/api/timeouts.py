@@ -0,0 +1,106 @@
+"""
+Server-side statement timeouts per dialect
+PostgreSQL uses a transaction-local statement_timeout, MySQL the session max_execution_time
+(SELECT statements only), and SQLite a progress handler that interrupts the statement once
+its deadline has passed.
+
+Configuration (environment variables):
+  STATEMENT_TIMEOUT       default timeout in seconds for executed SQL when the connection has
+                          none configured (default: 300, 0 = no limit)
+  BATCH_STATEMENT_TIMEOUT default for background work instead: scheduled runs, pipelines,
+                          incremental loads and metric refreshes (default: 0 = no limit), so
+                          long ETL statements keep running unless a limit is configured
+  STATEMENT_TIMEOUT_MAX   upper bound for connection and per-request timeouts (default: 0 = none)
+"""
+import os
+import time
+from contextlib import contextmanager
+from sqlalchemy import text
+
+
+@contextmanager
+def statement_timeout(conn, db_type: str, seconds):
+    """
+    Limit statements executed on conn inside the block to the given number of seconds
+    conn is a SQLAlchemy Connection; a falsy timeout means no limit
+    """
+    if not seconds:
+        yield
+        return
+    milliseconds = max(int(seconds * 1000), 1)
+
+    if db_type == 'postgresql':
+        # SET LOCAL ends with the transaction, so the setting never leaks into pooled connections
+        conn.execute(text(f'SET LOCAL statement_timeout = {milliseconds}'))
+        yield
+    elif db_type == 'mysql':
+        conn.execute(text(f'SET SESSION max_execution_time = {milliseconds}'))
+        try:
+            yield
+        finally:
+            try:
+                conn.execute(text('SET SESSION max_execution_time = DEFAULT'))
+            except Exception:
+                pass
+    elif db_type == 'sqlite':
+        raw = conn.connection.driver_connection
+        deadline = time.monotonic() + seconds
+        # A non-zero return value aborts the running statement with "interrupted"
+        raw.set_progress_handler(lambda: int(time.monotonic() > deadline), 1000)
+        try:
+            yield
+        finally:
+            raw.set_progress_handler(None, 0)
+    else:
+        yield
+
+
+def parse_timeout(value):
+    """
+    Validate a timeout given by a client; returns seconds or None, raises ValueError
+    """
+    if value is None or value == '':
+        return None
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('超时时间必须是正数（秒）')
+    if seconds <= 0:
+        raise ValueError('超时时间必须是正数（秒）')
+    return seconds
+
+
+def resolve_statement_timeout(connection_timeout=None, requested=None, batch: bool = False) -> float:
+    """
+    Effective timeout in seconds: per-request override, then the connection setting, then the
+    STATEMENT_TIMEOUT default (BATCH_STATEMENT_TIMEOUT for background work), capped at
+    STATEMENT_TIMEOUT_MAX; 0 means no limit
+    """
+    if requested:
+        seconds = float(requested)
+    elif connection_timeout:
+        seconds = float(connection_timeout)
+    elif batch:
+        seconds = float(os.getenv('BATCH_STATEMENT_TIMEOUT', '0'))
+    else:
+        seconds = float(os.getenv('STATEMENT_TIMEOUT', '300'))
+    cap = float(os.getenv('STATEMENT_TIMEOUT_MAX', '0'))
+    if cap > 0 and (seconds <= 0 or seconds > cap):
+        seconds = cap
+    return max(seconds, 0.0)
+
+
+def is_timeout_error(error) -> bool:
+    """
+    True when a driver error was raised because a statement timeout fired
+    """
+    original = getattr(error, 'orig', error)
+    # PostgreSQL query_canceled
+    if getattr(original, 'pgcode', None) == '57014' or getattr(original, 'sqlstate', None) == '57014':
+        return True
+    args = getattr(original, 'args', ())
+    # MySQL ER_QUERY_TIMEOUT / query execution was interrupted
+    if args and args[0] in (3024, 1317, 1969):
+        return True
+    message = str(original).lower()
+    return 'statement timeout' in message or message == 'interrupted'
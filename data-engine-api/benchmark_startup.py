@@ -0,0 +1,75 @@
+"""
+Cold start benchmark for create_app()
+Starts fresh interpreters (as a new worker would), times `import main` and `create_app()`,
+and fails when the median total exceeds the budget or when a heavy module that should
+only load on demand was imported during startup.
+
+    python benchmark_startup.py [--runs 5] [--budget 1.0]
+
+Configuration (environment variables):
+  STARTUP_BUDGET   default for --budget, in seconds (default: 1.0)
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Must not be imported by create_app(); they load on first use
+LAZY_MODULES = ('flasgger', 'yaml', 'jsonschema', 'pyarrow', 'langchain', 'langgraph',
+                'langchain_openai', 'langchain_ollama')
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.create_app()
+created = time.perf_counter()
+print(json.dumps({
+    'import': imported - started,
+    'create_app': created - imported,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+""" % (LAZY_MODULES,)
+
+
+def run_once() -> dict:
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure create_app() cold start time')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=float(os.getenv('STARTUP_BUDGET', '1.0')))
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    totals = [sample['import'] + sample['create_app'] for sample in samples]
+    for phase in ('import', 'create_app'):
+        values = [sample[phase] for sample in samples]
+        print(f'{phase:<12} median {statistics.median(values):.3f}s  max {max(values):.3f}s')
+    median_total = statistics.median(totals)
+    print(f'{"total":<12} median {median_total:.3f}s  max {max(totals):.3f}s  (budget {args.budget:.3f}s)')
+
+    failures = []
+    if median_total > args.budget:
+        failures.append(f'median startup {median_total:.3f}s exceeds budget {args.budget:.3f}s')
+    loaded = sorted({name for sample in samples for name in sample['loaded']})
+    if loaded:
+        failures.append(f'imported during startup: {", ".join(loaded)}')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
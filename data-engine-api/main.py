@@ -3,9 +3,12 @@ Main application entry point
 """
 from flask import Flask, jsonify
 from flask_cors import CORS
-from flasgger import Swagger
 from models import init_db
 from api import api_bp
+from api.compression import init_compression
+from api.apidocs import init_apidocs
+from api.query_socket import init_query_socket, socketio
+from api.schedule_runner import init_schedule_runner
 
 
 def create_app():
@@ -17,43 +20,11 @@ def create_app():
     # Enable CORS for frontend
     CORS(app)
     
-    # Initialize Swagger
-    swagger_config = {
-        "headers": [],
-        "specs": [
-            {
-                "endpoint": "apispec",
-                "route": "/apispec.json",
-                "rule_filter": lambda rule: True,
-                "model_filter": lambda tag: True,
-            }
-        ],
-        "static_url_path": "/flasgger_static",
-        "swagger_ui": True,
-        "specs_route": "/api-docs"
-    }
+    # Negotiated response compression (zstd / brotli / gzip)
+    init_compression(app)
     
-    swagger_template = {
-        "swagger": "2.0",
-        "info": {
-            "title": "Data Engine API",
-            "description": "API documentation for Data Engine - Directory and Project Management",
-            "version": "1.0.0",
-            "contact": {
-                "name": "API Support"
-            }
-        },
-        "basePath": "/api",
-        "schemes": ["http", "https"],
-        "tags": [
-            {
-                "name": "Editor",
-                "description": "Editor API endpoints for directory and project management"
-            }
-        ]
-    }
-    
-    Swagger(app, config=swagger_config, template=swagger_template)
+    # Swagger UI and the (prebuilt) API spec
+    init_apidocs(app)
     
     # Initialize database
     init_db(app)
@@ -61,6 +32,12 @@ def create_app():
     # Register API blueprints
     app.register_blueprint(api_bp)
     
+    # Streamed query execution over Socket.IO (/query namespace)
+    init_query_socket(app)
+    
+    # Poller and worker pool for scheduled project runs
+    init_schedule_runner(app)
+    
     return app
 
 
@@ -76,7 +53,7 @@ def main():
         return jsonify({'status': 'ok', 'message': 'Data Engine API is running'}), 200
     
     # Run the application
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
 
 
 if __name__ == "__main__":
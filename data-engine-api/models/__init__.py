@@ -5,6 +5,16 @@ from .database import db, init_db
 from .directory import Directory
 from .project import Project
 from .database_connection import DatabaseConnection
+from .sql_usage import ProjectSqlIndex, ProjectTableUsage
+from .table_profile import TableProfile
+from .project_revision import ProjectRevision
+from .metric import Metric, MetricCategory, MetricLibraryState
+from .metric_value import MetricValue, MetricMaterialization
+from .schedule import ProjectSchedule, ScheduleRun
+from .incremental_load import IncrementalLoad
+from .pipeline import ProjectDependency, PipelineRun, PipelineNode
 
-__all__ = ['db', 'init_db', 'Directory', 'Project', 'DatabaseConnection']
+__all__ = ['db', 'init_db', 'Directory', 'Project', 'DatabaseConnection', 'ProjectSqlIndex', 'ProjectTableUsage',
+           'TableProfile', 'ProjectRevision', 'Metric', 'MetricCategory', 'MetricLibraryState', 'MetricValue', 'MetricMaterialization',
+           'ProjectSchedule', 'ScheduleRun', 'IncrementalLoad', 'ProjectDependency', 'PipelineRun', 'PipelineNode']
 
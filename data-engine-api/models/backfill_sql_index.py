@@ -0,0 +1,33 @@
+"""
+Backfill the project SQL usage index
+Processes projects in keyset-ordered batches; rerun with --after to resume an interrupted run
+"""
+import argparse
+import os
+import sys
+from flask import Flask
+
+
+if __name__ == '__main__':
+    # Add parent directory to path for imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from models.database import init_db
+    from models.sql_usage import backfill_sql_index
+
+    parser = argparse.ArgumentParser(description='Backfill the project SQL usage index')
+    parser.add_argument('--after', default=None, help='Resume after this project ID')
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        cursor = args.after
+        while True:
+            result = backfill_sql_index(after=cursor, batch_size=args.batch_size)
+            print(f"processed={result['processed']} indexed={result['indexed']} cursor={result['nextCursor']}")
+            cursor = result['nextCursor']
+            if cursor is None:
+                break
+    print("SQL usage index backfill complete!")
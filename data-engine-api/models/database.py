@@ -3,6 +3,7 @@ Database configuration and initialization
 Supports SQLite (default) and PostgreSQL
 """
 import os
+from typing import Optional
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from dotenv import load_dotenv
@@ -33,16 +34,26 @@ def get_database_uri():
         return f'sqlite:///{db_path}'
 
 
-def init_db(app: Flask):
+def configure_db(app: Flask):
     """
-    Initialize database with Flask app
+    Bind the database to the Flask app without touching the schema
     """
     app.config['SQLALCHEMY_DATABASE_URI'] = get_database_uri()
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
     db.init_app(app)
+
+
+def init_db(app: Flask, auto_migrate: Optional[bool] = None):
+    """
+    Initialize database with Flask app
+    The schema is managed by models.migrations; when it is current this costs one query.
+    auto_migrate overrides DB_AUTO_MIGRATE
+    """
+    configure_db(app)
     
     with app.app_context():
-        db.create_all()
-        print(f"Database initialized: {app.config['SQLALCHEMY_DATABASE_URI']}")
+        from .migrations import ensure_schema
+        version = ensure_schema(db.engine, auto_migrate)
+        app.logger.info('Database initialized: %s (schema version %d)', app.config['SQLALCHEMY_DATABASE_URI'], version)
 
@@ -23,6 +23,7 @@ class DatabaseConnection(db.Model):
     password = Column(String(255), nullable=True)  # 密码（加密存储）
     connection_string = Column(Text, nullable=True)  # 连接字符串（可选）
     description = Column(Text, nullable=True)  # 描述
+    statement_timeout = Column(Integer, nullable=True)  # 语句超时（秒），为空时使用 STATEMENT_TIMEOUT 默认值
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
@@ -37,7 +38,8 @@ class DatabaseConnection(db.Model):
         username: Optional[str] = None,
         password: Optional[str] = None,
         connection_string: Optional[str] = None,
-        description: Optional[str] = None
+        description: Optional[str] = None,
+        statement_timeout: Optional[int] = None
     ):
         self.id = id
         self.name = name
@@ -49,6 +51,7 @@ class DatabaseConnection(db.Model):
         self.password = password
         self.connection_string = connection_string
         self.description = description
+        self.statement_timeout = statement_timeout
         self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
     
@@ -66,6 +69,7 @@ class DatabaseConnection(db.Model):
             'username': self.username,
             'connectionString': self.connection_string,
             'description': self.description,
+            'statementTimeout': self.statement_timeout,
             'createdAt': self.created_at.isoformat() if self.created_at else None,
             'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
         }
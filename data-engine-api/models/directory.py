@@ -16,7 +16,7 @@ class Directory(db.Model):
     
     id = Column(String(36), primary_key=True)
     name = Column(String(255), nullable=False)
-    parent_id = Column(String(36), ForeignKey('directories.id'), nullable=True)
+    parent_id = Column(String(36), ForeignKey('directories.id'), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
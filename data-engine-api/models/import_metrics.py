@@ -0,0 +1,38 @@
+"""
+Import the metrics library from a JSON file (format of data-engine-web/data/metrics.json)
+    python -m models.import_metrics [path] [--replace]
+"""
+import argparse
+import json
+import os
+import sys
+from flask import Flask
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'data-engine-web', 'data', 'metrics.json'
+)
+
+
+if __name__ == '__main__':
+    # Add parent directory to path for imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from models.database import db, init_db
+    from models.metric import import_library
+
+    parser = argparse.ArgumentParser(description='Import metric categories and definitions')
+    parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+    parser.add_argument('--replace', action='store_true', help='Delete categories and metrics missing from the file')
+    args = parser.parse_args()
+
+    with open(args.path, encoding='utf-8') as f:
+        data = json.load(f)
+
+    app = Flask(__name__)
+    init_db(app)
+    with app.app_context():
+        summary = import_library(data, replace=args.replace)
+        db.session.commit()
+    print(f"categories: {summary['categories']}")
+    print(f"metrics: {summary['metrics']}")
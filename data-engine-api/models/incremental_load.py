@@ -0,0 +1,167 @@
+"""
+Incremental loads of project SQL into target tables
+A project with an IncrementalLoad is run as ETL: its SELECT is executed on the source
+connection for the rows at or after the stored high-water mark and the rows are upserted into
+a table on the target connection. The high-water mark is the largest value of the watermark
+column loaded so far; it belongs to the load definition it was computed with (definition_hash)
+and is discarded when the source, target or watermark column changes.
+"""
+import hashlib
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+from sqlalchemy import Column, String, DateTime, Integer, Float, Text, ForeignKey, delete
+from .database import db
+
+LOAD_STATUSES = ('idle', 'pending', 'running', 'completed', 'failed')
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 50000
+
+
+class IncrementalLoad(db.Model):
+    """
+    Watermark-based load of a project's result into a target table
+    """
+    __tablename__ = 'incremental_loads'
+
+    project_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
+    source_connection_id = Column(String(36), ForeignKey('database_connections.id', ondelete='SET NULL'), nullable=True, index=True)
+    target_connection_id = Column(String(36), ForeignKey('database_connections.id', ondelete='SET NULL'), nullable=True, index=True)
+    target_schema = Column(String(255), nullable=True)  # 目标表所在 schema（PostgreSQL），为空时使用默认
+    target_table = Column(String(255), nullable=False)  # 目标表名
+    key_columns = Column(Text, nullable=False)  # 唯一键列（JSON 数组），目标表上须有对应的主键或唯一索引
+    watermark_column = Column(String(255), nullable=False)  # 结果中的水位列（如 updated_at、自增 id）
+    batch_size = Column(Integer, nullable=False, default=DEFAULT_BATCH_SIZE)  # 每批读取和写入的行数
+    watermark = Column(Text, nullable=True)  # 已加载的最大水位值（按 watermark_type 编码）
+    watermark_type = Column(String(20), nullable=True)  # datetime / date / int / float / decimal / str
+    definition_hash = Column(String(40), nullable=True)  # 水位值对应的加载定义
+    status = Column(String(20), nullable=False, default='idle')  # idle / pending / running / completed / failed
+    error = Column(Text, nullable=True)  # 最近一次失败原因
+    rows_read = Column(Integer, nullable=True)  # 最近一次读取的行数
+    rows_written = Column(Integer, nullable=True)  # 最近一次写入（插入或更新）的行数
+    duration = Column(Float, nullable=True)  # 最近一次加载耗时（秒）
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)  # 最近一次成功加载的完成时间
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __init__(
+        self,
+        project_id: str,
+        source_connection_id: str,
+        target_connection_id: str,
+        target_table: str,
+        key_columns: list,
+        watermark_column: str,
+        target_schema: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ):
+        self.project_id = project_id
+        self.source_connection_id = source_connection_id
+        self.target_connection_id = target_connection_id
+        self.target_schema = target_schema
+        self.target_table = target_table
+        self.key_columns = json.dumps(key_columns)
+        self.watermark_column = watermark_column
+        self.batch_size = batch_size
+        self.status = 'idle'
+        self.created_at = datetime.utcnow()
+        self.updated_at = self.created_at
+
+    @property
+    def keys(self) -> list:
+        return json.loads(self.key_columns) if self.key_columns else []
+
+    def get_watermark(self):
+        return decode_watermark(self.watermark, self.watermark_type)
+
+    def to_dict(self) -> dict:
+        # A watermark of another definition is ignored by the next load
+        current = self.definition_hash == definition_hash(self)
+        return {
+            'projectId': self.project_id,
+            'sourceConnectionId': self.source_connection_id,
+            'targetConnectionId': self.target_connection_id,
+            'targetSchema': self.target_schema,
+            'targetTable': self.target_table,
+            'keyColumns': self.keys,
+            'watermarkColumn': self.watermark_column,
+            'batchSize': self.batch_size,
+            'watermark': self.watermark if current else None,
+            'watermarkType': self.watermark_type if current else None,
+            'status': self.status,
+            'error': self.error,
+            'rowsRead': self.rows_read,
+            'rowsWritten': self.rows_written,
+            'duration': self.duration,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'completedAt': self.completed_at.isoformat() if self.completed_at else None,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f'<IncrementalLoad {self.project_id} -> {self.target_table}>'
+
+
+def definition_hash(load) -> str:
+    """
+    Fingerprint of everything the stored watermark depends on
+    """
+    raw = '\0'.join([
+        load.source_connection_id or '',
+        load.target_connection_id or '',
+        load.target_schema or '',
+        load.target_table or '',
+        load.watermark_column or '',
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def encode_watermark(value) -> tuple:
+    """
+    (text, type) stored for a watermark value; raises ValueError for unsupported types
+    """
+    if value is None:
+        return None, None
+    if isinstance(value, datetime):
+        return value.isoformat(), 'datetime'
+    if isinstance(value, date):
+        return value.isoformat(), 'date'
+    if isinstance(value, bool):
+        raise ValueError('水位列不能是布尔值')
+    if isinstance(value, int):
+        return str(value), 'int'
+    if isinstance(value, (float, Decimal)):
+        return str(value), 'float' if isinstance(value, float) else 'decimal'
+    if isinstance(value, str):
+        return value, 'str'
+    raise ValueError(f'不支持的水位值类型: {type(value).__name__}')
+
+
+def decode_watermark(text: Optional[str], kind: Optional[str]):
+    if text is None:
+        return None
+    if kind == 'datetime':
+        return datetime.fromisoformat(text)
+    if kind == 'date':
+        return date.fromisoformat(text)
+    if kind == 'int':
+        return int(text)
+    if kind == 'float':
+        return float(text)
+    if kind == 'decimal':
+        return Decimal(text)
+    return text
+
+
+def purge_project_loads(project_ids):
+    """
+    Remove load definitions of deleted projects; project_ids may be a list or a SELECT of IDs
+    Runs in the caller's transaction.
+    """
+    db.session.execute(
+        delete(IncrementalLoad).where(IncrementalLoad.project_id.in_(project_ids)),
+        execution_options={'synchronize_session': False}
+    )
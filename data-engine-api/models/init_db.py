@@ -1,6 +1,6 @@
 """
 Database initialization script
-Run this to create database tables
+Run this to create database tables (applies all pending migrations)
 """
 from flask import Flask
 from .database import init_db, db
@@ -28,6 +28,6 @@ if __name__ == '__main__':
     from models.project import Project
     
     app = Flask(__name__)
-    init_db(app)
+    init_db(app, auto_migrate=True)
     print("Database tables created successfully!")
 
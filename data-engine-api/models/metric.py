@@ -0,0 +1,379 @@
+"""
+Metrics library: categories and metric definitions shared by all users
+Search over metric names and descriptions is substring based and indexed:
+  - SQLite: FTS5 trigram table kept in sync by triggers on `metrics`
+  - PostgreSQL: ILIKE over pg_trgm GIN indexes (plain scan when the extension is unavailable)
+"""
+import hashlib
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text, and_, delete, func, insert, or_, select, text, update
+from sqlalchemy.orm import relationship
+from .database import db
+from .database_connection import DatabaseConnection
+from .metric_value import purge_metric_values
+
+METRIC_STATUSES = ('active', 'draft')
+# Time partitions metric values can be materialized at
+TIME_GRAINS = ('hour', 'day', 'week', 'month', 'quarter', 'year')
+
+FTS_TABLE = 'metrics_fts'
+DOCS_TABLE = 'metric_search_docs'
+
+
+class MetricCategory(db.Model):
+    """
+    Category (folder) of metrics
+    """
+    __tablename__ = 'metric_categories'
+
+    id = Column(String(64), primary_key=True)
+    name = Column(String(255), nullable=False)  # 目录名称
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    metrics = relationship('Metric', back_populates='category', order_by='Metric.created_at')
+
+    def __init__(self, id: str, name: str, created_at: Optional[datetime] = None,
+                 updated_at: Optional[datetime] = None):
+        self.id = id
+        self.name = name
+        self.created_at = created_at or datetime.utcnow()
+        self.updated_at = updated_at or self.created_at
+
+    def to_dict(self, metrics=None) -> dict:
+        """
+        Convert category to dictionary; metrics is the list of its metric dicts, if included
+        """
+        result = {
+            'id': self.id,
+            'name': self.name,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
+        }
+        if metrics is not None:
+            result['metrics'] = metrics
+        return result
+
+    def __repr__(self):
+        return f'<MetricCategory {self.id}: {self.name}>'
+
+
+class Metric(db.Model):
+    """
+    Metric definition
+    """
+    __tablename__ = 'metrics'
+
+    id = Column(String(64), primary_key=True)
+    category_id = Column(String(64), ForeignKey('metric_categories.id'), nullable=False, index=True)
+    name = Column(String(255), nullable=False, index=True)  # 指标名称
+    description = Column(Text, nullable=True)  # 指标描述（口径说明）
+    definition_sql = Column(Text, nullable=True)  # 指标定义 SQL
+    status = Column(String(20), nullable=False, default='draft', index=True)  # active / draft
+    connection_id = Column(String(36), ForeignKey('database_connections.id', ondelete='SET NULL'), nullable=True, index=True)  # 计算指标的数据库连接
+    time_grain = Column(String(10), nullable=True)  # 物化的时间粒度：hour / day / week / month / quarter / year
+    watermark_column = Column(String(255), nullable=True)  # 定义 SQL 结果中的时间列（增量物化的水位列）
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
+
+    category = relationship('MetricCategory', back_populates='metrics')
+
+    def __init__(
+        self,
+        id: str,
+        category_id: str,
+        name: str,
+        description: Optional[str] = None,
+        definition_sql: Optional[str] = None,
+        status: str = 'draft',
+        connection_id: Optional[str] = None,
+        time_grain: Optional[str] = None,
+        watermark_column: Optional[str] = None,
+        created_at: Optional[datetime] = None,
+        updated_at: Optional[datetime] = None
+    ):
+        self.id = id
+        self.category_id = category_id
+        self.name = name
+        self.description = description
+        self.definition_sql = definition_sql
+        self.status = status
+        self.connection_id = connection_id
+        self.time_grain = time_grain
+        self.watermark_column = watermark_column
+        self.created_at = created_at or datetime.utcnow()
+        self.updated_at = updated_at or self.created_at
+
+    def to_dict(self) -> dict:
+        """
+        Convert metric to dictionary
+        """
+        return {
+            'id': self.id,
+            'categoryId': self.category_id,
+            'name': self.name,
+            'description': self.description or '',
+            'definitionSql': self.definition_sql,
+            'status': self.status,
+            'connectionId': self.connection_id,
+            'timeGrain': self.time_grain,
+            'watermarkColumn': self.watermark_column,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def is_materializable(self) -> bool:
+        return bool(self.connection_id and (self.definition_sql or '').strip()
+                    and self.time_grain in TIME_GRAINS and self.watermark_column)
+
+    def __repr__(self):
+        return f'<Metric {self.id}: {self.name}>'
+
+
+class MetricLibraryState(db.Model):
+    """
+    Single row holding the library revision, incremented by every write (see bump_library_revision)
+    """
+    __tablename__ = 'metric_library_state'
+
+    id = Column(Integer, primary_key=True)
+    revision = Column(Integer, nullable=False, default=0)  # 指标库修订号，每次写入加一
+
+    def __repr__(self):
+        return f'<MetricLibraryState r{self.revision}>'
+
+
+def bump_library_revision():
+    """
+    Mark the library as changed; call in the transaction of every write to categories or metrics
+    Timestamps cannot serve as the version: imports keep the updatedAt of the file, which may be
+    older than rows already stored.
+    """
+    result = db.session.execute(
+        update(MetricLibraryState).where(MetricLibraryState.id == 1)
+        .values(revision=MetricLibraryState.revision + 1),
+        execution_options={'synchronize_session': False}
+    )
+    if not result.rowcount:
+        db.session.execute(insert(MetricLibraryState).values(id=1, revision=1))
+
+
+def init_sqlite_metric_search(conn):
+    """
+    Create the FTS5 trigram table, docid map and triggers for metrics (idempotent)
+    """
+    exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': FTS_TABLE}).first()
+    if exists:
+        return
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {DOCS_TABLE} (
+            docid INTEGER PRIMARY KEY,
+            metric_id VARCHAR(64) NOT NULL UNIQUE
+        )
+    """))
+    try:
+        conn.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, description, tokenize='trigram')"))
+    except Exception:
+        # SQLite built without FTS5 (or without the trigram tokenizer): search scans the table
+        conn.execute(text(f"DROP TABLE IF EXISTS {DOCS_TABLE}"))
+        return
+
+    docid_of_new = f"(SELECT docid FROM {DOCS_TABLE} WHERE metric_id = new.id)"
+    docid_of_old = f"(SELECT docid FROM {DOCS_TABLE} WHERE metric_id = old.id)"
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS metrics_search_ai AFTER INSERT ON metrics BEGIN
+            INSERT INTO {DOCS_TABLE}(metric_id) VALUES (new.id);
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES ({docid_of_new}, new.name, new.description);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS metrics_search_au AFTER UPDATE OF name, description ON metrics BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = {docid_of_old};
+            INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES ({docid_of_new}, new.name, new.description);
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS metrics_search_ad AFTER DELETE ON metrics BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = {docid_of_old};
+            DELETE FROM {DOCS_TABLE} WHERE metric_id = old.id;
+        END
+    """))
+    conn.execute(text(f"INSERT OR IGNORE INTO {DOCS_TABLE}(metric_id) SELECT id FROM metrics"))
+    conn.execute(text(f"""
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        SELECT d.docid, m.name, m.description FROM metrics m JOIN {DOCS_TABLE} d ON d.metric_id = m.id
+    """))
+
+
+def _sqlite_search_ids(terms):
+    """
+    SELECT of metric IDs matching all terms through the FTS table, or None without one
+    """
+    exists = db.session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': FTS_TABLE}
+    ).first()
+    if not exists:
+        return None
+    params = {}
+    clauses = []
+    if all(len(term) >= 3 for term in terms):
+        # Quote every term so user input cannot inject FTS5 operators
+        params['match'] = ' '.join('"' + term.replace('"', '""') + '"' for term in terms)
+        clauses.append(f'{FTS_TABLE} MATCH :match')
+    else:
+        # The trigram tokenizer cannot match terms shorter than 3 characters
+        for i, term in enumerate(terms):
+            params[f't{i}'] = f'%{term}%'
+            clauses.append(f'(name LIKE :t{i} OR description LIKE :t{i})')
+    return text(f"""
+        SELECT d.metric_id FROM {FTS_TABLE} JOIN {DOCS_TABLE} d ON d.docid = {FTS_TABLE}.rowid
+        WHERE {' AND '.join(clauses)}
+    """).bindparams(**params).columns(metric_id=String)
+
+
+def metric_search_filter(query: str):
+    """
+    WHERE clause restricting metrics to those whose name or description contains every term
+    """
+    terms = query.split()
+    if db.engine.dialect.name == 'sqlite':
+        ids = _sqlite_search_ids(terms)
+        if ids is not None:
+            return Metric.id.in_(select(ids.subquery().c.metric_id))
+    clauses = []
+    for term in terms:
+        pattern = f'%{term}%'
+        clauses.append(or_(Metric.name.ilike(pattern), Metric.description.ilike(pattern)))
+    return and_(*clauses)
+
+
+def library_version() -> str:
+    """
+    Fingerprint of the whole library, used as ETag; any insert, update or delete changes it
+    Computed from the library revision, plus counts and the latest updated_at (served by indexes)
+    """
+    revision = db.session.execute(
+        select(MetricLibraryState.revision).where(MetricLibraryState.id == 1)
+    ).scalar()
+    categories = db.session.execute(
+        select(func.count(), func.max(MetricCategory.updated_at)).select_from(MetricCategory)
+    ).one()
+    metrics = db.session.execute(
+        select(func.count(), func.max(Metric.updated_at)).select_from(Metric)
+    ).one()
+    raw = f'{revision}:{categories[0]}:{categories[1]}:{metrics[0]}:{metrics[1]}'
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """
+    ISO 8601 timestamp or date as exported by the web client ('2024-01-15T10:00:00Z', '2024-01-15')
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed.replace(tzinfo=None)
+
+
+def import_library(data: dict, replace: bool = False) -> dict:
+    """
+    Bulk upsert categories and metrics in the metrics.json format
+    ({"categories": [{id, name, createdAt, updatedAt, metrics: [{id, name, description, status, ...}]}]});
+    rows are matched by id, new rows inserted and existing ones updated with executemany.
+    With replace, categories and metrics missing from data are deleted.
+    Runs in the caller's transaction; raises ValueError for malformed input.
+    """
+    categories = data.get('categories') if isinstance(data, dict) else None
+    if not isinstance(categories, list):
+        raise ValueError('导入数据必须包含 categories 数组')
+
+    now = datetime.utcnow()
+    category_rows, metric_rows = {}, {}
+    for category in categories:
+        if not isinstance(category, dict) or not str(category.get('name') or '').strip():
+            raise ValueError('目录名称不能为空')
+        category_id = str(category.get('id') or f'cat_{uuid.uuid4().hex}')
+        created_at = parse_timestamp(category.get('createdAt')) or now
+        category_rows[category_id] = {
+            'id': category_id,
+            'name': str(category['name']).strip(),
+            'created_at': created_at,
+            'updated_at': parse_timestamp(category.get('updatedAt')) or created_at,
+        }
+        for metric in category.get('metrics') or []:
+            if not isinstance(metric, dict) or not str(metric.get('name') or '').strip():
+                raise ValueError('指标名称不能为空')
+            status = metric.get('status') or 'draft'
+            if status not in METRIC_STATUSES:
+                raise ValueError(f'指标状态无效: {status}')
+            time_grain = metric.get('timeGrain') or None
+            if time_grain is not None and time_grain not in TIME_GRAINS:
+                raise ValueError(f'时间粒度无效: {time_grain}')
+            metric_id = str(metric.get('id') or f'metric_{uuid.uuid4().hex}')
+            updated_at = parse_timestamp(metric.get('updatedAt')) or now
+            metric_rows[metric_id] = {
+                'id': metric_id,
+                'category_id': category_id,
+                'name': str(metric['name']).strip(),
+                'description': metric.get('description'),
+                'definition_sql': metric.get('definitionSql'),
+                'status': status,
+                'connection_id': metric.get('connectionId') or None,
+                'time_grain': time_grain,
+                'watermark_column': metric.get('watermarkColumn') or None,
+                'created_at': parse_timestamp(metric.get('createdAt')) or updated_at,
+                'updated_at': updated_at,
+            }
+
+    connection_ids = {row['connection_id'] for row in metric_rows.values() if row['connection_id']}
+    if connection_ids:
+        known = set(db.session.execute(
+            select(DatabaseConnection.id).where(DatabaseConnection.id.in_(connection_ids))
+        ).scalars())
+        missing = sorted(connection_ids - known)
+        if missing:
+            raise ValueError(f'数据库连接不存在: {missing[0]}')
+
+    existing_categories = set(db.session.execute(
+        select(MetricCategory.id).where(MetricCategory.id.in_(category_rows.keys()))
+    ).scalars()) if category_rows else set()
+    existing_metrics = set(db.session.execute(
+        select(Metric.id).where(Metric.id.in_(metric_rows.keys()))
+    ).scalars()) if metric_rows else set()
+
+    deleted = {'categories': 0, 'metrics': 0}
+    if replace:
+        purge_metric_values(select(Metric.id).where(Metric.id.not_in(metric_rows.keys())))
+        deleted['metrics'] = db.session.execute(
+            delete(Metric).where(Metric.id.not_in(metric_rows.keys())),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        deleted['categories'] = db.session.execute(
+            delete(MetricCategory).where(MetricCategory.id.not_in(category_rows.keys())),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+
+    new_categories = [row for key, row in category_rows.items() if key not in existing_categories]
+    changed_categories = [row for key, row in category_rows.items() if key in existing_categories]
+    new_metrics = [row for key, row in metric_rows.items() if key not in existing_metrics]
+    changed_metrics = [row for key, row in metric_rows.items() if key in existing_metrics]
+    if new_categories:
+        db.session.execute(insert(MetricCategory), new_categories)
+    if changed_categories:
+        db.session.execute(update(MetricCategory), changed_categories)
+    if new_metrics:
+        db.session.execute(insert(Metric), new_metrics)
+    if changed_metrics:
+        db.session.execute(update(Metric), changed_metrics)
+    bump_library_revision()
+
+    return {
+        'categories': {'created': len(new_categories), 'updated': len(changed_categories),
+                       'deleted': deleted['categories']},
+        'metrics': {'created': len(new_metrics), 'updated': len(changed_metrics), 'deleted': deleted['metrics']},
+    }
@@ -0,0 +1,117 @@
+"""
+Materialized metric values
+Every metric with a definition, connection, time grain and watermark column has one row per
+time partition in metric_values, plus one metric_materializations row with the state of its
+refreshes. The high-water mark is the start of the newest stored partition.
+"""
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import Column, String, DateTime, Float, Integer, Text, ForeignKey, delete
+from .database import db
+
+
+class MetricValue(db.Model):
+    """
+    Value of a metric for one time partition
+    """
+    __tablename__ = 'metric_values'
+
+    metric_id = Column(String(64), ForeignKey('metrics.id', ondelete='CASCADE'), primary_key=True)
+    period = Column(DateTime, primary_key=True)  # 时间分区的起点（按指标的时间粒度截断）
+    value = Column(Float, nullable=True)  # 指标值
+    computed_at = Column(DateTime, default=datetime.utcnow, nullable=False)  # 计算时间
+
+    def to_dict(self) -> dict:
+        return {
+            'period': self.period.isoformat() if self.period else None,
+            'value': self.value,
+            'computedAt': self.computed_at.isoformat() if self.computed_at else None,
+        }
+
+    def __repr__(self):
+        return f'<MetricValue {self.metric_id}@{self.period}>'
+
+
+class MetricMaterialization(db.Model):
+    """
+    Refresh state of a metric's materialized values
+    """
+    __tablename__ = 'metric_materializations'
+
+    metric_id = Column(String(64), ForeignKey('metrics.id', ondelete='CASCADE'), primary_key=True)
+    status = Column(String(20), nullable=False, default='pending')  # pending / running / completed / failed
+    error = Column(Text, nullable=True)  # 失败原因
+    definition_hash = Column(String(40), nullable=True)  # 已存储的值对应的定义（连接、SQL、粒度、水位列）
+    watermark = Column(DateTime, nullable=True)  # 已存储的最新时间分区
+    partitions = Column(Integer, nullable=True)  # 最近一次刷新写入的分区数
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)  # 最近一次成功刷新的完成时间
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(self, metric_id: str):
+        self.metric_id = metric_id
+        self.status = 'pending'
+        self.created_at = datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        return {
+            'metricId': self.metric_id,
+            'status': self.status,
+            'error': self.error,
+            'watermark': self.watermark.isoformat() if self.watermark else None,
+            'partitions': self.partitions,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'completedAt': self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+    def __repr__(self):
+        return f'<MetricMaterialization {self.metric_id} ({self.status})>'
+
+
+def definition_hash(metric) -> str:
+    """
+    Fingerprint of everything the stored values depend on
+    """
+    raw = '\0'.join([
+        metric.connection_id or '',
+        (metric.definition_sql or '').strip(),
+        metric.time_grain or '',
+        metric.watermark_column or '',
+    ])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def truncate_period(value: datetime, grain: str) -> datetime:
+    """
+    Start of the time partition containing value
+    """
+    if grain == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    day = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if grain == 'day':
+        return day
+    if grain == 'week':
+        return day - timedelta(days=day.weekday())
+    if grain == 'month':
+        return day.replace(day=1)
+    if grain == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    if grain == 'year':
+        return day.replace(month=1, day=1)
+    raise ValueError(f'时间粒度无效: {grain}')
+
+
+def purge_metric_values(metric_ids):
+    """
+    Remove stored values and refresh state; metric_ids may be a list or a SELECT of IDs
+    Runs in the caller's transaction.
+    """
+    db.session.execute(
+        delete(MetricValue).where(MetricValue.metric_id.in_(metric_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(MetricMaterialization).where(MetricMaterialization.metric_id.in_(metric_ids)),
+        execution_options={'synchronize_session': False}
+    )
+
@@ -0,0 +1,292 @@
+"""
+Versioned schema migrations
+The applied version is stored in `schema_migrations`; when it is current, startup costs a
+single query. Migrations run in order, each in its own transaction together with the row
+recording it. Migrations building indexes on PostgreSQL run outside a transaction instead
+(CREATE INDEX CONCURRENTLY does not block writes) and are recorded once they have finished.
+
+Every migration must be idempotent: installs created by db.create_all() before versioning
+existed start at version 0 and replay all migrations against tables that already exist.
+
+Run at deploy time:
+
+    python -m models.migrations status
+    python -m models.migrations upgrade [--to VERSION]
+
+Configuration (environment variables):
+  DB_AUTO_MIGRATE   apply pending migrations when the app starts (default: true); set to
+                    false in multi-worker deployments and run the CLI once instead
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = 'schema_migrations'
+# Arbitrary key serializing concurrent migration runs on PostgreSQL
+ADVISORY_LOCK_KEY = 7243018
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable
+    # Runs in autocommit mode on PostgreSQL, for CREATE INDEX CONCURRENTLY
+    concurrent: bool = False
+
+
+def create_index(conn, name: str, table: str, columns: str, using: Optional[str] = None):
+    """
+    Create an index if missing; on PostgreSQL without blocking writes (CONCURRENTLY)
+    conn must be in autocommit mode on PostgreSQL
+    """
+    method = f' USING {using}' if using else ''
+    if conn.dialect.name == 'postgresql':
+        # An interrupted concurrent build leaves an INVALID index that IF NOT EXISTS would keep
+        invalid = conn.execute(text("""
+            SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name AND NOT i.indisvalid
+        """), {'name': name}).first()
+        if invalid:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {name}'))
+        conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table}{method} ({columns})'))
+    else:
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table}{method} ({columns})'))
+
+
+def add_column(conn, table: str, column: str, definition: str):
+    """
+    Add a column if missing (tables created from the current models already have it)
+    """
+    if column in {existing['name'] for existing in inspect(conn).get_columns(table)}:
+        return
+    conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {definition}'))
+
+
+def _initial_schema(conn):
+    from .database import db
+    db.metadata.create_all(conn)
+
+
+def _search_index(conn):
+    from .search_index import PG_TSVECTOR, init_sqlite_search
+    if conn.dialect.name == 'sqlite':
+        init_sqlite_search(conn)
+    elif conn.dialect.name == 'postgresql':
+        create_index(conn, 'ix_projects_search', 'projects', f'({PG_TSVECTOR})', using='GIN')
+
+
+def _tree_indexes(conn):
+    create_index(conn, 'ix_projects_directory_id', 'projects', 'directory_id')
+    create_index(conn, 'ix_directories_parent_id', 'directories', 'parent_id')
+
+
+def _connection_statement_timeout(conn):
+    add_column(conn, 'database_connections', 'statement_timeout', 'INTEGER')
+
+
+def _project_sql_version(conn):
+    add_column(conn, 'projects', 'sql_version', 'INTEGER NOT NULL DEFAULT 0')
+
+
+def _project_revisions(conn):
+    from .project_revision import ProjectRevision
+    ProjectRevision.__table__.create(conn, checkfirst=True)
+
+
+def _metrics_library(conn):
+    from .metric import Metric, MetricCategory, init_sqlite_metric_search
+    MetricCategory.__table__.create(conn, checkfirst=True)
+    Metric.__table__.create(conn, checkfirst=True)
+    if conn.dialect.name == 'sqlite':
+        init_sqlite_metric_search(conn)
+    elif conn.dialect.name == 'postgresql':
+        try:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        except Exception:
+            # Not allowed to create extensions: metric search falls back to a scan
+            logger.warning('pg_trgm is unavailable; metric search will not be indexed')
+            return
+        create_index(conn, 'ix_metrics_name_trgm', 'metrics', 'name gin_trgm_ops', using='GIN')
+        create_index(conn, 'ix_metrics_description_trgm', 'metrics', 'description gin_trgm_ops', using='GIN')
+
+
+def _metric_materialization(conn):
+    from .metric_value import MetricMaterialization, MetricValue
+    add_column(conn, 'metrics', 'connection_id', 'VARCHAR(36)')
+    add_column(conn, 'metrics', 'time_grain', 'VARCHAR(10)')
+    add_column(conn, 'metrics', 'watermark_column', 'VARCHAR(255)')
+    create_index(conn, 'ix_metrics_connection_id', 'metrics', 'connection_id')
+    MetricValue.__table__.create(conn, checkfirst=True)
+    MetricMaterialization.__table__.create(conn, checkfirst=True)
+
+
+def _project_schedules(conn):
+    from .schedule import ProjectSchedule, ScheduleRun
+    ProjectSchedule.__table__.create(conn, checkfirst=True)
+    ScheduleRun.__table__.create(conn, checkfirst=True)
+
+
+def _incremental_loads(conn):
+    from .incremental_load import IncrementalLoad
+    IncrementalLoad.__table__.create(conn, checkfirst=True)
+
+
+def _pipelines(conn):
+    from .pipeline import ProjectDependency, PipelineRun, PipelineNode
+    ProjectDependency.__table__.create(conn, checkfirst=True)
+    PipelineRun.__table__.create(conn, checkfirst=True)
+    PipelineNode.__table__.create(conn, checkfirst=True)
+
+
+def _metric_library_revision(conn):
+    from .metric import MetricLibraryState
+    MetricLibraryState.__table__.create(conn, checkfirst=True)
+    if conn.execute(text('SELECT COUNT(*) FROM metric_library_state')).scalar() == 0:
+        conn.execute(text('INSERT INTO metric_library_state (id, revision) VALUES (1, 0)'))
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, 'initial_schema', _initial_schema),
+    Migration(2, 'search_index', _search_index, concurrent=True),
+    Migration(3, 'tree_indexes', _tree_indexes, concurrent=True),
+    Migration(4, 'connection_statement_timeout', _connection_statement_timeout),
+    Migration(5, 'project_sql_version', _project_sql_version),
+    Migration(6, 'project_revisions', _project_revisions),
+    Migration(7, 'metrics_library', _metrics_library, concurrent=True),
+    Migration(8, 'metric_materialization', _metric_materialization, concurrent=True),
+    Migration(9, 'project_schedules', _project_schedules),
+    Migration(10, 'incremental_loads', _incremental_loads),
+    Migration(11, 'pipelines', _pipelines),
+    Migration(12, 'metric_library_revision', _metric_library_revision),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def _ensure_migrations_table(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at TIMESTAMP NOT NULL
+            )
+        """))
+
+
+def current_version(engine: Engine) -> int:
+    """
+    Highest applied migration version; 0 for an unversioned database
+    """
+    with engine.connect() as conn:
+        try:
+            version = conn.execute(text(f'SELECT MAX(version) FROM {MIGRATIONS_TABLE}')).scalar()
+        except Exception:
+            conn.rollback()
+            return 0
+    return version or 0
+
+
+def pending_migrations(engine: Engine, target: Optional[int] = None) -> List[Migration]:
+    version = current_version(engine)
+    target = LATEST_VERSION if target is None else target
+    return [migration for migration in MIGRATIONS if version < migration.version <= target]
+
+
+def _record(conn, migration: Migration):
+    conn.execute(
+        text(f'INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)'),
+        {'version': migration.version, 'name': migration.name, 'applied_at': datetime.utcnow()}
+    )
+
+
+def migrate(engine: Engine, target: Optional[int] = None) -> List[Migration]:
+    """
+    Apply pending migrations up to target (default: latest); returns the ones applied
+    """
+    _ensure_migrations_table(engine)
+    is_postgresql = engine.dialect.name == 'postgresql'
+    with engine.connect() as lock_conn:
+        if is_postgresql:
+            # Session-level lock: a second process waits here and then finds nothing pending
+            lock_conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY})
+            lock_conn.commit()
+        try:
+            applied = []
+            for migration in pending_migrations(engine, target):
+                logger.info('Applying migration %d_%s', migration.version, migration.name)
+                if migration.concurrent and is_postgresql:
+                    with engine.connect() as conn:
+                        conn = conn.execution_options(isolation_level='AUTOCOMMIT')
+                        migration.upgrade(conn)
+                        _record(conn, migration)
+                else:
+                    with engine.begin() as conn:
+                        migration.upgrade(conn)
+                        _record(conn, migration)
+                applied.append(migration)
+            return applied
+        finally:
+            if is_postgresql:
+                lock_conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+                lock_conn.commit()
+
+
+def auto_migrate_enabled() -> bool:
+    return os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')
+
+
+def ensure_schema(engine: Engine, auto_migrate: Optional[bool] = None) -> int:
+    """
+    Startup check: one query when the schema is current, otherwise migrate or warn
+    Returns the schema version in effect
+    """
+    version = current_version(engine)
+    if version >= LATEST_VERSION:
+        return version
+    if auto_migrate is None:
+        auto_migrate = auto_migrate_enabled()
+    if not auto_migrate:
+        logger.warning(
+            'Database schema is at version %d, latest is %d; run `python -m models.migrations upgrade`',
+            version, LATEST_VERSION
+        )
+        return version
+    migrate(engine)
+    return LATEST_VERSION
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    from flask import Flask
+
+    # Add parent directory to path for imports
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from models.database import db, configure_db
+    from models import migrations
+
+    parser = argparse.ArgumentParser(description='Manage database schema migrations')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='Show the current version and pending migrations')
+    upgrade_parser = subparsers.add_parser('upgrade', help='Apply pending migrations')
+    upgrade_parser.add_argument('--to', type=int, default=None, help='Target version (default: latest)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    app = Flask(__name__)
+    configure_db(app)
+    with app.app_context():
+        if args.command == 'status':
+            print(f'Current version: {migrations.current_version(db.engine)} (latest {migrations.LATEST_VERSION})')
+            for migration in migrations.pending_migrations(db.engine):
+                print(f'  pending: {migration.version}_{migration.name}')
+        else:
+            applied = migrations.migrate(db.engine, args.to)
+            print(f'Applied {len(applied)} migration(s); now at version {migrations.current_version(db.engine)}')
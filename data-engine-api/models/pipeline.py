@@ -0,0 +1,149 @@
+"""
+Pipelines of dependent projects
+The projects of a directory (with its subdirectories) form a DAG: a project depends on the
+projects it is explicitly declared to depend on (ProjectDependency) and on the projects that
+write the tables it reads (inferred from the SQL usage index). A PipelineRun executes the DAG,
+one PipelineNode per project; every node records the input fingerprint it ran (or was skipped)
+with, so the next run can skip nodes whose inputs did not change.
+"""
+import json
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Float, Integer, Boolean, Text, ForeignKey, delete
+from .database import db
+
+RUN_STATUSES = ('pending', 'running', 'succeeded', 'failed')
+# blocked: not run because a project it depends on failed
+NODE_STATUSES = ('pending', 'running', 'succeeded', 'failed', 'skipped', 'blocked')
+
+
+class ProjectDependency(db.Model):
+    """
+    Explicitly declared dependency: project_id runs after depends_on_id
+    """
+    __tablename__ = 'project_dependencies'
+
+    project_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
+    depends_on_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ProjectDependency {self.project_id} -> {self.depends_on_id}>'
+
+
+class PipelineRun(db.Model):
+    """
+    One execution of the project DAG of a directory
+    """
+    __tablename__ = 'pipeline_runs'
+
+    id = Column(String(36), primary_key=True)
+    directory_id = Column(String(36), nullable=False, index=True)  # 执行的目录（含子目录）
+    connection_id = Column(String(36), nullable=True)  # 执行项目 SQL 的连接（增量加载项目使用自己的连接）
+    status = Column(String(20), nullable=False, default='pending')  # pending / running / succeeded / failed
+    max_workers = Column(Integer, nullable=False)  # 同时执行的项目数上限
+    connection_limit = Column(Integer, nullable=False)  # 每个连接同时执行的项目数上限
+    infer = Column(Boolean, nullable=False, default=True)  # 是否根据读写的表推断依赖
+    force = Column(Boolean, nullable=False, default=False)  # 为真时不跳过输入未变化的项目
+    node_count = Column(Integer, nullable=True)
+    succeeded = Column(Integer, nullable=True)
+    failed = Column(Integer, nullable=True)
+    skipped = Column(Integer, nullable=True)
+    blocked = Column(Integer, nullable=True)
+    critical_path_json = Column(Text, nullable=True)  # 关键路径（项目 ID 列表，JSON）
+    critical_path_duration = Column(Float, nullable=True)  # 关键路径上各项目耗时之和（秒）
+    total_duration = Column(Float, nullable=True)  # 各项目耗时之和（串行执行所需时间）
+    wall_time = Column(Float, nullable=True)  # 实际耗时（秒）
+    error = Column(Text, nullable=True)  # 整个运行失败的原因（如存在循环依赖）
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __init__(self, id: str, directory_id: str, connection_id: str, max_workers: int, connection_limit: int,
+                 infer: bool = True, force: bool = False):
+        self.id = id
+        self.directory_id = directory_id
+        self.connection_id = connection_id
+        self.status = 'pending'
+        self.max_workers = max_workers
+        self.connection_limit = connection_limit
+        self.infer = infer
+        self.force = force
+        self.created_at = datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'directoryId': self.directory_id,
+            'connectionId': self.connection_id,
+            'status': self.status,
+            'maxWorkers': self.max_workers,
+            'connectionLimit': self.connection_limit,
+            'infer': self.infer,
+            'force': self.force,
+            'nodeCount': self.node_count,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'blocked': self.blocked,
+            'criticalPath': json.loads(self.critical_path_json) if self.critical_path_json else None,
+            'criticalPathDuration': self.critical_path_duration,
+            'totalDuration': self.total_duration,
+            'wallTime': self.wall_time,
+            'error': self.error,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f'<PipelineRun {self.id} ({self.status})>'
+
+
+class PipelineNode(db.Model):
+    """
+    One project of a pipeline run
+    """
+    __tablename__ = 'pipeline_nodes'
+
+    run_id = Column(String(36), ForeignKey('pipeline_runs.id', ondelete='CASCADE'), primary_key=True)
+    project_id = Column(String(36), primary_key=True, index=True)
+    project_name = Column(String(255), nullable=True)  # 运行时的项目名称
+    mode = Column(String(10), nullable=False, default='sql')  # sql：在运行的连接上执行 / load：增量加载
+    depends_on_json = Column(Text, nullable=True)  # 本次运行中的上游项目（JSON）
+    status = Column(String(20), nullable=False, default='pending')  # pending / running / succeeded / failed / skipped / blocked
+    fingerprint = Column(String(64), nullable=True)  # 输入指纹（SQL、连接、上游指纹和源表变化计数）
+    row_count = Column(Integer, nullable=True)  # 影响或写入的行数
+    duration = Column(Float, nullable=True)  # 执行耗时（秒）
+    error = Column(Text, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True, index=True)
+
+    def to_dict(self) -> dict:
+        return {
+            'projectId': self.project_id,
+            'projectName': self.project_name,
+            'mode': self.mode,
+            'dependsOn': json.loads(self.depends_on_json) if self.depends_on_json else [],
+            'status': self.status,
+            'fingerprint': self.fingerprint,
+            'rowCount': self.row_count,
+            'duration': self.duration,
+            'error': self.error,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f'<PipelineNode {self.run_id}/{self.project_id} ({self.status})>'
+
+
+def purge_project_dependencies(project_ids):
+    """
+    Remove dependencies from and to deleted projects; project_ids may be a list or a SELECT of IDs
+    Run history keeps the deleted projects' nodes. Runs in the caller's transaction.
+    """
+    for column in (ProjectDependency.project_id, ProjectDependency.depends_on_id):
+        db.session.execute(
+            delete(ProjectDependency).where(column.in_(project_ids)),
+            execution_options={'synchronize_session': False}
+        )
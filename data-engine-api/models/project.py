@@ -3,7 +3,7 @@ Project model for storing project information
 """
 from datetime import datetime
 from typing import Optional
-from sqlalchemy import Column, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Text
 from sqlalchemy.orm import relationship
 from .database import db
 
@@ -16,12 +16,13 @@ class Project(db.Model):
     
     id = Column(String(36), primary_key=True)
     name = Column(String(255), nullable=False)
-    directory_id = Column(String(36), ForeignKey('directories.id'), nullable=True)
+    directory_id = Column(String(36), ForeignKey('directories.id'), nullable=True, index=True)
     requirement_name = Column(String(255), nullable=True)  # 需求名称（通常等于项目名称）
     requirement_description = Column(Text, nullable=True)  # 需求描述
     requester = Column(String(255), nullable=True)  # 需求方
     creator = Column(String(255), nullable=True)  # 创建人
     sql_content = Column(Text, nullable=True)  # SQL内容
+    sql_version = Column(Integer, nullable=False, default=0, server_default='0')  # SQL内容版本号，每次保存递增
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
@@ -47,6 +48,7 @@ class Project(db.Model):
         self.requester = requester
         self.creator = creator
         self.sql_content = sql_content
+        self.sql_version = 0
         self.created_at = datetime.utcnow()
         self.updated_at = datetime.utcnow()
     
@@ -67,6 +69,7 @@ class Project(db.Model):
                 'requester': self.requester,
                 'creator': self.creator,
                 'sql': self.sql_content,
+                'sqlVersion': self.sql_version,
             }
         }
     
@@ -0,0 +1,250 @@
+"""
+Revision history of project SQL
+Every save stores one revision keyed by (project_id, version), where version is the
+project's sql_version after the save. A revision is either a full snapshot or a delta
+against the previous revision: a list of [start, end, text] replacements (code point
+offsets) found by trimming the common prefix and suffix and, for larger changes, diffing
+the remaining lines. Payloads are stored raw-deflate compressed. A new snapshot is taken
+after REVISION_SNAPSHOT_INTERVAL deltas or once the deltas since the last snapshot are
+larger than the snapshot itself, so rebuilding any version reads one snapshot plus a
+bounded number of small deltas.
+
+Configuration (environment variables):
+  REVISION_SNAPSHOT_INTERVAL   maximum deltas between two snapshots (default: 100)
+"""
+import difflib
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import List, Optional, Tuple
+from sqlalchemy import Column, String, DateTime, Integer, LargeBinary, ForeignKey, delete, func, select
+from sqlalchemy.orm import defer
+from .database import db
+
+# Below this many changed characters the changed range is stored as one replacement
+LINE_DIFF_THRESHOLD = 4096
+
+
+class ProjectRevision(db.Model):
+    """
+    One saved version of a project's SQL, stored as a snapshot or as a delta
+    """
+    __tablename__ = 'project_revisions'
+
+    project_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
+    version = Column(Integer, primary_key=True, autoincrement=False)  # 保存后的 sql_version
+    kind = Column(String(10), nullable=False)  # snapshot / delta（相对上一版本）
+    data = Column(LargeBinary, nullable=False)  # 压缩后的完整内容或差异
+    content_length = Column(Integer, nullable=False)  # 该版本内容的字符数
+    content_hash = Column(String(40), nullable=False)  # 该版本内容的哈希
+    stored_size = Column(Integer, nullable=False)  # data 的字节数
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self) -> dict:
+        return {
+            'version': self.version,
+            'kind': self.kind,
+            'length': self.content_length,
+            'hash': self.content_hash,
+            'storedSize': self.stored_size,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ProjectRevision {self.project_id}@{self.version} ({self.kind})>'
+
+
+def snapshot_interval() -> int:
+    return max(1, int(os.getenv('REVISION_SNAPSHOT_INTERVAL', '100')))
+
+
+def _compress(payload: bytes) -> bytes:
+    # Raw deflate: no zlib header or checksum, which matter for deltas of a few bytes
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+    return compressor.compress(payload) + compressor.flush()
+
+
+def _decompress(data: bytes) -> bytes:
+    return zlib.decompress(data, -15)
+
+
+def _common_prefix(a: str, b: str) -> int:
+    # Binary search with slice comparisons runs at C speed, unlike a per-character loop
+    low, high = 0, min(len(a), len(b))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    low, high = 0, limit
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len(a) - middle:] == b[len(b) - middle:]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def compute_delta(old: str, new: str) -> List[list]:
+    """
+    Replacements [start, end, text] turning old into new; offsets refer to old
+    """
+    prefix = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    old_middle = old[prefix:len(old) - suffix]
+    new_middle = new[prefix:len(new) - suffix]
+    if not old_middle and not new_middle:
+        return []
+    if len(old_middle) + len(new_middle) < LINE_DIFF_THRESHOLD:
+        return [[prefix, prefix + len(old_middle), new_middle]]
+
+    old_lines = old_middle.splitlines(keepends=True)
+    new_lines = new_middle.splitlines(keepends=True)
+    offsets = [prefix]
+    for line in old_lines:
+        offsets.append(offsets[-1] + len(line))
+    delta = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            delta.append([offsets[i1], offsets[i2], ''.join(new_lines[j1:j2])])
+    return delta
+
+
+def apply_delta(base: str, delta: List[list]) -> str:
+    parts = []
+    position = 0
+    for start, end, replacement in delta:
+        parts.append(base[position:start])
+        parts.append(replacement)
+        position = end
+    parts.append(base[position:])
+    return ''.join(parts)
+
+
+def _add_revision(project_id: str, version: int, kind: str, content: str, payload: bytes):
+    data = _compress(payload)
+    db.session.add(ProjectRevision(
+        project_id=project_id,
+        version=version,
+        kind=kind,
+        data=data,
+        content_length=len(content),
+        content_hash=hashlib.sha1(content.encode('utf-8')).hexdigest(),
+        stored_size=len(data),
+        created_at=datetime.utcnow(),
+    ))
+
+
+def _needs_snapshot(project_id: str) -> bool:
+    snapshot = db.session.execute(
+        select(ProjectRevision.version, ProjectRevision.stored_size)
+        .where(ProjectRevision.project_id == project_id, ProjectRevision.kind == 'snapshot')
+        .order_by(ProjectRevision.version.desc())
+        .limit(1)
+    ).first()
+    if snapshot is None:
+        return True
+    deltas, delta_size = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(ProjectRevision.stored_size), 0))
+        .where(ProjectRevision.project_id == project_id, ProjectRevision.version > snapshot.version)
+    ).one()
+    return deltas >= snapshot_interval() or delta_size >= snapshot.stored_size
+
+
+def record_revision(project_id: str, version: int, content: Optional[str],
+                    previous: Optional[Tuple[int, Optional[str]]] = None):
+    """
+    Store the revision created by saving content as version
+    previous is the (version, content) the save replaced; a delta is only written when it is
+    the latest stored revision, otherwise (first save, concurrent writers) a snapshot is taken.
+    Runs in the caller's transaction.
+    """
+    content = content or ''
+    latest = db.session.execute(
+        select(func.max(ProjectRevision.version)).where(ProjectRevision.project_id == project_id)
+    ).scalar()
+    if previous is not None and previous[0] == version - 1:
+        previous_version, previous_content = previous[0], previous[1] or ''
+        if latest is None and previous_content:
+            # Content saved before history existed becomes the first revision
+            _add_revision(project_id, previous_version, 'snapshot', previous_content,
+                          previous_content.encode('utf-8'))
+            db.session.flush()
+            latest = previous_version
+        if latest == previous_version and not _needs_snapshot(project_id):
+            delta = compute_delta(previous_content, content)
+            payload = json.dumps(delta, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            _add_revision(project_id, version, 'delta', content, payload)
+            return
+    _add_revision(project_id, version, 'snapshot', content, content.encode('utf-8'))
+
+
+def revision_content(project_id: str, version: int) -> Optional[str]:
+    """
+    Rebuild the SQL of one revision from the nearest snapshot; None if it does not exist
+    """
+    snapshot_version = db.session.execute(
+        select(func.max(ProjectRevision.version)).where(
+            ProjectRevision.project_id == project_id,
+            ProjectRevision.kind == 'snapshot',
+            ProjectRevision.version <= version,
+        )
+    ).scalar()
+    if snapshot_version is None:
+        return None
+    rows = db.session.execute(
+        select(ProjectRevision.version, ProjectRevision.kind, ProjectRevision.data)
+        .where(
+            ProjectRevision.project_id == project_id,
+            ProjectRevision.version.between(snapshot_version, version),
+        )
+        .order_by(ProjectRevision.version)
+    ).all()
+    if not rows or rows[-1].version != version:
+        return None
+    content = ''
+    for row in rows:
+        payload = _decompress(row.data)
+        if row.kind == 'snapshot':
+            content = payload.decode('utf-8')
+        else:
+            content = apply_delta(content, json.loads(payload))
+    return content
+
+
+def list_revisions(project_id: str, offset: int = 0, limit: int = 20) -> Tuple[int, List[ProjectRevision]]:
+    """
+    Newest first, without loading the payloads; returns (total, revisions)
+    """
+    total = db.session.execute(
+        select(func.count()).select_from(ProjectRevision).where(ProjectRevision.project_id == project_id)
+    ).scalar()
+    revisions = (
+        ProjectRevision.query
+        .options(defer(ProjectRevision.data))
+        .filter(ProjectRevision.project_id == project_id)
+        .order_by(ProjectRevision.version.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return total, revisions
+
+
+def purge_project_revisions(project_ids):
+    """
+    Remove the history of deleted projects; project_ids may be a list or a SELECT of IDs
+    """
+    db.session.execute(
+        delete(ProjectRevision).where(ProjectRevision.project_id.in_(project_ids)),
+        execution_options={'synchronize_session': False}
+    )
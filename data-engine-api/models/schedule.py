@@ -0,0 +1,171 @@
+"""
+Scheduled execution of saved projects
+A ProjectSchedule runs a project's SQL on a connection at the times of a cron expression.
+Every execution is a ScheduleRun; failed runs are retried with exponential backoff in the
+same run row. A schedule holds at most one active run (running_run_id), so runs of one
+schedule never overlap, and it is claimed with a conditional UPDATE so several API
+processes can poll the same table without running a job twice.
+"""
+import json
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Column, String, DateTime, Float, Integer, Boolean, Text, ForeignKey, delete, select
+from .database import db
+
+MISFIRE_POLICIES = ('run_once', 'skip')
+RUN_STATUSES = ('queued', 'running', 'retrying', 'succeeded', 'failed', 'skipped')
+
+
+class ProjectSchedule(db.Model):
+    """
+    Cron schedule running a project's SQL on a connection
+    """
+    __tablename__ = 'project_schedules'
+
+    id = Column(String(36), primary_key=True)
+    project_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), nullable=False, index=True)
+    connection_id = Column(String(36), ForeignKey('database_connections.id', ondelete='SET NULL'), nullable=True, index=True)
+    cron = Column(String(255), nullable=False)  # cron 表达式（分 时 日 月 星期）
+    timezone = Column(String(64), nullable=False, default='UTC')  # cron 表达式所在时区
+    enabled = Column(Boolean, nullable=False, default=True)
+    max_retries = Column(Integer, nullable=False, default=2)  # 失败后的最大重试次数
+    retry_delay = Column(Integer, nullable=False, default=60)  # 首次重试的等待秒数，之后每次翻倍
+    misfire_policy = Column(String(20), nullable=False, default='run_once')  # 错过执行时间：run_once 补跑一次 / skip 跳过
+    misfire_grace = Column(Integer, nullable=False, default=3600)  # 超过计划时间多少秒算错过
+    next_run_at = Column(DateTime, nullable=True, index=True)  # 下次执行时间（UTC），停用时为空
+    running_run_id = Column(String(36), nullable=True)  # 正在执行（含等待重试）的运行，防止重叠
+    last_run_at = Column(DateTime, nullable=True)  # 最近一次开始执行的时间
+    last_status = Column(String(20), nullable=True)  # 最近一次运行的结果
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+    def __init__(
+        self,
+        id: str,
+        project_id: str,
+        connection_id: str,
+        cron: str,
+        timezone: str = 'UTC',
+        enabled: bool = True,
+        max_retries: int = 2,
+        retry_delay: int = 60,
+        misfire_policy: str = 'run_once',
+        misfire_grace: int = 3600,
+        next_run_at: Optional[datetime] = None
+    ):
+        self.id = id
+        self.project_id = project_id
+        self.connection_id = connection_id
+        self.cron = cron
+        self.timezone = timezone
+        self.enabled = enabled
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.misfire_policy = misfire_policy
+        self.misfire_grace = misfire_grace
+        self.next_run_at = next_run_at
+        self.created_at = datetime.utcnow()
+        self.updated_at = self.created_at
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'projectId': self.project_id,
+            'connectionId': self.connection_id,
+            'cron': self.cron,
+            'timezone': self.timezone,
+            'enabled': self.enabled,
+            'maxRetries': self.max_retries,
+            'retryDelay': self.retry_delay,
+            'misfirePolicy': self.misfire_policy,
+            'misfireGrace': self.misfire_grace,
+            'nextRunAt': self.next_run_at.isoformat() if self.next_run_at else None,
+            'runningRunId': self.running_run_id,
+            'lastRunAt': self.last_run_at.isoformat() if self.last_run_at else None,
+            'lastStatus': self.last_status,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+            'updatedAt': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ProjectSchedule {self.id}: {self.cron}>'
+
+
+class ScheduleRun(db.Model):
+    """
+    One execution of a schedule, including its retries
+    """
+    __tablename__ = 'schedule_runs'
+
+    id = Column(String(36), primary_key=True)
+    schedule_id = Column(String(36), ForeignKey('project_schedules.id', ondelete='CASCADE'), nullable=False, index=True)
+    project_id = Column(String(36), nullable=False)  # 执行的项目
+    scheduled_for = Column(DateTime, nullable=False)  # 计划执行时间（UTC）
+    trigger = Column(String(20), nullable=False, default='cron')  # cron / manual
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued / running / retrying / succeeded / failed / skipped
+    attempt = Column(Integer, nullable=False, default=0)  # 已开始的执行次数
+    next_attempt_at = Column(DateTime, nullable=True, index=True)  # 等待重试时的下次执行时间
+    error = Column(Text, nullable=True)  # 最近一次失败原因
+    sql_version = Column(Integer, nullable=True)  # 执行时项目 SQL 的版本
+    row_count = Column(Integer, nullable=True)  # 结果行数（非查询语句为影响行数）
+    truncated = Column(Boolean, nullable=False, default=False)  # 结果是否超过行数上限被截断
+    columns_json = Column(Text, nullable=True)  # 结果列名（JSON）
+    snapshot_size = Column(Integer, nullable=True)  # 结果快照文件字节数，无快照时为空
+    duration = Column(Float, nullable=True)  # 最近一次执行耗时（秒）
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    def __init__(self, id: str, schedule_id: str, project_id: str, scheduled_for: datetime, trigger: str = 'cron',
+                 status: str = 'queued'):
+        self.id = id
+        self.schedule_id = schedule_id
+        self.project_id = project_id
+        self.scheduled_for = scheduled_for
+        self.trigger = trigger
+        self.status = status
+        self.attempt = 0
+        self.truncated = False
+        self.created_at = datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'scheduleId': self.schedule_id,
+            'projectId': self.project_id,
+            'scheduledFor': self.scheduled_for.isoformat() if self.scheduled_for else None,
+            'trigger': self.trigger,
+            'status': self.status,
+            'attempt': self.attempt,
+            'nextAttemptAt': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'error': self.error,
+            'sqlVersion': self.sql_version,
+            'rowCount': self.row_count,
+            'truncated': self.truncated,
+            'columns': json.loads(self.columns_json) if self.columns_json else None,
+            'hasSnapshot': self.snapshot_size is not None,
+            'snapshotSize': self.snapshot_size,
+            'duration': self.duration,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'finishedAt': self.finished_at.isoformat() if self.finished_at else None,
+            'createdAt': self.created_at.isoformat() if self.created_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ScheduleRun {self.id} ({self.status})>'
+
+
+def purge_project_schedules(project_ids):
+    """
+    Remove schedules and runs of deleted projects; project_ids may be a list or a SELECT of IDs
+    Snapshot files of the removed runs are swept by the schedule runner. Runs in the caller's transaction.
+    """
+    schedule_ids = select(ProjectSchedule.id).where(ProjectSchedule.project_id.in_(project_ids))
+    db.session.execute(
+        delete(ScheduleRun).where(ScheduleRun.schedule_id.in_(schedule_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(ProjectSchedule).where(ProjectSchedule.project_id.in_(project_ids)),
+        execution_options={'synchronize_session': False}
+    )
@@ -0,0 +1,386 @@
+"""
+Full-text search index over projects
+Backends:
+  - SQLite: FTS5 virtual table kept in sync by triggers on `projects`
+  - PostgreSQL: GIN expression index over a weighted tsvector
+  - Fallback: in-process inverted index, refreshed incrementally from `updated_at`
+"""
+import math
+import re
+import threading
+from datetime import datetime
+from sqlalchemy import text
+from .database import db
+
+
+# Indexed columns with their ranking weights (higher is more relevant)
+SEARCH_FIELDS = (
+    ('name', 10.0),
+    ('requirement_name', 5.0),
+    ('requirement_description', 2.0),
+    ('requester', 1.0),
+    ('sql_content', 1.0),
+)
+
+FTS_TABLE = 'projects_fts'
+DOCS_TABLE = 'project_search_docs'
+
+SNIPPET_RADIUS = 40
+
+# PostgreSQL tsvector expression; must match the indexed expression exactly for the GIN index to be used
+PG_WEIGHT_CLASSES = {'name': 'A', 'requirement_name': 'A', 'requirement_description': 'B',
+                     'requester': 'C', 'sql_content': 'D'}
+PG_TSVECTOR = ' || '.join(
+    f"setweight(to_tsvector('simple', coalesce({field}, '')), '{PG_WEIGHT_CLASSES[field]}')"
+    for field, _ in SEARCH_FIELDS
+)
+
+
+def _field_list(prefix: str = '') -> str:
+    return ', '.join(f'{prefix}{field}' for field, _ in SEARCH_FIELDS)
+
+
+def _sqlite_has_table(conn, name: str) -> bool:
+    row = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': name}
+    ).first()
+    return row is not None
+
+
+def init_sqlite_search(conn) -> str:
+    """
+    Create the FTS5 table, docid map and triggers, backfilling existing projects once
+    Returns the backend name actually available; run by the search_index migration
+    """
+    if _sqlite_has_table(conn, FTS_TABLE):
+        return 'fts5'
+
+    # projects has a string primary key, so its implicit rowid may change on VACUUM.
+    # A separate INTEGER PRIMARY KEY map gives the FTS rows a stable docid.
+    conn.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {DOCS_TABLE} (
+            docid INTEGER PRIMARY KEY,
+            project_id VARCHAR(36) NOT NULL UNIQUE
+        )
+    """))
+
+    columns = _field_list()
+    try:
+        # trigram matches substrings, which also covers CJK text and identifiers inside SQL
+        conn.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns}, tokenize='trigram')"))
+    except Exception:
+        try:
+            conn.execute(text(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5({columns})"))
+        except Exception:
+            # SQLite built without FTS5
+            conn.execute(text(f"DROP TABLE IF EXISTS {DOCS_TABLE}"))
+            return 'python'
+
+    new_values = _field_list('new.')
+    docid_of_new = f"(SELECT docid FROM {DOCS_TABLE} WHERE project_id = new.id)"
+    docid_of_old = f"(SELECT docid FROM {DOCS_TABLE} WHERE project_id = old.id)"
+    update_columns = _field_list()
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS projects_search_ai AFTER INSERT ON projects BEGIN
+            INSERT INTO {DOCS_TABLE}(project_id) VALUES (new.id);
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES ({docid_of_new}, {new_values});
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS projects_search_au AFTER UPDATE OF {update_columns} ON projects BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = {docid_of_old};
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES ({docid_of_new}, {new_values});
+        END
+    """))
+    conn.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS projects_search_ad AFTER DELETE ON projects BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = {docid_of_old};
+            DELETE FROM {DOCS_TABLE} WHERE project_id = old.id;
+        END
+    """))
+
+    # Backfill projects that existed before the index
+    conn.execute(text(f"INSERT OR IGNORE INTO {DOCS_TABLE}(project_id) SELECT id FROM projects"))
+    conn.execute(text(f"""
+        INSERT INTO {FTS_TABLE}(rowid, {columns})
+        SELECT d.docid, {_field_list('p.')}
+        FROM projects p JOIN {DOCS_TABLE} d ON d.project_id = p.id
+    """))
+    return 'fts5'
+
+
+_backends = {}
+
+
+def detect_search_backend() -> str:
+    """
+    Backend available in the current database; the structures are created by migrations
+    """
+    engine = db.engine
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            backend = 'fts5' if _sqlite_has_table(conn, FTS_TABLE) else 'python'
+    elif engine.dialect.name == 'postgresql':
+        # The tsvector query works without the GIN index, just slower
+        backend = 'postgresql'
+    else:
+        backend = 'python'
+    _backends[str(engine.url)] = backend
+    return backend
+
+
+def get_search_backend() -> str:
+    """
+    Name of the search backend in use: fts5, postgresql or python
+    """
+    key = str(db.engine.url)
+    if key not in _backends:
+        return detect_search_backend()
+    return _backends[key]
+
+
+def _fts5_query(query: str) -> str:
+    # Quote every term so user input cannot inject FTS5 operators
+    terms = [term.replace('"', '""') for term in query.split()]
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def _search_fts5(query: str, offset: int, limit: int):
+    terms = query.split()
+    if all(len(term) >= 3 for term in terms):
+        weights = ', '.join(str(weight) for _, weight in SEARCH_FIELDS)
+        params = {'match': _fts5_query(query), 'limit': limit, 'offset': offset}
+        total = db.session.execute(
+            text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"), params
+        ).scalar()
+        rows = db.session.execute(
+            text(f"""
+                SELECT d.project_id, -bm25({FTS_TABLE}, {weights}) AS score,
+                       snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', 16) AS snippet
+                FROM {FTS_TABLE} JOIN {DOCS_TABLE} d ON d.docid = {FTS_TABLE}.rowid
+                WHERE {FTS_TABLE} MATCH :match
+                ORDER BY score DESC
+                LIMIT :limit OFFSET :offset
+            """),
+            params
+        ).all()
+        return total, [(row[0], float(row[1]), row[2]) for row in rows]
+
+    # The trigram tokenizer cannot match terms shorter than 3 characters; fall back to a LIKE scan
+    params = {'limit': limit, 'offset': offset}
+    clauses = []
+    for i, term in enumerate(terms):
+        params[f't{i}'] = f'%{term}%'
+        clauses.append('(' + ' OR '.join(f"{field} LIKE :t{i}" for field, _ in SEARCH_FIELDS) + ')')
+    where = ' AND '.join(clauses)
+    total = db.session.execute(
+        text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {where}"), params
+    ).scalar()
+    rows = db.session.execute(
+        text(f"""
+            SELECT d.project_id, {_field_list()}
+            FROM {FTS_TABLE} JOIN {DOCS_TABLE} d ON d.docid = {FTS_TABLE}.rowid
+            WHERE {where}
+            ORDER BY {FTS_TABLE}.rowid
+            LIMIT :limit OFFSET :offset
+        """),
+        params
+    ).all()
+    return total, [(row[0], 0.0, _make_snippet(row[1:], terms)) for row in rows]
+
+
+def _search_postgresql(query: str, offset: int, limit: int):
+    params = {'query': query, 'limit': limit, 'offset': offset}
+    match = f"({PG_TSVECTOR}) @@ websearch_to_tsquery('simple', :query)"
+    total = db.session.execute(
+        text(f"SELECT count(*) FROM projects WHERE {match}"), params
+    ).scalar()
+    # Rank and page first; ts_headline is expensive, so only run it for the page being returned
+    rows = db.session.execute(
+        text(f"""
+            SELECT page.id, page.score,
+                   ts_headline('simple',
+                               coalesce(p.requirement_description, '') || ' ' || coalesce(p.sql_content, ''),
+                               websearch_to_tsquery('simple', :query),
+                               'StartSel=<mark>, StopSel=</mark>, MaxWords=20, MinWords=5') AS snippet
+            FROM (
+                SELECT id, ts_rank_cd({PG_TSVECTOR}, websearch_to_tsquery('simple', :query)) AS score
+                FROM projects
+                WHERE {match}
+                ORDER BY score DESC
+                LIMIT :limit OFFSET :offset
+            ) page
+            JOIN projects p ON p.id = page.id
+            ORDER BY page.score DESC
+        """),
+        params
+    ).all()
+    return total, [(row[0], float(row[1]), row[2]) for row in rows]
+
+
+_TOKEN_RE = re.compile(r'[a-z0-9_]+|[一-鿿]')
+
+
+def tokenize(value: str) -> list:
+    """
+    Lowercase word tokens; CJK runs are split into overlapping character bigrams
+    """
+    if not value:
+        return []
+    tokens = []
+    pieces = _TOKEN_RE.findall(value.lower())
+    cjk_run = []
+    for piece in pieces + ['']:
+        if len(piece) == 1 and '一' <= piece <= '鿿':
+            cjk_run.append(piece)
+            continue
+        if cjk_run:
+            if len(cjk_run) == 1:
+                tokens.append(cjk_run[0])
+            else:
+                tokens.extend(a + b for a, b in zip(cjk_run, cjk_run[1:]))
+            cjk_run = []
+        if piece:
+            tokens.append(piece)
+    return tokens
+
+
+class InvertedIndex:
+    """
+    In-process inverted index used when the database has no native full-text search
+    Refreshes incrementally: only rows with updated_at past the last watermark are re-read,
+    and deleted projects are detected by comparing the row count
+    """
+
+    def __init__(self):
+        self.postings = {}  # token -> {project_id: weighted term frequency}
+        self.doc_tokens = {}  # project_id -> set of tokens
+        self.watermark = None
+        self.lock = threading.Lock()
+
+    def _remove(self, project_id):
+        for token in self.doc_tokens.pop(project_id, ()):
+            docs = self.postings.get(token)
+            if docs is not None:
+                docs.pop(project_id, None)
+                if not docs:
+                    del self.postings[token]
+
+    def _add(self, row):
+        project_id = row[0]
+        self._remove(project_id)
+        tokens = set()
+        for (field, weight), value in zip(SEARCH_FIELDS, row[1:]):
+            for token in tokenize(value):
+                docs = self.postings.setdefault(token, {})
+                docs[project_id] = docs.get(project_id, 0.0) + weight
+                tokens.add(token)
+        self.doc_tokens[project_id] = tokens
+
+    def refresh(self):
+        with self.lock:
+            query = f"SELECT id, {_field_list()}, updated_at FROM projects"
+            params = {}
+            if self.watermark is not None:
+                query += " WHERE updated_at >= :watermark"
+                params['watermark'] = self.watermark
+            for row in db.session.execute(text(query), params):
+                self._add(row[:-1])
+                updated_at = row[-1]
+                if isinstance(updated_at, str):
+                    updated_at = datetime.fromisoformat(updated_at)
+                if self.watermark is None or updated_at > self.watermark:
+                    self.watermark = updated_at
+
+            count = db.session.execute(text("SELECT count(*) FROM projects")).scalar()
+            if count != len(self.doc_tokens):
+                live = {row[0] for row in db.session.execute(text("SELECT id FROM projects"))}
+                for project_id in list(self.doc_tokens):
+                    if project_id not in live:
+                        self._remove(project_id)
+
+    def search(self, query: str):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self.lock:
+            candidates = None
+            for term in terms:
+                docs = self.postings.get(term, {})
+                candidates = set(docs) if candidates is None else candidates & set(docs)
+                if not candidates:
+                    return []
+            total_docs = max(len(self.doc_tokens), 1)
+            scores = {}
+            for term in terms:
+                docs = self.postings[term]
+                idf = math.log(1 + total_docs / len(docs))
+                for project_id in candidates:
+                    scores[project_id] = scores.get(project_id, 0.0) + docs[project_id] * idf
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+_python_indexes = {}
+
+
+def _search_python(query: str, offset: int, limit: int):
+    key = str(db.engine.url)
+    index = _python_indexes.setdefault(key, InvertedIndex())
+    index.refresh()
+    ranked = index.search(query)
+    page = ranked[offset:offset + limit]
+    if not page:
+        return len(ranked), []
+
+    ids = [project_id for project_id, _ in page]
+    placeholders = ', '.join(f':id{i}' for i in range(len(ids)))
+    texts = {
+        row[0]: row[1:]
+        for row in db.session.execute(
+            text(f"SELECT id, requirement_description, sql_content, name FROM projects WHERE id IN ({placeholders})"),
+            {f'id{i}': project_id for i, project_id in enumerate(ids)}
+        )
+    }
+    terms = query.split()
+    return len(ranked), [
+        (project_id, score, _make_snippet(texts.get(project_id), terms))
+        for project_id, score in page
+    ]
+
+
+def _make_snippet(values, terms):
+    """
+    Window of text around the first occurrence of any query term, with matches wrapped in <mark>
+    """
+    lowered_terms = [term.lower() for term in terms if term]
+    for value in values or ():
+        if not value:
+            continue
+        lowered = value.lower()
+        positions = [position for position in (lowered.find(term) for term in lowered_terms) if position >= 0]
+        if not positions:
+            continue
+        first = min(positions)
+        start = max(first - SNIPPET_RADIUS, 0)
+        end = min(first + SNIPPET_RADIUS * 2, len(value))
+        snippet = value[start:end]
+        for term in lowered_terms:
+            snippet = re.sub(re.escape(term), lambda m: f'<mark>{m.group(0)}</mark>', snippet, flags=re.IGNORECASE)
+        return ('…' if start > 0 else '') + snippet + ('…' if end < len(value) else '')
+    return None
+
+
+def search_projects(query: str, offset: int = 0, limit: int = 20):
+    """
+    Ranked full-text search over projects
+    Returns (total, [(project_id, score, snippet), ...]) for the requested page
+    """
+    query = (query or '').strip()
+    if not query:
+        return 0, []
+    backend = get_search_backend()
+    if backend == 'fts5':
+        return _search_fts5(query, offset, limit)
+    if backend == 'postgresql':
+        return _search_postgresql(query, offset, limit)
+    return _search_python(query, offset, limit)
@@ -0,0 +1,306 @@
+"""
+Lightweight SQL analysis: normalized fingerprints and referenced tables/columns
+This is a best-effort tokenizer, not a full grammar; it understands enough of
+SELECT/INSERT/UPDATE/DELETE/MERGE/CREATE/ALTER/DROP to find table references
+across MySQL, PostgreSQL and SQLite dialects.
+"""
+import hashlib
+import re
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>(?:[eEnNxXbB])?'(?:[^'\\]|''|\\.)*'|\$\$.*?\$\$)
+  | (?P<qident>"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<param>\$\d+|%\(\w+\)s|%s|\?|(?<!:):[A-Za-z_]\w*|@\w+)
+  | (?P<word>[^\W\d]\w*)
+  | (?P<op>::|<>|!=|<=|>=|\|\||.)
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = frozenset("""
+    add all alter analyze and any array as asc between both by case cast check collate column
+    constraint create cross current_date current_time current_timestamp database default delete
+    desc describe distinct do drop else end escape except exists explain false fetch filter first
+    following for foreign from full group having if ilike in index inner insert intersect interval
+    into is join key last lateral leading left like limit materialized merge natural not null nulls
+    offset on only or order outer over overwrite partition preceding primary range recursive
+    references replace returning right row rows select set show similar table then to top
+    trailing true truncate unbounded union unique update using values view when where window with
+    within
+    bigint binary bit blob bool boolean char character date datetime decimal double float int integer
+    json jsonb numeric real smallint text time timestamp tinyint uuid varchar
+""".split())
+
+# Keywords after which a table name follows
+_TABLE_TRIGGERS = frozenset(['from', 'join', 'into', 'update', 'table', 'view', 'truncate'])
+# Keywords that turn the following table reference into a write
+_WRITE_PREFIXES = frozenset(['insert', 'into', 'update', 'create', 'alter', 'drop', 'truncate',
+                             'overwrite', 'delete', 'merge', 'replace'])
+_IGNORED_TABLES = frozenset(['dual'])
+
+
+def tokenize_sql(sql: str) -> list:
+    """
+    Split SQL into (kind, value) tokens, dropping whitespace and comments
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(sql or ''):
+        kind = match.lastgroup
+        if kind in ('ws', 'comment'):
+            continue
+        tokens.append((kind, match.group()))
+    return tokens
+
+
+def tokenize_sql_spans(sql: str) -> list:
+    """
+    Like tokenize_sql, but (kind, value, start, end) so callers can rewrite the original text
+    """
+    return [
+        (match.lastgroup, match.group(), match.start(), match.end())
+        for match in _TOKEN_RE.finditer(sql or '')
+        if match.lastgroup not in ('ws', 'comment')
+    ]
+
+
+def split_statements(tokens: list) -> list:
+    statements = []
+    current = []
+    for token in tokens:
+        if token == ('op', ';'):
+            if current:
+                statements.append(current)
+            current = []
+        else:
+            current.append(token)
+    if current:
+        statements.append(current)
+    return statements
+
+
+def _identifier(token) -> str:
+    kind, value = token
+    if kind == 'qident':
+        return value[1:-1].replace('""', '"').replace('``', '`').lower()
+    return value.lower()
+
+
+def _is_name(token) -> bool:
+    return token[0] == 'qident' or (token[0] == 'word' and token[1].lower() not in KEYWORDS)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical form of a script: literals and parameters become ?, case and whitespace are
+    normalized, and IN/VALUES lists collapse to a single placeholder group
+    """
+    parts = []
+    for kind, value in tokenize_sql(sql):
+        if kind in ('string', 'number', 'param'):
+            parts.append('?')
+        elif kind == 'qident':
+            parts.append(_identifier((kind, value)))
+        else:
+            parts.append(value.lower())
+    normalized = ' '.join(parts).strip(' ;')
+    normalized = re.sub(r'\(\s*\?(?:\s*,\s*\?)+\s*\)', '(?)', normalized)
+    normalized = re.sub(r'\(\?\)(?:\s*,\s*\(\?\))+', '(?)', normalized)
+    return normalized
+
+
+def fingerprint_sql(sql: str) -> str:
+    """
+    Stable hash of the normalized script; equal for queries differing only in literals or formatting
+    """
+    normalized = normalize_sql(sql)
+    if not normalized:
+        return None
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def _read_qualified_name(tokens, i):
+    """
+    Read name(.name)* starting at i; returns (parts, next_index)
+    """
+    parts = [_identifier(tokens[i])]
+    i += 1
+    while i + 1 < len(tokens) and tokens[i] == ('op', '.') and tokens[i + 1][0] in ('word', 'qident'):
+        parts.append(_identifier(tokens[i + 1]))
+        i += 2
+    return parts, i
+
+
+def _cte_names(tokens) -> set:
+    names = set()
+    for i in range(1, len(tokens) - 2):
+        previous = tokens[i - 1][1].lower()
+        if previous not in ('with', 'recursive', ','):
+            continue
+        if not _is_name(tokens[i]):
+            continue
+        j = i + 1
+        if tokens[j] == ('op', '('):
+            depth = 0
+            while j < len(tokens):
+                if tokens[j] == ('op', '('):
+                    depth += 1
+                elif tokens[j] == ('op', ')'):
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            j += 1
+        if j + 1 < len(tokens) and tokens[j][1].lower() == 'as':
+            following = tokens[j + 1]
+            if following == ('op', '(') or following[1].lower() in ('materialized', 'not'):
+                names.add(_identifier(tokens[i]))
+    return names
+
+
+def _function_arguments(tokens) -> set:
+    """
+    Positions directly inside the parentheses of a function call, where FROM is part of the
+    call's syntax (EXTRACT(YEAR FROM ts), SUBSTRING(s FROM 2), TRIM(BOTH ' ' FROM s)) rather
+    than a table reference; subqueries nested in the arguments are not included
+    """
+    positions = set()
+    stack = []  # per open parenthesis: True when it belongs to a function call
+    for i, token in enumerate(tokens):
+        if token == ('op', '('):
+            stack.append(i > 0 and _is_name(tokens[i - 1]))
+        elif token == ('op', ')'):
+            if stack:
+                stack.pop()
+        elif stack and stack[-1]:
+            positions.add(i)
+    return positions
+
+
+def _analyze_statement(tokens, tables):
+    ctes = _cte_names(tokens)
+    arguments = _function_arguments(tokens)
+    aliases = {}  # alias or bare table name -> full table name
+    statement_tables = []
+    skip = set()  # token positions consumed as table names/aliases
+
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        keyword = value.lower() if kind == 'word' else None
+        if keyword not in _TABLE_TRIGGERS:
+            i += 1
+            continue
+
+        previous = tokens[i - 1][1].lower() if i > 0 else ''
+        if keyword == 'from' and (i in arguments or (previous == 'distinct' and i > 1
+                                                       and tokens[i - 2][1].lower() in ('is', 'not'))):
+            # Function syntax, or IS [NOT] DISTINCT FROM
+            i += 1
+            continue
+        if keyword == 'from' and previous == 'delete':
+            access = 'write'
+        elif keyword in ('into', 'update', 'truncate'):
+            access = 'write'
+        elif keyword in ('table', 'view'):
+            access = 'write' if previous in _WRITE_PREFIXES or previous in ('temporary', 'temp', 'or') else 'read'
+        else:
+            access = 'read'
+
+        in_from = keyword in ('from', 'join')
+        j = i + 1
+        while True:
+            while j < len(tokens) and tokens[j][1].lower() in ('if', 'not', 'exists', 'only', 'table', 'lateral'):
+                j += 1
+            if j >= len(tokens) or not (tokens[j][0] == 'qident' or tokens[j][0] == 'word'):
+                break
+            if tokens[j][0] == 'word' and tokens[j][1].lower() in KEYWORDS:
+                break
+            start = j
+            parts, j = _read_qualified_name(tokens, j)
+            if in_from and j < len(tokens) and tokens[j] == ('op', '('):
+                # Table-valued function such as generate_series(...)
+                break
+            skip.update(range(start, j))
+            full_name = '.'.join(parts)
+            if not (len(parts) == 1 and (full_name in ctes or full_name in _IGNORED_TABLES)):
+                entry = tables.setdefault(full_name, {'access': set(), 'columns': set()})
+                entry['access'].add(access)
+                statement_tables.append(full_name)
+                aliases[parts[-1]] = full_name
+                aliases[full_name] = full_name
+                # Optional alias
+                if j < len(tokens) and tokens[j][1].lower() == 'as':
+                    j += 1
+                if j < len(tokens) and _is_name(tokens[j]):
+                    aliases[_identifier(tokens[j])] = full_name
+                    skip.add(j)
+                    j += 1
+            if in_from and j < len(tokens) and tokens[j] == ('op', ','):
+                j += 1
+                continue
+            break
+        i = max(j, i + 1)
+
+    _collect_columns(tokens, tables, aliases, set(statement_tables), ctes, skip)
+
+
+def _collect_columns(tokens, tables, aliases, statement_tables, ctes, skip):
+    select_aliases = set()
+    for i, token in enumerate(tokens):
+        if token[1].lower() == 'as' and i + 1 < len(tokens) and _is_name(tokens[i + 1]):
+            select_aliases.add(_identifier(tokens[i + 1]))
+
+    single_table = next(iter(statement_tables)) if len(statement_tables) == 1 else None
+
+    for i, token in enumerate(tokens):
+        if i in skip or not _is_name(token):
+            continue
+        following = tokens[i + 1] if i + 1 < len(tokens) else None
+        previous = tokens[i - 1] if i > 0 else None
+        if following == ('op', '('):
+            continue  # function call
+
+        # Qualified reference: alias.column or schema.table.column
+        if following == ('op', '.') and i + 2 < len(tokens):
+            parts, end = _read_qualified_name(tokens, i)
+            if len(parts) >= 2 and parts[-1] != '*' and not (end < len(tokens) and tokens[end] == ('op', '(')):
+                owner = '.'.join(parts[:-1])
+                table = aliases.get(owner)
+                if table and table in tables:
+                    tables[table]['columns'].add(parts[-1])
+            continue
+        if previous == ('op', '.'):
+            continue  # already handled as part of a qualified name
+
+        if single_table is None or single_table not in tables:
+            continue
+        name = _identifier(token)
+        if name in aliases or name in ctes or name in select_aliases:
+            continue
+        if previous is not None and (previous[1].lower() == 'as' or previous == ('op', '::')):
+            continue
+        if previous == ('op', '(') and i > 1 and tokens[i - 2][1].lower() == 'extract':
+            continue  # the field of EXTRACT(YEAR FROM ts)
+        if previous is not None and (previous[0] in ('string', 'number') or previous == ('op', ')')
+                                     or _is_name(previous)):
+            continue  # implicit alias such as count(*) cnt
+        tables[single_table]['columns'].add(name)
+
+
+def analyze_sql(sql: str) -> dict:
+    """
+    Fingerprint the script and collect referenced tables with access mode and columns
+    Returns {'fingerprint', 'statementCount', 'tables': {name: {'access': set, 'columns': set}}}
+    """
+    tokens = tokenize_sql(sql)
+    statements = split_statements(tokens)
+    tables = {}
+    for statement in statements:
+        _analyze_statement(statement, tables)
+    return {
+        'fingerprint': fingerprint_sql(sql),
+        'statementCount': len(statements),
+        'tables': tables,
+    }
@@ -0,0 +1,169 @@
+"""
+SQL usage index: per-project fingerprint plus referenced tables/columns
+Updated incrementally when a project's SQL is saved and backfilled by a resumable batch job:
+    python -m models.backfill_sql_index [--after <project_id>] [--batch-size 500]
+"""
+import hashlib
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, insert, delete, select
+from .database import db
+from .project import Project
+from .sql_parser import analyze_sql
+
+
+class ProjectSqlIndex(db.Model):
+    """
+    Fingerprint and bookkeeping for one project's indexed SQL
+    """
+    __tablename__ = 'project_sql_index'
+
+    project_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), primary_key=True)
+    fingerprint = Column(String(40), nullable=True, index=True)  # 归一化SQL的哈希，用于查找重复查询
+    content_hash = Column(String(40), nullable=False)  # 解析器版本加原始SQL的哈希，内容未变时跳过重新解析
+    statement_count = Column(Integer, nullable=False, default=0)
+    indexed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ProjectSqlIndex {self.project_id}: {self.fingerprint}>'
+
+
+class ProjectTableUsage(db.Model):
+    """
+    One referenced table (column_name is NULL) or column of a table in a project's SQL
+    """
+    __tablename__ = 'project_table_usage'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    project_id = Column(String(36), ForeignKey('projects.id', ondelete='CASCADE'), nullable=False, index=True)
+    table_name = Column(String(255), nullable=False, index=True)  # 完整表名（含schema），小写
+    object_name = Column(String(255), nullable=False, index=True)  # 不含schema的表名，小写
+    column_name = Column(String(255), nullable=True)  # 列名，表级记录为空
+    access = Column(String(10), nullable=False)  # read / write
+
+    def to_dict(self) -> dict:
+        return {
+            'projectId': self.project_id,
+            'table': self.table_name,
+            'column': self.column_name,
+            'access': self.access,
+        }
+
+    def __repr__(self):
+        return f'<ProjectTableUsage {self.project_id}: {self.table_name}.{self.column_name}>'
+
+
+# Bump when analyze_sql changes what it finds, so stored entries are re-parsed on the next index run
+PARSER_VERSION = 2
+
+
+def content_hash(sql) -> str:
+    return hashlib.sha1((sql or '').encode('utf-8')).hexdigest()
+
+
+def _index_hash(sql) -> str:
+    return hashlib.sha1(f'{PARSER_VERSION}:{sql or ""}'.encode('utf-8')).hexdigest()
+
+
+def index_projects(rows) -> int:
+    """
+    Index (project_id, sql) pairs, skipping projects whose SQL is unchanged since the last run
+    Runs in the caller's transaction; returns the number of projects re-indexed
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+
+    hashes = {project_id: _index_hash(sql) for project_id, sql in rows}
+    known = dict(
+        db.session.query(ProjectSqlIndex.project_id, ProjectSqlIndex.content_hash)
+        .filter(ProjectSqlIndex.project_id.in_(hashes.keys()))
+        .all()
+    )
+    changed = [(project_id, sql) for project_id, sql in rows if known.get(project_id) != hashes[project_id]]
+    if not changed:
+        return 0
+
+    changed_ids = [project_id for project_id, _ in changed]
+    db.session.execute(
+        delete(ProjectTableUsage).where(ProjectTableUsage.project_id.in_(changed_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(ProjectSqlIndex).where(ProjectSqlIndex.project_id.in_(changed_ids)),
+        execution_options={'synchronize_session': False}
+    )
+
+    now = datetime.utcnow()
+    index_rows = []
+    usage_rows = []
+    for project_id, sql in changed:
+        analysis = analyze_sql(sql)
+        index_rows.append({
+            'project_id': project_id,
+            'fingerprint': analysis['fingerprint'],
+            'content_hash': hashes[project_id],
+            'statement_count': analysis['statementCount'],
+            'indexed_at': now,
+        })
+        for table_name, usage in analysis['tables'].items():
+            object_name = table_name.rsplit('.', 1)[-1]
+            for access in sorted(usage['access']):
+                usage_rows.append({
+                    'project_id': project_id,
+                    'table_name': table_name,
+                    'object_name': object_name,
+                    'column_name': None,
+                    'access': access,
+                })
+            access = 'write' if 'write' in usage['access'] else 'read'
+            for column_name in sorted(usage['columns']):
+                usage_rows.append({
+                    'project_id': project_id,
+                    'table_name': table_name,
+                    'object_name': object_name,
+                    'column_name': column_name,
+                    'access': access,
+                })
+
+    db.session.execute(insert(ProjectSqlIndex), index_rows)
+    if usage_rows:
+        db.session.execute(insert(ProjectTableUsage), usage_rows)
+    return len(changed)
+
+
+def purge_project_sql_index(project_ids):
+    """
+    Remove index rows for deleted projects; project_ids may be a list or a SELECT of IDs
+    """
+    db.session.execute(
+        delete(ProjectTableUsage).where(ProjectTableUsage.project_id.in_(project_ids)),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.execute(
+        delete(ProjectSqlIndex).where(ProjectSqlIndex.project_id.in_(project_ids)),
+        execution_options={'synchronize_session': False}
+    )
+
+
+def backfill_sql_index(after=None, batch_size: int = 500) -> dict:
+    """
+    Index one keyset-ordered batch of projects and commit
+    Resumable: pass the returned nextCursor to continue; unchanged projects are skipped cheaply.
+    The final batch also purges index rows left behind by projects deleted outside the API.
+    """
+    query = select(Project.id, Project.sql_content).order_by(Project.id).limit(batch_size)
+    if after:
+        query = query.where(Project.id > after)
+    rows = db.session.execute(query).all()
+
+    indexed = index_projects((row.id, row.sql_content) for row in rows)
+    next_cursor = rows[-1].id if len(rows) == batch_size else None
+    if next_cursor is None:
+        orphaned = select(ProjectSqlIndex.project_id).where(
+            ProjectSqlIndex.project_id.not_in(select(Project.id))
+        )
+        purge_project_sql_index(orphaned)
+    db.session.commit()
+
+    return {'processed': len(rows), 'indexed': indexed, 'nextCursor': next_cursor}
+
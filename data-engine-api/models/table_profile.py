@@ -0,0 +1,73 @@
+"""
+Cached column statistics for a table of a saved database connection
+"""
+import json
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import Column, String, DateTime, Text, Integer, Boolean, ForeignKey, UniqueConstraint
+from .database import db
+
+
+class TableProfile(db.Model):
+    """
+    Latest column profile of one table; recomputed in the background on request
+    """
+    __tablename__ = 'table_profiles'
+    __table_args__ = (
+        UniqueConstraint('connection_id', 'database_name', 'schema_name', 'table_name', name='uq_table_profile'),
+    )
+
+    id = Column(String(36), primary_key=True)
+    connection_id = Column(String(36), ForeignKey('database_connections.id', ondelete='CASCADE'), nullable=False, index=True)
+    database_name = Column(String(255), nullable=False, default='')  # 数据库名，未指定时为空字符串
+    schema_name = Column(String(255), nullable=False, default='')  # schema，未指定时为空字符串
+    table_name = Column(String(255), nullable=False)  # 表名
+    status = Column(String(20), nullable=False, default='pending')  # pending / running / completed / failed
+    error = Column(Text, nullable=True)  # 失败原因
+    columns_json = Column(Text, nullable=True)  # 各列统计结果（JSON）
+    row_count = Column(Integer, nullable=True)  # 统计所用的行数（采样时为样本行数）
+    estimated_rows = Column(Integer, nullable=True)  # 目录统计的表行数估计
+    sampled = Column(Boolean, nullable=False, default=False)  # 是否基于采样
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)  # 统计完成时间，用于判断新鲜度
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(
+        self,
+        id: str,
+        connection_id: str,
+        table_name: str,
+        database_name: Optional[str] = None,
+        schema_name: Optional[str] = None
+    ):
+        self.id = id
+        self.connection_id = connection_id
+        self.table_name = table_name
+        self.database_name = database_name or ''
+        self.schema_name = schema_name or ''
+        self.status = 'pending'
+        self.sampled = False
+        self.created_at = datetime.utcnow()
+
+    def to_dict(self) -> dict:
+        """
+        Convert profile to dictionary
+        """
+        return {
+            'id': self.id,
+            'connectionId': self.connection_id,
+            'database': self.database_name or None,
+            'schema': self.schema_name or None,
+            'table': self.table_name,
+            'status': self.status,
+            'error': self.error,
+            'columns': json.loads(self.columns_json) if self.columns_json else [],
+            'rowCount': self.row_count,
+            'estimatedRows': self.estimated_rows,
+            'sampled': self.sampled,
+            'startedAt': self.started_at.isoformat() if self.started_at else None,
+            'completedAt': self.completed_at.isoformat() if self.completed_at else None,
+        }
+
+    def __repr__(self):
+        return f'<TableProfile {self.id}: {self.table_name} ({self.status})>'
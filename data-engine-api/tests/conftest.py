@@ -0,0 +1,31 @@
+"""
+Shared fixtures: an application on a fresh SQLite metadata database
+"""
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('SQLITE_PATH', str(tmp_path / 'engine.db'))
+    monkeypatch.setenv('SCHEDULE_RUNNER_ENABLED', 'false')
+    from main import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def sqlite_connection(client, tmp_path):
+    """
+    Id of a saved connection to an empty SQLite database
+    """
+    response = client.post('/api/database/connections', json={
+        'name': 'warehouse', 'dbType': 'sqlite', 'database': str(tmp_path / 'warehouse.db'),
+    })
+    assert response.status_code == 201, response.json
+    return response.json['id']
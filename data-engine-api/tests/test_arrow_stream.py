@@ -0,0 +1,89 @@
+"""
+Arrow encoding of query results whose column types change after the first batch
+"""
+import decimal
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from api.arrow_stream import ARROW_BATCH_ROWS, DECIMAL_PRECISION, build_record_batch, fit_schema, infer_schema, iter_arrow_stream, \
+    table_from_batches
+
+ROWS = [(i, i if i < 9000 else i + 0.5) for i in range(1, 10001)]
+
+
+def read_streams(data: bytes) -> list:
+    source = pa.BufferReader(data)
+    tables = []
+    while source.tell() < source.size():
+        tables.append(pa.ipc.open_stream(source).read_all())
+    return tables
+
+
+def test_stream_widens_int_column_with_fractional_tail():
+    first, rest = ROWS[:ARROW_BATCH_ROWS], ROWS[ARROW_BATCH_ROWS:]
+    batches = iter([rest, []])
+    tables = read_streams(b''.join(iter_arrow_stream(['id', 'price'], first, lambda: next(batches))))
+
+    assert [table.schema.field('price').type for table in tables] == [pa.int64(), pa.float64()]
+    prices = [price for table in tables for price in table.column('price').to_pylist()]
+    assert prices == [row[1] for row in ROWS]
+    assert prices[9000] == 9001.5
+
+
+def test_batches_cast_to_widened_schema():
+    schema, converters = infer_schema(['id', 'price'], ROWS[:ARROW_BATCH_ROWS])
+    batches = [build_record_batch(schema, converters, ROWS[:ARROW_BATCH_ROWS])]
+    schema, converters = fit_schema(schema, converters, ROWS[ARROW_BATCH_ROWS:])
+    batches.append(build_record_batch(schema, converters, ROWS[ARROW_BATCH_ROWS:]))
+
+    table = table_from_batches(batches, schema)
+    assert table.schema.field('id').type == pa.int64()
+    assert table.schema.field('price').type == pa.float64()
+    assert table.column('price').to_pylist() == [row[1] for row in ROWS]
+
+
+def test_text_after_numbers_becomes_string():
+    schema, converters = infer_schema(['value'], [(1,), (2,)])
+    widened, converters = fit_schema(schema, converters, [(3,), ('n/a',)])
+    assert widened.field('value').type == pa.string()
+    assert build_record_batch(widened, converters, [(3,), ('n/a',)]).column(0).to_pylist() == ['3', 'n/a']
+
+
+def test_int_beyond_int64_is_kept_as_text():
+    schema, _ = infer_schema(['value'], [(2 ** 64 - 1,)])
+    assert schema.field('value').type == pa.string()
+
+
+def test_decimals_keep_every_digit():
+    values = [decimal.Decimal('12345678901234567.89'), decimal.Decimal('0.10'), None]
+    schema, converters = infer_schema(['amount'], [(value,) for value in values])
+    assert schema.field('amount').type == pa.decimal128(DECIMAL_PRECISION, 2)
+    batch = build_record_batch(schema, converters, [(value,) for value in values])
+    assert batch.column(0).to_pylist() == values
+
+
+def test_decimals_of_different_scales_become_text():
+    rows = [(decimal.Decimal('1.5'),), (decimal.Decimal('2.25'),)]
+    schema, converters = infer_schema(['amount'], rows)
+    assert schema.field('amount').type == pa.string()
+    assert build_record_batch(schema, converters, rows).column(0).to_pylist() == ['1.5', '2.25']
+
+
+def test_int_column_widens_to_decimal_in_stream():
+    first = [(1,), (2,)]
+    rest = [(decimal.Decimal('12345678901234567.89'),)]
+    batches = iter([rest, []])
+    tables = read_streams(b''.join(iter_arrow_stream(['amount'], first, lambda: next(batches))))
+
+    assert [table.schema.field('amount').type for table in tables] == [pa.int64(), pa.decimal128(DECIMAL_PRECISION, 2)]
+    assert tables[1].column('amount').to_pylist() == [decimal.Decimal('12345678901234567.89')]
+
+
+def test_decimal_after_floats_is_not_rounded():
+    schema, converters = infer_schema(['amount'], [(1.5,)])
+    widened, converters = fit_schema(schema, converters, [(decimal.Decimal('12345678901234567.89'),)])
+    assert widened.field('amount').type == pa.string()
+    assert build_record_batch(widened, converters, [(decimal.Decimal('12345678901234567.89'),)]) \
+        .column(0).to_pylist() == ['12345678901234567.89']
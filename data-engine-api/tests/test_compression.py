@@ -0,0 +1,36 @@
+"""
+Response compression of file responses and their validators
+"""
+import gzip
+import json
+
+import pytest
+
+
+@pytest.fixture
+def apispec(tmp_path, monkeypatch):
+    path = tmp_path / 'apispec.json'
+    path.write_text(json.dumps({'paths': {f'/api/route{index}': {'get': {}} for index in range(500)}}))
+    monkeypatch.setenv('APISPEC_PATH', str(path))
+    return path
+
+
+def test_file_response_is_compressed_with_a_weak_etag(apispec, client):
+    response = client.get('/apispec.json', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert int(response.headers['Content-Length']) < apispec.stat().st_size
+    assert json.loads(gzip.decompress(response.get_data())) == json.loads(apispec.read_text())
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    response = client.get('/apispec.json', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_file_response_without_accept_encoding_keeps_its_etag(apispec, client):
+    response = client.get('/apispec.json', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert not response.headers['ETag'].startswith('W/')
+    assert response.get_data() == apispec.read_bytes()
@@ -0,0 +1,100 @@
+"""
+Project SQL saves: versions and revisions
+"""
+
+
+def create_project(client, sql: str) -> tuple:
+    """
+    (project id, SQL version) of a new project holding sql
+    """
+    project_id = client.post('/api/editor/projects', json={'name': 'report'}).json['id']
+    response = client.put(f'/api/editor/projects/{project_id}/details', json={'sql': sql})
+    return project_id, response.json['projectDetails']['sqlVersion']
+
+
+def revision_count(client, project_id: str) -> int:
+    return client.get(f'/api/editor/projects/{project_id}/revisions').json['total']
+
+
+def test_details_save_with_unchanged_sql_keeps_the_version(client):
+    project_id, version = create_project(client, 'SELECT 1')
+    revisions = revision_count(client, project_id)
+
+    response = client.put(f'/api/editor/projects/{project_id}/details', json={
+        'sql': 'SELECT 1', 'requester': 'finance', 'sqlVersion': version,
+    })
+    assert response.status_code == 200, response.json
+    assert response.json['projectDetails']['sqlVersion'] == version
+    assert response.json['projectDetails']['requester'] == 'finance'
+    assert revision_count(client, project_id) == revisions
+
+    response = client.put(f'/api/editor/projects/{project_id}/details', json={'sql': 'SELECT 2'})
+    assert response.json['projectDetails']['sqlVersion'] == version + 1
+    assert revision_count(client, project_id) == revisions + 1
+
+
+def test_patches_apply_to_the_base_version(client):
+    project_id, version = create_project(client, 'SELECT * FROM orders')
+
+    response = client.patch(f'/api/editor/projects/{project_id}/sql', json={
+        'baseVersion': version, 'patches': [{'start': 7, 'end': 8, 'text': 'id, amount'}],
+    })
+    assert response.status_code == 200, response.json
+    assert response.json['sqlVersion'] == version + 1
+    revision = client.get(f'/api/editor/projects/{project_id}/revisions/{version + 1}').json
+    assert revision == {'version': version + 1, 'sql': 'SELECT id, amount FROM orders'}
+
+    # Nothing changed: no new version
+    response = client.patch(f'/api/editor/projects/{project_id}/sql', json={'baseVersion': version + 1, 'patches': []})
+    assert response.json['sqlVersion'] == version + 1
+
+
+def test_patch_against_a_stale_version_is_a_conflict(client):
+    project_id, version = create_project(client, 'SELECT 1')
+    client.put(f'/api/editor/projects/{project_id}/details', json={'sql': 'SELECT 2'})
+
+    response = client.patch(f'/api/editor/projects/{project_id}/sql', json={
+        'baseVersion': version, 'patches': [{'start': 7, 'end': 8, 'text': '3'}],
+    })
+    assert response.status_code == 409
+    assert response.json['currentVersion'] == version + 1
+    assert client.get(f'/api/editor/projects/{project_id}/revisions/{version + 1}').json['sql'] == 'SELECT 2'
+
+
+def test_invalid_patches_are_rejected(client):
+    project_id, version = create_project(client, 'SELECT 1')
+    assert client.patch(f'/api/editor/projects/{project_id}/sql', json={'patches': []}).status_code == 400
+    response = client.patch(f'/api/editor/projects/{project_id}/sql', json={
+        'baseVersion': version, 'patches': [{'start': 0, 'end': 99, 'text': ''}],
+    })
+    assert response.status_code == 400
+    assert client.patch('/api/editor/projects/missing/sql', json={'baseVersion': 1}).status_code == 404
+
+
+def test_details_save_with_a_stale_version_is_a_conflict(client):
+    project_id, version = create_project(client, 'SELECT 1')
+    client.put(f'/api/editor/projects/{project_id}/details', json={'sql': 'SELECT 2'})
+
+    response = client.put(f'/api/editor/projects/{project_id}/details', json={'sql': 'SELECT 3', 'sqlVersion': version})
+    assert response.status_code == 409
+    assert response.json['currentVersion'] == version + 1
+
+
+def test_revisions_list_content_and_diff(client):
+    project_id, first = create_project(client, 'SELECT id\nFROM orders\n')
+    client.put(f'/api/editor/projects/{project_id}/details', json={'sql': 'SELECT id, amount\nFROM orders\n'})
+    client.put(f'/api/editor/projects/{project_id}/details', json={'sql': 'SELECT id, amount\nFROM sales.orders\n'})
+
+    listing = client.get(f'/api/editor/projects/{project_id}/revisions?pageSize=2').json
+    assert listing['total'] == 3
+    assert [item['version'] for item in listing['revisions']] == [first + 2, first + 1]
+    assert [item['kind'] for item in listing['revisions']] == ['delta', 'delta']
+
+    assert client.get(f'/api/editor/projects/{project_id}/revisions/{first}').json['sql'] == 'SELECT id\nFROM orders\n'
+    assert client.get(f'/api/editor/projects/{project_id}/revisions/{first + 9}').status_code == 404
+
+    diff = client.get(f'/api/editor/projects/{project_id}/revisions/diff?from={first}').json
+    assert diff['to'] == first + 2
+    assert '-SELECT id\n' in diff['diff']
+    assert '+FROM sales.orders\n' in diff['diff']
+    assert (diff['added'], diff['removed']) == (2, 2)
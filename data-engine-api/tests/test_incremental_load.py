@@ -0,0 +1,151 @@
+"""
+Incremental loads: upserts, watermarks and admission of concurrent loads
+"""
+import sqlite3
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import Column, MetaData, Table
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from api import incremental_load, scheduler
+from api.incremental_load import upsert_statement
+from api.scheduler import QueryScheduler
+from models.incremental_load import decode_watermark, encode_watermark
+
+
+def create_sqlite_connection(client, path, name: str) -> str:
+    sqlite3.connect(path).close()
+    response = client.post('/api/database/connections', json={'name': name, 'dbType': 'sqlite', 'database': str(path)})
+    return response.json['id']
+
+
+def create_load(client, source_id: str, target_id: str, name: str,
+                sql: str = 'SELECT 1 AS id, 1 AS version') -> str:
+    project_id = client.post('/api/editor/projects', json={'name': name}).json['id']
+    client.put(f'/api/editor/projects/{project_id}/details', json={'sql': sql})
+    response = client.put(f'/api/loads/{project_id}', json={
+        'sourceConnectionId': source_id, 'targetConnectionId': target_id, 'targetTable': 'copy',
+        'keyColumns': ['id'], 'watermarkColumn': 'version', 'batchSize': 2,
+    })
+    assert response.status_code in (200, 201), response.json
+    return project_id
+
+
+def wait_for_load(client, project_id: str) -> dict:
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        load = client.get(f'/api/loads/{project_id}').json
+        if load['status'] in ('completed', 'failed'):
+            return load
+        time.sleep(0.05)
+    raise AssertionError('load did not finish')
+
+
+def test_loads_over_two_connections_do_not_exhaust_the_user_limit(client, tmp_path, monkeypatch):
+    # Two slots per user and a wait deadline shorter than one load
+    monkeypatch.setattr(scheduler, 'query_scheduler', QueryScheduler(4, 2, 1, 32, 0.2))
+
+    def slow_load(load, sql, source, target, watermark=None):
+        time.sleep(0.4)
+        return {'rowsRead': 1, 'rowsWritten': 1, 'watermark': 1}
+
+    monkeypatch.setattr(incremental_load, 'execute_load', slow_load)
+    loads = []
+    for index in range(2):
+        source_id = create_sqlite_connection(client, tmp_path / f'source{index}.db', f'source{index}')
+        target_id = create_sqlite_connection(client, tmp_path / f'target{index}.db', f'target{index}')
+        loads.append(create_load(client, source_id, target_id, f'copy{index}'))
+
+    for project_id in loads:
+        assert client.post(f'/api/loads/{project_id}/run').status_code == 202
+    results = [wait_for_load(client, project_id) for project_id in loads]
+
+    assert [load['status'] for load in results] == ['completed', 'completed'], [load['error'] for load in results]
+
+
+@pytest.mark.parametrize('db_type, dialect, expected', [
+    ('sqlite', sqlite.dialect(), 'ON CONFLICT (id) DO UPDATE SET name = excluded.name, version = excluded.version'),
+    ('postgresql', postgresql.dialect(), 'ON CONFLICT (id) DO UPDATE SET name = excluded.name, version = excluded.version'),
+    ('mysql', mysql.dialect(), 'ON DUPLICATE KEY UPDATE name = VALUES(name), version = VALUES(version)'),
+])
+def test_upsert_updates_the_non_key_columns(db_type, dialect, expected):
+    table = Table('copy', MetaData(), Column('id'), Column('name'), Column('version'))
+    statement = str(upsert_statement(db_type, table, ['id']).compile(dialect=dialect))
+    assert statement.startswith('INSERT INTO copy (id, name, version) VALUES')
+    assert statement.endswith(expected)
+
+
+def test_upsert_of_key_only_rows_is_a_no_op():
+    table = Table('copy', MetaData(), Column('tenant'), Column('id'))
+    statement = str(upsert_statement('sqlite', table, ['tenant', 'id']).compile(dialect=sqlite.dialect()))
+    assert statement.endswith('ON CONFLICT (tenant, id) DO NOTHING')
+    statement = str(upsert_statement('mysql', table, ['tenant', 'id']).compile(dialect=mysql.dialect()))
+    assert statement.endswith('ON DUPLICATE KEY UPDATE tenant = VALUES(tenant)')
+    with pytest.raises(ValueError):
+        upsert_statement('oracle', table, ['id'])
+
+
+@pytest.mark.parametrize('value, kind', [
+    (42, 'int'),
+    (1.5, 'float'),
+    (Decimal('12345678901234567890.123'), 'decimal'),
+    (date(2026, 3, 1), 'date'),
+    (datetime(2026, 3, 1, 12, 30, 15, 250), 'datetime'),
+    ('b-0017', 'str'),
+])
+def test_watermarks_round_trip_with_their_type(value, kind):
+    stored, stored_kind = encode_watermark(value)
+    assert stored_kind == kind
+    assert decode_watermark(stored, stored_kind) == value
+    assert type(decode_watermark(stored, stored_kind)) is type(value)
+
+
+def test_boolean_watermark_is_rejected():
+    with pytest.raises(ValueError):
+        encode_watermark(True)
+
+
+def test_watermark_is_stored_and_used_by_the_next_load(client, tmp_path):
+    source = sqlite3.connect(tmp_path / 'source.db')
+    source.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, version INTEGER)')
+    source.executemany('INSERT INTO users VALUES (?, ?, ?)', [(1, 'ann', 1), (2, 'bob', 2), (3, 'cy', 3)])
+    source.commit()
+    target = sqlite3.connect(tmp_path / 'target.db')
+    target.execute('CREATE TABLE copy (id INTEGER PRIMARY KEY, name TEXT, version INTEGER)')
+    target.commit()
+    source_id = create_sqlite_connection(client, tmp_path / 'source.db', 'source')
+    target_id = create_sqlite_connection(client, tmp_path / 'target.db', 'target')
+    project_id = create_load(client, source_id, target_id, 'users', sql='SELECT id, name, version FROM users')
+
+    client.post(f'/api/loads/{project_id}/run')
+    load = wait_for_load(client, project_id)
+    assert load['status'] == 'completed', load['error']
+    assert (load['rowsRead'], load['rowsWritten']) == (3, 3)
+    assert (load['watermark'], load['watermarkType']) == ('3', 'int')
+
+    source.execute("UPDATE users SET name = 'bobby', version = 4 WHERE id = 2")
+    source.execute("INSERT INTO users VALUES (4, 'di', 5)")
+    source.commit()
+    client.post(f'/api/loads/{project_id}/run')
+    load = wait_for_load(client, project_id)
+    assert load['status'] == 'completed', load['error']
+    # Rows at or after the old mark: 3 again (an upsert), then the two changed ones
+    assert load['rowsRead'] == 3
+    assert load['watermark'] == '5'
+    assert target.execute('SELECT id, name, version FROM copy ORDER BY id').fetchall() == [
+        (1, 'ann', 1), (2, 'bobby', 4), (3, 'cy', 3), (4, 'di', 5),
+    ]
+
+    client.post(f'/api/loads/{project_id}/run', json={'full': True})
+    load = wait_for_load(client, project_id)
+    assert (load['rowsRead'], load['watermark']) == (4, '5')
+
+    # A new watermark column makes the stored mark meaningless
+    response = client.patch(f'/api/loads/{project_id}', json={'watermarkColumn': 'id'})
+    assert response.status_code == 200, response.json
+    assert client.get(f'/api/loads/{project_id}').json['watermark'] is None
+    source.close()
+    target.close()
@@ -0,0 +1,133 @@
+"""
+Pipeline runs: ordering, critical path and admission of parallel nodes
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from api import pipeline_runner
+from api.pipeline_runner import PipelineGraph, critical_path, remaining_work
+from api.scheduler import QueryScheduler
+
+
+def create_project(client, directory_id: str, name: str, sql: str) -> str:
+    project_id = client.post('/api/editor/projects', json={'name': name, 'parentId': directory_id}).json['id']
+    client.put(f'/api/editor/projects/{project_id}/details', json={'sql': sql})
+    return project_id
+
+
+def graph_of(names: str, edges: list) -> PipelineGraph:
+    """
+    Graph over projects whose ids are their names; edges are (upstream, downstream)
+    """
+    graph = PipelineGraph([SimpleNamespace(id=name, name=name) for name in names], {})
+    for upstream, downstream in edges:
+        graph.add_edge(upstream, downstream)
+    return graph
+
+
+def wait_for_run(client, run_id: str) -> dict:
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        run = client.get(f'/api/pipelines/runs/{run_id}').json
+        if run['status'] in ('succeeded', 'failed'):
+            return run
+        time.sleep(0.05)
+    raise AssertionError('pipeline run did not finish')
+
+
+def test_ready_nodes_beyond_user_limit_wait_for_slots(client, sqlite_connection, monkeypatch):
+    # Two slots per user and a wait deadline shorter than one node
+    monkeypatch.setattr(pipeline_runner, 'query_scheduler', QueryScheduler(4, 2, 1, 32, 0.2))
+    lock = threading.Lock()
+    running = {'now': 0, 'peak': 0}
+
+    def slow_script(connection, sql):
+        with lock:
+            running['now'] += 1
+            running['peak'] = max(running['peak'], running['now'])
+        time.sleep(0.4)
+        with lock:
+            running['now'] -= 1
+        return 0
+
+    monkeypatch.setattr(pipeline_runner, 'execute_script', slow_script)
+    directory_id = client.post('/api/editor/directories', json={'name': 'etl'}).json['id']
+    for name in 'abcde':
+        create_project(client, directory_id, name, 'SELECT 1')
+
+    response = client.post('/api/pipelines/runs', json={
+        'directoryId': directory_id, 'connectionId': sqlite_connection, 'maxWorkers': 4, 'connectionLimit': 4,
+    })
+    assert response.status_code == 202, response.json
+    run = wait_for_run(client, response.json['id'])
+
+    assert run['status'] == 'succeeded', [node['error'] for node in run['nodes']]
+    assert run['succeeded'] == 5
+    # Bounded by the scheduler's batch slots of the connection (4 - 1 reserved), not the user limit
+    assert running['peak'] == 3
+
+
+def test_order_is_topological_with_ties_by_name():
+    graph = graph_of('abcde', [('d', 'a'), ('c', 'a'), ('e', 'b')])
+    assert graph.order() == ['c', 'd', 'a', 'e', 'b']
+
+
+def test_cycle_is_reported_by_project_name():
+    graph = graph_of('abcd', [('a', 'b'), ('b', 'c'), ('c', 'a'), ('c', 'd')])
+    with pytest.raises(ValueError) as error:
+        graph.order()
+    assert str(error.value) == '存在循环依赖: a -> b -> c -> a'
+
+
+def test_critical_path_follows_the_slowest_chain():
+    #  a(1) -> b(5) -> d(1)
+    #  a(1) -> c(2) -> d(1)
+    #  e(6)
+    graph = graph_of('abcde', [('a', 'b'), ('a', 'c'), ('b', 'd'), ('c', 'd')])
+    durations = {'a': 1.0, 'b': 5.0, 'c': 2.0, 'd': 1.0, 'e': 6.0}
+    order = graph.order()
+    assert critical_path(order, graph.upstream, durations) == (['a', 'b', 'd'], 7.0)
+    assert critical_path([], {}, {}) == ([], 0.0)
+
+
+def test_remaining_work_ranks_nodes_by_the_chain_they_start():
+    graph = graph_of('abcde', [('a', 'b'), ('a', 'c'), ('b', 'd'), ('c', 'd')])
+    # e has no history and is estimated at DEFAULT_ESTIMATE
+    levels = remaining_work(graph.order(), graph.downstream, {'a': 1.0, 'b': 5.0, 'c': 2.0, 'd': 1.0})
+    assert levels == {'a': 7.0, 'b': 6.0, 'c': 3.0, 'd': 1.0, 'e': pipeline_runner.DEFAULT_ESTIMATE}
+
+
+def test_longest_chain_starts_first_and_failures_block_descendants(client, sqlite_connection, monkeypatch):
+    started = []
+
+    def record_script(connection, sql):
+        started.append(sql)
+        if sql == 'SELECT 3':
+            raise RuntimeError('boom')
+        return 0
+
+    monkeypatch.setattr(pipeline_runner, 'execute_script', record_script)
+    directory_id = client.post('/api/editor/directories', json={'name': 'etl'}).json['id']
+    alone = create_project(client, directory_id, 'a', 'SELECT 0')
+    chain = [create_project(client, directory_id, f'z{index}', f'SELECT {index}') for index in range(1, 5)]
+    for upstream, downstream in zip(chain, chain[1:]):
+        response = client.put(f'/api/pipelines/dependencies/{downstream}', json={'dependsOn': [upstream]})
+        assert response.status_code == 200, response.json
+
+    response = client.post('/api/pipelines/runs', json={
+        'directoryId': directory_id, 'connectionId': sqlite_connection, 'maxWorkers': 1,
+    })
+    run = wait_for_run(client, response.json['id'])
+
+    # Name order would start with a; the chain has more work left behind each of its nodes
+    assert started == ['SELECT 1', 'SELECT 2', 'SELECT 3', 'SELECT 0']
+    assert run['status'] == 'failed'
+    assert (run['succeeded'], run['failed'], run['blocked']) == (3, 1, 1)
+    nodes = {node['projectId']: node for node in run['nodes']}
+    assert nodes[chain[3]]['status'] == 'blocked'
+    assert nodes[chain[1]]['dependsOn'] == [chain[0]]
+    assert run['criticalPath'][0] == chain[0]
+    assert alone in nodes
@@ -0,0 +1,60 @@
+"""
+Revision deltas and rebuilding versions from snapshots
+"""
+import pytest
+
+from models.project_revision import LINE_DIFF_THRESHOLD, apply_delta, compute_delta
+
+
+@pytest.mark.parametrize('old, new', [
+    ('SELECT 1', 'SELECT 1'),
+    ('', 'SELECT 1'),
+    ('SELECT 1', ''),
+    ('SELECT id FROM orders', 'SELECT id, amount FROM orders'),
+    ('SELECT a FROM t WHERE x', 'SELECT b FROM t WHERE y'),
+])
+def test_small_changes_round_trip(old, new):
+    delta = compute_delta(old, new)
+    assert apply_delta(old, delta) == new
+    assert len(delta) <= 1
+
+
+def test_unchanged_text_has_an_empty_delta():
+    assert compute_delta('SELECT 1', 'SELECT 1') == []
+
+
+def test_large_changes_are_diffed_by_line():
+    lines = [f'SELECT {index} AS column_{index} FROM table_{index}\n' for index in range(400)]
+    old = ''.join(lines)
+    assert len(old) > LINE_DIFF_THRESHOLD
+    new_lines = list(lines)
+    new_lines[10] = 'SELECT changed\n'
+    new_lines[390] = 'SELECT also_changed\n'
+    new = ''.join(new_lines)
+
+    delta = compute_delta(old, new)
+    assert apply_delta(old, delta) == new
+    # Only the two edited lines are stored, not everything between them
+    assert len(delta) == 2
+    assert sum(len(text) for _, _, text in delta) <= len('SELECT changed\n') + len('SELECT also_changed\n')
+
+
+def test_every_version_is_rebuilt_across_snapshots(app, monkeypatch):
+    monkeypatch.setenv('REVISION_SNAPSHOT_INTERVAL', '3')
+    from models import ProjectRevision, db
+    from models.project_revision import record_revision, revision_content
+
+    versions = {1: 'SELECT 1'}
+    with app.app_context():
+        record_revision('project', 1, versions[1])
+        for version in range(2, 10):
+            versions[version] = versions[version - 1] + f' UNION ALL SELECT {version}'
+            record_revision('project', version, versions[version], (version - 1, versions[version - 1]))
+        db.session.commit()
+
+        kinds = dict(db.session.query(ProjectRevision.version, ProjectRevision.kind).all())
+        assert kinds[1] == 'snapshot'
+        assert list(kinds.values()).count('snapshot') >= 3
+        for version, content in versions.items():
+            assert revision_content('project', version) == content
+        assert revision_content('project', 10) is None
@@ -0,0 +1,37 @@
+"""
+Spilled query results read back as the inline JSON response shows them
+"""
+import decimal
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+
+from api import result_store
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('RESULT_STORE_DIR', str(tmp_path))
+
+
+def inline_value(value):
+    # execute_sql's conversion of driver values for the JSON response
+    return value if value is None or isinstance(value, (int, float, str, bool)) else str(value)
+
+
+def test_decimal_round_trip_keeps_precision():
+    rows = [(index, decimal.Decimal('12345678901234567.89') + index) for index in range(1500)]
+    result_id = result_store.spill_rows(['id', 'amount'], rows)
+
+    table = result_store.open_result(result_id)
+    assert table.schema.field('amount').type == pa.decimal128(38, 2)
+    page = result_store.table_to_rows(table.slice(1000, 2))
+    assert page == [[inline_value(value) for value in rows[index]] for index in (1000, 1001)]
+    assert page[0][1] == '12345678901235567.89'
+
+
+def test_decimals_of_mixed_scale_are_stored_as_text():
+    rows = [(decimal.Decimal('1.5'),), (decimal.Decimal('2.25'),)]
+    table = result_store.open_result(result_store.spill_rows(['amount'], rows))
+    assert result_store.table_to_rows(table) == [['1.5'], ['2.25']]
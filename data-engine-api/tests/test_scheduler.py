@@ -0,0 +1,188 @@
+"""
+Query admission: slot accounting, queueing and the endpoints that take slots
+"""
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from api import scheduler
+from api.scheduler import AdmissionCancelled, AdmissionRejected, QueryScheduler
+
+
+@pytest.fixture
+def small_scheduler(monkeypatch):
+    # One slot per connection, nothing reserved, short waits
+    instance = QueryScheduler(1, 2, 0, 32, 0.1)
+    monkeypatch.setattr(scheduler, 'query_scheduler', instance)
+    return instance
+
+
+def create_sqlite_connection(client, path, name: str) -> str:
+    database = sqlite3.connect(path)
+    database.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, amount NUMERIC)')
+    database.close()
+    response = client.post('/api/database/connections', json={'name': name, 'dbType': 'sqlite', 'database': str(path)})
+    return response.json['id']
+
+
+def test_schema_diff_takes_a_slot_on_both_connections(client, tmp_path, small_scheduler):
+    source = create_sqlite_connection(client, tmp_path / 'source.db', 'source')
+    target = create_sqlite_connection(client, tmp_path / 'target.db', 'target')
+    body = {'source': {'connectionId': source}, 'target': {'connectionId': target}}
+
+    busy = small_scheduler.acquire(target, 'someone-else', 'interactive')
+    response = client.post('/api/database/schema-diff', json=body)
+    assert response.status_code == 429
+    assert response.headers['Retry-After']
+    busy.release()
+
+    response = client.post('/api/database/schema-diff', json=body)
+    assert response.status_code == 200, response.json
+    assert 'X-Queue-Wait' in response.headers
+    assert small_scheduler.stats()['connections'] == {}
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    instance = QueryScheduler(1, 2, 0, 32, 30)
+    busy = instance.acquire('db', 'someone-else', 'interactive')
+    cancelled = threading.Event()
+    outcome = {}
+
+    def wait_for_slot():
+        try:
+            instance.acquire('db', 'me', 'interactive', cancelled=cancelled)
+        except AdmissionCancelled:
+            outcome['cancelled'] = time.monotonic()
+
+    waiter = threading.Thread(target=wait_for_slot)
+    waiter.start()
+    time.sleep(0.05)
+    assert instance.stats()['queueLength'] == 1
+    cancelled.set()
+    started = time.monotonic()
+    waiter.join(2)
+
+    assert outcome['cancelled'] - started < 1
+    assert instance.stats()['queueLength'] == 0
+    assert instance.stats()['cancelled'] == 1
+    busy.release()
+    # The slot went back to the pool, not to the cancelled request
+    assert instance.stats()['connections'] == {}
+
+
+
+def queue_behind(instance, connection_id, user, priority, order):
+    """
+    Start a request that records its user when admitted and releases at once
+    Returns after the request has joined the queue
+    """
+    queued = instance.stats()['queueLength']
+
+    def run():
+        ticket = instance.acquire(connection_id, user, priority)
+        order.append(user)
+        ticket.release()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while instance.stats()['queueLength'] == queued:
+        time.sleep(0.005)
+    return thread
+
+
+def test_waiters_are_granted_in_class_order_then_fifo():
+    instance = QueryScheduler(1, 10, 0, 32, 30)
+    busy = instance.acquire('db', 'holder', 'interactive')
+    order = []
+    threads = [
+        queue_behind(instance, 'db', 'batch-1', 'batch', order),
+        queue_behind(instance, 'db', 'metadata-1', 'metadata', order),
+        queue_behind(instance, 'db', 'interactive-1', 'interactive', order),
+        queue_behind(instance, 'db', 'interactive-2', 'interactive', order),
+    ]
+    assert instance.stats()['connections']['db']['queued'] == {'interactive': 2, 'metadata': 1, 'batch': 1}
+
+    busy.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == ['interactive-1', 'interactive-2', 'metadata-1', 'batch-1']
+    assert instance.stats()['connections'] == {}
+
+
+def test_batch_work_leaves_the_interactive_reserve_free():
+    instance = QueryScheduler(2, 10, 1, 32, 0.1)
+    export = instance.acquire('db', 'exporter', 'batch')
+    with pytest.raises(AdmissionRejected):
+        instance.acquire('db', 'exporter-2', 'batch')
+    interactive = instance.acquire('db', 'analyst', 'interactive')
+    assert instance.stats()['connections']['db']['running'] == 2
+    assert instance.stats()['connections']['db']['runningBatch'] == 1
+    assert instance.stats()['timedOut'] == 1
+    export.release()
+    interactive.release()
+
+
+def test_user_limit_spans_connections_but_not_metadata():
+    instance = QueryScheduler(4, 2, 0, 32, 0.1)
+    tickets = [instance.acquire('first', 'me', 'interactive'), instance.acquire('second', 'me', 'interactive')]
+    with pytest.raises(AdmissionRejected):
+        instance.acquire('third', 'me', 'interactive')
+    # Catalog browsing and other users are not held back by my queries
+    tickets.append(instance.acquire('third', 'me', 'metadata'))
+    tickets.append(instance.acquire('third', 'someone-else', 'interactive'))
+    for ticket in tickets:
+        ticket.release()
+    assert instance.running_users == {}
+
+
+def test_background_work_is_not_counted_for_the_user_and_waits_past_max_wait():
+    instance = QueryScheduler(1, 1, 0, 32, 0.05)
+    busy = instance.acquire('db', 'me', 'interactive')
+    order = []
+    thread = threading.Thread(target=lambda: order.append(instance.acquire('db', 'me', 'batch', background=True)))
+    thread.start()
+    time.sleep(0.2)
+    assert order == []
+    assert instance.stats()['queueLength'] == 1
+    busy.release()
+    thread.join(1)
+    (ticket,) = order
+    assert instance.running_users == {}
+    ticket.release()
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    instance = QueryScheduler(1, 10, 0, 1, 30)
+    busy = instance.acquire('db', 'holder', 'interactive')
+    order = []
+    thread = queue_behind(instance, 'db', 'waiting', 'interactive', order)
+    with pytest.raises(AdmissionRejected) as error:
+        instance.acquire('db', 'one-too-many', 'interactive')
+    assert error.value.retry_after >= 1
+    assert instance.stats()['rejected'] == 1
+    # A different class has its own queue
+    other = queue_behind(instance, 'db', 'browsing', 'metadata', order)
+    busy.release()
+    thread.join(2)
+    other.join(2)
+    assert order == ['waiting', 'browsing']
+
+
+def test_acquire_all_counts_the_user_once_and_is_all_or_nothing(monkeypatch):
+    instance = QueryScheduler(1, 1, 0, 32, 0.1)
+    monkeypatch.setattr(scheduler, 'query_scheduler', instance)
+
+    tickets = scheduler.acquire_all(['b', 'a', 'b'], 'me', 'interactive')
+    assert [ticket.waiter.connection_id for ticket in tickets] == ['a', 'b']
+    assert instance.running_users == {'me': 1}
+    for ticket in tickets:
+        ticket.release()
+
+    busy = instance.acquire('b', 'someone-else', 'interactive')
+    with pytest.raises(AdmissionRejected):
+        scheduler.acquire_all(['a', 'b'], 'me', 'interactive')
+    # The slot already taken on `a` was handed back
+    assert set(instance.stats()['connections']) == {'b'}
+    busy.release()
@@ -0,0 +1,41 @@
+"""
+Table and column extraction of the SQL usage index
+"""
+import pytest
+
+from models.sql_parser import analyze_sql
+
+
+def tables_of(sql: str) -> dict:
+    return {name: sorted(usage['access']) for name, usage in analyze_sql(sql)['tables'].items()}
+
+
+@pytest.mark.parametrize('sql', [
+    'SELECT EXTRACT(YEAR FROM ts) FROM events',
+    'SELECT SUBSTRING(ts FROM 2 FOR 3) FROM events',
+    "SELECT TRIM(BOTH ' ' FROM ts) FROM events",
+    'SELECT * FROM events WHERE ts IS DISTINCT FROM previous_ts',
+    'SELECT * FROM events WHERE ts IS NOT DISTINCT FROM previous_ts',
+])
+def test_from_inside_expressions_is_not_a_table(sql):
+    assert tables_of(sql) == {'events': ['read']}
+
+
+def test_extract_records_columns_not_fields():
+    assert analyze_sql('SELECT EXTRACT(YEAR FROM ts) FROM events')['tables']['events']['columns'] == {'ts'}
+
+
+def test_subquery_inside_function_arguments_is_read():
+    sql = 'SELECT COALESCE((SELECT MAX(id) FROM orders), 0), EXTRACT(EPOCH FROM NOW()) FROM events'
+    assert tables_of(sql) == {'orders': ['read'], 'events': ['read']}
+
+
+def test_reads_and_writes():
+    sql = 'INSERT INTO daily (day, total) SELECT CAST(ts AS date), SUM(amount) FROM events e ' \
+          'JOIN accounts a ON a.id = e.account_id GROUP BY 1'
+    assert tables_of(sql) == {'daily': ['write'], 'events': ['read'], 'accounts': ['read']}
+
+
+def test_ctes_and_table_functions_are_not_tables():
+    sql = 'WITH recent AS (SELECT * FROM events) SELECT * FROM recent JOIN generate_series(1, 3) g ON true'
+    assert tables_of(sql) == {'events': ['read']}
@@ -0,0 +1,44 @@
+"""
+Range patches in UTF-16 offsets
+"""
+import pytest
+
+from api.text_patch import apply_text_patches
+
+
+def test_patches_refer_to_the_base_text():
+    base = 'SELECT * FROM orders'
+    patches = [{'start': 7, 'end': 8, 'text': 'id, amount'}, {'start': 14, 'end': 20, 'text': 'sales.orders'}]
+    assert apply_text_patches(base, patches) == 'SELECT id, amount FROM sales.orders'
+
+
+def test_insert_without_end_and_empty_patch_list():
+    assert apply_text_patches('SELECT 1', [{'start': 8, 'text': ' AS one'}]) == 'SELECT 1 AS one'
+    assert apply_text_patches('SELECT 1', []) == 'SELECT 1'
+
+
+def test_offsets_count_astral_characters_as_two_units():
+    base = "SELECT '😀' AS face, 1"
+    # JavaScript: base.indexOf('1') === 21, one more than the Python index
+    assert apply_text_patches(base, [{'start': 21, 'end': 22, 'text': '2'}]) == "SELECT '😀' AS face, 2"
+
+
+@pytest.mark.parametrize('patches', [
+    [{'start': 5, 'end': 3, 'text': ''}],
+    [{'start': 0, 'end': 99, 'text': ''}],
+    [{'start': 4, 'end': 6, 'text': ''}, {'start': 2, 'end': 3, 'text': ''}],
+    [{'start': 0, 'end': 4, 'text': ''}, {'start': 3, 'end': 5, 'text': ''}],
+    [{'start': '1', 'text': ''}],
+    [{'start': True, 'text': ''}],
+    [{'start': 0, 'text': 5}],
+    ['not a patch'],
+    {'start': 0},
+])
+def test_malformed_patches_are_rejected(patches):
+    with pytest.raises(ValueError):
+        apply_text_patches('SELECT 1', patches)
+
+
+def test_offset_inside_a_surrogate_pair_is_rejected():
+    with pytest.raises(ValueError):
+        apply_text_patches("'😀'", [{'start': 2, 'end': 2, 'text': 'x'}])
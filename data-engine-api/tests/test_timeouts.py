@@ -0,0 +1,21 @@
+"""
+Effective statement timeouts
+"""
+from api.timeouts import resolve_statement_timeout
+
+
+def test_background_work_defaults_to_no_limit(monkeypatch):
+    monkeypatch.delenv('STATEMENT_TIMEOUT', raising=False)
+    monkeypatch.delenv('BATCH_STATEMENT_TIMEOUT', raising=False)
+    monkeypatch.delenv('STATEMENT_TIMEOUT_MAX', raising=False)
+    assert resolve_statement_timeout() == 300
+    assert resolve_statement_timeout(batch=True) == 0
+    # A timeout configured on the connection applies to background work as well
+    assert resolve_statement_timeout(60, batch=True) == 60
+
+
+def test_cap_applies_to_background_work(monkeypatch):
+    monkeypatch.setenv('STATEMENT_TIMEOUT_MAX', '900')
+    monkeypatch.delenv('BATCH_STATEMENT_TIMEOUT', raising=False)
+    assert resolve_statement_timeout(batch=True) == 900
+    assert resolve_statement_timeout(3600, batch=True) == 900
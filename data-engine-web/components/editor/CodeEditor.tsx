@@ -8,7 +8,7 @@ import CodeMirror from '@uiw/react-codemirror';
 import { sql } from '@codemirror/lang-sql';
 import { oneDark } from '@codemirror/theme-one-dark';
 import { format } from 'sql-formatter';
-import { saveProjectSQL, getFileItem } from '@/lib/api/files';
+import { saveProjectSQL, getFileItem, isSqlVersionConflict } from '@/lib/api/files';
 import { executeSQL } from '@/lib/api/database';
 import { DEFAULT_FILE_PATH } from '@/constants';
 
@@ -143,7 +143,18 @@ export function CodeEditor() {
       setIsSaving(true);
       // 先同步到 Context，确保保存最新内容
       setCodeContent(localContent);
-      await saveProjectSQL(selectedFile, localContent);
+      try {
+        await saveProjectSQL(selectedFile, localContent);
+      } catch (error) {
+        if (!isSqlVersionConflict(error)) {
+          throw error;
+        }
+        // 其他人已修改并保存了这个项目：由用户决定是否覆盖
+        if (!confirm(`该项目的 SQL 已被其他人修改（服务器版本 ${error.currentVersion}）。\n确定用当前编辑器中的内容覆盖吗？`)) {
+          return;
+        }
+        await saveProjectSQL(selectedFile, localContent, error.currentVersion);
+      }
       alert('SQL保存成功');
     } catch (error) {
       console.error('Failed to save SQL:', error);
@@ -11,6 +11,7 @@ export interface DatabaseConnection {
   password?: string; // 仅在创建/更新时使用
   connectionString?: string;
   description?: string;
+  statementTimeout?: number | null; // 语句超时（秒），为空时使用服务端默认值
   createdAt?: string;
   updatedAt?: string;
 }
@@ -144,14 +145,15 @@ export interface ExecuteSQLResult {
 
 export function executeSQL(
   connectionId: string,
-  sql: string
+  sql: string,
+  timeout?: number
 ): Promise<ExecuteSQLResult> {
   return fetch(`${API_BASE_URL}/database/connections/${connectionId}/execute`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
     },
-    body: JSON.stringify({ sql }),
+    body: JSON.stringify(timeout ? { sql, timeout } : { sql }),
   })
     .then(response => {
       if (!response.ok) {
@@ -213,6 +215,39 @@ export function getTables(
 }
 
 // 表结构列信息
+export interface TableStats {
+  estimatedRows: number | null;
+  dataSize: number | null;
+  indexSize: number | null;
+  totalSize: number | null;
+}
+
+// 获取表列表及目录统计（估计行数和大小，不执行 COUNT(*)）
+export function getTablesWithStats(
+  connectionId: string,
+  database?: string,
+  schema?: string
+): Promise<{ tables: string[]; stats: Record<string, TableStats> }> {
+  const params = new URLSearchParams({ stats: 'true' });
+  if (database) params.append('database', database);
+  if (schema) params.append('schema', schema);
+  
+  return fetch(`${API_BASE_URL}/database/connections/${connectionId}/tables?${params.toString()}`)
+    .then(response => {
+      if (!response.ok) {
+        return response.json().then(err => {
+          throw new Error(err.error || `HTTP error! status: ${response.status}`);
+        });
+      }
+      return response.json();
+    })
+    .then(data => ({ tables: data.tables || [], stats: data.stats || {} }))
+    .catch(error => {
+      console.error('Failed to fetch table stats:', error);
+      throw error;
+    });
+}
+
 export interface TableColumn {
   field: string;
   type: string;
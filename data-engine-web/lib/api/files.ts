@@ -5,9 +5,17 @@ export interface ProjectDetails {
   requirementDescription?: string; // 需求描述
   requester?: string; // 需求方
   sql?: string; // SQL内容
+  sqlVersion?: number; // SQL内容版本号，每次保存递增
   creator?: string; // 创建人
 }
 
+// SQL增量补丁：用 text 替换基准内容中 [start, end) 的部分（UTF-16 偏移，即 JS 字符串下标）
+export interface SqlPatch {
+  start: number;
+  end: number;
+  text: string;
+}
+
 export interface FileItem {
   id: string;
   name: string;
@@ -24,10 +32,6 @@ export interface FileItem {
 // API 基础 URL
 const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
 
-// 临时保留用于尚未迁移到 API 的函数
-const STORAGE_KEY = 'workspace_files';
-const initialData: FileItem[] = [];
-
 // 获取所有文件和目录
 export function getFiles(): Promise<FileItem[]> {
   return fetch(`${API_BASE_URL}/editor/files`)
@@ -161,25 +165,29 @@ export function updateItemName(itemId: string, name: string): Promise<void> {
     });
 }
 
-// 删除文件/目录
+// 删除文件/目录（目录会连同其下所有子目录和项目一起删除）
 export function deleteItem(itemId: string): Promise<void> {
-  return new Promise((resolve, reject) => {
-    if (typeof window === 'undefined') {
-      reject(new Error('此功能仅在客户端可用'));
-      return;
-    }
-
-    const stored = localStorage.getItem(STORAGE_KEY);
-    const data = stored ? JSON.parse(stored) : initialData;
+  // 服务端生成的ID带有类型前缀：目录为 dir_，项目为 file_
+  const resource = itemId.startsWith('dir_') ? 'directories' : 'projects';
 
-    const removed = removeItemById(data, itemId);
-    if (removed) {
-      localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
-      resolve();
-    } else {
-      reject(new Error('项目不存在'));
-    }
-  });
+  return fetch(`${API_BASE_URL}/editor/${resource}/${itemId}`, {
+    method: 'DELETE',
+  })
+    .then(response => {
+      if (!response.ok) {
+        return response.json().then(err => {
+          throw new Error(err.error || `HTTP error! status: ${response.status}`);
+        });
+      }
+      return response.json();
+    })
+    .then(() => {
+      // 删除成功，不需要返回值
+    })
+    .catch(error => {
+      console.error('Failed to delete item:', error);
+      throw error;
+    });
 }
 
 // 辅助函数：根据ID查找项目
@@ -198,21 +206,6 @@ function findItemById(items: FileItem[], id: string): FileItem | null {
   return null;
 }
 
-// 辅助函数：根据ID删除项目
-function removeItemById(items: FileItem[], id: string): boolean {
-  const index = items.findIndex(item => item.id === id);
-  if (index !== -1) {
-    items.splice(index, 1);
-    return true;
-  }
-  for (const item of items) {
-    if (item.children && removeItemById(item.children, id)) {
-      return true;
-    }
-  }
-  return false;
-}
-
 // 更新项目详情（需求名称、需求描述、需求方）
 export function updateProjectDetails(
   projectId: string,
@@ -242,9 +235,114 @@ export function updateProjectDetails(
     });
 }
 
-// 保存SQL内容
-export function saveProjectSQL(projectId: string, sql: string): Promise<void> {
-  return updateProjectDetails(projectId, { sql });
+// 每个项目最近一次保存到服务器的SQL和版本号，作为增量保存的基准
+const savedSQL = new Map<string, { version: number; content: string }>();
+
+function rememberSavedSQL(item: FileItem) {
+  if (item.type === 'file' && typeof item.projectDetails?.sqlVersion === 'number') {
+    savedSQL.set(item.id, { version: item.projectDetails.sqlVersion, content: item.projectDetails.sql ?? '' });
+  }
+}
+
+const isHighSurrogate = (code: number) => code >= 0xd800 && code <= 0xdbff;
+const isLowSurrogate = (code: number) => code >= 0xdc00 && code <= 0xdfff;
+
+// 计算从 base 到 next 的补丁：去掉公共前缀和后缀，剩下的部分作为一段替换
+export function diffText(base: string, next: string): SqlPatch[] {
+  if (base === next) {
+    return [];
+  }
+  const maxPrefix = Math.min(base.length, next.length);
+  let prefix = 0;
+  while (prefix < maxPrefix && base.charCodeAt(prefix) === next.charCodeAt(prefix)) {
+    prefix++;
+  }
+  let suffix = 0;
+  while (
+    suffix < maxPrefix - prefix &&
+    base.charCodeAt(base.length - 1 - suffix) === next.charCodeAt(next.length - 1 - suffix)
+  ) {
+    suffix++;
+  }
+  // 不在代理对（surrogate pair）中间切开
+  if (prefix > 0 && isHighSurrogate(base.charCodeAt(prefix - 1))) {
+    prefix--;
+  }
+  if (suffix > 0 && isLowSurrogate(base.charCodeAt(base.length - suffix))) {
+    suffix--;
+  }
+  return [{ start: prefix, end: base.length - suffix, text: next.slice(prefix, next.length - suffix) }];
+}
+
+// 增量保存SQL：只发送相对 baseVersion 的修改，返回新的版本号；版本冲突时抛出 status 为 409 的错误
+export function patchProjectSQL(
+  projectId: string,
+  baseVersion: number,
+  patches: SqlPatch[]
+): Promise<number> {
+  return fetch(`${API_BASE_URL}/editor/projects/${projectId}/sql`, {
+    method: 'PATCH',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ baseVersion, patches }),
+  })
+    .then(response => {
+      if (!response.ok) {
+        return response.json().then(err => {
+          throw Object.assign(new Error(err.error || `HTTP error! status: ${response.status}`), {
+            status: response.status,
+            currentVersion: err.currentVersion,
+          });
+        });
+      }
+      return response.json();
+    })
+    .then(result => result.sqlVersion as number);
+}
+
+// 服务器上的 SQL 已被其他人修改：currentVersion 为服务器上的版本
+export type SqlVersionConflict = Error & { status: 409; currentVersion: number };
+
+export function isSqlVersionConflict(error: unknown): error is SqlVersionConflict {
+  return error instanceof Error && (error as { status?: number }).status === 409;
+}
+
+// 保存SQL内容：已知服务器上的版本时只发送修改部分，否则整体保存。
+// 版本冲突时抛出 SqlVersionConflict，不覆盖其他人的修改；用户确认覆盖后以 overwriteVersion
+// （冲突时服务器返回的 currentVersion）再次保存，期间若又有新的修改仍会冲突
+export async function saveProjectSQL(projectId: string, sql: string, overwriteVersion?: number): Promise<void> {
+  const saved = savedSQL.get(projectId);
+  if (saved && overwriteVersion === undefined) {
+    try {
+      const version = await patchProjectSQL(projectId, saved.version, diffText(saved.content, sql));
+      savedSQL.set(projectId, { version, content: sql });
+      return;
+    } catch (error) {
+      if (!isSqlVersionConflict(error)) {
+        console.error('Failed to patch project SQL:', error);
+      }
+      throw error;
+    }
+  }
+  const response = await fetch(`${API_BASE_URL}/editor/projects/${projectId}/details`, {
+    method: 'PUT',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify(overwriteVersion === undefined ? { sql } : { sql, sqlVersion: overwriteVersion }),
+  });
+  const result = await response.json();
+  if (!response.ok) {
+    if (response.status !== 409) {
+      console.error('Failed to save project SQL:', result);
+    }
+    throw Object.assign(new Error(result.error || `HTTP error! status: ${response.status}`), {
+      status: response.status,
+      currentVersion: result.currentVersion,
+    });
+  }
+  rememberSavedSQL(result);
 }
 
 // 移动项目到不同目录
@@ -275,6 +373,81 @@ export function moveProject(projectId: string, targetParentId?: string): Promise
     });
 }
 
+// 批量操作（创建/移动/重命名/删除）
+export type BatchOperation =
+  | { op: 'createDirectory'; name: string; parentId?: string | null; tempId?: string }
+  | { op: 'createProject'; name: string; parentId?: string | null; creator?: string }
+  | { op: 'move'; type: 'file' | 'directory'; id: string; targetParentId?: string | null }
+  | { op: 'rename'; type: 'file' | 'directory'; id: string; name: string }
+  | { op: 'delete'; type: 'file' | 'directory'; id: string };
+
+export interface BatchOperationResult {
+  index: number;
+  op?: string;
+  success: boolean;
+  id?: string;
+  error?: string;
+}
+
+export interface BatchResponse {
+  results: BatchOperationResult[];
+  succeeded: number;
+  failed: number;
+}
+
+export function batchOperations(
+  operations: BatchOperation[],
+  atomic = false
+): Promise<BatchResponse> {
+  return fetch(`${API_BASE_URL}/editor/batch`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({ operations, atomic }),
+  })
+    .then(response => {
+      if (!response.ok) {
+        return response.json().then(err => {
+          throw new Error(err.error || `HTTP error! status: ${response.status}`);
+        });
+      }
+      return response.json();
+    })
+    .catch(error => {
+      console.error('Failed to apply batch operations:', error);
+      throw error;
+    });
+}
+
+// 移动目录（连同整个子树）到不同目录
+export function moveDirectory(directoryId: string, targetParentId?: string): Promise<void> {
+  return fetch(`${API_BASE_URL}/editor/directories/${directoryId}/move`, {
+    method: 'PUT',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      targetParentId: targetParentId || null,
+    }),
+  })
+    .then(response => {
+      if (!response.ok) {
+        return response.json().then(err => {
+          throw new Error(err.error || `HTTP error! status: ${response.status}`);
+        });
+      }
+      return response.json();
+    })
+    .then(() => {
+      // 移动成功，不需要返回值
+    })
+    .catch(error => {
+      console.error('Failed to move directory:', error);
+      throw error;
+    });
+}
+
 // 获取项目详情
 export function getProjectDetails(projectId: string): Promise<ProjectDetails | null> {
   return getFiles()
@@ -369,6 +542,9 @@ export function getFileItem(itemId: string): Promise<FileItem | null> {
   return getFiles()
     .then(files => {
       const item = findItemById(files, itemId);
+      if (item) {
+        rememberSavedSQL(item);
+      }
       return item || null;
     })
     .catch(error => {
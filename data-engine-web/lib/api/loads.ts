@@ -0,0 +1,71 @@
+// 项目增量加载 API
+
+export interface IncrementalLoad {
+  projectId: string;
+  sourceConnectionId: string | null;
+  targetConnectionId: string | null;
+  targetSchema: string | null;
+  targetTable: string;
+  keyColumns: string[]; // 目标表上须有对应的主键或唯一索引
+  watermarkColumn: string; // 例如 updated_at
+  batchSize: number;
+  watermark: string | null; // 已加载的最大水位值
+  watermarkType: 'datetime' | 'date' | 'int' | 'float' | 'decimal' | 'str' | null;
+  status: 'idle' | 'pending' | 'running' | 'completed' | 'failed';
+  error: string | null;
+  rowsRead: number | null;
+  rowsWritten: number | null;
+  duration: number | null;
+  startedAt: string | null;
+  completedAt: string | null;
+  createdAt: string;
+  updatedAt: string;
+}
+
+export type IncrementalLoadInput = Pick<
+  IncrementalLoad,
+  'sourceConnectionId' | 'targetConnectionId' | 'targetTable' | 'keyColumns' | 'watermarkColumn'
+> &
+  Partial<Pick<IncrementalLoad, 'targetSchema' | 'batchSize'>>;
+
+// API 基础 URL
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
+
+function request<T>(path: string, init?: RequestInit): Promise<T> {
+  return fetch(`${API_BASE_URL}/loads${path}`, {
+    ...init,
+    headers: init?.body ? { 'Content-Type': 'application/json' } : undefined,
+  }).then(response => {
+    if (!response.ok) {
+      return response.json().then(err => {
+        throw new Error(err.error || `HTTP error! status: ${response.status}`);
+      });
+    }
+    return response.json();
+  });
+}
+
+// 获取全部加载配置
+export function getLoads(): Promise<IncrementalLoad[]> {
+  return request<{ loads: IncrementalLoad[] }>('').then(data => data.loads);
+}
+
+// 获取项目的加载配置和最近一次加载状态
+export function getLoad(projectId: string): Promise<IncrementalLoad> {
+  return request<IncrementalLoad>(`/${projectId}`);
+}
+
+// 创建或替换项目的加载配置
+export function saveLoad(projectId: string, load: IncrementalLoadInput): Promise<IncrementalLoad> {
+  return request<IncrementalLoad>(`/${projectId}`, { method: 'PUT', body: JSON.stringify(load) });
+}
+
+// 删除加载配置（目标表中已加载的数据保留）
+export function deleteLoad(projectId: string): Promise<void> {
+  return request(`/${projectId}`, { method: 'DELETE' }).then(() => undefined);
+}
+
+// 后台执行加载，full 为 true 时忽略水位全量加载；通过 getLoad 轮询状态
+export function runLoad(projectId: string, full = false): Promise<IncrementalLoad> {
+  return request<IncrementalLoad>(`/${projectId}/run`, { method: 'POST', body: JSON.stringify({ full }) });
+}
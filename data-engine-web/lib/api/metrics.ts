@@ -1,109 +1,76 @@
-import { MetricCategory } from '@/types/metrics';
-
-// 从本地 JSON 文件读取数据（在客户端使用 localStorage，在服务端读取文件）
-const STORAGE_KEY = 'metrics_data';
-
-// 初始化数据
-const initialData = {
-  categories: [
-    {
-      id: 'cat_1',
-      name: '用户指标',
-      createdAt: '2024-01-15T10:00:00Z',
-      updatedAt: '2024-01-15T10:00:00Z',
-      metrics: [
-        {
-          id: 'metric_1',
-          name: '日活跃用户数',
-          description: '统计每日活跃用户数量',
-          status: 'active',
-          updatedAt: '2024-01-15',
-        },
-      ],
-    },
-    {
-      id: 'cat_2',
-      name: '业务指标',
-      createdAt: '2024-01-14T10:00:00Z',
-      updatedAt: '2024-01-14T10:00:00Z',
-      metrics: [
-        {
-          id: 'metric_2',
-          name: '订单转化率',
-          description: '计算订单转化率',
-          status: 'active',
-          updatedAt: '2024-01-14',
-        },
-        {
-          id: 'metric_3',
-          name: 'GMV',
-          description: '总交易额',
-          status: 'draft',
-          updatedAt: '2024-01-13',
-        },
-      ],
-    },
-  ],
-};
-
-// 获取所有指标目录
-export function getMetricsCategories(): Promise<MetricCategory[]> {
-  return new Promise((resolve) => {
-    if (typeof window === 'undefined') {
-      // 服务端：返回初始数据
-      resolve(initialData.categories as MetricCategory[]);
-      return;
-    }
-
-    // 客户端：从 localStorage 读取
-    const stored = localStorage.getItem(STORAGE_KEY);
-    if (stored) {
-      try {
-        const data = JSON.parse(stored);
-        resolve(data.categories || []);
-      } catch {
-        resolve(initialData.categories as MetricCategory[]);
-      }
-    } else {
-      // 首次使用，初始化 localStorage
-      localStorage.setItem(STORAGE_KEY, JSON.stringify(initialData));
-      resolve(initialData.categories as MetricCategory[]);
+import { Metric, MetricCategory, MetricMaterialization, MetricValues } from '@/types/metrics';
+
+// API 基础 URL
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
+
+// 旧版本保存在 localStorage 中的指标数据，首次连接服务端时导入
+const LEGACY_STORAGE_KEY = 'metrics_data';
+
+function request<T>(path: string, init?: RequestInit): Promise<T> {
+  return fetch(`${API_BASE_URL}/metrics${path}`, {
+    ...init,
+    headers: init?.body ? { 'Content-Type': 'application/json' } : undefined,
+  }).then(response => {
+    if (!response.ok) {
+      return response.json().then(err => {
+        throw new Error(err.error || `HTTP error! status: ${response.status}`);
+      });
     }
+    return response.json();
   });
 }
 
-// 添加新目录
-export function addMetricsCategory(name: string): Promise<MetricCategory> {
-  return new Promise((resolve, reject) => {
-    if (!name || name.trim() === '') {
-      reject(new Error('目录名称不能为空'));
-      return;
-    }
-
-    if (typeof window === 'undefined') {
-      reject(new Error('此功能仅在客户端可用'));
-      return;
+// 服务端指标库为空时，导入本浏览器 localStorage 中的旧数据（仅一次）
+async function importLegacyData(): Promise<boolean> {
+  if (typeof window === 'undefined') {
+    return false;
+  }
+  const stored = localStorage.getItem(LEGACY_STORAGE_KEY);
+  if (!stored) {
+    return false;
+  }
+  try {
+    const data = JSON.parse(stored);
+    if (!Array.isArray(data.categories) || data.categories.length === 0) {
+      return false;
     }
+    await request('/import', { method: 'POST', body: JSON.stringify({ categories: data.categories }) });
+    localStorage.removeItem(LEGACY_STORAGE_KEY);
+    return true;
+  } catch (error) {
+    console.error('Failed to import local metrics:', error);
+    return false;
+  }
+}
 
-    // 从 localStorage 读取现有数据
-    const stored = localStorage.getItem(STORAGE_KEY);
-    const data = stored ? JSON.parse(stored) : initialData;
-
-    // 创建新目录
-    const newCategory: MetricCategory = {
-      id: `cat_${Date.now()}`,
-      name: name.trim(),
-      metrics: [],
-    };
-
-    // 添加到列表
-    data.categories.push(newCategory);
+// 获取所有指标目录（浏览器通过 ETag 重新验证，未变化时服务端返回 304）
+export async function getMetricsCategories(): Promise<MetricCategory[]> {
+  let { categories } = await request<{ categories: MetricCategory[] }>('/library', { cache: 'no-cache' });
+  if (categories.length === 0 && (await importLegacyData())) {
+    ({ categories } = await request<{ categories: MetricCategory[] }>('/library', { cache: 'no-cache' }));
+  }
+  return categories;
+}
 
-    // 保存到 localStorage
-    localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
+// 搜索指标（名称和描述的子串匹配，多个词须全部命中）
+export function searchMetrics(
+  query: string,
+  options: { categoryId?: string; status?: Metric['status']; page?: number; pageSize?: number } = {}
+): Promise<{ metrics: Metric[]; total: number; page: number; pageSize: number }> {
+  const params = new URLSearchParams({ q: query });
+  if (options.categoryId) params.set('categoryId', options.categoryId);
+  if (options.status) params.set('status', options.status);
+  if (options.page) params.set('page', String(options.page));
+  if (options.pageSize) params.set('pageSize', String(options.pageSize));
+  return request(`?${params.toString()}`, { cache: 'no-cache' });
+}
 
-    resolve(newCategory);
-  });
+// 添加新目录
+export function addMetricsCategory(name: string): Promise<MetricCategory> {
+  if (!name || name.trim() === '') {
+    return Promise.reject(new Error('目录名称不能为空'));
+  }
+  return request<MetricCategory>('/categories', { method: 'POST', body: JSON.stringify({ name: name.trim() }) });
 }
 
 // 添加指标到目录
@@ -111,145 +78,93 @@ export function addMetricToCategory(
   categoryId: string,
   metric: { name: string; description: string }
 ): Promise<void> {
-  return new Promise((resolve) => {
-    if (typeof window === 'undefined') {
-      resolve();
-      return;
-    }
-
-    const stored = localStorage.getItem(STORAGE_KEY);
-    const data = stored ? JSON.parse(stored) : initialData;
-
-    const category = data.categories.find((cat: any) => cat.id === categoryId);
-    if (category) {
-      const newMetric = {
-        id: `metric_${Date.now()}`,
-        name: metric.name,
-        description: metric.description,
-        status: 'draft',
-        updatedAt: new Date().toISOString().split('T')[0],
-      };
-
-      category.metrics.push(newMetric);
-      category.updatedAt = new Date().toISOString();
-
-      localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
-    }
-
-    resolve();
-  });
+  return request('', {
+    method: 'POST',
+    body: JSON.stringify({ categoryId, name: metric.name, description: metric.description, status: 'draft' }),
+  }).then(() => undefined);
 }
 
 // 更新目录名称
 export function updateCategoryName(categoryId: string, name: string): Promise<void> {
-  return new Promise((resolve, reject) => {
-    if (!name || name.trim() === '') {
-      reject(new Error('目录名称不能为空'));
-      return;
-    }
-
-    if (typeof window === 'undefined') {
-      reject(new Error('此功能仅在客户端可用'));
-      return;
-    }
-
-    const stored = localStorage.getItem(STORAGE_KEY);
-    const data = stored ? JSON.parse(stored) : initialData;
-
-    const category = data.categories.find((cat: any) => cat.id === categoryId);
-    if (category) {
-      category.name = name.trim();
-      category.updatedAt = new Date().toISOString();
-      localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
-    }
-
-    resolve();
-  });
+  if (!name || name.trim() === '') {
+    return Promise.reject(new Error('目录名称不能为空'));
+  }
+  return request(`/categories/${categoryId}`, {
+    method: 'PUT',
+    body: JSON.stringify({ name: name.trim() }),
+  }).then(() => undefined);
 }
 
 // 更新指标名称
 export function updateMetricName(categoryId: string, metricId: string, name: string): Promise<void> {
-  return new Promise((resolve, reject) => {
-    if (!name || name.trim() === '') {
-      reject(new Error('指标名称不能为空'));
-      return;
-    }
-
-    if (typeof window === 'undefined') {
-      reject(new Error('此功能仅在客户端可用'));
-      return;
-    }
-
-    const stored = localStorage.getItem(STORAGE_KEY);
-    const data = stored ? JSON.parse(stored) : initialData;
-
-    const category = data.categories.find((cat: any) => cat.id === categoryId);
-    if (category && category.metrics) {
-      const metric = category.metrics.find((m: any) => m.id === metricId);
-      if (metric) {
-        metric.name = name.trim();
-        metric.updatedAt = new Date().toISOString().split('T')[0];
-        category.updatedAt = new Date().toISOString();
-        localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
-      }
-    }
-
-    resolve();
-  });
+  if (!name || name.trim() === '') {
+    return Promise.reject(new Error('指标名称不能为空'));
+  }
+  return request(`/${metricId}`, {
+    method: 'PUT',
+    body: JSON.stringify({ name: name.trim() }),
+  }).then(() => undefined);
 }
 
 // 创建临时目录（用于内联编辑）
 export function createTemporaryCategory(): Promise<MetricCategory> {
-  return new Promise((resolve) => {
-    if (typeof window === 'undefined') {
-      resolve({
-        id: `temp_cat_${Date.now()}`,
-        name: '新目录',
-        metrics: [],
-      });
-      return;
-    }
-
-    const newCategory: MetricCategory = {
-      id: `temp_cat_${Date.now()}`,
-      name: '新目录',
-      metrics: [],
-    };
-
-    resolve(newCategory);
+  return Promise.resolve({
+    id: `temp_cat_${Date.now()}`,
+    name: '新目录',
+    metrics: [],
   });
 }
 
 // 创建临时指标（用于内联编辑）
-export function createTemporaryMetric(categoryId: string): Promise<any> {
-  return new Promise((resolve) => {
-    const newMetric = {
-      id: `temp_metric_${Date.now()}`,
-      name: '新指标',
-      description: '',
-      status: 'draft' as const,
-      updatedAt: new Date().toISOString().split('T')[0],
-    };
-
-    resolve(newMetric);
+export function createTemporaryMetric(categoryId: string): Promise<Metric> {
+  return Promise.resolve({
+    id: `temp_metric_${Date.now()}`,
+    categoryId,
+    name: '新指标',
+    description: '',
+    status: 'draft' as const,
+    updatedAt: new Date().toISOString().split('T')[0],
   });
 }
 
-// 删除目录
+// 删除目录（连同其中的指标）
 export function deleteMetricsCategory(categoryId: string): Promise<void> {
-  return new Promise((resolve) => {
-    if (typeof window === 'undefined') {
-      resolve();
-      return;
-    }
+  return request(`/categories/${categoryId}`, { method: 'DELETE' }).then(() => undefined);
+}
 
-    const stored = localStorage.getItem(STORAGE_KEY);
-    if (stored) {
-      const data = JSON.parse(stored);
-      data.categories = data.categories.filter((cat: any) => cat.id !== categoryId);
-      localStorage.setItem(STORAGE_KEY, JSON.stringify(data));
-    }
+// 删除指标
+export function deleteMetric(metricId: string): Promise<void> {
+  return request(`/${metricId}`, { method: 'DELETE' }).then(() => undefined);
+}
+
+// 更新指标定义（定义 SQL、数据库连接、时间粒度、水位列变化时，已物化的值会被清除）
+export function updateMetricDefinition(
+  metricId: string,
+  definition: Pick<Metric, 'definitionSql' | 'connectionId' | 'timeGrain' | 'watermarkColumn'>
+): Promise<Metric> {
+  return request<Metric>(`/${metricId}`, {
+    method: 'PATCH',
+    body: JSON.stringify(definition),
+  });
+}
 
-    resolve();
+// 在后台物化新的时间分区（full 为 true 时重算全部分区）
+export function refreshMetric(metricId: string, full = false): Promise<MetricMaterialization> {
+  return request<MetricMaterialization>(`/${metricId}/refresh`, {
+    method: 'POST',
+    body: JSON.stringify({ full }),
   });
 }
+
+// 读取已物化的指标值（不访问源数据库）
+export function getMetricValues(
+  metricId: string,
+  options: { from?: string; to?: string; limit?: number } = {}
+): Promise<MetricValues> {
+  const params = new URLSearchParams();
+  if (options.from) params.set('from', options.from);
+  if (options.to) params.set('to', options.to);
+  if (options.limit) params.set('limit', String(options.limit));
+  const query = params.toString();
+  return request<MetricValues>(`/${metricId}/values${query ? `?${query}` : ''}`);
+}
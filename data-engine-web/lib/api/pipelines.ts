@@ -0,0 +1,145 @@
+// 目录流水线（项目依赖图）API
+
+export type PipelineRunStatus = 'pending' | 'running' | 'succeeded' | 'failed';
+export type PipelineNodeStatus = PipelineRunStatus | 'skipped' | 'blocked'; // blocked：上游项目失败，未执行
+
+export interface ProjectDependencies {
+  projectId: string;
+  dependsOn: string[];
+  dependents?: string[];
+}
+
+export interface PipelineGraphNode {
+  projectId: string;
+  projectName: string;
+  mode: 'sql' | 'load'; // load：执行项目的增量加载
+  dependsOn: string[];
+  level: number; // 同一层级的项目可以并行执行
+  externalTables: string[]; // 读取但不由本目录项目写入的表
+  estimatedDuration: number | null;
+}
+
+export interface PipelineGraphEdge {
+  from: string;
+  to: string;
+  explicit: boolean; // 显式声明的依赖
+  tables: string[]; // 推断依赖所依据的表
+}
+
+export interface PipelineGraph {
+  directoryId: string;
+  nodes: PipelineGraphNode[];
+  edges: PipelineGraphEdge[];
+  levels: number;
+  criticalPath: string[];
+  criticalPathDuration: number;
+  totalDuration: number;
+}
+
+export interface PipelineNode {
+  projectId: string;
+  projectName: string | null;
+  mode: 'sql' | 'load';
+  dependsOn: string[];
+  status: PipelineNodeStatus;
+  fingerprint: string | null;
+  rowCount: number | null;
+  duration: number | null;
+  error: string | null;
+  startedAt: string | null;
+  finishedAt: string | null;
+}
+
+export interface PipelineRun {
+  id: string;
+  directoryId: string;
+  connectionId: string | null;
+  status: PipelineRunStatus;
+  maxWorkers: number;
+  connectionLimit: number;
+  infer: boolean;
+  force: boolean;
+  nodeCount: number | null;
+  succeeded: number | null;
+  failed: number | null;
+  skipped: number | null;
+  blocked: number | null;
+  criticalPath: string[] | null;
+  criticalPathDuration: number | null;
+  totalDuration: number | null; // 各项目耗时之和（串行执行所需时间）
+  wallTime: number | null;
+  error: string | null;
+  startedAt: string | null;
+  finishedAt: string | null;
+  createdAt: string;
+  nodes?: PipelineNode[];
+}
+
+export interface PipelineRunInput {
+  directoryId: string;
+  connectionId?: string;
+  maxWorkers?: number;
+  connectionLimit?: number;
+  force?: boolean; // 不跳过输入未变化的项目
+  infer?: boolean; // 根据读写的表推断依赖，默认 true
+}
+
+export interface PipelineRunPage {
+  runs: PipelineRun[];
+  total: number;
+  page: number;
+  pageSize: number;
+}
+
+// API 基础 URL
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
+
+function request<T>(path: string, init?: RequestInit): Promise<T> {
+  return fetch(`${API_BASE_URL}/pipelines${path}`, {
+    ...init,
+    headers: init?.body ? { 'Content-Type': 'application/json' } : undefined,
+  }).then(response => {
+    if (!response.ok) {
+      return response.json().then(err => {
+        throw new Error(err.error || `HTTP error! status: ${response.status}`);
+      });
+    }
+    return response.json();
+  });
+}
+
+// 获取项目显式声明的依赖
+export function getDependencies(projectId: string): Promise<ProjectDependencies> {
+  return request<ProjectDependencies>(`/dependencies/${projectId}`);
+}
+
+// 替换项目显式声明的依赖
+export function setDependencies(projectId: string, dependsOn: string[]): Promise<ProjectDependencies> {
+  return request<ProjectDependencies>(`/dependencies/${projectId}`, {
+    method: 'PUT',
+    body: JSON.stringify({ dependsOn }),
+  });
+}
+
+// 获取目录（含子目录）的项目依赖图和估算的关键路径
+export function getPipelineGraph(directoryId: string, infer = true): Promise<PipelineGraph> {
+  const params = new URLSearchParams({ directoryId, infer: String(infer) });
+  return request<PipelineGraph>(`/graph?${params}`);
+}
+
+// 后台执行目录流水线；通过 getPipelineRun 轮询状态
+export function startPipelineRun(input: PipelineRunInput): Promise<PipelineRun> {
+  return request<PipelineRun>('/runs', { method: 'POST', body: JSON.stringify(input) });
+}
+
+// 获取流水线运行记录（最新的在前）
+export function getPipelineRuns(directoryId?: string, page = 1, pageSize = 20): Promise<PipelineRunPage> {
+  const params = new URLSearchParams({ page: String(page), pageSize: String(pageSize) });
+  if (directoryId) params.set('directoryId', directoryId);
+  return request<PipelineRunPage>(`/runs?${params}`);
+}
+
+// 获取运行及其各项目节点
+export function getPipelineRun(runId: string): Promise<PipelineRun> {
+  return request<PipelineRun>(`/runs/${runId}`);
+}
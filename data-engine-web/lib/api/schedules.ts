@@ -0,0 +1,128 @@
+// 项目定时执行 API
+
+export interface ProjectSchedule {
+  id: string;
+  projectId: string;
+  connectionId: string | null;
+  cron: string; // 分 时 日 月 星期，或 @daily / @hourly 等
+  timezone: string; // 例如 Asia/Shanghai
+  enabled: boolean;
+  maxRetries: number;
+  retryDelay: number; // 首次重试等待秒数，之后每次翻倍
+  misfirePolicy: 'run_once' | 'skip';
+  misfireGrace: number;
+  nextRunAt: string | null;
+  runningRunId: string | null;
+  lastRunAt: string | null;
+  lastStatus: ScheduleRun['status'] | null;
+  createdAt: string;
+  updatedAt: string;
+}
+
+export interface ScheduleRun {
+  id: string;
+  scheduleId: string;
+  projectId: string;
+  scheduledFor: string;
+  trigger: 'cron' | 'manual';
+  status: 'queued' | 'running' | 'retrying' | 'succeeded' | 'failed' | 'skipped';
+  attempt: number;
+  nextAttemptAt: string | null;
+  error: string | null;
+  sqlVersion: number | null;
+  rowCount: number | null;
+  truncated: boolean;
+  columns: string[] | null;
+  hasSnapshot: boolean;
+  snapshotSize: number | null;
+  duration: number | null;
+  startedAt: string | null;
+  finishedAt: string | null;
+  createdAt: string;
+}
+
+export interface ScheduleResult {
+  runId: string;
+  finishedAt: string | null;
+  columns: string[];
+  rows: unknown[][];
+  rowCount: number;
+  truncated: boolean;
+  offset: number;
+  limit: number;
+}
+
+export type ScheduleInput = Pick<ProjectSchedule, 'projectId' | 'connectionId' | 'cron'> &
+  Partial<Pick<ProjectSchedule, 'timezone' | 'enabled' | 'maxRetries' | 'retryDelay' | 'misfirePolicy' | 'misfireGrace'>>;
+
+// API 基础 URL
+const API_BASE_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:5000/api';
+
+function request<T>(path: string, init?: RequestInit): Promise<T> {
+  return fetch(`${API_BASE_URL}/schedules${path}`, {
+    ...init,
+    headers: init?.body ? { 'Content-Type': 'application/json' } : undefined,
+  }).then(response => {
+    if (!response.ok) {
+      return response.json().then(err => {
+        throw new Error(err.error || `HTTP error! status: ${response.status}`);
+      });
+    }
+    return response.json();
+  });
+}
+
+// 获取计划列表（可按项目筛选）
+export function getSchedules(projectId?: string): Promise<ProjectSchedule[]> {
+  const query = projectId ? `?projectId=${encodeURIComponent(projectId)}` : '';
+  return request<{ schedules: ProjectSchedule[] }>(query).then(data => data.schedules);
+}
+
+// 创建计划
+export function createSchedule(schedule: ScheduleInput): Promise<ProjectSchedule> {
+  return request<ProjectSchedule>('', { method: 'POST', body: JSON.stringify(schedule) });
+}
+
+// 更新计划
+export function updateSchedule(
+  scheduleId: string,
+  changes: Partial<Omit<ScheduleInput, 'projectId'>>
+): Promise<ProjectSchedule> {
+  return request<ProjectSchedule>(`/${scheduleId}`, { method: 'PATCH', body: JSON.stringify(changes) });
+}
+
+// 删除计划（连同运行记录和结果快照）
+export function deleteSchedule(scheduleId: string): Promise<void> {
+  return request(`/${scheduleId}`, { method: 'DELETE' }).then(() => undefined);
+}
+
+// 立即执行一次（已有运行中的任务时失败）
+export function runScheduleNow(scheduleId: string): Promise<ScheduleRun> {
+  return request<ScheduleRun>(`/${scheduleId}/run`, { method: 'POST' });
+}
+
+// 运行记录（最新在前）
+export function getScheduleRuns(
+  scheduleId: string,
+  options: { status?: ScheduleRun['status']; page?: number; pageSize?: number } = {}
+): Promise<{ runs: ScheduleRun[]; total: number; page: number; pageSize: number }> {
+  const params = new URLSearchParams();
+  if (options.status) params.set('status', options.status);
+  if (options.page) params.set('page', String(options.page));
+  if (options.pageSize) params.set('pageSize', String(options.pageSize));
+  const query = params.toString();
+  return request(`/${scheduleId}/runs${query ? `?${query}` : ''}`);
+}
+
+// 读取结果快照：不传 runId 时读取该计划最近一次成功运行的结果
+export function getScheduleResult(
+  scheduleId: string,
+  options: { runId?: string; offset?: number; limit?: number } = {}
+): Promise<ScheduleResult> {
+  const params = new URLSearchParams({
+    offset: String(options.offset ?? 0),
+    limit: String(options.limit ?? 100),
+  });
+  const path = options.runId ? `/runs/${options.runId}/result` : `/${scheduleId}/result`;
+  return request<ScheduleResult>(`${path}?${params.toString()}`);
+}
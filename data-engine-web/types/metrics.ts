@@ -1,9 +1,17 @@
+export type MetricTimeGrain = 'hour' | 'day' | 'week' | 'month' | 'quarter' | 'year';
+
 export interface Metric {
   id: string;
   name: string;
   description: string;
   category?: string;
+  categoryId?: string;
+  definitionSql?: string | null; // 指标定义 SQL
+  connectionId?: string | null; // 计算指标的数据库连接
+  timeGrain?: MetricTimeGrain | null; // 物化的时间粒度
+  watermarkColumn?: string | null; // 定义 SQL 结果中的时间列
   status: 'active' | 'draft';
+  createdAt?: string;
   updatedAt: string;
 }
 
@@ -15,3 +23,21 @@ export interface MetricCategory {
   createdAt?: string;
   updatedAt?: string;
 }
+
+export interface MetricMaterialization {
+  metricId: string;
+  status: 'pending' | 'running' | 'completed' | 'failed';
+  error: string | null;
+  watermark: string | null; // 已存储的最新时间分区
+  partitions: number | null;
+  startedAt: string | null;
+  completedAt: string | null;
+}
+
+export interface MetricValues {
+  metricId: string;
+  timeGrain: MetricTimeGrain | null;
+  values: { period: string; value: number | null; computedAt: string }[];
+  materialization: MetricMaterialization | null;
+  stale: boolean;
+}